@@ -10,19 +10,29 @@ cdef bytes RESPONSE_STATUS = b'+'
 cdef bytes RESPONSE_ERROR = b'-'
 cdef bytes nil = b'$-1\r\n'
 cdef bytes null_array = b'*-1\r\n'
+cdef int REPLY_STRING = ord('$')
+cdef int REPLY_ARRAY = ord('*')
+cdef int REPLY_INTEGER = ord(':')
+cdef int REPLY_STATUS = ord('+')
+cdef int REPLY_ERROR = ord('-')
+# Consumed bytes kept in the buffer before it is compacted
+cdef Py_ssize_t COMPACT_SIZE = 65536
 
 
 cdef class RedisParser:
     cdef object _protocolError
     cdef object _responseError
     cdef object _encoding
-    cdef object _inbuffer
+    cdef bytearray _inbuffer
+    cdef Py_ssize_t _pos
+    cdef object _view
     cdef Task _current
 
     def __cinit__(self, object perr, object rerr):
         self._protocolError = perr
         self._responseError = rerr
         self._inbuffer = bytearray()
+        self._pos = 0
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -33,16 +43,29 @@ cdef class RedisParser:
 
     # DECODER
     def get(self):
-        if self._current:
-            return self._resume(self._current, False)
-        else:
-            return self._get(None)
+        self._view = memoryview(self._inbuffer)
+        try:
+            if self._current:
+                return self._resume(self._current, False)
+            else:
+                return self._get(None)
+        finally:
+            self._view.release()
+            self._view = None
 
     def feed(self, stream):
+        cdef Py_ssize_t pos = self._pos
+        if pos:
+            if pos == len(self._inbuffer):
+                self._inbuffer.clear()
+                self._pos = 0
+            elif pos >= COMPACT_SIZE:
+                del self._inbuffer[:pos]
+                self._pos = 0
         self._inbuffer.extend(stream)
 
     def buffer(self):
-        return self._inbuffer
+        return bytes(self._inbuffer[self._pos:])
 
     # CLIENT ENCODERS
     def pack_command(self, args):
@@ -113,26 +136,31 @@ cdef class RedisParser:
             yield v
 
     cdef object _get(self, Task next):
-        b = self._inbuffer
-        cdef int length = b.find(b'\r\n')
+        cdef bytearray b = self._inbuffer
+        cdef Py_ssize_t pos = self._pos
+        cdef Py_ssize_t length = b.find(CRLF, pos)
+        cdef int rtype
         if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
-            if rtype == RESPONSE_ERROR:
+            self._pos = length + 2
+            rtype = 0
+            if length > pos:
+                rtype = b[pos]
+            response = self._view[pos+1:length].tobytes()
+            if rtype == REPLY_ERROR:
                 return self._responseError(response.decode('utf-8'))
-            elif rtype == RESPONSE_INTEGER:
+            elif rtype == REPLY_INTEGER:
                 return long(response)
-            elif rtype == RESPONSE_STATUS:
+            elif rtype == REPLY_STATUS:
                 return response
-            elif rtype == RESPONSE_STRING:
+            elif rtype == REPLY_STRING:
                 task = Task(long(response), next)
                 return task.decode(self, False)
-            elif rtype == RESPONSE_ARRAY:
+            elif rtype == REPLY_ARRAY:
                 task = ArrayTask(long(response), next)
                 return task.decode(self, False)
             else:
-                # Clear the buffer and raise
-                self._inbuffer = bytearray()
+                # Drop the buffer and raise
+                self._pos = len(b)
                 raise self._protocolError('Protocol Error')
         else:
             return False
@@ -155,12 +183,15 @@ cdef class Task:
 
     cdef object decode(self, RedisParser parser, object result):
         cdef long length = self._length
+        cdef Py_ssize_t pos, end
         cdef bytes chunk
         parser._current = None
         if length >= 0:
-            b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
+            pos = parser._pos
+            end = pos + length
+            if len(parser._inbuffer) >= end + 2:
+                parser._pos = end + 2
+                chunk = parser._view[pos:end].tobytes()
                 if parser._encoding:
                     return chunk.decode(parser._encoding)
                 else:
@@ -25,6 +25,19 @@ Redis Pipeline
 .. autoclass:: pulsar.apps.data.redis.client.Pipeline
    :members:
    :member-order: bysource
+
+Sharded Store
+~~~~~~~~~~~~~~~
+
+.. automodule:: pulsar.apps.data.redis.shard
+
+.. autoclass:: pulsar.apps.data.redis.shard.ShardedStore
+   :members:
+   :member-order: bysource
+
+.. autoclass:: pulsar.apps.data.redis.shard.HashRing
+   :members:
+   :member-order: bysource
 '''
 from pulsar.utils.config import Global
 from pulsar.apps.data import register_store
@@ -33,11 +46,12 @@ from pulsar.apps.ds import RedisError, NoScriptError, redis_parser
 from .store import RedisStore, RedisStoreConnection
 from .client import ResponseError, Consumer, Pipeline
 from .lock import RedisScript, LockError
+from .shard import ShardedStore, HashRing
 
 
 __all__ = ['RedisStore', 'RedisError', 'NoScriptError', 'redis_parser',
            'RedisStoreConnection', 'Consumer', 'Pipeline', 'ResponseError',
-           'RedisScript', 'LockError']
+           'RedisScript', 'LockError', 'ShardedStore', 'HashRing']
 
 
 class RedisServer(Global):
@@ -49,3 +63,4 @@ class RedisServer(Global):
 
 
 register_store('redis', 'pulsar.apps.data.RedisStore')
+register_store('shard', 'pulsar.apps.data.ShardedStore')
@@ -0,0 +1,242 @@
+'''Client side caching for :class:`.RedisStore`.
+
+Replies to the read commands in :data:`CACHED_COMMANDS` are kept in an in
+process LRU cache. The cache is kept coherent by the server with keys
+tracking (``CLIENT TRACKING``): a dedicated connection subscribes to the
+``__redis__:invalidate`` channel and the connections of the store pool
+redirect their invalidation messages to it. Invalidated keys are removed
+from the cache, all keys when the server is flushed or when the
+invalidation connection is lost.
+
+A reply is only cached if its key was not invalidated while the command
+was in flight, since the invalidation and the reply come from different
+connections.
+
+Cached replies are shared between callers and should not be modified.
+'''
+from functools import partial
+
+from pulsar import Protocol, asyncio, async
+from pulsar.utils.pep import to_bytes, to_string
+from pulsar.utils.structures import OrderedDict
+from pulsar.apps.ds import MovedError
+
+
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
+CACHED_COMMANDS = frozenset((
+    'exists', 'get', 'getrange', 'strlen', 'type',
+    'hexists', 'hget', 'hgetall', 'hkeys', 'hlen', 'hmget', 'hvals',
+    'lindex', 'llen', 'lrange',
+    'scard', 'sismember', 'smembers',
+    'zcard', 'zcount', 'zrange', 'zrangebyscore', 'zrank', 'zrevrange',
+    'zrevrangebyscore', 'zscore'))
+
+
+class InvalidationProtocol(Protocol):
+    '''The connection receiving invalidation messages for a
+    :class:`ClientCache`
+    '''
+    def __init__(self, cache, **kw):
+        super().__init__(cache.store._loop, **kw)
+        self.parser = self._producer._parser_class()
+        self.cache = cache
+        self.client_id = asyncio.Future(loop=self._loop)
+        self.bind_event('connection_lost', cache._lost)
+
+    def execute(self, *args):
+        self._transport.write(self.parser.multi_bulk(args))
+        # must be an asynchronous object like the base class method
+        yield None
+
+    def data_received(self, data):
+        parser = self.parser
+        parser.feed(data)
+        response = parser.get()
+        while response is not False:
+            if isinstance(response, Exception):
+                if not self.client_id.done():
+                    self.client_id.set_exception(response)
+            elif isinstance(response, int):
+                if not self.client_id.done():
+                    self.client_id.set_result(response)
+            elif isinstance(response, list) and response[0] == b'message':
+                self.cache.invalidate(response[2])
+            response = parser.get()
+
+
+class ClientCache:
+    '''LRU cache of the replies to read commands of a :class:`.RedisStore`
+
+    .. attribute:: size
+
+        Maximum number of cached replies
+
+    .. attribute:: broadcast
+
+        Use the broadcast mode of keys tracking, the server notifies the
+        modification of all keys starting with one of :attr:`prefixes`
+        rather than the keys read by the client
+
+    .. attribute:: prefixes
+
+        Only keys starting with one of these prefixes are cached
+    '''
+    def __init__(self, store, size, broadcast=False, prefixes=None):
+        self.store = store
+        self.size = size
+        self.broadcast = broadcast
+        self.prefixes = tuple((to_bytes(p, store.encoding)
+                               for p in prefixes or ()))
+        self.hits = 0
+        self.misses = 0
+        self.client_id = None
+        self._connection = None
+        self._connecting = None
+        self._data = OrderedDict()
+        # key -> {entry: token} of cached and in flight replies
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def execute(self, args, options):
+        '''Execute a command from the cache if possible
+        '''
+        entry = self._entry(args, options)
+        if entry is None:
+            return (yield from self.store._execute(args, options))
+        data = self._data
+        if entry in data:
+            self.hits += 1
+            data.move_to_end(entry)
+            return data[entry]
+        self.misses += 1
+        client_id = yield from self.connect()
+        key = entry[1]
+        token = object()
+        entries = self._keys.get(key)
+        if entries is None:
+            self._keys[key] = entries = {}
+        entries[entry] = token
+        cached = False
+        try:
+            connection = yield from self.store._pool.connect()
+            with connection:
+                if connection.tracking_id != client_id:
+                    yield from connection.execute(*self.tracking_command())
+                    connection.connection.tracking_id = client_id
+                try:
+                    result = yield from connection.execute(*args, **options)
+                except MovedError:
+                    moved = True
+                else:
+                    moved = False
+            if moved:
+                # the pool follows the redirect and learns the slots of the
+                # cluster, the store does not use the cache from now on
+                return (yield from self.store._execute(args, options))
+            # the key was not invalidated in the meantime
+            if (self.client_id == client_id and
+                    self._keys.get(key, {}).get(entry) is token):
+                data[entry] = result
+                cached = True
+                if len(data) > self.size:
+                    self._evict()
+            return result
+        finally:
+            if not cached:
+                self._discard(key, entry, token)
+
+    def connect(self):
+        '''Connect to the invalidation channel if needed and return the
+        client id of the connection
+        '''
+        if self.client_id is None:
+            if self._connecting is None:
+                self._connecting = async(self._connect(),
+                                         loop=self.store._loop)
+            try:
+                yield from asyncio.shield(self._connecting)
+            finally:
+                self._connecting = None
+        return self.client_id
+
+    def tracking_command(self):
+        '''The ``CLIENT TRACKING`` command of the store connections
+        '''
+        args = ['CLIENT', 'TRACKING', 'ON', 'REDIRECT', self.client_id]
+        if self.broadcast:
+            args.append('BCAST')
+            for prefix in self.prefixes:
+                args.extend(('PREFIX', prefix))
+        return args
+
+    def invalidate(self, keys):
+        '''Remove ``keys`` from the cache, all keys if ``None``
+        '''
+        if keys is None:
+            self.clear()
+        else:
+            data = self._data
+            for key in keys:
+                entries = self._keys.pop(key, None)
+                if entries:
+                    for entry in entries:
+                        data.pop(entry, None)
+
+    def clear(self):
+        '''Remove all replies from the cache'''
+        self._data.clear()
+        self._keys.clear()
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+    #    INTERNALS
+    def _entry(self, args, options):
+        command = to_string(args[0]).lower()
+        if command not in CACHED_COMMANDS or len(args) < 2:
+            return None
+        key = to_bytes(args[1], self.store.encoding)
+        if self.prefixes and not key.startswith(self.prefixes):
+            return None
+        entry = (command, key) + args[2:]
+        if options:
+            entry += tuple(sorted(options.items()))
+        try:
+            hash(entry)
+        except TypeError:
+            return None
+        return entry
+
+    def _connect(self):
+        store = self.store
+        factory = partial(InvalidationProtocol, self, producer=store)
+        connection = yield from store.connect(factory)
+        yield from connection.execute('CLIENT', 'ID')
+        yield from connection.execute('SUBSCRIBE', INVALIDATE_CHANNEL)
+        client_id = yield from connection.client_id
+        self._connection = connection
+        self.client_id = client_id
+
+    def _lost(self, connection, **kw):
+        if connection is self._connection:
+            self._connection = None
+            self.client_id = None
+            self.clear()
+
+    def _evict(self):
+        entry, _ = self._data.popitem(last=False)
+        entries = self._keys.get(entry[1])
+        if entries:
+            entries.pop(entry, None)
+            if not entries:
+                self._keys.pop(entry[1])
+
+    def _discard(self, key, entry, token):
+        entries = self._keys.get(key)
+        if entries and entries.get(entry) is token:
+            entries.pop(entry)
+            if not entries:
+                self._keys.pop(key)
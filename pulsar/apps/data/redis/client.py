@@ -1,4 +1,6 @@
 from itertools import chain
+from functools import partial
+from collections import deque
 import datetime
 
 import pulsar
@@ -85,7 +87,8 @@ def parse_info(response):
 def values_to_zset(response, withscores=False, **kw):
     if withscores:
         it = iter(response)
-        return Zset(((float(score), value) for value, score in zip(it, it)))
+        return Zset.from_items([(float(score), value)
+                                for value, score in zip(it, it)])
     else:
         return response
 
@@ -100,6 +103,34 @@ def sort_return_tuples(response, groups=None, **options):
     return list(zip(*[response[i::groups] for i in range(groups)]))
 
 
+def parse_scan(response, **kw):
+    cursor, result = response
+    return int(cursor), result
+
+
+def parse_hscan(response, **kw):
+    cursor, result = response
+    return int(cursor), pairs_to_object(result)
+
+
+def parse_zscan(response, **kw):
+    cursor, result = response
+    it = iter(result)
+    return int(cursor), [(member, float(score)) for member, score
+                         in zip(it, it)]
+
+
+def scan_args(cursor, match=None, count=None, type=None):
+    args = [cursor]
+    if match is not None:
+        args.extend(('MATCH', match))
+    if count is not None:
+        args.extend(('COUNT', count))
+    if type is not None:
+        args.extend(('TYPE', type))
+    return args
+
+
 def pubsub_callback(response, subcommand=None):
     if subcommand == 'numsub':
         it = iter(response)
@@ -116,7 +147,7 @@ class Consumer(pulsar.ProtocolConsumer):
     RESPONSE_CALLBACKS = dict_merge(
         string_keys_to_dict(
             'BGSAVE FLUSHALL FLUSHDB HMSET LSET LTRIM MSET RENAME RESTORE '
-            'SAVE SELECT SHUTDOWN SLAVEOF SET WATCH UNWATCH',
+            'SAVE SELECT SHUTDOWN SLAVEOF SET WATCH UNWATCH PFMERGE',
             lambda r: r == b'OK'
         ),
         string_keys_to_dict('SORT', sort_return_tuples),
@@ -136,23 +167,30 @@ class Consumer(pulsar.ProtocolConsumer):
             'TIME': lambda x: (int(float(x[0])), int(float(x[1]))),
             'HGETALL': pairs_to_object,
             'HMGET': values_to_object,
+            'SCAN': parse_scan,
+            'SSCAN': parse_scan,
+            'HSCAN': parse_hscan,
+            'ZSCAN': parse_zscan,
             'TYPE': lambda r: r.decode('utf-8')
         }
     )
 
     def start_request(self):
         conn = self._connection
-        args = self._request[0]
-        if len(self._request) == 2:
+        request = self._request
+        # the callbacks of the replies are resolved once, when the request
+        # is sent
+        if len(request) == 2:
+            args, options = request
+            self._callbacks = response_callback(args[0], options)
             chunk = conn.parser.pack_command(args)
         else:
-            chunk = conn.parser.pack_pipeline(args)
+            commands = request[0]
+            self._callbacks = [response_callback(args[0], options)
+                               for args, options in commands[1:-1]]
+            chunk = conn.parser.pack_pipeline(commands)
         conn._transport.write(chunk)
 
-    def parse_response(self, response, command, options):
-        callback = self.RESPONSE_CALLBACKS.get(command.upper())
-        return callback(response, **options) if callback else response
-
     def data_received(self, data):
         conn = self._connection
         parser = conn.parser
@@ -162,12 +200,10 @@ class Consumer(pulsar.ProtocolConsumer):
         try:
             if len(request) == 2:
                 if response is not False:
-                    if not isinstance(response, Exception):
-                        cmnd = request[0][0]
-                        response = self.parse_response(response, cmnd,
-                                                       request[1])
-                    else:
+                    if isinstance(response, Exception):
                         response = ResponseError(response)
+                    elif self._callbacks:
+                        response = self._callbacks(response)
                     self.finished(response)
             else:   # pipeline
                 commands, raise_on_error, responses = request
@@ -177,16 +213,18 @@ class Consumer(pulsar.ProtocolConsumer):
                 if len(responses) == len(commands):
                     error = None
                     result = responses[-1]
-                    response = []
                     if isinstance(result, Exception):
                         error = result
                         result = responses[1:-1]
-                    for cmds, resp in zip(commands[1:-1], result):
-                        args, options = cmds
-                        if isinstance(resp, Exception) and not error:
-                            error = resp
-                        resp = self.parse_response(resp, args[0], options)
-                        response.append(resp)
+                    response = []
+                    append = response.append
+                    for callback, resp in zip(self._callbacks, result):
+                        if isinstance(resp, Exception):
+                            if not error:
+                                error = resp
+                        elif callback:
+                            resp = callback(resp)
+                        append(resp)
                     if error and raise_on_error:
                         response = ResponseError(error)
                     self.finished(response)
@@ -194,6 +232,67 @@ class Consumer(pulsar.ProtocolConsumer):
             self.finished(exc=exc)
 
 
+def callbacks_table(callbacks):
+    '''Map the names of commands, in lower and upper case, as str and
+    bytes, to their callback or ``None``
+    '''
+    table = {}
+    for name in chain(COMMANDS_INFO, callbacks):
+        callback = callbacks.get(name.upper())
+        for key in (name.lower(), name.upper()):
+            table[key] = table[key.encode('utf-8')] = callback
+    return table
+
+
+CALLBACKS = callbacks_table(Consumer.RESPONSE_CALLBACKS)
+
+
+def response_callback(command, options=None):
+    '''The function converting the reply of ``command`` with ``options``,
+    ``None`` when the reply is returned as it is.
+
+    The ``raw`` option skips the conversion of the reply.
+    '''
+    callback = CALLBACKS.get(command, False)
+    if callback is False:
+        callback = Consumer.RESPONSE_CALLBACKS.get(to_string(command).upper())
+    if options and callback:
+        if 'raw' in options:
+            options = options.copy()
+            if options.pop('raw'):
+                return None
+        if options:
+            return partial(callback, **options)
+    return callback
+
+
+class ScanIterator:
+    '''Asynchronous iterator over the elements returned by one of the
+    SCAN commands.
+
+    Call :meth:`next` with ``yield from`` until it returns ``None``.
+    '''
+    def __init__(self, scan, *args, **options):
+        self._scan = scan
+        self._args = args
+        self._options = options
+        self._cursor = None
+        self._items = deque()
+
+    def next(self):
+        '''The next element or ``None`` when the iteration is over
+        '''
+        items = self._items
+        while not items:
+            if self._cursor == 0:
+                return None
+            self._cursor, result = yield from self._scan(
+                *self._args, cursor=self._cursor or 0, **self._options)
+            items.extend(result.items() if isinstance(result, dict)
+                         else result)
+        return items.popleft()
+
+
 class RedisClient(object):
     '''Client for :class:`.RedisStore`.
 
@@ -227,6 +326,20 @@ class RedisClient(object):
 
     # special commands
 
+    # KEYS
+    def scan(self, cursor=0, match=None, count=None, type=None):
+        """Incrementally iterate the keyspace.
+
+        Returns a ``cursor, keys`` pair, ``cursor`` is 0 when the iteration
+        is over.
+        """
+        return self.execute('scan', *scan_args(cursor, match, count, type))
+
+    def scan_iter(self, match=None, count=None, type=None):
+        '''A :class:`ScanIterator` over the keys of the database
+        '''
+        return ScanIterator(self.scan, match=match, count=count, type=type)
+
     # STRINGS
     def decrby(self, key, ammount=None):
         if ammount is None:
@@ -285,6 +398,19 @@ class RedisClient(object):
         [args.extend(pair) for pair in mapping_iterator(iterable)]
         return self.execute('hmset', key, *args)
 
+    def hscan(self, key, cursor=0, match=None, count=None):
+        """Incrementally iterate the hash at ``key``.
+
+        Returns a ``cursor, dict`` pair
+        """
+        return self.execute('hscan', key, *scan_args(cursor, match, count))
+
+    def hscan_iter(self, key, match=None, count=None):
+        '''A :class:`ScanIterator` over the ``field, value`` pairs of the
+        hash at ``key``
+        '''
+        return ScanIterator(self.hscan, key, match=match, count=count)
+
     # LISTS
     def blpop(self, keys, timeout=0):
         if timeout is None:
@@ -311,6 +437,19 @@ class RedisClient(object):
             timeout = 0
         return self.execute_command('BRPOPLPUSH', src, dst, timeout)
 
+    # SETS
+    def sscan(self, key, cursor=0, match=None, count=None):
+        """Incrementally iterate the set at ``key``.
+
+        Returns a ``cursor, members`` pair
+        """
+        return self.execute('sscan', key, *scan_args(cursor, match, count))
+
+    def sscan_iter(self, key, match=None, count=None):
+        '''A :class:`ScanIterator` over the members of the set at ``key``
+        '''
+        return ScanIterator(self.sscan, key, match=match, count=count)
+
     # SORTED SETS
     def zadd(self, name, *args, **kwargs):
         """
@@ -363,6 +502,20 @@ class RedisClient(object):
             pieces.append(aggregate)
         return self.execute_command('ZUNIONSTORE', des, numkeys, *pieces)
 
+    def zscan(self, key, cursor=0, match=None, count=None):
+        """Incrementally iterate the sorted set at ``key``.
+
+        Returns a ``cursor, pairs`` pair where ``pairs`` is a list of
+        ``member, score`` tuples
+        """
+        return self.execute('zscan', key, *scan_args(cursor, match, count))
+
+    def zscan_iter(self, key, match=None, count=None):
+        '''A :class:`ScanIterator` over the ``member, score`` pairs of the
+        sorted set at ``key``
+        '''
+        return ScanIterator(self.zscan, key, match=match, count=count)
+
     def zrange(self, key, start, stop, withscores=False):
         if withscores:
             return self.execute_command('ZRANGE', key, start, stop,
@@ -1,8 +1,10 @@
 import uuid
 import threading
-from asyncio import sleep
+from math import ceil
 
-from pulsar import is_async
+from pulsar import is_async, asyncio
+from pulsar.utils.pep import to_string
+from pulsar.apps.ds import ResponseError, hash_tag
 
 
 class LockError(Exception):
@@ -31,6 +33,24 @@ class RedisScript(object):
         return result
 
 
+# Lua code waking the first live waiter of the lock, the one at the head
+# of the queue KEYS[2] whose key is still refreshed. ARGV[2] is the prefix
+# of the waiter keys and ARGV[3] the time to live of the wake up token
+WAKE_FIRST_WAITER = """
+    local head = redis.call('lindex', KEYS[2], 0)
+    while head and
+            redis.call('exists', ARGV[2] .. 'waiter:' .. head) == 0 do
+        redis.call('lpop', KEYS[2])
+        head = redis.call('lindex', KEYS[2], 0)
+    end
+    if head then
+        local wake = ARGV[2] .. 'wake:' .. head
+        redis.call('rpush', wake, 1)
+        redis.call('pexpire', wake, ARGV[3])
+    end
+"""
+
+
 class Lock(object):
     '''Asynchronous locking primitive for distributing computing
 
@@ -42,6 +62,23 @@ class Lock(object):
     When the state is locked, :meth:`.acquire` wait
     until a call to :meth:`.release` changes it to unlocked,
     then the :meth:`.acquire` call resets it to locked and returns.
+
+    Waiting clients are queued in FIFO order. :meth:`.release` wakes the
+    first of them with a token pushed to a list it waits on with ``BLPOP``,
+    other clients can't take the lock while the queue is not empty. A
+    waiter polls instead when blocking would take the last available
+    connection of the store pool.
+    Waiters check the lock at least every ``sleep`` seconds and keep
+    their place in the queue only while they do so, a waiter which
+    stopped, because its process died for example, is dropped from the
+    queue after ``5*sleep + 2`` seconds. Servers before redis 6 only
+    accept whole seconds for the ``BLPOP`` timeout: with them waiters
+    check the lock every ``sleep`` seconds rounded up, and a ``blocking``
+    timeout may be exceeded by up to a second.
+
+    The keys of the queue are prefixed by the hash tag of the lock
+    ``name``, or by ``{name}`` when the name has no hash tag, so that they
+    are served by the node serving the lock.
     '''
     def __init__(self, client, name, timeout=None, blocking=0, sleep=0.2):
         self._local = threading.local()
@@ -53,6 +90,13 @@ class Lock(object):
         self.sleep = sleep
         if self.timeout and self.sleep > self.timeout:
             raise LockError("'sleep' must be less than 'timeout'")
+        name = to_string(name)
+        if hash_tag(name) == name.encode('utf-8'):
+            name = '{%s}' % name
+        self._prefix = '%s:' % name
+        self._queue = '%squeue' % self._prefix
+        # milliseconds a waiter keeps its place in the queue
+        self._waiter_ttl = int(1000*(5*sleep + 2))
 
     @property
     def _loop(self):
@@ -67,51 +111,170 @@ class Lock(object):
     def acquire(self):
         token = uuid.uuid1().hex.encode('utf-8')
         timeout = self.timeout and int(self.timeout * 1000) or ''
-        acquired = yield from self.lua_acquire(self.client,
-                                               keys=[self.name],
-                                               args=[token, timeout])
-        if not acquired:
-            loop = self._loop
-            start = loop.time()
-            while 1:
-                if (self.blocking is not None and
-                        loop.time() - start >= self.blocking):
+        waiter_ttl = self._waiter_ttl if self.blocking != 0 else ''
+        keys = [self.name, self._queue]
+        args = [token, timeout, waiter_ttl, self._prefix]
+        loop = self._loop
+        start = loop.time()
+        while True:
+            acquired = yield from self.lua_acquire(self.client, keys=keys,
+                                                   args=args)
+            if acquired:
+                self._local.token = token
+                return True
+            wait = self.sleep
+            if self.blocking is not None:
+                remaining = self.blocking - (loop.time() - start)
+                if remaining <= 0:
+                    if waiter_ttl:
+                        yield from self.lua_leave(
+                            self.client, keys=keys,
+                            args=[token, self._prefix, self._waiter_ttl])
                     return False
-                yield from sleep(self.sleep)
-        else:
-            self._local.token = token
-            return True
+                wait = min(wait, remaining)
+            yield from self._wait(token, wait)
 
     def release(self):
         expected_token = self.token
         if not expected_token:
             raise LockError("Cannot release an unlocked lock")
         self._local.token = None
-        released = yield from self.lua_release(self.client,
-                                               keys=[self.name],
-                                               args=[expected_token])
+        released = yield from self.lua_release(
+            self.client, keys=[self.name, self._queue],
+            args=[expected_token, self._prefix, self._waiter_ttl])
         if not released:
             raise LockError("Cannot release a lock that's no longer owned")
         return True
 
+    def extend(self, additional_time, replace_ttl=False):
+        '''Add ``additional_time`` seconds to the time to live of the lock,
+        or set the time to live to ``additional_time`` if ``replace_ttl``
+        '''
+        if not self.token:
+            raise LockError("Cannot extend an unlocked lock")
+        if self.timeout is None:
+            raise LockError("Cannot extend a lock with no timeout")
+        extended = yield from self.lua_extend(
+            self.client, keys=[self.name],
+            args=[self.token, int(additional_time * 1000),
+                  int(bool(replace_ttl))])
+        if not extended:
+            raise LockError("Cannot extend a lock that's no longer owned")
+        return True
+
+    def renew(self):
+        '''Reset the time to live of the lock to :attr:`timeout`
+        '''
+        return self.extend(self.timeout, True)
+
+    def _wait(self, token, timeout):
+        # wait for the wake up token pushed by release. Servers before
+        # redis 6 reject sub-second timeouts, the timeout is rounded up to
+        # whole seconds once it was rejected
+        wake = '%swake:%s' % (self._prefix, token.decode('utf-8'))
+        store = self.client.store
+        pool = store.pool
+        if pool.in_use >= pool.pool_size - 1:
+            # blocking the last connection of the pool would starve the
+            # other clients of the store, poll instead
+            return (yield from asyncio.sleep(timeout, loop=self._loop))
+        if not store._integer_timeouts:
+            try:
+                return (yield from self.client.blpop(wake,
+                                                     max(timeout, 0.01)))
+            except ResponseError as exc:
+                if 'timeout' not in str(exc):
+                    raise
+                store._integer_timeouts = True
+        return (yield from self.client.blpop(wake, max(ceil(timeout), 1)))
+
+    # KEYS[1] - lock name
+    # KEYS[2] - queue of waiters
+    # ARGS[1] - token
+    # ARGS[2] - lock time to live in milliseconds or empty
+    # ARGS[3] - waiter time to live in milliseconds, empty when not waiting
+    # ARGS[4] - prefix of the waiter keys
+    # return 1 if the lock was acquired, otherwise 0
     lua_acquire = RedisScript("""
-        if redis.call('setnx', KEYS[1], ARGV[1]) == 1 then
-            if ARGV[2] ~= '' then
-                redis.call('pexpire', KEYS[1], ARGV[2])
+        local prefix = ARGV[4]
+        local head = redis.call('lindex', KEYS[2], 0)
+        if redis.call('exists', KEYS[1]) == 0 then
+            while head and head ~= ARGV[1] and
+                    redis.call('exists', prefix .. 'waiter:' .. head) == 0 do
+                redis.call('lpop', KEYS[2])
+                head = redis.call('lindex', KEYS[2], 0)
+            end
+            if not head or head == ARGV[1] then
+                redis.call('set', KEYS[1], ARGV[1])
+                if ARGV[2] ~= '' then
+                    redis.call('pexpire', KEYS[1], ARGV[2])
+                end
+                if head then
+                    redis.call('lpop', KEYS[2])
+                    redis.call('del', prefix .. 'waiter:' .. head,
+                               prefix .. 'wake:' .. head)
+                end
+                return 1
             end
-            return 1
+        end
+        if ARGV[3] ~= '' then
+            local waiter = prefix .. 'waiter:' .. ARGV[1]
+            if redis.call('exists', waiter) == 0 then
+                redis.call('rpush', KEYS[2], ARGV[1])
+            end
+            redis.call('set', waiter, 1, 'px', ARGV[3])
+            redis.call('pexpire', KEYS[2], ARGV[3])
         end
         return 0
     """)
 
     # KEYS[1] - lock name
+    # KEYS[2] - queue of waiters
     # ARGS[1] - token
+    # ARGS[2] - prefix of the waiter keys
+    # ARGS[3] - wake up token time to live in milliseconds
     # return 1 if the lock was released, otherwise 0
     lua_release = RedisScript("""
-        local token = redis.call('get', KEYS[1])
-        if not token or token ~= ARGV[1] then
+        if redis.call('get', KEYS[1]) ~= ARGV[1] then
             return 0
         end
         redis.call('del', KEYS[1])
+        %s
+        return 1
+    """ % WAKE_FIRST_WAITER)
+
+    # KEYS[1] - lock name
+    # KEYS[2] - queue of waiters
+    # ARGS[1] - token of a waiter giving up
+    # ARGS[2] - prefix of the waiter keys
+    # ARGS[3] - wake up token time to live in milliseconds
+    # a wake up token for the waiter is passed on to the next waiter
+    lua_leave = RedisScript("""
+        redis.call('lrem', KEYS[2], 0, ARGV[1])
+        redis.call('del', ARGV[2] .. 'waiter:' .. ARGV[1],
+                   ARGV[2] .. 'wake:' .. ARGV[1])
+        if redis.call('exists', KEYS[1]) == 0 then
+            %s
+        end
+        return 1
+    """ % WAKE_FIRST_WAITER)
+
+    # KEYS[1] - lock name
+    # ARGS[1] - token
+    # ARGS[2] - milliseconds
+    # ARGS[3] - 1 to replace the time to live, 0 to add to it
+    # return 1 if the lock was extended, otherwise 0
+    lua_extend = RedisScript("""
+        if redis.call('get', KEYS[1]) ~= ARGV[1] then
+            return 0
+        end
+        local ttl = tonumber(ARGV[2])
+        if ARGV[3] == '0' then
+            local current = redis.call('pttl', KEYS[1])
+            if current > 0 then
+                ttl = ttl + current
+            end
+        end
+        redis.call('pexpire', KEYS[1], ttl)
         return 1
     """)
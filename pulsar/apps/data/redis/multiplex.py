@@ -0,0 +1,169 @@
+'''Automatic pipelining for :class:`.RedisStore`.
+
+Commands executed by a store with ``auto_pipeline`` connections are not
+sent on a connection checked out of the pool. They are queued and the
+commands queued in the same iteration of the event loop are packed into a
+single write on one of a few shared connections. Many commands are in
+flight on a connection at once and the replies, which redis sends in the
+order of the commands, are dispatched back in FIFO order.
+
+Commands which block the connection or change its state, listed in
+:data:`EXCLUSIVE_COMMANDS`, are still executed on a connection of the pool,
+and so are pipelines and the commands of a store following the slots of a
+cluster.
+'''
+from collections import deque
+from functools import partial
+
+from pulsar import Protocol, asyncio, async
+from pulsar.utils.pep import to_string
+from pulsar.apps.ds import MovedError
+
+from .client import response_callback
+
+
+EXCLUSIVE_COMMANDS = frozenset((
+    'auth', 'select', 'multi', 'exec', 'discard', 'watch', 'unwatch',
+    'blpop', 'brpop', 'brpoplpush', 'xread', 'xreadgroup', 'wait',
+    'subscribe', 'psubscribe', 'unsubscribe', 'punsubscribe', 'monitor',
+    'client', 'quit', 'shutdown'))
+
+
+class MultiplexProtocol(Protocol):
+    '''A connection shared by the commands of an :class:`AutoPipeline`
+    '''
+    def __init__(self, pipeline, **kw):
+        super().__init__(pipeline.store._loop, **kw)
+        self.parser = self._producer._parser_class()
+        # futures waiting for a reply, in the order of the commands
+        self.waiters = deque()
+        self.bind_event('connection_lost', pipeline._lost)
+
+    def execute(self, *args, **options):
+        waiter = asyncio.Future(loop=self._loop)
+        self.send([(args, response_callback(args[0], options), waiter)])
+        result = yield from waiter
+        return result
+
+    def send(self, commands):
+        '''Write ``commands``, a list of ``(args, callback, waiter)``
+        triples, to the connection in a single chunk
+        '''
+        self.waiters.extend(commands)
+        self._transport.write(self.parser.pack_pipeline(
+            ((args, None) for args, _, _ in commands)))
+
+    def data_received(self, data):
+        parser = self.parser
+        waiters = self.waiters
+        parser.feed(data)
+        response = parser.get()
+        while response is not False:
+            _, callback, waiter = waiters.popleft()
+            if not waiter.done():
+                if isinstance(response, Exception):
+                    waiter.set_exception(response)
+                elif callback:
+                    try:
+                        response = callback(response)
+                    except Exception as exc:
+                        waiter.set_exception(exc)
+                    else:
+                        waiter.set_result(response)
+                else:
+                    waiter.set_result(response)
+            response = parser.get()
+
+    def fail(self, exc):
+        '''Fail the commands waiting for a reply
+        '''
+        waiters = self.waiters
+        while waiters:
+            waiter = waiters.popleft()[2]
+            if not waiter.done():
+                waiter.set_exception(exc)
+
+
+class AutoPipeline:
+    '''Commands of a :class:`.RedisStore` multiplexed on :attr:`size`
+    shared connections
+
+    .. attribute:: writes
+
+        Number of writes to the shared connections
+
+    .. attribute:: commands
+
+        Number of commands sent on the shared connections
+    '''
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self.writes = 0
+        self.commands = 0
+        self._connections = []
+        self._connecting = None
+        self._queue = []
+        self._handle = None
+        self._next = 0
+
+    def execute(self, args, options):
+        '''Queue a command and wait for its reply
+        '''
+        if to_string(args[0]).lower() in EXCLUSIVE_COMMANDS:
+            return (yield from self.store._execute(args, options))
+        waiter = asyncio.Future(loop=self.store._loop)
+        self._queue.append((args, response_callback(args[0], options),
+                            waiter))
+        if self._handle is None:
+            self._handle = self.store._loop.call_soon(self._flush)
+        try:
+            result = yield from waiter
+        except MovedError:
+            # the pool follows the redirect and learns the slots of the
+            # cluster, the store does not use the pipeline from now on
+            result = yield from self.store._execute(args, options)
+        return result
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+
+    #    INTERNALS
+    def _flush(self):
+        self._handle = None
+        commands, self._queue = self._queue, []
+        if len(self._connections) < self.size:
+            if self._connecting is None:
+                self._connecting = async(self._connect(),
+                                         loop=self.store._loop)
+            self._connecting.add_done_callback(
+                partial(self._send, commands))
+        else:
+            self._send(commands)
+
+    def _send(self, commands, connecting=None):
+        if connecting is not None:
+            self._connecting = None
+            exc = connecting.exception()
+            if exc is not None and not self._connections:
+                for _, _, waiter in commands:
+                    if not waiter.done():
+                        waiter.set_exception(exc)
+                return
+        connections = self._connections
+        self._next = (self._next + 1) % len(connections)
+        connections[self._next].send(commands)
+        self.writes += 1
+        self.commands += len(commands)
+
+    def _connect(self):
+        factory = partial(MultiplexProtocol, self, producer=self.store)
+        connection = yield from self.store.connect(factory)
+        self._connections.append(connection)
+
+    def _lost(self, connection, exc=None, **kw):
+        if connection in self._connections:
+            self._connections.remove(connection)
+        connection.fail(exc or ConnectionResetError('Connection lost'))
@@ -0,0 +1,342 @@
+'''Client side sharding of keys over several redis or pulsar-ds nodes.
+
+A :class:`ShardedStore` is created from a url with a comma separated list
+of nodes::
+
+    store = create_store('shard://127.0.0.1:6410,127.0.0.1:6411/9')
+
+Each node is accessed with a :class:`.RedisStore` and keys are mapped to
+nodes by a :class:`HashRing`. As in cluster mode, when a key contains a
+``{...}`` hash tag only the tag is hashed, so that related keys can be
+forced into the same node.
+
+Commands on keys served by one node are sent to that node. ``MGET``,
+``MSET``, ``DEL``, ``UNLINK`` and ``EXISTS`` are split by node, the parts
+are executed in parallel and their results merged, other commands on keys
+served by different nodes fail with a :class:`.CommandError`. Commands
+without keys, or unknown to pulsar-ds, are sent to the first node
+with the exception of the commands in :data:`BROADCAST_COMMANDS` which are
+sent to all nodes.
+
+Pipelines are split in the same way, the commands of each node are
+executed in a transaction of that node and the replies are merged back
+in the order of the commands. A pipeline is atomic only when all its keys
+are served by one node.
+'''
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import partial
+from hashlib import md5
+from itertools import chain
+
+from pulsar import asyncio
+from pulsar.utils.pep import to_string
+from pulsar.apps.data import RemoteStore
+from pulsar.apps.ds import COMMANDS_INFO, CommandError, hash_tag
+
+from .client import RedisClient, Pipeline
+from .store import RedisStore
+
+
+def reorder(positions, results):
+    '''Merge the ``results`` of the parts of a split ``MGET``, ``positions``
+    are the indexes of the keys of each part in the original command
+    '''
+    values = [None]*sum(len(indexes) for indexes in positions)
+    for indexes, result in zip(positions, results):
+        for index, value in zip(indexes, result):
+            values[index] = value
+    return values
+
+
+# commands on several keys which can be split by node, with the number of
+# arguments per key and the function merging the results of the parts
+SPLIT_COMMANDS = {
+    'mget': (1, reorder),
+    'mset': (2, all),
+    'del': (1, sum),
+    'unlink': (1, sum),
+    'exists': (1, any)
+}
+
+# commands without keys sent to all nodes, with the function merging the
+# results of the nodes
+BROADCAST_COMMANDS = {
+    'ping': all,
+    'flushdb': all,
+    'flushall': all,
+    'dbsize': sum,
+    'keys': lambda results: list(chain(*results)),
+    'script': lambda results: results[0]
+}
+
+
+def key_hash(key):
+    '''The position of ``key`` in a :class:`HashRing`
+    '''
+    if not isinstance(key, (bytes, str)):
+        key = str(key)
+    return int.from_bytes(md5(hash_tag(key)).digest()[:4], 'little')
+
+
+def ketama_points(node, points):
+    '''The positions of ``node`` in a :class:`HashRing`, four for each md5
+    digest of ``<node>-<n>``
+    '''
+    for n in range(points // 4):
+        digest = md5(('%s-%d' % (node, n)).encode('utf-8')).digest()
+        for i in range(0, 16, 4):
+            yield int.from_bytes(digest[i:i+4], 'little')
+
+
+def command_keys(command, args):
+    '''The keys of a command, ``EVAL`` and ``EVALSHA`` included
+    '''
+    if command in ('eval', 'evalsha'):
+        return args[3:3+int(args[2])] if len(args) > 2 else ()
+    info = COMMANDS_INFO.get(command)
+    return info.get_keys(args) if info else ()
+
+
+class HashRing:
+    '''Ketama consistent hashing of keys to nodes
+
+    Nodes, given by their names, are placed on a ring of 32 bits integers
+    at :attr:`points` positions each, the virtual nodes. A key is served by
+    the node at the first position following the :func:`key_hash` of the
+    key. Adding or removing a node only remaps the keys hashed between the
+    positions of that node and the positions preceding them, about ``1/N``
+    of the keys for ``N`` nodes.
+    '''
+    def __init__(self, nodes=(), points=160):
+        self.points = points
+        self._nodes = []
+        self._ring = {}
+        self._positions = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    @property
+    def nodes(self):
+        '''Tuple of nodes in the order they were added
+        '''
+        return tuple(self._nodes)
+
+    def add(self, node):
+        '''Add ``node`` to the ring
+        '''
+        if node not in self._nodes:
+            self._nodes.append(node)
+            self._place(node)
+            self._positions = sorted(self._ring)
+
+    def remove(self, node):
+        '''Remove ``node`` from the ring
+        '''
+        self._nodes.remove(node)
+        # rebuild the ring so that positions shared with the removed node
+        # go back to their previous owner
+        self._ring = {}
+        for node in self._nodes:
+            self._place(node)
+        self._positions = sorted(self._ring)
+
+    def get(self, key):
+        '''The node serving ``key``
+        '''
+        positions = self._positions
+        if not positions:
+            raise KeyError('No nodes in the ring')
+        index = bisect_right(positions, key_hash(key))
+        if index == len(positions):
+            index = 0
+        return self._ring[positions[index]]
+
+    def _place(self, node):
+        ring = self._ring
+        for position in ketama_points(node, self.points):
+            ring.setdefault(position, node)
+
+
+class ShardedStore(RemoteStore):
+    '''A :class:`.Store` sharding keys over several redis or pulsar-ds
+    nodes
+
+    The ``points`` parameter is the number of virtual nodes of each node
+    in the :class:`HashRing`, other parameters are passed to the
+    :class:`.RedisStore` of the nodes.
+    '''
+    def _init(self, points=160, **kwargs):
+        if self._database is None:
+            self._database = 0
+        self._database = int(self._database)
+        self._kwargs = kwargs
+        self._ring = HashRing(points=int(points))
+        self._stores = {}
+        self.loaded_scripts = set()
+        hosts = self._host if isinstance(self._host, list) else [self._host]
+        self._host = []
+        for host in hosts:
+            self.add_node(host)
+
+    @property
+    def ring(self):
+        '''The :class:`HashRing` of this store
+        '''
+        return self._ring
+
+    @property
+    def nodes(self):
+        '''The :class:`.RedisStore` of the nodes, in the order they were
+        added
+        '''
+        return [self._stores[name] for name in self._ring.nodes]
+
+    def add_node(self, host):
+        '''Add a node at ``host``, a ``(host, port)`` tuple, and return its
+        :class:`.RedisStore`
+        '''
+        name = '%s:%s' % host
+        if name not in self._stores:
+            self._stores[name] = RedisStore('redis', host, loop=self._loop,
+                                            database=self._database,
+                                            user=self._user,
+                                            password=self._password,
+                                            encoding=self._encoding,
+                                            **self._kwargs)
+            self._ring.add(name)
+            self._host.append(host)
+            self._dns = self._buildurl()
+        return self._stores[name]
+
+    def remove_node(self, host):
+        '''Remove the node at ``host`` and return its :class:`.RedisStore`,
+        which is not closed
+        '''
+        name = '%s:%s' % host
+        store = self._stores.pop(name)
+        self._ring.remove(name)
+        self._host.remove(host)
+        self._dns = self._buildurl()
+        return store
+
+    def node(self, key):
+        '''The :class:`.RedisStore` of the node serving ``key``
+        '''
+        return self._stores[self._ring.get(key)]
+
+    def client(self):
+        '''Get a :class:`.RedisClient` for the Store'''
+        return RedisClient(self)
+
+    def pipeline(self):
+        '''Get a :class:`.Pipeline` for the Store'''
+        return Pipeline(self)
+
+    def pubsub(self, protocol=None):
+        '''Publish/subscribe on the first node
+        '''
+        return self.nodes[0].pubsub(protocol=protocol)
+
+    def ping(self):
+        return self.client().ping()
+
+    def execute(self, *args, **options):
+        parts, merge = self._route(args)
+        if len(parts) == 1:
+            store, args = parts[0]
+            result = yield from store.execute(*args, **options)
+            return result
+        results = yield from asyncio.gather(
+            *[store.execute(*args, **options) for store, args in parts],
+            loop=self._loop)
+        return merge(results)
+
+    def execute_pipeline(self, commands, raise_on_error=True):
+        # commands of each node and, for each command of the pipeline,
+        # the node and position of its parts
+        stacks = OrderedDict()
+        plan = []
+        for args, options in commands[1:-1]:
+            parts, merge = self._route(args)
+            locations = []
+            for store, args in parts:
+                stack = stacks.get(store)
+                if stack is None:
+                    stack = stacks[store] = []
+                locations.append((store, len(stack)))
+                stack.append((args, options))
+            plan.append((locations, merge))
+        stores = list(stacks)
+        results = yield from asyncio.gather(
+            *[store.execute_pipeline(
+                list(chain(commands[:1], stacks[store], commands[-1:])),
+                False) for store in stores],
+            loop=self._loop)
+        results = dict(zip(stores, results))
+        response = []
+        error = None
+        for locations, merge in plan:
+            values = [results[store][index] for store, index in locations]
+            errors = [v for v in values if isinstance(v, Exception)]
+            if errors:
+                value = errors[0]
+                error = error or value
+            else:
+                value = values[0] if len(values) == 1 else merge(values)
+            response.append(value)
+        if error and raise_on_error:
+            raise error
+        return response
+
+    def connect(self, protocol_factory=None):
+        '''Connect to the first node
+        '''
+        return self.nodes[0].connect(protocol_factory)
+
+    def flush(self):
+        return self.execute('flushdb')
+
+    def close(self):
+        '''Close all open connections.'''
+        for store in self._stores.values():
+            store.close()
+
+    #    INTERNALS
+    def _route(self, args):
+        # The parts of a command as a list of (store, args) pairs and the
+        # function merging the results of the parts
+        command = to_string(args[0]).lower()
+        keys = command_keys(command, args)
+        if not keys:
+            merge = BROADCAST_COMMANDS.get(command)
+            if merge:
+                return [(store, args) for store in self.nodes], merge
+            return [(self.nodes[0], args)], None
+        ring = self._ring
+        names = set(ring.get(key) for key in keys)
+        if len(names) == 1:
+            return [(self._stores[names.pop()], args)], None
+        split = SPLIT_COMMANDS.get(command)
+        if not split:
+            raise CommandError("Keys of '%s' are served by different nodes, "
+                               "use a hash tag" % command)
+        step, merge = split
+        parts = OrderedDict()
+        for position, index in enumerate(range(1, len(args), step)):
+            name = ring.get(args[index])
+            part = parts.get(name)
+            if part is None:
+                part = parts[name] = ([args[0]], [])
+            part[0].extend(args[index:index+step])
+            part[1].append(position)
+        if merge is reorder:
+            merge = partial(reorder, [part[1] for part in parts.values()])
+        return ([(self._stores[name], tuple(part[0]))
+                 for name, part in parts.items()], merge)
@@ -3,13 +3,23 @@ from functools import partial
 from pulsar import Connection, Pool, get_actor
 from pulsar.utils.pep import to_string
 from pulsar.apps.data import RemoteStore
-from pulsar.apps.ds import redis_parser
+from pulsar.apps.ds import redis_parser, MovedError, COMMANDS_INFO, key_slot
+from pulsar.apps.ds.cluster import parse_moved
 
 from .client import RedisClient, Pipeline, Consumer, ResponseError
 from .pubsub import RedisPubSub
+from .cache import ClientCache
+from .multiplex import AutoPipeline
+
+
+# Maximum number of MOVED redirects followed by a command
+MAX_REDIRECTS = 5
 
 
 class RedisStoreConnection(Connection):
+    # client id of the cache invalidation connection this connection
+    # redirects its keys tracking to
+    tracking_id = None
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
@@ -39,7 +49,8 @@ class RedisStore(RemoteStore):
     supported_queries = frozenset(('filter', 'exclude'))
 
     def _init(self, namespace=None, parser_class=None, pool_size=50,
-              decode_responses=False, **kwargs):
+              decode_responses=False, cache_size=0, cache_broadcast=False,
+              cache_prefixes=None, auto_pipeline=0, **kwargs):
         self._decode_responses = decode_responses
         if not parser_class:
             actor = get_actor()
@@ -48,16 +59,47 @@ class RedisStore(RemoteStore):
         self._parser_class = parser_class
         if namespace:
             self._urlparams['namespace'] = namespace
+        self._pool_size = pool_size
         self._pool = Pool(self.connect, pool_size=pool_size, loop=self._loop)
+        # pools of cluster nodes and their hash slots, learnt from the
+        # CLUSTER SLOTS command and MOVED errors
+        self._nodes = {}
+        self._slots = {}
         if self._database is None:
             self._database = 0
         self._database = int(self._database)
         self.loaded_scripts = set()
+        # the server rejects fractional timeouts of blocking commands, as
+        # redis before 6 does, learnt by locks
+        self._integer_timeouts = False
+        cache_size = int(cache_size)
+        self._cache = None
+        if cache_size:
+            self._cache = ClientCache(self, cache_size, cache_broadcast,
+                                      cache_prefixes)
+        auto_pipeline = int(auto_pipeline)
+        self._auto_pipeline = None
+        if auto_pipeline:
+            self._auto_pipeline = AutoPipeline(self, auto_pipeline)
 
     @property
     def pool(self):
         return self._pool
 
+    @property
+    def cache(self):
+        '''The :class:`.ClientCache` of this store, ``None`` unless the
+        store was created with a ``cache_size``
+        '''
+        return self._cache
+
+    @property
+    def auto_pipeline(self):
+        '''The :class:`.AutoPipeline` of this store, ``None`` unless the
+        store was created with ``auto_pipeline`` connections
+        '''
+        return self._auto_pipeline
+
     @property
     def namespace(self):
         '''The prefix namespace to append to all transaction on keys
@@ -83,10 +125,26 @@ class RedisStore(RemoteStore):
         return self.client().ping()
 
     def execute(self, *args, **options):
-        connection = yield from self._pool.connect()
-        with connection:
-            result = yield from connection.execute(*args, **options)
-            return result
+        if self._cache is not None and not self._slots:
+            return self._cache.execute(args, options)
+        if self._auto_pipeline is not None and not self._slots:
+            return self._auto_pipeline.execute(args, options)
+        return self._execute(args, options)
+
+    def _execute(self, args, options):
+        pool = self._slot_pool(args) if self._slots else self._pool
+        redirects = 0
+        while True:
+            connection = yield from pool.connect()
+            with connection:
+                try:
+                    result = yield from connection.execute(*args, **options)
+                    return result
+                except MovedError as exc:
+                    redirects += 1
+                    if redirects > MAX_REDIRECTS:
+                        raise
+                    pool = yield from self._moved(exc)
 
     def execute_pipeline(self, commands, raise_on_error=True):
         conn = yield from self._pool.connect()
@@ -94,10 +152,11 @@ class RedisStore(RemoteStore):
             result = yield from conn.execute_pipeline(commands, raise_on_error)
             return result
 
-    def connect(self, protocol_factory=None):
+    def connect(self, protocol_factory=None, address=None):
         protocol_factory = protocol_factory or self.create_protocol
-        if isinstance(self._host, tuple):
-            host, port = self._host
+        address = address or self._host
+        if isinstance(address, tuple):
+            host, port = address
             transport, connection = yield from self._loop.create_connection(
                 protocol_factory, host, port)
         else:
@@ -114,11 +173,57 @@ class RedisStore(RemoteStore):
 
     def close(self):
         '''Close all open connections.'''
+        if self._cache is not None:
+            self._cache.close()
+        if self._auto_pipeline is not None:
+            self._auto_pipeline.close()
+        for pool in self._nodes.values():
+            pool.close()
         return self._pool.close()
 
     def has_query(self, query_type):
         return query_type in self.supported_queries
 
+    def _slot_pool(self, args):
+        # The connection pool of the cluster node serving the command keys
+        info = COMMANDS_INFO.get(to_string(args[0]).lower())
+        keys = info.get_keys(args) if info else None
+        if keys:
+            key = keys[0]
+            if not isinstance(key, (bytes, str)):
+                key = str(key)
+            return self._slots.get(key_slot(key), self._pool)
+        return self._pool
+
+    def _moved(self, exc):
+        slot, address = parse_moved(exc.args[0])
+        pool = self._node_pool(address)
+        if not self._slots:
+            # the first redirect, load the slots of all nodes
+            yield from self._load_slots(pool)
+        self._slots[slot] = pool
+        return pool
+
+    def _node_pool(self, address):
+        if address == self._host:
+            return self._pool
+        pool = self._nodes.get(address)
+        if pool is None:
+            pool = Pool(partial(self.connect, address=address),
+                        pool_size=self._pool_size, loop=self._loop)
+            self._nodes[address] = pool
+        return pool
+
+    def _load_slots(self, pool):
+        connection = yield from pool.connect()
+        with connection:
+            ranges = yield from connection.execute('cluster', 'slots')
+        slots = self._slots
+        for first, last, master in (r[:3] for r in ranges):
+            node = self._node_pool((to_string(master[0]), int(master[1])))
+            for slot in range(int(first), int(last) + 1):
+                slots[slot] = node
+
     def basekey(self, meta, *args):
         key = '%s%s' % (self.namespace, meta.table_name)
         postfix = ':'.join((to_string(p) for p in args if p is not None))
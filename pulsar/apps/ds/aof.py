@@ -0,0 +1,290 @@
+'''Append only file persistence for pulsar-ds.
+
+Write commands are appended to the file in the redis protocol. Commands
+received in the same loop iteration are written with a single system call
+and the file is synced to disk according to the ``fsync`` policy:
+
+* ``always`` write and sync before replying to the client
+* ``everysec`` sync once per second in a thread of the default executor
+* ``no`` leave the sync to the operating system
+
+A rewrite writes a snapshot of the dataset, in the
+:mod:`~pulsar.apps.ds.snapshot` format, in a background process. Commands
+received while the rewrite is in progress are buffered and appended to the
+new file once the snapshot is written.
+'''
+import os
+import time
+
+import pulsar
+
+from .client import ClientMixin
+from .snapshot import write_snapshot
+
+
+class AofError(pulsar.PulsarException):
+    '''Raised when the append only file is corrupted'''
+    pass
+
+
+class AppendOnlyFile:
+    '''Append write commands to a file
+    '''
+    def __init__(self, store, filename, fsync='everysec', rewrite_size=0):
+        self.store = store
+        self.filename = filename
+        self.fsync = fsync
+        self.rewrite_size = rewrite_size
+        self._loop = store._loop
+        self._buffer = bytearray()
+        self._scheduled = False
+        self._db = None
+        self._syncing = False
+        self._last_fsync = time.time()
+        self._rewriter = None
+        self._rewrite_buffer = None
+        self._rewrite_db = None
+        self.last_rewrite_status = 'ok'
+        self._open()
+
+    @property
+    def rewriting(self):
+        return self._rewriter is not None
+
+    def feed(self, num, request):
+        '''Append a ``request`` executed on database ``num``
+        '''
+        buffer = self._buffer
+        if num != self._db:
+            self._db = num
+            pack_command(buffer, ('select', num))
+        if self._rewrite_buffer is not None:
+            start = len(buffer)
+            pack_command(buffer, request)
+            if num != self._rewrite_db:
+                self._rewrite_db = num
+                pack_command(self._rewrite_buffer, ('select', num))
+            self._rewrite_buffer += buffer[start:]
+        else:
+            pack_command(buffer, request)
+        if self.fsync == 'always':
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon(self.flush)
+
+    def flush(self):
+        '''Write the buffer into the file
+        '''
+        self._scheduled = False
+        buffer = self._buffer
+        if buffer:
+            self._buffer = bytearray()
+            self._write(buffer)
+            if self.fsync == 'always':
+                os.fsync(self._fd)
+
+    def cron(self):
+        '''Periodic task invoked by the :class:`.Storage` cron
+        '''
+        if self._rewriter is not None:
+            if not self._rewriter.is_alive():
+                self._rewrite_done()
+        elif self.rewrite_size and self.size > max(self.rewrite_size,
+                                                   2*self.base_size):
+            self.rewrite()
+        if self.fsync == 'everysec' and not self._syncing:
+            now = time.time()
+            if now - self._last_fsync >= 1:
+                self._last_fsync = now
+                self._syncing = True
+                future = self._loop.run_in_executor(None, os.fsync, self._fd)
+                future.add_done_callback(self._synced)
+
+    def rewrite(self):
+        '''Start rewriting the file in a background process.
+
+        :return: ``False`` if a rewrite is already in progress
+        '''
+        if self._rewriter is not None:
+            return False
+        from multiprocessing import Process
+        store = self.store
+        self.flush()
+        offset = time.time() - self._loop.time()
+        self._rewrite_buffer = bytearray()
+        self._rewrite_db = None
+        self._rewriter = Process(target=rewrite_aof,
+                                 args=(self._temp_filename(), store._dbs(),
+                                       offset))
+        self._rewriter.start()
+        store.logger.info('Background append only file rewriting started')
+        return True
+
+    def close(self):
+        self.flush()
+        os.fsync(self._fd)
+        os.close(self._fd)
+
+    def info(self):
+        return {'aof_enabled': 1,
+                'aof_rewrite_in_progress': int(self.rewriting),
+                'aof_last_bgrewrite_status': self.last_rewrite_status,
+                'aof_current_size': self.size,
+                'aof_base_size': self.base_size,
+                'aof_buffer_length': len(self._buffer)}
+
+    #    INTERNALS
+    def _open(self):
+        self._fd = os.open(self.filename,
+                           os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.size = self.base_size = os.fstat(self._fd).st_size
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self.size += len(data)
+
+    def _synced(self, future):
+        self._syncing = False
+        exc = future.exception()
+        if exc:
+            self.store.logger.error('Could not sync append only file: %s',
+                                    exc)
+
+    def _temp_filename(self):
+        path, name = os.path.split(self.filename)
+        return os.path.join(path, 'temp-rewriteaof-%s' % name)
+
+    def _rewrite_done(self):
+        rewriter, self._rewriter = self._rewriter, None
+        buffer, self._rewrite_buffer = self._rewrite_buffer, None
+        temp = self._temp_filename()
+        logger = self.store.logger
+        if rewriter.exitcode:
+            self.last_rewrite_status = 'err'
+            logger.error('Background append only file rewriting failed')
+            if os.path.isfile(temp):
+                os.remove(temp)
+            return
+        self.flush()
+        fd = os.open(temp, os.O_WRONLY | os.O_APPEND)
+        try:
+            view = memoryview(buffer)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temp, self.filename)
+        os.close(self._fd)
+        self._open()
+        self.base_size = os.path.getsize(self.filename) - len(buffer)
+        self._db = self._rewrite_db
+        self.last_rewrite_status = 'ok'
+        logger.info('Background append only file rewriting terminated')
+
+
+class AofClient(ClientMixin):
+    '''A client replaying commands from an append only file
+    '''
+    def __init__(self, store):
+        super().__init__(store)
+        self._loop = store._loop
+        self.password = store._password
+        self.channels = ()
+        self.patterns = ()
+
+    def reply_ok(self):
+        pass
+
+    def reply_status(self, status):
+        pass
+
+    def reply_error(self, value, prefix=None):
+        pass
+
+    def reply_rejected(self, value, prefix):
+        pass
+
+    def reply_wrongtype(self):
+        pass
+
+    def reply_int(self, value):
+        pass
+
+    def reply_one(self):
+        pass
+
+    def reply_zero(self):
+        pass
+
+    def reply_bulk(self, value=None):
+        pass
+
+    def reply_multi_bulk(self, value):
+        pass
+
+    def reply_multi_bulk_len(self, len):
+        pass
+
+    def reply_queued(self):
+        pass
+
+
+def pack_command(buffer, request):
+    '''Append the redis protocol encoding of ``request`` to ``buffer``
+    '''
+    buffer += ('*%d\r\n' % len(request)).encode('utf-8')
+    for value in request:
+        if not isinstance(value, bytes):
+            value = str(value).encode('utf-8')
+        buffer += ('$%d\r\n' % len(value)).encode('utf-8')
+        buffer += value
+        buffer += b'\r\n'
+
+
+def read_commands(file):
+    '''Generator over the commands stored in an append only ``file``.
+
+    Yields ``request``, ``offset`` pairs where ``offset`` is the position
+    in the file after the ``request``. A truncated command at the end of
+    the file terminates the iteration.
+    '''
+    readline = file.readline
+    read = file.read
+    offset = file.tell()
+    while True:
+        line = readline()
+        if not line:
+            return
+        if line[:1] != b'*':
+            raise AofError('Bad file format reading the append only file')
+        if line[-2:] != b'\r\n':
+            return
+        size = len(line)
+        request = []
+        for _ in range(int(line[1:])):
+            line = readline()
+            if line[-2:] != b'\r\n':
+                return
+            if line[:1] != b'$':
+                raise AofError('Bad file format reading the append only '
+                               'file')
+            length = int(line[1:])
+            value = read(length + 2)
+            if len(value) < length + 2:
+                return
+            request.append(value[:-2])
+            size += len(line) + length + 2
+        offset += size
+        yield request, offset
+
+
+def rewrite_aof(filename, dbs, offset):
+    with open(filename, 'wb') as file:
+        write_snapshot(file, dbs, offset)
+        file.flush()
+        os.fsync(file.fileno())
@@ -0,0 +1,274 @@
+'''Bitmap operations for pulsar-ds.
+
+Strings are ``bytearray`` and their bits are numbered from the most
+significant bit of the first byte. Operations never loop over the bytes
+of a string in python:
+
+* ``BITOP`` converts its operands to integers with ``int.from_bytes`` and
+  combines them with the integer bitwise operators, ``NOT`` translates the
+  string with a table of inverted bytes.
+* ``BITCOUNT`` uses ``int.bit_count`` when available, python 3.10 and
+  above, otherwise it sums a ``bytes.translate`` of the range with a table
+  of bit counts.
+* ``BITPOS`` converts chunks of :data:`CHUNK_SIZE` bytes to integers and
+  returns as soon as a chunk contains the bit.
+* ``BITFIELD`` reads and writes the few bytes of each field.
+
+Ranges are taken from a ``memoryview`` of the string, without copying it.
+'''
+import operator
+from functools import reduce
+
+from .parser import CommandError
+
+
+# Number of bits set in each byte value
+POPCOUNT = bytes((bin(n).count('1') for n in range(256)))
+# Inverted bits of each byte value
+NOT = bytes((~n & 255 for n in range(256)))
+# Bytes converted to an integer at once when searching for a bit
+CHUNK_SIZE = 1 << 16
+OPERATORS = {b'and': operator.and_,
+             b'or': operator.or_,
+             b'xor': operator.xor}
+OVERFLOWS = (b'wrap', b'sat', b'fail')
+INVALID_TYPE = ('Invalid bitfield type. Use something like i16 u8. Note '
+                'that u64 is not supported but i64 is.')
+INVALID_OFFSET = 'bit offset is not an integer or out of range'
+INVALID_OVERFLOW = 'Invalid OVERFLOW type specified'
+
+
+if hasattr(int, 'bit_count'):   # pragma    nocover
+    def count_bits(data):
+        '''Number of bits set in the bytes-like ``data``
+        '''
+        return int.from_bytes(data, 'little').bit_count()
+
+    def count_int(value):
+        '''Number of bits set in the positive integer ``value``
+        '''
+        return value.bit_count()
+else:
+    def count_bits(data):
+        '''Number of bits set in the bytes-like ``data``
+        '''
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return sum(data.translate(POPCOUNT))
+
+    def count_int(value):
+        '''Number of bits set in the positive integer ``value``
+        '''
+        return count_bits(value.to_bytes((value.bit_length() + 7) >> 3,
+                                         'little'))
+
+
+def string_range(length, start, end):
+    '''Normalise the inclusive ``start``, ``end`` range of a sequence of
+    ``length`` elements, negative values count from the end.
+
+    :return: the ``start``, ``stop`` slice, empty when ``stop <= start``
+    '''
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    return start, min(end, length - 1) + 1
+
+
+def get_bits(string, start, stop):
+    '''The bits of ``string`` from ``start`` to ``stop``, excluded, as a
+    positive integer. Bits past the end of ``string`` are zero.
+    '''
+    first, last = start >> 3, (stop + 7) >> 3
+    data = memoryview(string)[first:last]
+    value = int.from_bytes(data, 'big') << ((last - first - len(data)) << 3)
+    return (value >> ((last << 3) - stop)) & ((1 << (stop - start)) - 1)
+
+
+def set_bits(string, start, stop, value):
+    '''Set the bits of ``string`` from ``start`` to ``stop``, excluded, to
+    the positive integer ``value``, growing ``string`` when needed.
+    '''
+    first, last = start >> 3, (stop + 7) >> 3
+    if last > len(string):
+        string.extend(bytes(last - len(string)))
+    shift = (last << 3) - stop
+    mask = ((1 << (stop - start)) - 1) << shift
+    current = int.from_bytes(memoryview(string)[first:last], 'big')
+    current = (current & ~mask) | ((value << shift) & mask)
+    string[first:last] = current.to_bytes(last - first, 'big')
+
+
+def bitcount(string, start=0, end=-1, bit=False):
+    '''Number of bits set in the range of bytes, or bits if ``bit`` is
+    true, from ``start`` to ``end`` included
+    '''
+    length = len(string) << 3 if bit else len(string)
+    start, stop = string_range(length, start, end)
+    if stop <= start:
+        return 0
+    elif bit:
+        # whole bytes of the range and the bits at its two ends
+        first, last = (start + 7) >> 3, stop >> 3
+        if last <= first:
+            return count_int(get_bits(string, start, stop))
+        return (count_bits(memoryview(string)[first:last]) +
+                count_int(get_bits(string, start, first << 3)) +
+                count_int(get_bits(string, last << 3, stop)))
+    elif stop - start == len(string):
+        return count_bits(string)
+    else:
+        return count_bits(memoryview(string)[start:stop])
+
+
+def bitpos(string, bit, start=0, end=None, unit_bit=False):
+    '''Position of the first ``bit`` (0 or 1) in the range of bytes, or
+    bits if ``unit_bit`` is true, from ``start`` to ``end`` included
+    '''
+    length = len(string) << 3 if unit_bit else len(string)
+    start, stop = string_range(length, start, -1 if end is None else end)
+    if not unit_bit:
+        start, stop = start << 3, stop << 3
+    chunk = CHUNK_SIZE << 3
+    for offset in range(start, stop, chunk):
+        limit = min(offset + chunk, stop)
+        value = get_bits(string, offset, limit)
+        if not bit:
+            value ^= (1 << (limit - offset)) - 1
+        if value:
+            return limit - value.bit_length()
+    # a clear bit is found past the end of a string if the range is open
+    if not bit and end is None and start < stop:
+        return stop
+    return -1
+
+
+def bitop(op, strings):
+    '''The result of the bitwise ``op``, ``b'and'``, ``b'or'``, ``b'xor'``
+    or ``b'not'``, of a list of ``strings``
+    '''
+    if op == b'not':
+        return bytearray(strings[0].translate(NOT))
+    size = max((len(string) for string in strings))
+    value = reduce(OPERATORS[op], (int.from_bytes(string, 'little')
+                                   for string in strings))
+    return bytearray(value.to_bytes(size, 'little'))
+
+
+class BitField:
+    '''A field of ``BITFIELD``, a signed or unsigned integer of ``bits``
+    bits starting at bit ``offset``
+    '''
+    __slots__ = ('signed', 'bits', 'offset')
+
+    def __init__(self, type, offset):
+        type = type.lower()
+        try:
+            self.signed = type[:1] == b'i'
+            self.bits = int(type[1:])
+            if (type[:1] not in b'iu' or self.bits < 1 or
+                    self.bits > (64 if self.signed else 63)):
+                raise ValueError
+        except ValueError:
+            raise CommandError(INVALID_TYPE)
+        try:
+            if offset[:1] == b'#':
+                offset = int(offset[1:])*self.bits
+            else:
+                offset = int(offset)
+            if offset < 0 or offset + self.bits > (1 << 32):
+                raise ValueError
+        except ValueError:
+            raise CommandError(INVALID_OFFSET)
+        self.offset = offset
+
+    def get(self, string):
+        value = get_bits(string, self.offset, self.offset + self.bits)
+        if self.signed and value >> (self.bits - 1):
+            value -= 1 << self.bits
+        return value
+
+    def set(self, string, value):
+        set_bits(string, self.offset, self.offset + self.bits, value)
+
+    def overflow(self, value, overflow):
+        '''Apply the ``overflow`` behaviour to ``value``, return ``None``
+        when the ``fail`` behaviour prevents the operation
+        '''
+        if self.signed:
+            low, high = -(1 << (self.bits - 1)), (1 << (self.bits - 1)) - 1
+        else:
+            low, high = 0, (1 << self.bits) - 1
+        if low <= value <= high:
+            return value
+        elif overflow == b'sat':
+            return low if value < low else high
+        elif overflow == b'fail':
+            return None
+        value &= (1 << self.bits) - 1
+        if self.signed and value > high:
+            value -= 1 << self.bits
+        return value
+
+
+def bitfield_operations(args, readonly=False):
+    '''Parse the arguments of ``BITFIELD`` into a list of
+    ``(operation, field, value, overflow)`` tuples
+    '''
+    operations = []
+    overflow = b'wrap'
+    while args:
+        name = args[0].lower()
+        if name == b'get' and len(args) > 2:
+            operations.append((name, BitField(args[1], args[2]), None,
+                               overflow))
+            args = args[3:]
+        elif name == b'overflow' and len(args) > 1:
+            overflow = args[1].lower()
+            if overflow not in OVERFLOWS:
+                raise CommandError(INVALID_OVERFLOW)
+            args = args[2:]
+        elif name in (b'set', b'incrby') and len(args) > 3:
+            if readonly:
+                raise CommandError('BITFIELD_RO only supports the GET '
+                                   'subcommand')
+            field = BitField(args[1], args[2])
+            try:
+                value = int(args[3])
+            except ValueError:
+                raise CommandError('value is not an integer or out of range')
+            operations.append((name, field, value, overflow))
+            args = args[4:]
+        else:
+            raise CommandError('Syntax error')
+    return operations
+
+
+def bitfield(string, operations):
+    '''Execute the ``BITFIELD`` ``operations`` on ``string``, which is
+    modified in place.
+
+    :return: the list of replies, ``None`` for failed operations
+    '''
+    # like redis, grow the string to the highest field written
+    size = max((field.offset + field.bits + 7 >> 3
+                for name, field, _, _ in operations if name != b'get'),
+               default=0)
+    if size > len(string):
+        string.extend(bytes(size - len(string)))
+    results = []
+    for name, field, value, overflow in operations:
+        if name == b'get':
+            results.append(field.get(string))
+            continue
+        current = field.get(string)
+        if name == b'incrby':
+            value = field.overflow(current + value, overflow)
+            results.append(value)
+        else:
+            value = field.overflow(value, overflow)
+            results.append(None if value is None else current)
+        if value is not None:
+            field.set(string, value)
+    return results
@@ -1,4 +1,5 @@
 import time
+from time import perf_counter
 from functools import partial
 
 import pulsar
@@ -9,6 +10,16 @@ from .parser import CommandError
 
 
 COMMANDS_INFO = OrderedDict()
+# Command groups with the key as first argument
+KEY_GROUPS = frozenset(('Keys', 'Strings', 'Hashes', 'Lists', 'Sets',
+                        'Sorted Sets', 'Streams'))
+# Write commands allowed when the used memory is above maxmemory
+NO_DENYOOM_COMMANDS = frozenset((
+    'del', 'expire', 'expireat', 'flushall', 'flushdb', 'hdel', 'lpop',
+    'lrem', 'ltrim', 'move', 'persist', 'pexpire', 'pexpireat', 'rpop',
+    'spop', 'srem', 'zrem', 'zremrangebyrank', 'zremrangebyscore'))
+# Bulk replies from this length are written apart from their header
+LARGE_BULK_SIZE = 16384
 
 
 def check_input(request, failed):
@@ -18,15 +29,24 @@ def check_input(request, failed):
 
 class command:
     '''Decorator for pulsar-ds server commands
+
+    ``keys`` is either a ``first, last, step`` triple giving the position
+    of keys in the request, where a negative ``last`` counts from the end
+    of the request, or a callable returning the keys of a request.
+    By default commands in :data:`KEY_GROUPS` have one key, the first
+    argument, while other commands have none.
     '''
     def __init__(self, group, write=False, name=None,
-                 script=1, supported=True, subcommands=None):
+                 script=1, supported=True, subcommands=None, keys=None):
         self.group = group
         self.write = write
         self.name = name
         self.script = script
         self.supported = supported
         self.subcommands = subcommands
+        if keys is None:
+            keys = (1, 1, 1) if group in KEY_GROUPS else (0, 0, 0)
+        self.keys = keys
 
     @property
     def url(self):
@@ -40,6 +60,32 @@ class command:
         f._info = self
         return f
 
+    def get_keys(self, request):
+        '''The keys accessed by ``request``
+        '''
+        if not isinstance(self.keys, tuple):
+            return self.keys(request)
+        first, last, step = self.keys
+        if not first:
+            return ()
+        if last < 0:
+            last += len(request)
+        return request[first:last+1:step]
+
+
+def command_table(store):
+    '''Dispatch table of the commands of ``store``.
+
+    It maps the lower and upper case bytes names of commands to their
+    name, bound method and :class:`command` info.
+    '''
+    table = {}
+    for name, info in COMMANDS_INFO.items():
+        entry = (name, getattr(store, info.method_name), info)
+        key = name.encode('utf-8')
+        table[key] = table[key.upper()] = entry
+    return table
+
 
 class ClientMixin(object):
 
@@ -50,6 +96,10 @@ class ClientMixin(object):
         self.last_command = ''
         self.flag = 0
         self.blocked = None
+        # database number and key pairs watched by the client
+        self.watched_keys = None
+        self.listening_port = 0
+        self.tracking = None
 
     @property
     def db(self):
@@ -60,19 +110,43 @@ class ClientMixin(object):
         '''
         handle = None
         if request:
-            request[0] = command = to_string(request[0]).lower()
-            info = COMMANDS_INFO.get(command)
-            if info:
-                handle = getattr(self.store, info.method_name)
+            commands = self.store._commands
+            entry = commands.get(request[0])
+            if entry is None:
+                command = to_string(request[0]).lower()
+                entry = commands.get(command.encode('utf-8'))
+            if entry is None:
+                request[0] = command
+                info = None
+            else:
+                request[0], handle, info = entry
+                command = request[0]
             #
             if self.channels or self.patterns:
                 if command not in self.store.SUBSCRIBE_COMMANDS:
                     return self.reply_error(self.store.PUBSUB_ONLY)
             if self.blocked:
                 return self.reply_error('Blocked client cannot request')
+            if (self.store._loading is not None and
+                    command not in self.store.LOADING_COMMANDS):
+                return self.reply_error(self.store.LOADING, 'LOADING')
+            if (info and info.write and self.store._readonly and
+                    not self.flag & self.store.MASTER):
+                return self._reject(self.store.READONLY, 'READONLY')
+            if (info and self.store._cluster is not None and
+                    not self.flag & self.store.MASTER):
+                error = self.store._cluster.redirect(info, request)
+                if error:
+                    return self._reject(error[1], error[0])
+            if (info and info.write and self.store._maxmemory and
+                    self.store._master is None and
+                    not self.flag & self.store.MASTER and
+                    command not in NO_DENYOOM_COMMANDS and
+                    not self.store._free_memory()):
+                return self._reject(self.store.OOM, 'OOM')
             if self.transaction is not None and command not in 'exec':
                 self.transaction.append((handle, request))
-                return self._transport.write(self.store.QUEUED)
+                return self.reply_queued()
         self._execute_command(handle, request)
 
     def _execute_command(self, handle, request):
@@ -86,7 +160,22 @@ class ClientMixin(object):
                     if command != 'auth':
                         return self.reply_error(
                             'Authentication required', 'NOAUTH')
-                handle(self, request, len(request) - 1)
+                store = self.store
+                start = perf_counter()
+                failed = True
+                try:
+                    handle(self, request, len(request) - 1)
+                    failed = False
+                finally:
+                    store._stats.call(self, request, perf_counter() - start,
+                                      failed)
+                info = handle._info
+                if info.write:
+                    if (store._aof is not None or
+                            store._replication is not None):
+                        store._propagate(self.db, request)
+                elif self.tracking is not None:
+                    store._tracking.track(self, info.get_keys(request))
             else:
                 command = ''
                 return self.reply_error("no command")
@@ -99,6 +188,13 @@ class ClientMixin(object):
         finally:
             self.last_command = command
 
+    def _reject(self, value, prefix):
+        # A request refused before being queued, the transaction in
+        # progress is aborted at EXEC
+        if self.transaction is not None:
+            self.flag |= self.store.DIRTY_EXEC
+        self.reply_rejected(value, prefix)
+
     def reply_ok(self):
         raise NotImplementedError
 
@@ -108,6 +204,11 @@ class ClientMixin(object):
     def reply_error(self, value, prefix=None):
         raise NotImplementedError
 
+    def reply_rejected(self, value, prefix):
+        '''Reply an error which is not queued in a transaction
+        '''
+        raise NotImplementedError
+
     def reply_wrongtype(self):
         raise NotImplementedError
 
@@ -129,6 +230,9 @@ class ClientMixin(object):
     def reply_multi_bulk_len(self, len):
         raise NotImplementedError
 
+    def reply_queued(self):
+        raise NotImplementedError
+
 
 class PulsarStoreClient(pulsar.Protocol, ClientMixin):
     '''Used both by client and server'''
@@ -136,13 +240,16 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
     def __init__(self, cfg, *args, **kw):
         super().__init__(*args, **kw)
         ClientMixin.__init__(self, self._producer._key_value_store)
+        self.store._last_client_id += 1
+        self.id = self.store._last_client_id
         self.cfg = cfg
         self.parser = self._producer._parser_class()
         self.started = time.time()
         self.channels = set()
         self.patterns = set()
-        self.watched_keys = None
         self.password = b''
+        # replies of the requests parsed by a data_received call
+        self._replies = None
         self.bind_event('connection_lost',
                         partial(self.store._remove_connection, self))
 
@@ -166,6 +273,9 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
         prefix = prefix or 'ERR'
         self._write(('-%s %s\r\n' % (prefix, value)).encode('utf-8'))
 
+    def reply_rejected(self, value, prefix):
+        self._send(('-%s %s\r\n' % (prefix, value)).encode('utf-8'))
+
     def reply_wrongtype(self):
         # Quick wrong type method
         self._write((b'-WRONGTYPE Operation against a key holding '
@@ -174,8 +284,17 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
     def reply_bulk(self, value=None):
         if value is None:
             self._write(self.store.NIL)
-        else:
+        elif len(value) < LARGE_BULK_SIZE or self.transaction is not None:
             self._write(self.store._parser.bulk(value))
+        else:
+            # write the value as it is, after the replies before it since
+            # the next requests can modify it
+            self._send(('$%d\r\n' % len(value)).encode('utf-8'))
+            self._flush()
+            if not self._transport._closing:
+                self._transport.write(value)
+                self.store._stats.net_output_bytes += len(value)
+            self._send(b'\r\n')
 
     def reply_multi_bulk(self, value=None):
         self._write(self.store._parser.multi_bulk(value))
@@ -183,22 +302,58 @@ class PulsarStoreClient(pulsar.Protocol, ClientMixin):
     def reply_multi_bulk_len(self, value):
         self._write(self.store._parser.multi_bulk_len(value))
 
+    def reply_queued(self):
+        self._send(self.store.QUEUED)
+
     # Protocol Implementaton
     def data_received(self, data):
-        self.parser.feed(data)
-        request = self.parser.get()
-        while request is not False:
-            if self.store._monitors:
-                self.store._write_to_monitors(self, request)
-            self.execute(request)
-            request = self.parser.get()
+        self.store._stats.net_input_bytes += len(data)
+        parser = self.parser
+        parser.feed(data)
+        request = parser.get()
+        if request is False:
+            return
+        store = self.store
+        execute = self.execute
+        self._replies = []
+        try:
+            while request is not False:
+                if store._monitors:
+                    store._write_to_monitors(self, request)
+                execute(request)
+                request = parser.get()
+        finally:
+            self._flush()
+            self._replies = None
+
+    def close(self):
+        self._flush()
+        super().close()
 
     # Internals
     def _write(self, response):
         if self.transaction is not None:
             self.transaction.append(response)
+        else:
+            self._send(response)
+
+    def _send(self, response):
+        # Write to the transport, or to the reply buffer while executing
+        # the requests of a data_received call
+        if self._replies is not None:
+            self._replies.append(response)
         elif not self._transport._closing:
             self._transport.write(response)
+            self.store._stats.net_output_bytes += len(response)
+
+    def _flush(self):
+        replies = self._replies
+        if replies:
+            self._replies = []
+            if not self._transport._closing:
+                data = b''.join(replies)
+                self._transport.write(data)
+                self.store._stats.net_output_bytes += len(data)
 
 
 class Blocked:
@@ -231,16 +386,15 @@ class Blocked:
             client.blocked = None
             store._bpop_blocked_clients -= 1
             #
-            # make sure to remove the client from the set of blocked
-            # clients in the database associated with key
-            if key is None:
-                bkeys = client.db._blocking_keys
-                for key in self.keys:
-                    clients = bkeys.get(key)
-                    if clients:
-                        clients.discard(client)
-                        if not clients:
-                            bkeys.pop(key)
+            # make sure to remove the client from the sets of blocked
+            # clients in the database associated with its keys
+            bkeys = client.db._blocking_keys
+            for bkey in self.keys:
+                clients = bkeys.get(bkey)
+                if clients:
+                    clients.discard(client)
+                    if not clients:
+                        bkeys.pop(bkey)
             #
             # send the response
             if value is None:
@@ -270,7 +424,7 @@ def _redis_to_py_pattern(pattern):
             esc = False
             yield v
         elif v == e:
-            clear, esc = True
+            clear, esc = True, True
             yield v
         elif clear:
             clear, esc = False, False
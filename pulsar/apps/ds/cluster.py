@@ -0,0 +1,139 @@
+'''Hash slot cluster mode for pulsar-ds.
+
+The keyspace is split into 16384 hash slots. The slot of a key is the
+CRC16 of the key modulo 16384; when the key contains a ``{...}`` hash tag
+only the tag is hashed, so that related keys can be forced into the same
+slot.
+
+In cluster mode each worker of a :class:`.PulsarDS` server is a node
+serving a contiguous range of slots. Every node listens on its own
+address, in addition to the shared server address, and replies to
+commands on keys it does not serve with a redirect::
+
+    -MOVED <slot> <host>:<port>
+
+Commands accessing several keys must have all keys in the same slot,
+otherwise they fail with a ``CROSSSLOT`` error.
+'''
+import os
+from bisect import bisect_right
+from binascii import crc_hqx
+from hashlib import sha1
+
+from pulsar.utils.pep import to_string
+
+
+SLOTS = 16384
+
+
+def hash_tag(key):
+    '''The part of ``key`` which is hashed, as bytes: the ``{...}`` hash
+    tag when ``key`` has a non empty one, otherwise the whole key
+    '''
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    start = key.find(b'{')
+    if start >= 0:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start+1:end]
+    return key
+
+
+def key_slot(key):
+    '''The hash slot of ``key``
+    '''
+    return crc_hqx(hash_tag(key), 0) & (SLOTS - 1)
+
+
+def slot_ranges(nodes):
+    '''Split the hash slots in ``nodes`` contiguous ranges
+    '''
+    return [(n*SLOTS//nodes, (n+1)*SLOTS//nodes - 1) for n in range(nodes)]
+
+
+class Cluster:
+    '''The cluster as seen by one of its nodes.
+
+    :param addresses: the list of node addresses
+    :param index: the index of this node in ``addresses``
+    '''
+    def __init__(self, addresses, index=0):
+        self.addresses = ['%s:%s' % tuple(address[:2])
+                          for address in addresses]
+        self.index = index
+        self.ranges = slot_ranges(len(addresses))
+        self.first, self.last = self.ranges[index]
+        self._starts = [first for first, _ in self.ranges]
+
+    def node(self, slot):
+        '''The index of the node serving ``slot``
+        '''
+        return bisect_right(self._starts, slot) - 1
+
+    def node_id(self, index):
+        return sha1(self.addresses[index].encode('utf-8')).hexdigest()
+
+    def serves(self, key):
+        '''Check if this node serves the slot of ``key``
+        '''
+        return self.first <= key_slot(key) <= self.last
+
+    def filename(self, filename):
+        '''The name of the data file ``filename`` of this node, suffixed
+        with the node index so that nodes do not share data files
+        '''
+        root, ext = os.path.splitext(filename)
+        return '%s-%d%s' % (root, self.index, ext)
+
+    def redirect(self, info, request):
+        '''Check if ``request`` can be served by this node.
+
+        :return: ``None`` or an error ``prefix``, ``message`` pair
+        '''
+        keys = info.get_keys(request)
+        if keys:
+            slot = key_slot(keys[0])
+            for key in keys[1:]:
+                if key_slot(key) != slot:
+                    return ('CROSSSLOT',
+                            "Keys in request don't hash to the same slot")
+            if not self.first <= slot <= self.last:
+                return 'MOVED', '%d %s' % (slot,
+                                           self.addresses[self.node(slot)])
+
+    def slots(self):
+        '''Reply of the CLUSTER SLOTS command
+        '''
+        slots = []
+        for (first, last), address in zip(self.ranges, self.addresses):
+            host, port = address.rsplit(':', 1)
+            slots.append((first, last, (host, int(port))))
+        return slots
+
+    def nodes(self):
+        '''Reply of the CLUSTER NODES command
+        '''
+        lines = []
+        for index, (first, last) in enumerate(self.ranges):
+            flags = 'myself,master' if index == self.index else 'master'
+            lines.append('%s %s %s - 0 0 %d connected %d-%d' %
+                         (self.node_id(index), self.addresses[index], flags,
+                          index, first, last))
+        return '\n'.join(lines)
+
+    def info(self):
+        return {'cluster_enabled': 1,
+                'cluster_state': 'ok',
+                'cluster_slots_assigned': SLOTS,
+                'cluster_known_nodes': len(self.addresses),
+                'cluster_size': len(self.addresses),
+                'cluster_my_slots': '%d-%d' % (self.first, self.last)}
+
+
+def parse_moved(message):
+    '''Parse the ``<slot> <host>:<port>`` message of a MOVED error
+    '''
+    slot, address = to_string(message).split()
+    host, port = address.rsplit(':', 1)
+    return int(slot), (host, int(port))
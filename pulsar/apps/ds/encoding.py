@@ -0,0 +1,423 @@
+'''Compact encodings of small collections for pulsar-ds.
+
+Small hashes and lists are stored as a :class:`PackedHash` or a
+:class:`PackedList`, a single ``bytes`` string where each element is
+prefixed by its length, similar to the redis listpack. Small sets of
+integers are stored as an :class:`IntSet`, a sorted array of 64 bits
+integers.
+
+Compact values avoid the cost of a Python object for each element and of
+the hash table, at the price of operations linear in the number of
+elements. They are converted to their full encoding, a
+:class:`~.scan.ScanDict`, a :class:`~.quicklist.QuickList` or a
+:class:`~.scan.ScanSet`, by
+:meth:`Compact.full` when their number of elements, or the length of an
+element, exceeds the limits of the storage. Full values are never
+converted back.
+'''
+from array import array
+from bisect import bisect_left
+from random import randrange
+from struct import Struct
+from itertools import islice
+
+from pulsar.utils.structures import Dict
+
+from .quicklist import QuickList
+from .scan import ScanDict, ScanSet
+
+
+# Prefix of elements longer than 254 bytes
+LONG = Struct('!BI')
+LONG_LENGTH = 255
+MIN_INT = -(1 << 63)
+MAX_INT = (1 << 63) - 1
+
+
+def pack(elements):
+    '''Pack ``elements``, a sequence of bytes, into a bytes string
+    '''
+    parts = []
+    for element in elements:
+        size = len(element)
+        if size < LONG_LENGTH:
+            parts.append(bytes((size,)))
+        else:
+            parts.append(LONG.pack(LONG_LENGTH, size))
+        parts.append(element)
+    return b''.join(parts)
+
+
+def unpack(data):
+    '''The list of elements packed by :func:`pack` into ``data``
+    '''
+    elements = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        size = data[pos]
+        if size == LONG_LENGTH:
+            size = LONG.unpack_from(data, pos)[1]
+            pos += LONG.size
+        else:
+            pos += 1
+        elements.append(data[pos:pos+size])
+        pos += size
+    return elements
+
+
+def as_integer(value):
+    '''The 64 bits integer represented by the bytes ``value``, ``None`` if
+    ``value`` is not the canonical representation of one
+    '''
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    if (MIN_INT <= number <= MAX_INT and
+            str(number).encode('utf-8') == value):
+        return number
+
+
+def to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, bytearray):
+        return bytes(value)
+    else:
+        # numbers stored by HINCRBY and HINCRBYFLOAT
+        return str(value).encode('utf-8')
+
+
+def full_encoding(value):
+    '''The encoding reported by OBJECT ENCODING for a non compact value
+    '''
+    if isinstance(value, bytearray):
+        if len(value) <= 20 and as_integer(bytes(value)) is not None:
+            return 'int'
+        return 'embstr' if len(value) <= 44 else 'raw'
+    elif isinstance(value, Dict):
+        return 'hashtable'
+    elif isinstance(value, QuickList):
+        return QuickList.encoding
+    elif isinstance(value, set):
+        return 'hashtable'
+    else:
+        return 'skiplist'
+
+
+class Compact:
+    '''Base class of compact values
+    '''
+    __slots__ = ()
+    encoding = None
+
+    def __bool__(self):
+        return bool(len(self))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._data == other._data
+
+    def nbytes(self):
+        '''Memory used by the elements
+        '''
+        raise NotImplementedError
+
+    def fits(self, elements, *limits):
+        '''Check if the value can store ``elements`` within ``limits``
+        '''
+        raise NotImplementedError
+
+    def full(self):
+        '''The value with its full encoding
+        '''
+        raise NotImplementedError
+
+
+class ListPack(Compact):
+    __slots__ = ('_data', '_size')
+    encoding = 'listpack'
+
+    def __init__(self, elements=None):
+        elements = list(elements) if elements else []
+        self._set(elements)
+
+    def __reduce__(self):
+        return self.__class__, (), (self._data, self._size)
+
+    def __setstate__(self, state):
+        self._data, self._size = state
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(unpack(self._data))
+
+    def nbytes(self):
+        return len(self._data)
+
+    def _set(self, elements):
+        self._data = pack(elements)
+        self._size = len(elements)
+
+
+class PackedHash(ListPack):
+    '''A small hash stored as packed fields and values
+    '''
+    __slots__ = ()
+
+    def __len__(self):
+        return self._size // 2
+
+    def __iter__(self):
+        return islice(unpack(self._data), 0, None, 2)
+
+    def __contains__(self, field):
+        return self._index(unpack(self._data), field) >= 0
+
+    def __getitem__(self, field):
+        elements = unpack(self._data)
+        index = self._index(elements, field)
+        if index < 0:
+            raise KeyError(field)
+        return elements[index+1]
+
+    def __setitem__(self, field, value):
+        elements = unpack(self._data)
+        index = self._index(elements, field)
+        if index < 0:
+            elements.append(field)
+            elements.append(to_bytes(value))
+        else:
+            elements[index+1] = to_bytes(value)
+        self._set(elements)
+
+    def get(self, field, default=None):
+        elements = unpack(self._data)
+        index = self._index(elements, field)
+        return default if index < 0 else elements[index+1]
+
+    def pop(self, field, default=None):
+        elements = unpack(self._data)
+        index = self._index(elements, field)
+        if index < 0:
+            return default
+        value = elements[index+1]
+        del elements[index:index+2]
+        self._set(elements)
+        return value
+
+    def update(self, pairs):
+        items = Dict(zip(*[iter(unpack(self._data))]*2))
+        items.update(((field, to_bytes(value)) for field, value in pairs))
+        self._set(items.flat())
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return unpack(self._data)[1::2]
+
+    def items(self):
+        elements = unpack(self._data)
+        return list(zip(elements[::2], elements[1::2]))
+
+    def mget(self, fields):
+        items = dict(self.items())
+        return [items.get(f) for f in fields]
+
+    def flat(self):
+        return unpack(self._data)
+
+    def fits(self, elements, entries, size):
+        '''``elements`` is a sequence of fields and values
+        '''
+        fields = elements[::2]
+        if len(fields) > entries:
+            return False
+        current = set(self)
+        new = set(fields).difference(current)
+        return (len(current) + len(new) <= entries and
+                all(len(to_bytes(e)) <= size for e in elements))
+
+    def full(self):
+        return ScanDict(self.items())
+
+    def _index(self, elements, field):
+        # index of field in elements, -1 if not available
+        for index in range(0, len(elements), 2):
+            if elements[index] == field:
+                return index
+        return -1
+
+
+class PackedList(ListPack):
+    '''A small list stored as packed elements
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, index):
+        return unpack(self._data)[index]
+
+    def __setitem__(self, index, value):
+        elements = unpack(self._data)
+        elements[index] = value
+        self._set(elements)
+
+    def append(self, value):
+        self._set(unpack(self._data) + [value])
+
+    def appendleft(self, value):
+        self._set([value] + unpack(self._data))
+
+    def extend(self, values):
+        self._set(unpack(self._data) + list(values))
+
+    def extendleft(self, values):
+        # as deque.extendleft, elements are inserted in reversed order
+        self._set(list(reversed(values)) + unpack(self._data))
+
+    def pop(self):
+        elements = unpack(self._data)
+        value = elements.pop()
+        self._set(elements)
+        return value
+
+    def popleft(self):
+        elements = unpack(self._data)
+        value = elements.pop(0)
+        self._set(elements)
+        return value
+
+    def insert_before(self, pivot, value):
+        self._insert(pivot, value, 0)
+
+    def insert_after(self, pivot, value):
+        self._insert(pivot, value, 1)
+
+    def remove(self, elem, count=1):
+        elements = unpack(self._data)
+        if count < 0:
+            elements.reverse()
+        kept = []
+        removed = 0
+        for element in elements:
+            if element == elem and (not count or removed < abs(count)):
+                removed += 1
+            else:
+                kept.append(element)
+        if removed:
+            if count < 0:
+                kept.reverse()
+            self._set(kept)
+        return removed
+
+    def trim(self, start, end):
+        self._set(unpack(self._data)[start:end])
+
+    def fits(self, elements, entries, size):
+        return (self._size + len(elements) <= entries and
+                all(len(e) <= size for e in elements))
+
+    def full(self):
+        return QuickList(unpack(self._data))
+
+    def _insert(self, pivot, value, offset):
+        elements = unpack(self._data)
+        try:
+            index = elements.index(pivot)
+        except ValueError:
+            pass
+        else:
+            elements.insert(index + offset, value)
+            self._set(elements)
+
+
+class IntSet(Compact):
+    '''A small set of integers stored in a sorted array
+    '''
+    __slots__ = ('_data',)
+    encoding = 'intset'
+
+    def __init__(self, members=None):
+        self._data = array('q')
+        if members:
+            self.update(members)
+
+    def __reduce__(self):
+        return self.__class__, (), self._data.tobytes()
+
+    def __setstate__(self, state):
+        self._data = array('q')
+        self._data.frombytes(state)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return (str(n).encode('utf-8') for n in self._data)
+
+    def __contains__(self, member):
+        return self._index(as_integer(member)) >= 0
+
+    def add(self, member):
+        number = as_integer(member)
+        if number is None:
+            raise ValueError('intset members are integers')
+        data = self._data
+        index = bisect_left(data, number)
+        if index == len(data) or data[index] != number:
+            data.insert(index, number)
+
+    def update(self, members):
+        for member in members:
+            self.add(member)
+
+    def discard(self, member):
+        index = self._index(as_integer(member))
+        if index >= 0:
+            del self._data[index]
+
+    def remove(self, member):
+        index = self._index(as_integer(member))
+        if index < 0:
+            raise KeyError(member)
+        del self._data[index]
+
+    def difference_update(self, members):
+        for member in members:
+            self.discard(member)
+
+    def pop(self):
+        '''Remove and return a random member
+        '''
+        if not self._data:
+            raise KeyError('pop from an empty set')
+        return str(self._data.pop(randrange(len(self._data)))).encode(
+            'utf-8')
+
+    def nbytes(self):
+        return self._data.itemsize*len(self._data)
+
+    def fits(self, members, entries):
+        size = len(self._data)
+        for member in set(members):
+            number = as_integer(member)
+            if number is None:
+                return False
+            if self._index(number) < 0:
+                size += 1
+        return size <= entries
+
+    def full(self):
+        return ScanSet(self)
+
+    def _index(self, number):
+        # index of number in the array, -1 if not available
+        if number is not None:
+            data = self._data
+            index = bisect_left(data, number)
+            if index < len(data) and data[index] == number:
+                return index
+        return -1
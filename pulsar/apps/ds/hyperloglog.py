@@ -0,0 +1,334 @@
+'''HyperLogLog cardinality estimation for pulsar-ds.
+
+A :class:`HyperLogLog` estimates the number of distinct elements added to
+it with a standard error of 0.81%, using :data:`REGISTERS` registers of 6
+bits as redis does. Elements are hashed with the first 64 bits of their
+``md5`` digest: the first :data:`P` bits select a register, which keeps
+the longest run of trailing zeros, plus one, seen in the remaining bits.
+
+Two encodings are used:
+
+* ``sparse``, a sorted ``array`` of the registers which are not zero, each
+  entry packing the index of the register and its value. Small counters
+  take a few bytes.
+* ``dense``, all the registers packed in a ``bytearray`` of 12KB with the
+  layout used by redis.
+
+A sparse value is converted to dense when its size exceeds the
+``hll-sparse-max-bytes`` parameter, and never converted back. The
+cardinality is computed with the histogram based estimator of Otmar Ertl,
+also used by redis, and cached until the registers change. Dense
+registers are unpacked, merged and packed with ``bytes.translate`` and
+integer operations over whole arrays, not with a loop over the registers.
+'''
+from array import array
+from bisect import bisect_left
+from hashlib import md5
+from math import log, sqrt
+from struct import Struct
+
+from .encoding import Compact
+
+
+# Bits of the hash selecting the register
+P = 14
+REGISTERS = 1 << P
+# Bits of the hash counting trailing zeros
+Q = 64 - P
+# Bytes of the packed registers, followed by a padding byte
+DENSE_SIZE = (REGISTERS*6 + 7) >> 3
+ALPHA_INF = 0.5/log(2)
+# Header of the serialised value
+HEADER = Struct('!4sB')
+MAGIC = b'HYLL'
+DENSE = 0
+SPARSE = 1
+SPARSE_ENTRY_SIZE = array('I').itemsize
+# The high bit of each register unpacked into a byte
+HIGH_BITS = int.from_bytes(b'\x80'*REGISTERS, 'little')
+
+
+def _table(operation):
+    return bytes((operation(n) & 255 for n in range(256)))
+
+
+LOW2_SHL4 = _table(lambda n: (n & 3) << 4)
+LOW2_SHL6 = _table(lambda n: n << 6)
+LOW4_SHL2 = _table(lambda n: (n & 15) << 2)
+LOW4_SHL4 = _table(lambda n: n << 4)
+LOW6 = _table(lambda n: n & 63)
+SHL2 = _table(lambda n: n << 2)
+SHR2 = _table(lambda n: n >> 2)
+SHR4 = _table(lambda n: n >> 4)
+SHR6 = _table(lambda n: n >> 6)
+
+
+def hash_element(element):
+    '''The index of the register of ``element`` and its run of zeros
+    '''
+    value = int.from_bytes(md5(element).digest()[:8], 'little')
+    bits = (value >> P) | (1 << Q)
+    return value & (REGISTERS - 1), (bits & -bits).bit_length()
+
+
+def _or(a, b):
+    return (int.from_bytes(a, 'little') |
+            int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+def unpack_registers(data):
+    '''The dense registers packed in ``data``, one register per byte
+    '''
+    b0 = data[0:DENSE_SIZE:3]
+    b1 = data[1:DENSE_SIZE:3]
+    b2 = data[2:DENSE_SIZE:3]
+    registers = bytearray(REGISTERS)
+    registers[0::4] = b0.translate(LOW6)
+    registers[1::4] = _or(b0.translate(SHR6), b1.translate(LOW4_SHL2))
+    registers[2::4] = _or(b1.translate(SHR4), b2.translate(LOW2_SHL4))
+    registers[3::4] = b2.translate(SHR2)
+    return registers
+
+
+def pack_registers(registers):
+    '''Pack ``registers``, one register per byte, into dense registers
+    '''
+    r0 = registers[0::4]
+    r1 = registers[1::4]
+    r2 = registers[2::4]
+    r3 = registers[3::4]
+    data = bytearray(DENSE_SIZE + 1)
+    data[0:DENSE_SIZE:3] = _or(r0, r1.translate(LOW2_SHL6))
+    data[1:DENSE_SIZE:3] = _or(r1.translate(SHR2), r2.translate(LOW4_SHL4))
+    data[2:DENSE_SIZE:3] = _or(r2.translate(SHR4), r3.translate(SHL2))
+    return data
+
+
+def max_registers(a, b):
+    '''The maximum of registers ``a`` and ``b``, one register per byte
+    '''
+    x = int.from_bytes(a, 'little')
+    y = int.from_bytes(b, 'little')
+    # the high bit of a byte is set where x >= y, registers are below 64
+    mask = ((((x | HIGH_BITS) - y) & HIGH_BITS) >> 7)*255
+    return ((x & mask) | (y & ~mask)).to_bytes(REGISTERS, 'little')
+
+
+def estimate(histogram):
+    '''Estimate the cardinality from the ``histogram`` of register values
+    '''
+    m = REGISTERS
+    z = m*_tau((m - histogram[Q + 1])/m)
+    for k in range(Q, 0, -1):
+        z = 0.5*(z + histogram[k])
+    z += m*_sigma(histogram[0]/m)
+    return int(round(ALPHA_INF*m*m/z))
+
+
+def _sigma(x):
+    if x == 1:
+        return float('inf')
+    y = 1
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x*y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x)**2*y
+        if z == previous:
+            return z/3
+
+
+class HyperLogLog(Compact):
+    '''A HyperLogLog with the sparse or the dense encoding
+    '''
+    __slots__ = ('_data', '_sparse', '_card')
+
+    def __init__(self):
+        self._data = array('I')
+        self._sparse = True
+        self._card = None
+
+    def __reduce__(self):
+        return self.__class__, (), self.dumps()
+
+    def __setstate__(self, state):
+        encoding = HEADER.unpack_from(state)[1]
+        data = state[HEADER.size:]
+        if encoding == SPARSE:
+            self._data = array('I')
+            self._data.frombytes(data)
+        else:
+            self._data = bytearray(data)
+            self._sparse = False
+
+    def __bool__(self):
+        return True
+
+    @property
+    def encoding(self):
+        return 'sparse' if self._sparse else 'dense'
+
+    def add(self, elements, sparse_max_bytes):
+        '''Add ``elements`` and return ``True`` if a register was changed
+        '''
+        changed = False
+        elements = iter(elements)
+        for element in elements:
+            if self.add_register(*hash_element(element)):
+                changed = True
+                if len(self._data)*SPARSE_ENTRY_SIZE > sparse_max_bytes:
+                    self.full()
+            if not self._sparse:
+                break
+        if self._sparse:
+            return changed
+        # dense registers, the loop of _set_dense inlined
+        data = self._data
+        from_bytes = int.from_bytes
+        mask = REGISTERS - 1
+        sentinel = 1 << Q
+        for element in elements:
+            value = from_bytes(md5(element).digest()[:8], 'little')
+            bits = (value >> P) | sentinel
+            count = (bits & -bits).bit_length()
+            pos = (value & mask)*6
+            byte = pos >> 3
+            shift = pos & 7
+            word = data[byte] | (data[byte + 1] << 8)
+            if (word >> shift) & 63 < count:
+                word = (word & ~(63 << shift)) | (count << shift)
+                data[byte] = word & 255
+                data[byte + 1] = word >> 8
+                changed = True
+        if changed:
+            self._card = None
+        return changed
+
+    def merge(self, other, sparse_max_bytes):
+        '''Merge the registers of ``other`` into this HyperLogLog
+        '''
+        if other._sparse:
+            for entry in other._data:
+                self.add_register(entry >> 6, entry & 63)
+            if (self._sparse and
+                    len(self._data)*SPARSE_ENTRY_SIZE > sparse_max_bytes):
+                self.full()
+        else:
+            self._data = pack_registers(max_registers(self.registers(),
+                                                      other.registers()))
+            self._sparse = False
+            self._card = None
+
+    def add_register(self, index, count):
+        '''Set the register ``index`` to ``count`` if it is smaller and
+        return ``True`` if it was changed
+        '''
+        if self._sparse:
+            changed = self._set_sparse(index, count)
+        else:
+            changed = self._set_dense(index, count)
+        if changed:
+            self._card = None
+        return changed
+
+    def count(self):
+        '''The estimated number of distinct elements
+        '''
+        if self._card is None:
+            self._card = estimate(self.histogram())
+        return self._card
+
+    def histogram(self):
+        '''The number of registers of each value
+        '''
+        if self._sparse:
+            histogram = [0]*(Q + 2)
+            histogram[0] = REGISTERS - len(self._data)
+            for entry in self._data:
+                histogram[entry & 63] += 1
+            return histogram
+        registers = self.registers()
+        return [registers.count(n) for n in range(Q + 2)]
+
+    def registers(self):
+        '''All the registers, one register per byte
+        '''
+        if self._sparse:
+            registers = bytearray(REGISTERS)
+            for entry in self._data:
+                registers[entry >> 6] = entry & 63
+            return registers
+        return unpack_registers(self._data)
+
+    def nbytes(self):
+        if self._sparse:
+            return SPARSE_ENTRY_SIZE*len(self._data)
+        return len(self._data)
+
+    def full(self):
+        '''Convert to the dense encoding
+        '''
+        if self._sparse:
+            self._data = pack_registers(self.registers())
+            self._sparse = False
+        return self
+
+    def dumps(self):
+        '''Serialise as bytes
+        '''
+        if self._sparse:
+            return HEADER.pack(MAGIC, SPARSE) + self._data.tobytes()
+        return HEADER.pack(MAGIC, DENSE) + self._data
+
+    @classmethod
+    def loads(cls, data):
+        '''Load a HyperLogLog serialised by :meth:`dumps`
+        '''
+        magic, _ = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('Not a HyperLogLog')
+        value = cls()
+        value.__setstate__(bytes(data))
+        return value
+
+    def _set_sparse(self, index, count):
+        # set a register of the sparse array, return True if changed
+        data = self._data
+        entry = (index << 6) | count
+        pos = bisect_left(data, index << 6)
+        if pos < len(data) and data[pos] >> 6 == index:
+            if data[pos] & 63 >= count:
+                return False
+            data[pos] = entry
+        else:
+            data.insert(pos, entry)
+        return True
+
+    def _set_dense(self, index, count):
+        # set a register of the dense array, return True if changed
+        data = self._data
+        pos = index*6
+        byte = pos >> 3
+        shift = pos & 7
+        word = data[byte] | (data[byte + 1] << 8)
+        if (word >> shift) & 63 >= count:
+            return False
+        word = (word & ~(63 << shift)) | (count << shift)
+        data[byte] = word & 255
+        data[byte + 1] = word >> 8
+        return True
@@ -0,0 +1,133 @@
+'''Incremental iteration for the SCAN family of commands.
+
+Python dictionaries do not expose their hash table, therefore the keys of a
+database are also indexed in :data:`BUCKETS` buckets, by the CRC32 of the
+key. The cursor of ``SCAN`` is the bucket where the iteration resumes: a
+key is always in the same bucket, so every key present from the start to
+the end of a full iteration is returned at least once, whatever the changes
+to the keyspace in between. Each call only visits the buckets needed to
+collect ``COUNT`` keys.
+
+The members of hashes, sets and sorted sets are indexed in a similar way,
+see :mod:`~pulsar.apps.ds.scan`.
+'''
+from bisect import bisect_left, insort
+from binascii import crc32
+
+from .memory import key_size
+
+
+BUCKETS = 1 << 16
+
+
+def key_bucket(key):
+    '''The keyspace bucket of ``key``
+    '''
+    return crc32(key) & (BUCKETS - 1)
+
+
+class KeySpace(dict):
+    '''The dictionary of keys and values of a database.
+
+    Keeps the keys in buckets for :meth:`scan` together with the estimated
+    memory used by each key and the key access data used for eviction,
+    see :mod:`~pulsar.apps.ds.memory`.
+
+    The memory is updated by :meth:`resize`, called after the value of a
+    key is changed.
+
+    .. attribute:: memory
+
+        Estimated memory, in bytes, used by the keys and values
+    '''
+    __slots__ = ('_buckets', '_bucket_ids', '_sizes', '_access', 'memory')
+
+    def __init__(self, data=None):
+        super().__init__()
+        self._buckets = {}
+        # sorted list of buckets
+        self._bucket_ids = []
+        self._sizes = {}
+        self._access = {}
+        self.memory = 0
+        if data:
+            self.update(data)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._index(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._unindex(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._unindex(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._unindex(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+            self.resize(key)
+
+    def clear(self):
+        dict.clear(self)
+        self._buckets.clear()
+        del self._bucket_ids[:]
+        self._sizes.clear()
+        self._access.clear()
+        self.memory = 0
+
+    def resize(self, key):
+        '''Update the memory used by ``key`` after a change of its value
+        '''
+        size = key_size(key, dict.__getitem__(self, key))
+        self.memory += size - self._sizes.get(key, 0)
+        self._sizes[key] = size
+
+    def scan(self, cursor, count):
+        '''Keys in the buckets from ``cursor``, at least ``count`` of them
+        unless the iteration is over.
+
+        :return: a two-elements tuple with the cursor of the next call,
+            0 when the iteration is over, and the list of keys
+        '''
+        buckets = self._buckets
+        ids = self._bucket_ids
+        index = bisect_left(ids, cursor)
+        keys = []
+        while index < len(ids) and len(keys) < count:
+            keys.extend(buckets[ids[index]])
+            index += 1
+        return (ids[index] if index < len(ids) else 0), keys
+
+    #    INTERNALS
+    def _index(self, key):
+        bucket_id = key_bucket(key)
+        bucket = self._buckets.get(bucket_id)
+        if bucket is None:
+            self._buckets[bucket_id] = bucket = set()
+            insort(self._bucket_ids, bucket_id)
+        bucket.add(key)
+
+    def _unindex(self, key):
+        self.memory -= self._sizes.pop(key, 0)
+        self._access.pop(key, None)
+        bucket_id = key_bucket(key)
+        # empty buckets are kept, there are at most BUCKETS of them
+        self._buckets[bucket_id].discard(key)
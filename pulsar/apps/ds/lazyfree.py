@@ -0,0 +1,129 @@
+'''Lazy freeing of values for pulsar-ds.
+
+Freeing a large collection in python means decrementing the reference
+count of each of its elements, in the single call which drops the last
+reference to the collection. Deleting a set of millions of members or
+flushing a large database would block the event loop for seconds.
+
+``UNLINK``, ``FLUSHDB ASYNC`` and ``FLUSHALL ASYNC`` detach values from the
+keyspace immediately and hand them to :class:`LazyFree`, which empties
+them in steps of at most :data:`LAZYFREE_STEP_TIME` seconds run by the
+event loop. Values with less than :data:`LAZYFREE_THRESHOLD` elements are
+freed at once, as redis does.
+
+A background thread would not help: it needs the GIL to free the
+elements, so it would block the event loop as much as freeing in place.
+'''
+from collections import deque
+from time import perf_counter
+
+from pulsar.utils.structures import Zset
+
+from .keyspace import KeySpace
+from .quicklist import QuickList
+from .scan import ScanDict, ScanSet
+
+
+# Number of elements from which values are freed lazily
+LAZYFREE_THRESHOLD = 64
+# Elements freed between two checks of the step time
+LAZYFREE_SLICE = 256
+# Maximum duration, in seconds, of a step
+LAZYFREE_STEP_TIME = 0.002
+# Blocks of elements in the containers of values
+BLOCKS = (list, set)
+
+
+def free_effort(value):
+    '''The number of elements freed with ``value``
+    '''
+    if isinstance(value, (dict, set, list, deque, QuickList, Zset)):
+        return len(value)
+    return 1
+
+
+def containers(value):
+    '''The containers to empty to free ``value``, emptied from the last
+    '''
+    if isinstance(value, KeySpace):
+        return [value._access, value._sizes, value._buckets, value]
+    elif isinstance(value, (ScanDict, ScanSet)):
+        index = value._index
+        return [value, index._starts, index._buckets]
+    elif isinstance(value, Zset):
+        return [value._scores, value._members] + containers(value._dict)
+    return [value]
+
+
+class LazyFree:
+    '''Free values in steps of the event loop
+
+    .. attribute:: pending
+
+        Number of values waiting to be freed
+
+    .. attribute:: freed
+
+        Number of values freed lazily
+    '''
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = deque()
+        self._handle = None
+        self.pending = 0
+        self.freed = 0
+
+    def free(self, value):
+        '''Free ``value``, lazily if it is large
+        '''
+        if free_effort(value) > LAZYFREE_THRESHOLD:
+            self._queue.append(containers(value))
+            self.pending += 1
+            if self._handle is None:
+                self._handle = self._loop.call_soon(self._step)
+
+    def step(self):
+        '''Free values for at most :data:`LAZYFREE_STEP_TIME` seconds.
+
+        :return: ``True`` when there are no more values to free
+        '''
+        queue = self._queue
+        deadline = perf_counter() + LAZYFREE_STEP_TIME
+        while queue:
+            values = queue[0]
+            if self._drain(values[-1]):
+                values.pop()
+                if not values:
+                    queue.popleft()
+                    self.pending -= 1
+                    self.freed += 1
+            if perf_counter() >= deadline:
+                break
+        return not queue
+
+    def _step(self):
+        self._handle = None
+        if not self.step():
+            self._handle = self._loop.call_soon(self._step)
+
+    def _drain(self, container):
+        # Remove about LAZYFREE_SLICE elements from container and return
+        # True when it is empty. Large values of dictionaries are queued,
+        # blocks of elements, as the blocks of zsets, count for their
+        # elements.
+        freed = 0
+        if isinstance(container, dict):
+            popitem = dict.popitem
+            free = self.free
+            while container and freed < LAZYFREE_SLICE:
+                value = popitem(container)[1]
+                effort = free_effort(value)
+                freed += effort if effort <= LAZYFREE_THRESHOLD else 1
+                free(value)
+        else:
+            pop = (set.pop if isinstance(container, set) else
+                   type(container).pop)
+            while container and freed < LAZYFREE_SLICE:
+                element = pop(container)
+                freed += len(element) if type(element) in BLOCKS else 1
+        return not container
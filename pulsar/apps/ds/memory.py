@@ -0,0 +1,192 @@
+'''Memory accounting and eviction for pulsar-ds.
+
+The memory used by a key is estimated from the length of the key and of
+its value. For collections the size of the elements is estimated from a
+sample of :data:`SIZE_SAMPLES` elements, so that the estimate does not
+depend on the size of the collection. The estimate is updated every time
+a command modifies the key.
+
+When ``key_value_maxmemory`` is set and the used memory is above it, write
+commands evict keys before executing, according to the
+``key_value_maxmemory_policy``:
+
+* ``noeviction`` reply with an ``OOM`` error
+* ``allkeys-lru`` evict the least recently used keys
+* ``allkeys-lfu`` evict the least frequently used keys
+* ``volatile-lru`` evict the least recently used keys with an expire
+* ``volatile-ttl`` evict the keys with an expire and the shortest time
+  to live
+
+As in redis, eviction is approximated: each eviction samples
+``key_value_maxmemory_samples`` keys of each database and evicts the best
+candidate among them.
+
+The access time of a key, in seconds, or its access frequency, with the
+logarithmic counter used by redis, is stored in a dictionary of integers,
+one for each database.
+'''
+from itertools import islice
+from random import random, randrange
+
+from pulsar.utils.structures import Dict, Zset
+
+from .encoding import Compact
+from .quicklist import QuickList
+from .scan import ScanDict, ScanSet, ScanZset
+from .stream import Stream
+
+
+POLICIES = ('noeviction', 'allkeys-lru', 'allkeys-lfu', 'volatile-lru',
+            'volatile-ttl')
+# Estimated memory used by a key besides its length
+KEY_OVERHEAD = 160
+# Estimated memory used by a value besides its elements
+VALUE_OVERHEAD = 64
+# Estimated memory used by an element of a collection besides its length
+ELEMENT_OVERHEAD = {set: 64, Dict: 110, QuickList: 40, Zset: 100,
+                    ScanSet: 100, ScanDict: 146, ScanZset: 136}
+# Estimated memory used by a number stored in a hash
+NUMBER_SIZE = 24
+# Number of elements sampled to estimate the size of a collection
+SIZE_SAMPLES = 5
+# Initial value and maximum of the LFU counter
+LFU_INIT_VAL = 5
+LFU_MAX = 255
+# Probability factor of the LFU counter increment
+LFU_LOG_FACTOR = 10
+# Minutes after which the LFU counter is decremented
+LFU_DECAY_TIME = 1
+# Number of keyspace buckets visited when sampling keys, more are visited
+# until a key is found
+SAMPLE_BUCKETS = 64
+
+
+def key_size(key, value):
+    '''Estimated memory used by ``key`` and its ``value``
+    '''
+    size = KEY_OVERHEAD + len(key) + VALUE_OVERHEAD
+    if isinstance(value, bytearray):
+        return size + len(value)
+    elif isinstance(value, (Compact, Stream)):
+        return size + value.nbytes()
+    length = len(value)
+    if not length:
+        return size
+    elements = 0
+    if isinstance(value, Dict):
+        for field, val in islice(value.items(), SIZE_SAMPLES):
+            elements += element_size(field) + element_size(val)
+    else:
+        for member in islice(value, SIZE_SAMPLES):
+            elements += element_size(member)
+    sampled = min(length, SIZE_SAMPLES)
+    return size + length*(ELEMENT_OVERHEAD.get(type(value), 64) +
+                          elements//sampled)
+
+
+def element_size(element):
+    try:
+        return len(element)
+    except TypeError:
+        # numbers stored by HINCRBY and HINCRBYFLOAT
+        return NUMBER_SIZE
+
+
+def lfu_touch(access, minutes):
+    '''Update the LFU ``access`` value of a key accessed at ``minutes``.
+
+    The value packs the access time, in minutes, and an 8 bits
+    logarithmic counter
+    '''
+    if access is None:
+        counter = LFU_INIT_VAL
+    else:
+        counter = lfu_counter(access, minutes)
+        if counter < LFU_MAX:
+            base = max(counter - LFU_INIT_VAL, 0)
+            if random() < 1.0/(base*LFU_LOG_FACTOR + 1):
+                counter += 1
+    return (minutes << 8) | counter
+
+
+def lfu_counter(access, minutes):
+    '''The LFU counter of ``access`` decayed at ``minutes``
+    '''
+    elapsed = minutes - (access >> 8)
+    return max((access & 255) - elapsed//LFU_DECAY_TIME, 0)
+
+
+def human_size(size):
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            break
+        size /= 1024
+    return '%.2f%s' % (size, unit) if unit != 'B' else '%dB' % size
+
+
+def used_memory(store):
+    return sum(db._data.memory for db in store.databases.values())
+
+
+def sample_keys(db, volatile, samples):
+    '''Sample keys of ``db``, only keys with an expire if ``volatile``.
+
+    Starts from a random keyspace bucket and visits the following ones,
+    wrapping around, until :data:`SAMPLE_BUCKETS` buckets are visited and
+    keys are found. Emptied buckets are kept by the keyspace, so that all
+    of them may be visited after mass deletions.
+    '''
+    data = db._data
+    ids = data._bucket_ids
+    expires = db._expires
+    if not ids or (volatile and not expires):
+        return []
+    buckets = data._buckets
+    keys = []
+    index = randrange(len(ids))
+    for visited in range(len(ids)):
+        if keys and visited >= SAMPLE_BUCKETS:
+            break
+        for key in buckets[ids[index]]:
+            if not volatile or key in expires:
+                keys.append(key)
+                if len(keys) == samples:
+                    return keys
+        index = (index + 1) % len(ids)
+    return keys
+
+
+def evict(store):
+    '''Evict keys until the memory used by ``store`` is below the limit.
+
+    :return: ``True`` if the used memory is below the limit
+    '''
+    maxmemory = store._maxmemory
+    used = used_memory(store)
+    policy = store._maxmemory_policy
+    if used <= maxmemory:
+        return True
+    elif policy == 'noeviction':
+        return False
+    volatile = policy.startswith('volatile')
+    clock = store._lru_clock
+    while used > maxmemory:
+        best = None
+        for db in store.databases.values():
+            access = db._data._access
+            for key in sample_keys(db, volatile, store._maxmemory_samples):
+                if policy == 'volatile-ttl':
+                    score = -db._expires[key]
+                elif policy == 'allkeys-lfu':
+                    score = -lfu_counter(access.get(key, LFU_INIT_VAL),
+                                         clock//60)
+                else:
+                    score = clock - access.get(key, 0)
+                if best is None or score > best[0]:
+                    best = (score, db, key)
+        if best is None:
+            return False
+        _, db, key = best
+        used -= db._data._sizes.get(key, 0)
+        store._evict(db, key)
+    return True
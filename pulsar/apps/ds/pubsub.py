@@ -0,0 +1,137 @@
+'''Index of the pattern subscriptions of pulsar-ds.
+
+Patterns are grouped by their literal prefix, the part before the first
+glob character. When a message is published, only the groups whose prefix
+is a prefix of the channel are checked, with one dictionary lookup for
+each distinct prefix length. Within a group, patterns of the form
+``prefix*`` and patterns without glob characters match without a regular
+expression.
+
+The cost of matching a channel therefore depends on the channel length and
+on the number of patterns sharing a prefix with it, rather than on the
+number of patterns.
+'''
+import re
+
+from .client import redis_to_py_pattern
+
+
+GLOB_CHARS = frozenset(b'*?[\\')
+
+
+def literal_prefix(pattern):
+    '''The part of ``pattern`` before the first glob character
+    '''
+    for index, char in enumerate(pattern):
+        if char in GLOB_CHARS:
+            return pattern[:index]
+    return pattern
+
+
+class Pattern:
+    '''A pattern subscription and its clients
+    '''
+    __slots__ = ('pattern', 'prefix', 'clients', '_tail', '_re')
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.prefix = literal_prefix(pattern)
+        self.clients = set()
+        self._tail = pattern[len(self.prefix):]
+        self._re = None
+        if self._tail not in (b'', b'*'):
+            self._re = re.compile(redis_to_py_pattern(
+                pattern.decode('utf-8', 'ignore')))
+
+    def __repr__(self):
+        return self.pattern.decode('utf-8', 'ignore')
+    __str__ = __repr__
+
+    def match(self, channel):
+        '''Check if ``channel`` matches, knowing it starts with the prefix
+        '''
+        if self._re is not None:
+            return bool(self._re.match(channel.decode('utf-8', 'ignore')))
+        elif self._tail:
+            return True
+        else:
+            return len(channel) == len(self.prefix)
+
+
+class PatternIndex:
+    '''The pattern subscriptions of a :class:`.Storage`.
+
+    .. attribute:: subscriptions
+
+        The number of client subscriptions to all patterns
+    '''
+    def __init__(self):
+        self.subscriptions = 0
+        self._patterns = {}
+        # literal prefix -> {pattern: Pattern}
+        self._prefixes = {}
+        # prefix length -> number of prefixes with that length
+        self._lengths = {}
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __iter__(self):
+        return iter(self._patterns)
+
+    def __contains__(self, pattern):
+        return pattern in self._patterns
+
+    def add(self, pattern, client):
+        '''Subscribe ``client`` to ``pattern``
+        '''
+        p = self._patterns.get(pattern)
+        if p is None:
+            self._patterns[pattern] = p = Pattern(pattern)
+            group = self._prefixes.get(p.prefix)
+            if group is None:
+                self._prefixes[p.prefix] = group = {}
+                size = len(p.prefix)
+                self._lengths[size] = self._lengths.get(size, 0) + 1
+            group[pattern] = p
+        if client not in p.clients:
+            p.clients.add(client)
+            client.patterns.add(pattern)
+            self.subscriptions += 1
+
+    def remove(self, pattern, client):
+        '''Unsubscribe ``client`` from ``pattern``
+
+        :return: ``True`` if the client was subscribed to the pattern
+        '''
+        p = self._patterns.get(pattern)
+        if p is None or client not in p.clients:
+            return False
+        p.clients.remove(client)
+        client.patterns.discard(pattern)
+        self.subscriptions -= 1
+        if not p.clients:
+            self._patterns.pop(pattern)
+            group = self._prefixes[p.prefix]
+            group.pop(pattern)
+            if not group:
+                self._prefixes.pop(p.prefix)
+                size = len(p.prefix)
+                self._lengths[size] -= 1
+                if not self._lengths[size]:
+                    self._lengths.pop(size)
+        return True
+
+    def match(self, channel):
+        '''List of :class:`Pattern` matching ``channel``
+        '''
+        result = []
+        size = len(channel)
+        prefixes = self._prefixes
+        for length in self._lengths:
+            if length <= size:
+                group = prefixes.get(channel[:length])
+                if group:
+                    result.extend((p for p in group.values()
+                                   if p.match(channel)))
+        return result
@@ -1,4 +1,12 @@
 '''A parser for redis messages
+
+Data fed to the parser is appended to a ``bytearray`` which is consumed by
+moving a read offset rather than by slicing the buffer after every token,
+so that parsing a reply is linear in its size. Consumed data is dropped
+when new data is fed, once the offset exceeds :data:`COMPACT_SIZE` or
+when the whole buffer has been consumed. Bulk strings are copied from a
+``memoryview`` of the buffer, released at the end of :meth:`Parser.get`
+so that the buffer can grow again.
 '''
 from itertools import starmap
 
@@ -9,6 +17,13 @@ REPLAY_TYPE = frozenset((b'$',   # REDIS_REPLY_STRING,
                          b':',   # REDIS_REPLY_INTEGER,
                          b'+',   # REDIS_REPLY_STATUS,
                          b'-'))  # REDIS_REPLY_ERROR
+REPLY_STRING = ord('$')
+REPLY_ARRAY = ord('*')
+REPLY_INTEGER = ord(':')
+REPLY_STATUS = ord('+')
+REPLY_ERROR = ord('-')
+# Consumed bytes kept in the buffer before it is compacted
+COMPACT_SIZE = 65536
 
 
 class String(object):
@@ -22,9 +37,11 @@ class String(object):
         parser._current = None
         length = self._length
         if length >= 0:
-            b = parser._inbuffer
-            if len(b) >= length+2:
-                parser._inbuffer, chunk = b[length+2:], bytes(b[:length])
+            pos = parser._pos
+            end = pos + length
+            if len(parser._inbuffer) >= end + 2:
+                parser._pos = end + 2
+                chunk = parser._view[pos:end].tobytes()
                 if parser.encoding:
                     return chunk.decode(parser.encoding)
                 else:
@@ -71,6 +88,8 @@ class Parser(object):
         self.responseError = responseError
         self._current = None
         self._inbuffer = bytearray()
+        self._pos = 0
+        self._view = None
 
     def on_connect(self, connection):
         if connection.decode_responses:
@@ -81,14 +100,27 @@ class Parser(object):
 
     def feed(self, buffer):
         '''Feed new data into the buffer'''
+        pos = self._pos
+        if pos:
+            if pos == len(self._inbuffer):
+                self._inbuffer.clear()
+                self._pos = 0
+            elif pos >= COMPACT_SIZE:
+                del self._inbuffer[:pos]
+                self._pos = 0
         self._inbuffer.extend(buffer)
 
     def get(self):
         '''Called by the protocol consumer'''
-        if self._current:
-            return self._resume(self._current, False)
-        else:
-            return self._get(None)
+        self._view = memoryview(self._inbuffer)
+        try:
+            if self._current:
+                return self._resume(self._current, False)
+            else:
+                return self._get(None)
+        finally:
+            self._view.release()
+            self._view = None
 
     def bulk(self, value):
         if value is None:
@@ -168,32 +200,34 @@ class Parser(object):
 
     def _get(self, next):
         b = self._inbuffer
-        length = b.find(b'\r\n')
+        pos = self._pos
+        length = b.find(b'\r\n', pos)
         if length >= 0:
-            self._inbuffer, response = b[length+2:], bytes(b[:length])
-            rtype, response = response[:1], response[1:]
-            if rtype == b'-':
+            self._pos = length + 2
+            rtype = b[pos] if length > pos else None
+            response = self._view[pos+1:length].tobytes()
+            if rtype == REPLY_ERROR:
                 return self.responseError(response.decode('utf-8'))
-            elif rtype == b':':
+            elif rtype == REPLY_INTEGER:
                 return int(response)
-            elif rtype == b'+':
+            elif rtype == REPLY_STATUS:
                 return response
-            elif rtype == b'$':
+            elif rtype == REPLY_STRING:
                 task = String(int(response), next)
                 return task.decode(self, False)
-            elif rtype == b'*':
+            elif rtype == REPLY_ARRAY:
                 task = ArrayTask(int(response), next)
                 return task.decode(self, False)
             else:
-                # Clear the buffer and raise
-                self._inbuffer = bytearray()
+                # Drop the buffer and raise
+                self._pos = len(b)
                 raise self.protocolError('Protocol Error')
         else:
             return False
 
     def buffer(self):
         '''Current buffer'''
-        return bytes(self._inbuffer)
+        return bytes(self._inbuffer[self._pos:])
 
     def _resume(self, task, result):
         result = task.decode(self, result)
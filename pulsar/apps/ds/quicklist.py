@@ -0,0 +1,274 @@
+'''Chunked lists for pulsar-ds.
+
+A :class:`QuickList` stores the elements of a list in a chain of chunks,
+python lists of at most :data:`CHUNK_SIZE` elements, as the quicklist of
+redis chains listpacks. Pushing and popping at either end only touches the
+first or the last chunk.
+
+Positional access locates the chunk of an index by bisecting the
+cumulative counts of the chunks. The counts are kept up to date by pushes
+and pops at both ends: an element added to or removed from the first
+chunk shifts all the counts by one, which is recorded in a single offset.
+Other changes drop the counts, which are rebuilt when needed in
+``O(n/CHUNK_SIZE)``. Indexing is then logarithmic in the number of chunks
+and ranges are copied chunk by chunk.
+'''
+from bisect import bisect_right
+from itertools import accumulate, chain
+
+
+# Maximum number of elements of a chunk
+CHUNK_SIZE = 128
+
+
+class QuickList:
+    '''A list of bytes stored in chunks
+    '''
+    __slots__ = ('_chunks', '_len', '_counts', '_base')
+    encoding = 'quicklist'
+
+    def __init__(self, elements=None):
+        self._chunks = []
+        self._len = 0
+        # cumulative counts of the chunks, minus _base
+        self._counts = None
+        self._base = 0
+        if elements is not None:
+            self.extend(elements)
+
+    def __getstate__(self):
+        return self._chunks
+
+    def __setstate__(self, state):
+        self._chunks = state
+        self._len = sum(map(len, state))
+        self._counts = None
+        self._base = 0
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def __reversed__(self):
+        return chain.from_iterable(map(reversed, reversed(self._chunks)))
+
+    def __eq__(self, other):
+        if isinstance(other, QuickList):
+            return self._len == other._len and list(self) == list(other)
+        return NotImplemented
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step == 1:
+                return self.range(start, stop)
+            return list(self)[index]
+        chunk, offset = self._locate(index)
+        return self._chunks[chunk][offset]
+
+    def __setitem__(self, index, value):
+        chunk, offset = self._locate(index)
+        self._chunks[chunk][offset] = value
+
+    def range(self, start, stop):
+        '''The list of elements from ``start`` to ``stop`` excluded
+        '''
+        start = max(start, 0)
+        count = min(stop, self._len) - start
+        if count <= 0:
+            return []
+        chunks = self._chunks
+        chunk, offset = self._locate(start)
+        result = chunks[chunk][offset:offset+count]
+        count -= len(result)
+        while count > 0:
+            chunk += 1
+            part = chunks[chunk][:count]
+            result.extend(part)
+            count -= len(part)
+        return result
+
+    def append(self, value):
+        chunks = self._chunks
+        counts = self._counts
+        self._len += 1
+        if chunks and len(chunks[-1]) < CHUNK_SIZE:
+            chunks[-1].append(value)
+            if counts is not None:
+                counts[-1] += 1
+        else:
+            chunks.append([value])
+            if counts is not None:
+                counts.append(self._len - self._base)
+
+    def appendleft(self, value):
+        chunks = self._chunks
+        self._len += 1
+        self._base += 1
+        if chunks and len(chunks[0]) < CHUNK_SIZE:
+            chunks[0].insert(0, value)
+        else:
+            chunks.insert(0, [value])
+            if self._counts is not None:
+                self._counts.insert(0, 1 - self._base)
+
+    def extend(self, values):
+        values = list(values)
+        chunks = self._chunks
+        start = 0
+        if chunks:
+            start = CHUNK_SIZE - len(chunks[-1])
+            chunks[-1].extend(values[:start])
+        for n in range(start, len(values), CHUNK_SIZE):
+            chunks.append(values[n:n+CHUNK_SIZE])
+        self._len += len(values)
+        self._counts = None
+
+    def extendleft(self, values):
+        # as deque.extendleft, elements are inserted in reversed order
+        for value in values:
+            self.appendleft(value)
+
+    def pop(self):
+        if not self._len:
+            raise IndexError('pop from an empty list')
+        chunks = self._chunks
+        counts = self._counts
+        last = chunks[-1]
+        value = last.pop()
+        self._len -= 1
+        if not last:
+            chunks.pop()
+            if counts is not None:
+                counts.pop()
+        elif counts is not None:
+            counts[-1] -= 1
+        return value
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError('pop from an empty list')
+        chunks = self._chunks
+        first = chunks[0]
+        value = first.pop(0)
+        self._len -= 1
+        self._base -= 1
+        if not first:
+            chunks.pop(0)
+            if self._counts is not None:
+                self._counts.pop(0)
+        return value
+
+    def clear(self):
+        self._chunks = []
+        self._len = 0
+        self._counts = None
+
+    def insert_before(self, pivot, value):
+        return self._insert(pivot, value, 0)
+
+    def insert_after(self, pivot, value):
+        return self._insert(pivot, value, 1)
+
+    def remove(self, elem, count=1):
+        '''Remove ``count`` occurrences of ``elem`` from the head, from the
+        tail if negative, all of them when 0.
+
+        :return: the number of elements removed
+        '''
+        chunks = self._chunks
+        limit = abs(count) or self._len
+        removed = 0
+        if count < 0:
+            order = range(len(chunks) - 1, -1, -1)
+        else:
+            order = range(len(chunks))
+        for n in order:
+            chunk = chunks[n]
+            if elem not in chunk:
+                continue
+            positions = [i for i, e in enumerate(chunk) if e == elem]
+            if len(positions) > limit - removed:
+                if count < 0:
+                    positions = positions[removed-limit:]
+                else:
+                    positions = positions[:limit-removed]
+            for i in reversed(positions):
+                del chunk[i]
+            removed += len(positions)
+            if removed == limit:
+                break
+        if removed:
+            self._len -= removed
+            self._compact()
+        return removed
+
+    def trim(self, start, end):
+        '''Keep the elements from ``start`` to ``end`` excluded
+        '''
+        start = max(start, 0)
+        end = min(end, self._len)
+        if start >= end:
+            return self.clear()
+        first, offset = self._locate(start)
+        last, end_offset = self._locate(end - 1)
+        chunks = self._chunks[first:last+1]
+        chunks[-1] = chunks[-1][:end_offset+1]
+        chunks[0] = chunks[0][offset:]
+        self._chunks = chunks
+        self._len = end - start
+        self._counts = None
+
+    def chunks(self):
+        '''Number of chunks
+        '''
+        return len(self._chunks)
+
+    def _locate(self, index):
+        # the chunk and offset in the chunk of the element at index
+        size = self._len
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('list index out of range')
+        counts = self._counts
+        if counts is None:
+            self._counts = counts = list(accumulate(map(len, self._chunks)))
+            self._base = 0
+        chunk = bisect_right(counts, index - self._base)
+        if chunk:
+            index -= counts[chunk-1] + self._base
+        return chunk, index
+
+    def _insert(self, pivot, value, offset):
+        # insert value before or after the first occurrence of pivot
+        chunks = self._chunks
+        for n, chunk in enumerate(chunks):
+            if pivot in chunk:
+                chunk.insert(chunk.index(pivot) + offset, value)
+                if len(chunk) > CHUNK_SIZE:
+                    half = len(chunk) // 2
+                    chunks.insert(n + 1, chunk[half:])
+                    del chunk[half:]
+                self._len += 1
+                self._counts = None
+                return True
+        return False
+
+    def _compact(self):
+        # drop empty chunks and merge neighbours which fit in a chunk
+        chunks = []
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            elif chunks and len(chunks[-1]) + len(chunk) <= CHUNK_SIZE:
+                chunks[-1].extend(chunk)
+            else:
+                chunks.append(chunk)
+        self._chunks = chunks
+        self._counts = None
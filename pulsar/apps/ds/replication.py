@@ -0,0 +1,471 @@
+'''Master/replica replication for pulsar-ds.
+
+A replica connects to its master and sends::
+
+    REPLCONF listening-port <port>
+    PSYNC <replid> <offset>
+
+where ``replid`` and ``offset`` identify the replication stream already
+processed by the replica, ``? -1`` when there is none. The offset is the
+number of bytes of the stream of write commands sent by the master.
+
+When the master can continue the stream from its backlog, which keeps the
+most recent ``key_value_repl_backlog_size`` bytes, it replies with
+``+CONTINUE`` followed by the missing part of the stream. Otherwise it
+replies with ``+FULLRESYNC <replid> <offset>`` and sends a snapshot of the
+dataset, in the :mod:`~pulsar.apps.ds.snapshot` format, as a bulk string
+without the trailing ``CRLF``. The snapshot is written by a background
+process and the write commands received in the meantime are buffered and
+sent once the snapshot has been transferred.
+
+Replicas acknowledge the processed offset once per second with
+``REPLCONF ACK <offset>``.
+'''
+import os
+import time
+from binascii import hexlify
+from functools import partial
+from asyncio import Protocol
+
+import pulsar
+from pulsar.utils.structures import OrderedDict
+
+from .aof import AofClient, pack_command
+from .snapshot import write_snapshot, is_snapshot, read_snapshot
+
+
+class ReplicationError(pulsar.PulsarException):
+    '''Raised when the replication stream cannot be processed'''
+    pass
+
+
+def new_replid():
+    return hexlify(os.urandom(20)).decode('utf-8')
+
+
+def command_size(request):
+    '''Size in bytes of the redis protocol encoding of ``request``
+    '''
+    size = len(str(len(request))) + 3
+    for value in request:
+        size += len(str(len(value))) + len(value) + 5
+    return size
+
+
+def temp_filename(filename, prefix):
+    path, name = os.path.split(filename)
+    return os.path.join(path, '%s-%d-%s' % (prefix, os.getpid(), name))
+
+
+class Replica:
+    '''A replica connected to this server
+    '''
+    def __init__(self, client):
+        self.client = client
+        self.state = 'wait_bgsave'
+        self.port = client.listening_port
+        self.ack_offset = 0
+        self.ack_time = time.time()
+
+    def write(self, data):
+        # after the replies to the requests before psync
+        self.client._send(data)
+
+    def info(self):
+        address = self.client.address
+        return OrderedDict((('ip', address[0] if address else ''),
+                            ('port', self.port),
+                            ('state', self.state),
+                            ('offset', self.ack_offset),
+                            ('lag', int(time.time() - self.ack_time))))
+
+
+class Replication:
+    '''The master side of replication.
+
+    Keeps the backlog of the replication stream and feeds it to the
+    connected replicas.
+    '''
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self.replid = new_replid()
+        self.offset = 0
+        self.first_offset = 0
+        self.replicas = OrderedDict()
+        self._buffer = bytearray()
+        self._db = None
+        self._syncer = None
+        self._sync_offset = None
+        self._sync_buffer = None
+        self._sync_replicas = []
+
+    def feed(self, num, requests):
+        '''Append ``requests`` executed on database ``num`` to the stream
+        '''
+        data = bytearray()
+        if num != self._db:
+            self._db = num
+            pack_command(data, ('select', num))
+        for request in requests:
+            pack_command(data, request)
+        buffer = self._buffer
+        buffer += data
+        self.offset += len(data)
+        if len(buffer) > 2*self.size:
+            # trim the backlog, amortised over at least size bytes
+            trim = len(buffer) - self.size
+            del buffer[:trim]
+            self.first_offset += trim
+        if self._sync_buffer is not None:
+            self._sync_buffer += data
+        for replica in self.replicas.values():
+            if replica.state == 'online':
+                replica.write(data)
+
+    def sync(self, client, replid=None, offset=-1):
+        '''Synchronise the replica connected with ``client``.
+
+        ``replid`` is ``None`` for the SYNC command
+        '''
+        store = self.store
+        client.flag |= store.SLAVE
+        replica = Replica(client)
+        self.replicas[client] = replica
+        if (replid == self.replid and
+                self.first_offset <= offset <= self.offset):
+            store._sync_partial_ok += 1
+            replica.state = 'online'
+            replica.ack_offset = offset
+            replica.write(b'+CONTINUE\r\n')
+            replica.write(bytes(self._buffer[offset-self.first_offset:]))
+            store.logger.info('Partial resynchronization accepted for %s, '
+                              'sending %d bytes of backlog', client,
+                              self.offset - offset)
+            return
+        if replid not in (None, '?'):
+            store._sync_partial_err += 1
+        store._sync_full += 1
+        if self._syncer is None:
+            self._start_sync()
+        if replid is not None:
+            replica.write(('+FULLRESYNC %s %d\r\n' %
+                           (self.replid, self._sync_offset)).encode('utf-8'))
+        self._sync_replicas.append(replica)
+
+    def ack(self, client, offset):
+        replica = self.replicas.get(client)
+        if replica:
+            replica.ack_offset = offset
+            replica.ack_time = time.time()
+
+    def remove(self, client):
+        replica = self.replicas.pop(client, None)
+        if replica in self._sync_replicas:
+            self._sync_replicas.remove(replica)
+
+    def reset(self):
+        '''Disconnect replicas and start a new replication stream
+        '''
+        for client in tuple(self.replicas):
+            client.close()
+        self.replicas.clear()
+        self._sync_replicas = []
+        self.replid = new_replid()
+        self.first_offset = self.offset
+        self._buffer = bytearray()
+        self._db = None
+
+    def cron(self):
+        if self._syncer is not None and not self._syncer.is_alive():
+            self._sync_done()
+
+    def info(self):
+        info = OrderedDict((('role', 'master'),
+                            ('connected_slaves', len(self.replicas))))
+        for n, replica in enumerate(self.replicas.values()):
+            info['slave%d' % n] = replica.info()
+        info['master_replid'] = self.replid
+        info['master_repl_offset'] = self.offset
+        info['repl_backlog_active'] = 1
+        info['repl_backlog_size'] = self.size
+        info['repl_backlog_first_byte_offset'] = self.first_offset
+        info['repl_backlog_histlen'] = len(self._buffer)
+        return info
+
+    #    INTERNALS
+    def _start_sync(self):
+        from multiprocessing import Process
+        store = self.store
+        offset = time.time() - store._loop.time()
+        # force a SELECT at the start of the stream sent after the snapshot
+        self._db = None
+        self._sync_offset = self.offset
+        self._sync_buffer = bytearray()
+        self._syncer = Process(target=write_sync,
+                               args=(self._sync_filename(), store._dbs(),
+                                     offset))
+        self._syncer.start()
+        store.logger.info('Starting background snapshot for replication')
+
+    def _sync_filename(self):
+        return temp_filename(self.store._filename, 'temp-sync')
+
+    def _sync_done(self):
+        syncer, self._syncer = self._syncer, None
+        buffer, self._sync_buffer = self._sync_buffer, None
+        replicas, self._sync_replicas = self._sync_replicas, []
+        filename = self._sync_filename()
+        logger = self.store.logger
+        if syncer.exitcode:
+            logger.error('Background snapshot for replication failed')
+            for replica in replicas:
+                replica.client.close()
+        else:
+            with open(filename, 'rb') as file:
+                data = file.read()
+            header = ('$%d\r\n' % len(data)).encode('utf-8')
+            for replica in replicas:
+                replica.write(header)
+                replica.write(data)
+                replica.write(bytes(buffer))
+                replica.state = 'online'
+                replica.ack_offset = self._sync_offset
+            logger.info('Sent snapshot of %d bytes to %d replicas',
+                        len(data), len(replicas))
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+class MasterLink:
+    '''The replica side of replication, the link with the master.
+    '''
+    def __init__(self, store, host, port):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.state = 'connect'
+        self.replid = '?'
+        self.offset = -1
+        self.client = None
+        self._loop = store._loop
+        self._protocol = None
+        self._last_io = time.time()
+        self._next_connect = 0
+        self._last_ack = 0
+
+    def __repr__(self):
+        return '%s:%s' % (self.host, self.port)
+    __str__ = __repr__
+
+    def cron(self):
+        now = time.time()
+        if self.state == 'connect':
+            if now >= self._next_connect:
+                self.connect()
+        elif self.state == 'connected' and now - self._last_ack >= 1:
+            self._last_ack = now
+            self._protocol.send(('replconf', 'ack', self.offset))
+
+    def connect(self):
+        self.state = 'connecting'
+        self._next_connect = time.time() + 1
+        self.store.logger.info('Connecting to master %s', self)
+        connect = self._loop.create_connection(
+            partial(MasterProtocol, self), self.host, self.port)
+        self._loop.create_task(connect).add_done_callback(self._connected)
+
+    def close(self):
+        self.state = 'closed'
+        if self._protocol is not None:
+            self._protocol.transport.close()
+
+    def info(self):
+        connected = self.state == 'connected'
+        return OrderedDict((
+            ('role', 'slave'),
+            ('master_host', self.host),
+            ('master_port', self.port),
+            ('master_link_status', 'up' if connected else 'down'),
+            ('master_last_io_seconds_ago',
+             int(time.time() - self._last_io) if connected else -1),
+            ('master_sync_in_progress', int(self.state == 'transfer')),
+            ('master_replid', self.replid),
+            ('slave_repl_offset', self.offset),
+            ('slave_read_only', int(self.store._readonly))))
+
+    #    INTERNALS
+    def _connected(self, future):
+        exc = future.exception()
+        if exc and self.state == 'connecting':
+            self.state = 'connect'
+            self.store.logger.error('Could not connect with master %s: %s',
+                                    self, exc)
+
+    def _lost(self, protocol):
+        if protocol is self._protocol:
+            self._protocol = None
+            if self.state != 'closed':
+                self.store.logger.warning('Connection with master %s lost',
+                                          self)
+                self.state = 'connect'
+
+    def _full_sync(self, filename, replid, offset):
+        store = self.store
+        for db in store.databases.values():
+            db.flush()
+        with open(filename, 'rb') as file:
+            if not is_snapshot(file):
+                raise ReplicationError('Bad snapshot format from master')
+            store._loaded_keys = 0
+            store._load_entries(read_snapshot(file))
+        os.replace(filename, store._filename)
+        self.replid = replid
+        self.offset = offset
+        self.client = AofClient(store)
+        self.client.flag |= store.MASTER
+        if store._replication is not None:
+            store._replication.reset()
+        if store._aof is not None and not store._aof.rewrite():
+            store.logger.warning('Append only file rewrite in progress, '
+                                 'the file may not match the master dataset')
+        store.logger.info('Full synchronization with master %s completed, '
+                          'loaded %d keys', self, store._loaded_keys)
+
+
+class MasterProtocol(Protocol):
+    '''Connection of a replica with its master
+    '''
+    transport = None
+
+    def __init__(self, link):
+        self.link = link
+        self.store = link.store
+        self._buffer = bytearray()
+        self._replies = 0
+        self._parser = None
+        self._sync = None
+        self._file = None
+        self._remaining = 0
+
+    def send(self, request):
+        data = bytearray()
+        pack_command(data, request)
+        self.transport.write(data)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        link = self.link
+        if link.state != 'connecting':
+            return transport.close()
+        link._protocol = self
+        link.state = 'handshake'
+        link._last_io = time.time()
+        cfg = self.store.cfg
+        requests = []
+        if cfg.key_value_masterauth:
+            requests.append(('auth', cfg.key_value_masterauth))
+        address = getattr(self.store._server, 'address', None)
+        if address:
+            requests.append(('replconf', 'listening-port', address[1]))
+        requests.append(('psync', link.replid, link.offset))
+        self._replies = len(requests)
+        for request in requests:
+            self.send(request)
+
+    def connection_lost(self, exc=None):
+        if self._file is not None:
+            self._file.close()
+            os.remove(self._file.name)
+            self._file = None
+        self.link._lost(self)
+
+    def data_received(self, data):
+        link = self.link
+        link._last_io = time.time()
+        if link.state == 'connected':
+            return self._process(data)
+        buffer = self._buffer
+        buffer += data
+        while buffer and link.state != 'connected':
+            if self._file is not None:
+                self._transfer()
+            else:
+                index = buffer.find(b'\r\n')
+                if index < 0:
+                    return
+                line = bytes(buffer[:index])
+                del buffer[:index+2]
+                self._reply(line.decode('utf-8'))
+            if self.transport._closing:
+                return
+        if link.state == 'connected' and buffer:
+            self._buffer = bytearray()
+            self._process(buffer)
+
+    #    INTERNALS
+    def _reply(self, line):
+        link = self.link
+        logger = self.store.logger
+        if link.state == 'handshake':
+            self._replies -= 1
+            if line.startswith('-'):
+                logger.error('Master %s replied with an error: %s',
+                             link, line[1:])
+                if line.startswith('-NOAUTH') or self._replies == 0:
+                    return self.transport.close()
+            if self._replies == 0:
+                self._psync(line)
+        elif line.startswith('$'):
+            link.state = 'transfer'
+            self._remaining = int(line[1:])
+            self._file = open(temp_filename(self.store._filename,
+                                            'temp-transfer'), 'wb')
+        elif line:
+            raise ReplicationError('Unexpected reply from master: %s' % line)
+
+    def _psync(self, line):
+        link = self.link
+        logger = self.store.logger
+        if line.startswith('+FULLRESYNC'):
+            _, replid, offset = line.split()
+            self._sync = (replid, int(offset))
+            link.state = 'wait_bgsave'
+            logger.info('Full resynchronization from master %s', link)
+        elif line.startswith('+CONTINUE'):
+            link.state = 'connected'
+            self._parser = self.store._server._parser_class()
+            logger.info('Partial resynchronization from master %s at '
+                        'offset %d', link, link.offset)
+        else:
+            logger.error('Master %s does not support PSYNC', link)
+            self.transport.close()
+
+    def _transfer(self):
+        buffer = self._buffer
+        chunk = buffer[:self._remaining]
+        del buffer[:len(chunk)]
+        self._file.write(chunk)
+        self._remaining -= len(chunk)
+        if not self._remaining:
+            file, self._file = self._file, None
+            file.close()
+            self.link._full_sync(file.name, *self._sync)
+            self.link.state = 'connected'
+            self._parser = self.store._server._parser_class()
+
+    def _process(self, data):
+        parser = self._parser
+        parser.feed(data)
+        link = self.link
+        execute = link.client.execute
+        request = parser.get()
+        while request is not False:
+            link.offset += command_size(request)
+            execute(request)
+            request = parser.get()
+
+
+def write_sync(filename, dbs, offset):
+    with open(filename, 'wb') as file:
+        write_snapshot(file, dbs, offset)
@@ -0,0 +1,246 @@
+'''Full encodings of hashes, sets and sorted sets for the HSCAN, SSCAN and
+ZSCAN commands.
+
+Python dictionaries and sets do not expose their hash table, therefore the
+members of the full encodings are also indexed by a :class:`ScanIndex`.
+The index keeps the members in buckets by the CRC32 of the member, each
+bucket covering a contiguous range of the 32 bits hash space. A bucket is
+split in two when it holds more than :data:`BUCKET_SIZE` members and
+removed, its range merged with the preceding one, when it is empty.
+
+The cursor of the scan commands is a position in the hash space. A call
+returns the members of the buckets from the cursor until ``COUNT``
+members are collected and the next cursor is the start of the following
+bucket. The ranges of the buckets always cover the whole hash space, so
+that every member present from the start to the end of a full iteration
+is returned at least once, whatever the changes to the collection in
+between, and a call only visits the buckets needed to collect ``COUNT``
+members.
+'''
+from bisect import bisect_right
+from binascii import crc32
+
+from pulsar.utils.structures import Dict, Zset
+
+
+BUCKET_SIZE = 128
+
+
+class ScanIndex:
+    '''Members of a collection in buckets ordered by CRC32
+    '''
+    __slots__ = ('_starts', '_buckets')
+
+    def __init__(self, members=()):
+        self.clear()
+        for member in members:
+            self.add(member)
+
+    def add(self, member):
+        '''Add ``member``, which must not be in the index
+        '''
+        index = bisect_right(self._starts, crc32(member)) - 1
+        bucket = self._buckets[index]
+        bucket.add(member)
+        if len(bucket) > BUCKET_SIZE:
+            self._split(index)
+
+    def discard(self, member):
+        index = bisect_right(self._starts, crc32(member)) - 1
+        bucket = self._buckets[index]
+        bucket.discard(member)
+        if index and not bucket:
+            del self._starts[index]
+            del self._buckets[index]
+
+    def clear(self):
+        self._starts = [0]
+        self._buckets = [set()]
+
+    def scan(self, cursor, count):
+        '''Members in the buckets from ``cursor``, at least ``count`` of
+        them unless the iteration is over.
+
+        :return: a two-elements tuple with the cursor of the next call,
+            0 when the iteration is over, and the list of members
+        '''
+        starts = self._starts
+        buckets = self._buckets
+        index = bisect_right(starts, cursor) - 1
+        if starts[index] < cursor:
+            members = [m for m in buckets[index] if crc32(m) >= cursor]
+        else:
+            members = list(buckets[index])
+        index += 1
+        while index < len(starts) and len(members) < count:
+            members.extend(buckets[index])
+            index += 1
+        return (starts[index] if index < len(starts) else 0), members
+
+    #    INTERNALS
+    def _split(self, index):
+        bucket = self._buckets[index]
+        hashes = sorted(crc32(member) for member in bucket)
+        start = hashes[len(hashes) // 2]
+        if start == hashes[0]:
+            # more than half of the members share the lowest hash
+            start = next((h for h in hashes if h > start), None)
+            if start is None:
+                return
+        upper = set((m for m in bucket if crc32(m) >= start))
+        bucket.difference_update(upper)
+        self._starts.insert(index + 1, start)
+        self._buckets.insert(index + 1, upper)
+
+
+class ScanDict(Dict):
+    '''The full encoding of hashes, a :class:`.Dict` with its fields in a
+    :class:`ScanIndex`
+    '''
+    __slots__ = ('_index',)
+
+    def __init__(self, data=None):
+        super().__init__()
+        self._index = ScanIndex()
+        if data:
+            self.update(data)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._index.add(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._index.discard(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._index.discard(key)
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._index.discard(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._index.clear()
+
+    def copy(self):
+        return self.__class__(self)
+
+    def scan(self, cursor, count):
+        '''See :meth:`ScanIndex.scan`
+        '''
+        return self._index.scan(cursor, count)
+
+
+class ScanSet(set):
+    '''The full encoding of sets, a set with its members in a
+    :class:`ScanIndex`
+    '''
+    __slots__ = ('_index',)
+
+    def __init__(self, members=()):
+        super().__init__(members)
+        self._index = ScanIndex(self)
+
+    def __reduce__(self):
+        return self.__class__, (set(self),)
+
+    def add(self, member):
+        if member not in self:
+            set.add(self, member)
+            self._index.add(member)
+
+    def discard(self, member):
+        if member in self:
+            set.discard(self, member)
+            self._index.discard(member)
+
+    def remove(self, member):
+        set.remove(self, member)
+        self._index.discard(member)
+
+    def pop(self):
+        member = set.pop(self)
+        self._index.discard(member)
+        return member
+
+    def clear(self):
+        set.clear(self)
+        self._index.clear()
+
+    def update(self, *others):
+        for other in others:
+            for member in other:
+                self.add(member)
+
+    def difference_update(self, *others):
+        for other in others:
+            for member in other:
+                self.discard(member)
+
+    def intersection_update(self, *others):
+        for member in set.difference(self, set.intersection(self, *others)):
+            self.discard(member)
+
+    def symmetric_difference_update(self, other):
+        for member in set(other):
+            if member in self:
+                self.discard(member)
+            else:
+                self.add(member)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+    def copy(self):
+        return self.__class__(self)
+
+    def scan(self, cursor, count):
+        '''See :meth:`ScanIndex.scan`
+        '''
+        return self._index.scan(cursor, count)
+
+
+class ScanZset(Zset):
+    '''A :class:`.Zset` with its members in a :class:`ScanIndex`
+    '''
+    __slots__ = ()
+
+    def clear(self):
+        super().clear()
+        self._dict = ScanDict()
+
+    def scan(self, cursor, count):
+        '''See :meth:`ScanIndex.scan`
+        '''
+        return self._dict.scan(cursor, count)
@@ -45,20 +45,41 @@ import re
 import time
 import math
 import pickle
+from time import perf_counter
 from random import choice
-from itertools import islice, chain
+from itertools import islice
 from functools import partial, reduce
-from collections import namedtuple
-from itertools import zip_longest
 
 import pulsar
+from pulsar import asyncio
 from pulsar.apps.socket import SocketServer
 from pulsar.utils.config import Global
-from pulsar.utils.structures import Dict, Zset, Deque
-
-from .parser import redis_parser
-from .utils import sort_command, count_bytes, and_op, or_op, xor_op, save_data
-from .client import (command, PulsarStoreClient, Blocked,
+from pulsar.utils.string import gen_unique_id
+from pulsar.utils.structures import Dict, Zset, Deque, OrderedDict
+
+from .parser import redis_parser, CommandError
+from .snapshot import is_snapshot, read_snapshot
+from .aof import AppendOnlyFile, AofClient, read_commands
+from .replication import Replication, MasterLink
+from .cluster import Cluster, key_slot
+from .keyspace import KeySpace
+from .scan import ScanDict, ScanSet, ScanZset
+from .pubsub import PatternIndex
+from .tracking import Tracking
+from .stats import Stats, Latency
+from .lazyfree import LazyFree
+from .encoding import PackedHash, PackedList, IntSet, Compact, full_encoding
+from .memory import (POLICIES, evict, used_memory, lfu_touch, lfu_counter,
+                     human_size)
+from .utils import sort_command, save_data
+from .hyperloglog import HyperLogLog
+from .quicklist import QuickList
+from .stream import (Stream, ConsumerGroup, StreamRead, parse_id,
+                     parse_range_id, format_id, read_keys, MIN_ID, MAX_ID,
+                     ID_TOO_SMALL)
+from .bitops import (OPERATORS, bitcount, bitop, bitpos, bitfield,
+                     bitfield_operations)
+from .client import (command, command_table, PulsarStoreClient, Blocked,
                      COMMANDS_INFO, check_input, redis_to_py_pattern)
 
 
@@ -74,10 +95,40 @@ def pulsards_url(address=None):
 
 # Keyspace changes notification classes
 STRING_LIMIT = 2**32
+# Frequency of the server cron and number of expire wheel slots per second
+CRON_HZ = 10
+# Fraction of a cron period the active expire cycle can use
+EXPIRE_CYCLE_PERC = 0.25
+# Number of keys expired between two checks of the cycle time limit
+EXPIRE_CYCLE_CHECK = 20
+# Maximum time of a background snapshot loading step
+LOAD_STEP_TIME = 0.02
+# Number of keys loaded between two checks of the step time limit
+LOAD_STEP_CHECK = 100
+# Commands not propagated, their effects are propagated as they happen
+BLOCKING_COMMANDS = frozenset(('blpop', 'brpop', 'brpoplpush'))
+# Stream commands blocking until entries are added
+STREAM_READ_COMMANDS = frozenset(('xread', 'xreadgroup'))
+XCLAIM_OPTIONS = frozenset((b'idle', b'time', b'retrycount', b'force',
+                            b'justid', b'lastid'))
+XGROUP_NO_KEY = ('The XGROUP subcommand requires the key to exist. Note '
+                 'that for CREATE you may want to use the MKSTREAM option '
+                 'to create an empty stream automatically.')
+# Commands which may set an expire on their first key
+EXPIRE_COMMANDS = frozenset(('expire', 'expireat', 'pexpire', 'pexpireat',
+                             'psetex', 'restore', 'set', 'setex'))
 
 nan = float('nan')
 
 
+def zstore_keys(request):
+    # keys of ZINTERSTORE and ZUNIONSTORE
+    try:
+        return request[1:2] + request[3:3+int(request[2])]
+    except (IndexError, ValueError):
+        return request[1:2]
+
+
 class RedisParserSetting(Global):
     name = "redis_py_parser"
     flags = ["--redis-py-parser"]
@@ -110,6 +161,43 @@ def validate_list_of_pairs(val):
     return new_val
 
 
+def validate_memory(val):
+    # Number of bytes with an optional kb, mb or gb unit
+    if isinstance(val, str):
+        val = val.strip().lower()
+        for unit, size in (('gb', 1 << 30), ('mb', 1 << 20), ('kb', 1 << 10)):
+            if val.endswith(unit):
+                return int(val[:-2])*size
+    val = int(val)
+    if val < 0:
+        raise ValueError("Value must be positive: %s" % val)
+    return val
+
+
+def validate_policy(val):
+    if val not in POLICIES:
+        raise ValueError('Unknown policy %s' % val)
+    return val
+
+
+# Parameters of CONFIG GET and SET, the storage attribute and validator
+CONFIG_PARAMETERS = OrderedDict((
+    ('maxmemory', ('_maxmemory', validate_memory)),
+    ('maxmemory-policy', ('_maxmemory_policy', validate_policy)),
+    ('maxmemory-samples', ('_maxmemory_samples', int)),
+    ('hash-max-listpack-entries', ('_hash_max_listpack_entries', int)),
+    ('hash-max-listpack-value', ('_hash_max_listpack_value', int)),
+    ('list-max-listpack-entries', ('_list_max_listpack_entries', int)),
+    ('list-max-listpack-value', ('_list_max_listpack_value', int)),
+    ('set-max-intset-entries', ('_set_max_intset_entries', int)),
+    ('hll-sparse-max-bytes', ('_hll_sparse_max_bytes', int)),
+    ('stream-node-max-entries', ('_stream_node_max_entries', int)),
+    ('stream-node-max-bytes', ('_stream_node_max_bytes', int)),
+    ('slowlog-log-slower-than', ('_slowlog_log_slower_than', int)),
+    ('slowlog-max-len', ('_slowlog_max_len', int)),
+    ('latency-monitor-threshold', ('_latency_monitor_threshold', int))))
+
+
 # #############################################################################
 # #    CONFIGURATION PARAMETERS
 class KeyValueDatabases(PulsarDsSetting):
@@ -153,13 +241,299 @@ class KeyValueFileName(PulsarDsSetting):
     desc = '''The filename where to dump the DB.'''
 
 
+class KeyValueAppendOnly(PulsarDsSetting):
+    name = "key_value_appendonly"
+    flags = ["--key-value-appendonly"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Log every write command into the append only file.
+
+        When enabled, the append only file rather than the DB file is loaded
+        at startup.
+        '''
+
+
+class KeyValueAppendFilename(PulsarDsSetting):
+    name = "key_value_appendfilename"
+    flags = ["--key-value-appendfilename"]
+    default = 'pulsards.aof'
+    desc = '''The name of the append only file.'''
+
+
+class KeyValueAppendFsync(PulsarDsSetting):
+    name = "key_value_appendfsync"
+    flags = ["--key-value-appendfsync"]
+    choices = ('always', 'everysec', 'no')
+    default = 'everysec'
+    desc = '''\
+        How often the append only file is synced to disk.
+
+        ``always`` syncs after every write command, ``everysec`` once per
+        second and ``no`` lets the operating system decide.
+        '''
+
+
+class KeyValueAofRewriteSize(PulsarDsSetting):
+    name = "key_value_aof_rewrite_size"
+    flags = ["--key-value-aof-rewrite-size"]
+    type = int
+    default = 64*1024*1024
+    desc = '''\
+        Minimum size, in bytes, of the append only file for an automatic
+        rewrite.
+
+        The file is rewritten when larger than this size and twice as large
+        as after the last rewrite. Set to 0 to disable automatic rewrites.
+        '''
+
+
+class KeyValueSlaveOf(PulsarDsSetting):
+    name = "key_value_slaveof"
+    flags = ["--key-value-slaveof"]
+    default = ''
+    meta = "ADDRESS"
+    desc = '''\
+        Make the server a replica of the master at ``host:port``.
+
+        The replication can be changed at runtime with the SLAVEOF command.
+        '''
+
+
+class KeyValueMasterAuth(PulsarDsSetting):
+    name = "key_value_masterauth"
+    flags = ["--key-value-masterauth"]
+    default = ''
+    desc = 'Password used by a replica to authenticate with the master.'
+
+
+class KeyValueReplicaWritable(PulsarDsSetting):
+    name = "key_value_replica_writable"
+    flags = ["--key-value-replica-writable"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Accept write commands from clients when the server is a replica.
+
+        By default replicas reply with a READONLY error to write commands.
+        '''
+
+
+class KeyValueReplBacklogSize(PulsarDsSetting):
+    name = "key_value_repl_backlog_size"
+    flags = ["--key-value-repl-backlog-size"]
+    type = int
+    default = 1024*1024
+    desc = '''\
+        Size, in bytes, of the replication backlog.
+
+        The backlog keeps the most recent part of the stream of write
+        commands sent to replicas so that a replica can continue the
+        replication after a disconnection without a full resynchronization.
+        '''
+
+
+class KeyValueCluster(PulsarDsSetting):
+    name = "key_value_cluster"
+    flags = ["--key-value-cluster"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Run the data store in cluster mode.
+
+        Each worker serves a range of hash slots and listens on its own
+        address, the port following the server port for the first
+        worker and so on. Commands on keys served by another worker are
+        redirected with a MOVED error.
+
+        Each worker saves its keys into its own data files, the
+        ``key_value_filename`` and ``key_value_appendfilename`` suffixed
+        by the index of the worker node. Keys of the slots of other
+        workers found when loading them are dropped.
+        '''
+
+
+class KeyValueMaxMemory(PulsarDsSetting):
+    name = "key_value_maxmemory"
+    flags = ["--key-value-maxmemory"]
+    default = 0
+    validator = validate_memory
+    desc = '''\
+        Memory limit, in bytes or with a kb, mb or gb unit.
+
+        When the estimated memory used by the data is above the limit,
+        keys are evicted according to the ``key_value_maxmemory_policy``.
+        Set to 0, the default, for no limit.
+        '''
+
+
+class KeyValueMaxMemoryPolicy(PulsarDsSetting):
+    name = "key_value_maxmemory_policy"
+    flags = ["--key-value-maxmemory-policy"]
+    choices = POLICIES
+    default = 'noeviction'
+    desc = '''\
+        How keys are evicted when the memory limit is reached.
+
+        ``noeviction`` replies with an error to write commands,
+        ``allkeys-lru`` and ``allkeys-lfu`` evict the least recently or
+        frequently used keys, ``volatile-lru`` the least recently used keys
+        with an expire and ``volatile-ttl`` the keys with the shortest time
+        to live.
+        '''
+
+
+class KeyValueMaxMemorySamples(PulsarDsSetting):
+    name = "key_value_maxmemory_samples"
+    flags = ["--key-value-maxmemory-samples"]
+    type = int
+    default = 5
+    desc = '''\
+        Number of keys sampled in each database to select the key to evict.
+        '''
+
+
+class KeyValueHashMaxListpackEntries(PulsarDsSetting):
+    name = "key_value_hash_max_listpack_entries"
+    flags = ["--key-value-hash-max-listpack-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of fields of a hash with the compact encoding.
+        '''
+
+
+class KeyValueHashMaxListpackValue(PulsarDsSetting):
+    name = "key_value_hash_max_listpack_value"
+    flags = ["--key-value-hash-max-listpack-value"]
+    type = int
+    default = 64
+    desc = '''\
+        Maximum length of fields and values of a hash with the compact
+        encoding.
+        '''
+
+
+class KeyValueListMaxListpackEntries(PulsarDsSetting):
+    name = "key_value_list_max_listpack_entries"
+    flags = ["--key-value-list-max-listpack-entries"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of elements of a list with the compact encoding.
+        '''
+
+
+class KeyValueListMaxListpackValue(PulsarDsSetting):
+    name = "key_value_list_max_listpack_value"
+    flags = ["--key-value-list-max-listpack-value"]
+    type = int
+    default = 64
+    desc = '''\
+        Maximum length of the elements of a list with the compact encoding.
+        '''
+
+
+class KeyValueSetMaxIntsetEntries(PulsarDsSetting):
+    name = "key_value_set_max_intset_entries"
+    flags = ["--key-value-set-max-intset-entries"]
+    type = int
+    default = 512
+    desc = '''\
+        Maximum number of members of a set of integers with the compact
+        encoding.
+        '''
+
+
+class KeyValueHllSparseMaxBytes(PulsarDsSetting):
+    name = "key_value_hll_sparse_max_bytes"
+    flags = ["--key-value-hll-sparse-max-bytes"]
+    type = int
+    default = 3000
+    desc = '''\
+        Size in bytes above which a HyperLogLog with the sparse encoding is
+        converted to the dense encoding, of 12KB.
+        '''
+
+
+class KeyValueStreamNodeMaxEntries(PulsarDsSetting):
+    name = "key_value_stream_node_max_entries"
+    flags = ["--key-value-stream-node-max-entries"]
+    type = int
+    default = 100
+    desc = '''\
+        Maximum number of entries of a stream node, 0 for no limit.
+        '''
+
+
+class KeyValueStreamNodeMaxBytes(PulsarDsSetting):
+    name = "key_value_stream_node_max_bytes"
+    flags = ["--key-value-stream-node-max-bytes"]
+    type = int
+    default = 4096
+    desc = '''\
+        Size in bytes of the fields and values of a stream node above which
+        new entries are added to a new node, 0 for no limit.
+        '''
+
+
+class KeyValueSlowlogLogSlowerThan(PulsarDsSetting):
+    name = "key_value_slowlog_log_slower_than"
+    flags = ["--key-value-slowlog-log-slower-than"]
+    type = int
+    default = 10000
+    desc = '''\
+        Execution time, in microseconds, from which commands are logged in
+        the slow log.
+
+        Set to 0 to log all commands, to a negative number to disable the
+        slow log.
+        '''
+
+
+class KeyValueSlowlogMaxLen(PulsarDsSetting):
+    name = "key_value_slowlog_max_len"
+    flags = ["--key-value-slowlog-max-len"]
+    type = int
+    default = 128
+    desc = '''\
+        Maximum number of commands in the slow log.
+        '''
+
+
+class KeyValueLatencyMonitorThreshold(PulsarDsSetting):
+    name = "key_value_latency_monitor_threshold"
+    flags = ["--key-value-latency-monitor-threshold"]
+    type = int
+    default = 0
+    desc = '''\
+        Latency, in milliseconds, from which commands and expire cycles are
+        recorded by the latency monitor.
+
+        Set to 0, the default, to disable the latency monitor.
+        '''
+
+
+class KeyValueBackgroundLoad(PulsarDsSetting):
+    name = "key_value_background_load"
+    flags = ["--key-value-background-load"]
+    action = "store_true"
+    default = False
+    desc = '''\
+        Load the DB file in the background.
+
+        The server accepts connections while loading the data but replies
+        with a LOADING error to commands which access the data.
+        '''
+
+
 class TcpServer(pulsar.TcpServer):
 
-    def __init__(self, cfg, *args, **kwargs):
+    def __init__(self, cfg, *args, cluster=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.cfg = cfg
         self._parser_class = redis_parser(cfg.redis_py_parser)
-        self._key_value_store = Storage(self, cfg)
+        self._key_value_store = Storage(self, cfg, cluster)
 
     def info(self):
         info = super().info()
@@ -176,44 +550,145 @@ class PulsarDS(SocketServer):
                         apps=['socket', 'pulsards'])
 
     def server_factory(self, *args, **kw):
-        return TcpServer(self.cfg, *args, **kw)
+        cfg = self.cfg
+        cluster = None
+        if cfg.key_value_cluster:
+            if cfg.workers:
+                # the store of a node loads the data of its slots only
+                index = pulsar.get_actor().cluster_node[0]
+                cluster = Cluster(cfg.cluster_addresses, index)
+            else:
+                # a single node serving all slots
+                cluster = Cluster(cfg.addresses[:1])
+        return TcpServer(cfg, *args, cluster=cluster, **kw)
 
     def protocol_factory(self):
         return partial(PulsarStoreClient, self.cfg)
 
     def monitor_start(self, monitor):
         cfg = self.cfg
+        if cfg.key_value_cluster:
+            return self._cluster_start(monitor)
         workers = min(1, cfg.workers)
         cfg.set('workers', workers)
         return super().monitor_start(monitor)
 
+    def actorparams(self, monitor, params):
+        super().actorparams(monitor, params)
+        if self.cfg.key_value_cluster:
+            # assign the first node not served by a live worker, workers
+            # spawned while all nodes are served get no node and stop
+            nodes = monitor.cluster_nodes
+            for index, aid in enumerate(nodes):
+                if aid not in monitor.managed_actors:
+                    params['aid'] = nodes[index] = gen_unique_id()[:8]
+                    params['cluster_node'] = (index,
+                                              monitor.cluster_sockets[index])
+                    break
+
+    def worker_start(self, worker, exc=None):
+        if not exc and self.cfg.key_value_cluster and self.cfg.workers:
+            node = getattr(worker, 'cluster_node', None)
+            if node is None:
+                # all nodes are served by live workers
+                self.logger.error('No free cluster node for %s, stopping',
+                                  worker)
+                return worker.stop()
+            worker.sockets = list(worker.sockets) + [node[1]]
+        super().worker_start(worker, exc)
+
+    #    INTERNALS
+    def _cluster_start(self, monitor):
+        yield from super().monitor_start(monitor)
+        cfg = self.cfg
+        loop = monitor._loop
+        host, port = cfg.addresses[0][:2]
+        sockets = []
+        addresses = []
+        for index in range(cfg.workers):
+            server = yield from loop.create_server(
+                asyncio.Protocol, host, port + index + 1 if port else 0)
+            sock = server.sockets[0]
+            loop.remove_reader(sock.fileno())
+            sockets.append(sock)
+            addresses.append(sock.getsockname())
+        monitor.cluster_sockets = sockets
+        monitor.cluster_nodes = [None]*len(sockets)
+        cfg.cluster_addresses = addresses
+
 
 # #############################################################################
 # #    DATA STORE
-pubsub_patterns = namedtuple('pubsub_patterns', 're clients')
 
 
 class Storage(object):
     '''Implement redis commands.
     '''
-    def __init__(self, server, cfg):
+    def __init__(self, server, cfg, cluster=None):
         self.cfg = cfg
         self._password = cfg.key_value_password.encode('utf-8')
         self._filename = cfg.key_value_filename
+        self._appendfilename = cfg.key_value_appendfilename
+        if cluster is not None:
+            self._filename = cluster.filename(self._filename)
+            self._appendfilename = cluster.filename(self._appendfilename)
         self._writer = None
+        self._aof = None
+        self._replication = None
+        self._master = None
+        self._cluster = cluster
+        self._readonly = False
+        self._loading = None
+        self._loaded_keys = 0
         self._server = server
         self._loop = server._loop
         self._parser = server._parser_class()
         self._missed_keys = 0
         self._hit_keys = 0
         self._expired_keys = 0
+        self._expire_cycle_time = 0
+        self._expire_cycle_cap_reached = 0
+        self._sync_full = 0
+        self._sync_partial_ok = 0
+        self._sync_partial_err = 0
+        self._evicted_keys = 0
+        self._maxmemory = cfg.key_value_maxmemory
+        self._maxmemory_policy = cfg.key_value_maxmemory_policy
+        self._maxmemory_samples = cfg.key_value_maxmemory_samples
+        self._hash_max_listpack_entries = \
+            cfg.key_value_hash_max_listpack_entries
+        self._hash_max_listpack_value = cfg.key_value_hash_max_listpack_value
+        self._list_max_listpack_entries = \
+            cfg.key_value_list_max_listpack_entries
+        self._list_max_listpack_value = cfg.key_value_list_max_listpack_value
+        self._set_max_intset_entries = cfg.key_value_set_max_intset_entries
+        self._hll_sparse_max_bytes = cfg.key_value_hll_sparse_max_bytes
+        self._stream_node_max_entries = cfg.key_value_stream_node_max_entries
+        self._stream_node_max_bytes = cfg.key_value_stream_node_max_bytes
+        self._slowlog_log_slower_than = \
+            cfg.key_value_slowlog_log_slower_than
+        self._slowlog_max_len = cfg.key_value_slowlog_max_len
+        self._latency_monitor_threshold = \
+            cfg.key_value_latency_monitor_threshold
+        self._stats = Stats(self)
+        self._latency = Latency()
+        self._lazyfree = LazyFree(self._loop)
+        # event loop lag measured by the cron, in seconds
+        self._loop_lag = 0
+        self._loop_lag_max = 0
+        self._cron_deadline = None
+        # seconds since the storage started, the clock of key accesses
+        self._started = time.time()
+        self._lru_clock = 0
         self._dirty = 0
         self._bpop_blocked_clients = 0
+        # streams with new entries for clients blocked by XREAD
+        self._ready_streams = []
         self._last_save = int(time.time())
         self._channels = {}
-        self._patterns = {}
-        # The set of clients which are watching keys
-        self._watching = set()
+        self._patterns = PatternIndex()
+        self._tracking = Tracking(self)
+        self._last_client_id = 0
         # The set of clients which issued the monitor command
         self._monitors = set()
         self.logger = server.logger
@@ -228,22 +703,28 @@ class Storage(object):
         self.NOTIFY_ZSET = (1 << 7)
         self.NOTIFY_EXPIRED = (1 << 8)
         self.NOTIFY_EVICTED = (1 << 9)
+        self.NOTIFY_STREAM = (1 << 10)
         self.NOTIFY_ALL = (self.NOTIFY_GENERIC | self.NOTIFY_STRING |
                            self.NOTIFY_LIST | self.NOTIFY_SET |
                            self.NOTIFY_HASH | self.NOTIFY_ZSET |
-                           self.NOTIFY_EXPIRED | self.NOTIFY_EVICTED)
+                           self.NOTIFY_EXPIRED | self.NOTIFY_EVICTED |
+                           self.NOTIFY_STREAM)
 
+        self.SLAVE = (1 << 0)
+        self.MASTER = (1 << 1)
         self.MONITOR = (1 << 2)
         self.MULTI = (1 << 3)
         self.BLOCKED = (1 << 4)
         self.DIRTY_CAS = (1 << 5)
+        self.DIRTY_EXEC = (1 << 6)
         #
         self._event_handlers = {self.NOTIFY_GENERIC: self._generic_event,
                                 self.NOTIFY_STRING: self._string_event,
                                 self.NOTIFY_SET: self._set_event,
                                 self.NOTIFY_HASH: self._hash_event,
                                 self.NOTIFY_LIST: self._list_event,
-                                self.NOTIFY_ZSET: self._zset_event}
+                                self.NOTIFY_ZSET: self._zset_event,
+                                self.NOTIFY_STREAM: self._stream_event}
         self._set_options = (b'ex', b'px', b'nx', b'xx')
         self.OK = b'+OK\r\n'
         self.QUEUED = b'+QUEUED\r\n'
@@ -260,42 +741,79 @@ class Storage(object):
         self.SYNTAX_ERROR = 'Syntax error'
         self.SUBSCRIBE_COMMANDS = ('psubscribe', 'punsubscribe', 'subscribe',
                                    'unsubscribe', 'quit')
+        self.LOADING_COMMANDS = ('auth', 'echo', 'info', 'ping', 'quit',
+                                 'select', 'time')
+        self.LOADING = 'Pulsar-ds is loading the dataset in memory'
+        self.READONLY = "You can't write against a read only replica."
+        self.OOM = "command not allowed when used memory > 'maxmemory'."
         self.encoder = pickle
-        self.hash_type = Dict
-        self.list_type = Deque
-        self.zset_type = Zset
-        self.data_types = (bytearray, set, self.hash_type,
-                           self.list_type, self.zset_type)
+        self.hash_type = ScanDict
+        self.list_type = QuickList
+        self.set_type = ScanSet
+        self.zset_type = ScanZset
+        self.hash_types = (self.hash_type, PackedHash)
+        self.list_types = (self.list_type, PackedList)
+        self.set_types = (self.set_type, IntSet)
+        self.data_types = ((bytearray, self.zset_type, HyperLogLog,
+                            Stream) + self.hash_types + self.list_types +
+                           self.set_types)
         self.zset_aggregate = {b'min': min,
                                b'max': max,
                                b'sum': sum}
         self._type_event_map = {bytearray: self.NOTIFY_STRING,
                                 self.hash_type: self.NOTIFY_HASH,
+                                PackedHash: self.NOTIFY_HASH,
                                 self.list_type: self.NOTIFY_LIST,
-                                set: self.NOTIFY_SET,
-                                self.zset_type: self.NOTIFY_ZSET}
+                                PackedList: self.NOTIFY_LIST,
+                                self.set_type: self.NOTIFY_SET,
+                                IntSet: self.NOTIFY_SET,
+                                self.zset_type: self.NOTIFY_ZSET,
+                                HyperLogLog: self.NOTIFY_STRING,
+                                Stream: self.NOTIFY_STREAM}
         self._type_name_map = {bytearray: 'string',
                                self.hash_type: 'hash',
+                               PackedHash: 'hash',
                                self.list_type: 'list',
-                               set: 'set',
-                               self.zset_type: 'zset'}
+                               PackedList: 'list',
+                               self.set_type: 'set',
+                               IntSet: 'set',
+                               self.zset_type: 'zset',
+                               HyperLogLog: 'string',
+                               Stream: 'stream'}
         self.databases = dict(((num, Db(num, self))
                                for num in range(cfg.key_value_databases)))
+        self._commands = command_table(self)
         # Initialise lua
         self.lua = None
         self.version = '2.4.10'
         self._loaddb()
+        if cfg.key_value_appendonly:
+            self._aof = AppendOnlyFile(self, self._appendfilename,
+                                       cfg.key_value_appendfsync,
+                                       cfg.key_value_aof_rewrite_size)
+            if not self._aof.size and self._loading is None:
+                self._aof_init()
+        if cfg.key_value_slaveof:
+            host, port = cfg.key_value_slaveof.rsplit(':', 1)
+            self._slaveof(host, int(port))
         self._cron()
 
     # #########################################################################
     # #    KEYS COMMANDS
-    @command('Keys', True, name='del')
+    @command('Keys', True, name='del', keys=(1, -1, 1))
     def delete(self, client, request, N):
         check_input(request, not N)
         rem = client.db.rem
         result = reduce(lambda x, y: x + rem(y), request[1:], 0)
         client.reply_int(result)
 
+    @command('Keys', True, keys=(1, -1, 1))
+    def unlink(self, client, request, N):
+        check_input(request, not N)
+        rem = client.db.rem
+        result = reduce(lambda x, y: x + rem(y, True), request[1:], 0)
+        client.reply_int(result)
+
     @command('Keys')
     def dump(self, client, request, N):
         check_input(request, N != 1)
@@ -344,7 +862,7 @@ class Storage(object):
                     return client.reply_one()
             client.reply_zero()
 
-    @command('Keys')
+    @command('Keys', keys=(0, 0, 0))
     def keys(self, client, request, N):
         err = 'ignore'
         check_input(request, N != 1)
@@ -357,7 +875,7 @@ class Storage(object):
                   gr.search(key.decode('utf-8', err))]
         client.reply_multi_bulk(result)
 
-    @command('Keys', supported=False)
+    @command('Keys', supported=False, keys=(0, 0, 0))
     def migrate(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
 
@@ -382,9 +900,38 @@ class Storage(object):
         self._signal(self._type_event_map[type(value)], db2, 'set', key, 1)
         client.reply_one()
 
-    @command('Keys', supported=False)
+    @command('Keys', keys=(2, 2, 1))
     def object(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N != 2)
+        subcommand = request[1].decode('utf-8').lower()
+        key = request[2]
+        db = client.db
+        if key not in db._data or db._expire_if_needed(key):
+            return client.reply_bulk()
+        lfu = self._maxmemory_policy == 'allkeys-lfu'
+        access = db._data._access.get(key)
+        if subcommand == 'refcount':
+            client.reply_int(1)
+        elif subcommand == 'encoding':
+            value = db._data[key]
+            if isinstance(value, (Compact, Stream)):
+                client.reply_bulk(value.encoding.encode('utf-8'))
+            else:
+                client.reply_bulk(full_encoding(value).encode('utf-8'))
+        elif subcommand == 'freq':
+            if not lfu:
+                return client.reply_error(
+                    'An LFU maxmemory policy is not selected, access '
+                    'frequency not tracked.')
+            client.reply_int(lfu_counter(access or 0, self._lru_clock//60))
+        elif subcommand == 'idletime':
+            if lfu:
+                return client.reply_error(
+                    'An LFU maxmemory policy is selected, idle time not '
+                    'tracked.')
+            client.reply_int(self._lru_clock - (access or 0))
+        else:
+            client.reply_error("Unknown subcommand '%s'" % subcommand)
 
     @command('Keys', True)
     def persist(self, client, request, N):
@@ -407,7 +954,7 @@ class Storage(object):
         check_input(request, N != 1)
         client.reply_int(client.db.ttl(request[1], 1000))
 
-    @command('Keys')
+    @command('Keys', keys=(0, 0, 0))
     def randomkey(self, client, request, N):
         check_input(request, N)
         keys = list(client.db)
@@ -416,7 +963,7 @@ class Storage(object):
         else:
             client.reply_bulk()
 
-    @command('Keys', True)
+    @command('Keys', True, keys=(1, 2, 1))
     def rename(self, client, request, N, ex=False):
         check_input(request, N != 2)
         key1, key2 = request[1], request[2]
@@ -443,7 +990,7 @@ class Storage(object):
             self._signal(event, db, request[0], key2, dirty)
             client.reply_one() if result else client.reply_ok()
 
-    @command('Keys', True)
+    @command('Keys', True, keys=(1, 2, 1))
     def renamenx(self, client, request, N):
         self.rename(client, request, N, True)
 
@@ -453,7 +1000,7 @@ class Storage(object):
         key = request[1]
         db = client.db
         try:
-            value = self.encoder.loads(request[3])
+            value = self._upgrade(self.encoder.loads(request[3]))
         except Exception:
             value = None
         if not isinstance(value, self.data_types):
@@ -475,16 +1022,17 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             value = self.list_type()
-        elif not isinstance(value, (set, self.list_type, self.zset_type)):
+        elif not isinstance(value, (self.zset_type,) + self.list_types +
+                            self.set_types):
             return client.reply_wrongtype()
         sort_command(self, client, request, value)
 
-    @command('Keys', True)
+    @command('Keys')
     def ttl(self, client, request, N):
         check_input(request, N != 1)
         client.reply_int(client.db.ttl(request[1]))
 
-    @command('Keys', True)
+    @command('Keys')
     def type(self, client, request, N):
         check_input(request, N != 1)
         value = client.db.get(request[1])
@@ -494,9 +1042,24 @@ class Storage(object):
             result = self._type_name_map[type(value)]
         client.reply_status(result)
 
-    @command('Keys', supported=False)
+    @command('Keys', keys=(0, 0, 0))
     def scan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, not N)
+        cursor, match, count, type_name = self._scan_options(request[1:],
+                                                             True)
+        db = client.db
+        cursor, keys = db._data.scan(cursor, count)
+        result = []
+        for key in keys:
+            if db._expire_if_needed(key):
+                continue
+            if type_name and (self._type_name_map[type(db._data[key])] !=
+                              type_name):
+                continue
+            if match and not match.search(key.decode('utf-8', 'ignore')):
+                continue
+            result.append(key)
+        client.reply_multi_bulk((str(cursor).encode('utf-8'), result))
 
     # #########################################################################
     # #    STRING COMMANDS
@@ -519,65 +1082,68 @@ class Storage(object):
 
     @command('Strings')
     def bitcount(self, client, request, N):
-        check_input(request, N < 1 or N > 3)
-        key = request[1]
-        db = client.db
-        value = db.get(key)
-        if value is None:
-            client.reply_int(0)
-        elif not isinstance(value, bytearray):
+        check_input(request, N < 1 or N > 4)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, bytearray):
             return client.reply_wrongtype()
-        else:
-            assert value
-            if N > 1:
-                start = request[2]
-                end = request[3] if N == 3 else -1
-                start, end = self._range_values(value, start, end)
-                value = value[start:end]
-            client.reply_int(count_bytes(value))
+        start, end, bit = self._bit_range(request[2:], N == 4)
+        client.reply_int(bitcount(value, start, end, bit) if value else 0)
 
-    @command('Strings', True)
+    @command('Strings', True, keys=(2, -1, 1))
     def bitop(self, client, request, N):
         check_input(request, N < 3)
         db = client.db
         op = request[1].lower()
-        if op == b'and':
-            reduce_op = and_op
-        elif op == b'or':
-            reduce_op = or_op
-        elif op == b'xor':
-            reduce_op = xor_op
-        elif op == b'not':
-            reduce_op = None
+        if op == b'not':
             check_input(request, N != 3)
-        else:
-            return client.reply_error('bad command')
+        elif op not in OPERATORS:
+            return client.reply_error(self.SYNTAX_ERROR)
         empty = bytearray()
-        keys = []
+        strings = []
         for key in request[3:]:
             value = db.get(key)
             if value is None:
-                keys.append(empty)
+                strings.append(empty)
             elif isinstance(value, bytearray):
-                keys.append(value)
+                strings.append(value)
             else:
                 return client.reply_wrongtype()
-        result = bytearray()
-        if reduce_op is None:
-            for value in keys[0]:
-                result.append(~value & 255)
-        else:
-            for values in zip_longest(*keys, **{'fillvalue': 0}):
-                result.append(reduce(reduce_op, values))
+        result = bitop(op, strings)
+        dest = request[2]
+        if db.pop(dest):
+            self._signal(self.NOTIFY_GENERIC, db, 'del', dest)
         if result:
-            dest = request[2]
-            if db.pop(dest):
-                self._signal(self.NOTIFY_GENERIC, db, 'del', dest)
             db._data[dest] = result
             self._signal(self.NOTIFY_STRING, db, 'set', dest, 1)
-            client.reply_int(len(result))
-        else:
-            client.reply_zero()
+        client.reply_int(len(result))
+
+    @command('Strings')
+    def bitpos(self, client, request, N):
+        check_input(request, N < 2 or N > 5)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, bytearray):
+            return client.reply_wrongtype()
+        bit = request[2]
+        if bit not in (b'0', b'1'):
+            return client.reply_error('The bit argument must be 1 or 0.')
+        bit = bit == b'1'
+        if not value:
+            return client.reply_int(-1 if bit else 0)
+        start, end, unit_bit = self._bit_range(request[3:], N == 5)
+        if N < 4:
+            end = None
+        client.reply_int(bitpos(value, bit, start, end, unit_bit))
+
+    @command('Strings', True)
+    def bitfield(self, client, request, N):
+        check_input(request, not N)
+        self._bitfield(client, request, bitfield_operations(request[2:]))
+
+    @command('Strings', name='bitfield_ro')
+    def bitfield_ro(self, client, request, N):
+        check_input(request, not N)
+        self._bitfield(client, request,
+                       bitfield_operations(request[2:], True))
 
     @command('Strings', True)
     def decr(self, client, request, N):
@@ -691,7 +1257,7 @@ class Storage(object):
         r = self._incrby(client, request[0], request[1], request[2], float)
         client.reply_bulk(str(r).encode('utf-8'))
 
-    @command('Strings')
+    @command('Strings', keys=(1, -1, 1))
     def mget(self, client, request, N):
         check_input(request, not N)
         get = client.db.get
@@ -706,7 +1272,7 @@ class Storage(object):
                 return client.reply_wrongtype()
         client.reply_multi_bulk(values)
 
-    @command('Strings', True)
+    @command('Strings', True, keys=(1, -1, 2))
     def mset(self, client, request, N):
         D = N // 2
         check_input(request, N < 2 or D * 2 != N)
@@ -717,7 +1283,7 @@ class Storage(object):
             self._signal(self.NOTIFY_STRING, db, 'set', key, 1)
         client.reply_ok()
 
-    @command('Strings', True)
+    @command('Strings', True, keys=(1, -1, 2))
     def msetnx(self, client, request, N):
         D = N // 2
         check_input(request, N < 2 or D * 2 != N)
@@ -880,7 +1446,7 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_zero()
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             rem = 0
             for field in request[2:]:
                 rem += 0 if value.pop(field, None) is None else 1
@@ -897,7 +1463,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_zero()
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_int(int(request[2] in value))
         else:
             client.reply_wrongtype()
@@ -908,7 +1474,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_bulk()
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_bulk(value.get(request[2]))
         else:
             client.reply_wrongtype()
@@ -919,7 +1485,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_multi_bulk(())
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_multi_bulk(value.flat())
         else:
             client.reply_wrongtype()
@@ -942,7 +1508,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_multi_bulk(())
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_multi_bulk(value)
         else:
             client.reply_wrongtype()
@@ -953,7 +1519,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_zero()
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_int(len(value))
         else:
             client.reply_wrongtype()
@@ -964,7 +1530,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_multi_bulk(())
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             result = value.mget(request[2:])
             client.reply_multi_bulk(result)
         else:
@@ -978,10 +1544,11 @@ class Storage(object):
         db = client.db
         value = db.get(key)
         if value is None:
-            value = self.hash_type()
+            value = PackedHash()
             db._data[key] = value
-        elif not isinstance(value, self.hash_type):
+        elif not isinstance(value, self.hash_types):
             return client.reply_wrongtype()
+        value = self._fit(db, key, value, request[2:])
         it = iter(request[2:])
         value.update(zip(it, it))
         self._signal(self.NOTIFY_HASH, db, request[0], key, D)
@@ -994,10 +1561,11 @@ class Storage(object):
         db = client.db
         value = db.get(key)
         if value is None:
-            value = self.hash_type()
+            value = PackedHash()
             db._data[key] = value
-        elif not isinstance(value, self.hash_type):
+        elif not isinstance(value, self.hash_types):
             return client.reply_wrongtype()
+        value = self._fit(db, key, value, request[2:])
         avail = (field in value)
         value[field] = request[3]
         self._signal(self.NOTIFY_HASH, db, request[0], key, 1)
@@ -1010,13 +1578,14 @@ class Storage(object):
         db = client.db
         value = db.get(key)
         if value is None:
-            value = self.hash_type()
+            value = PackedHash()
             db._data[key] = value
-        elif not isinstance(value, self.hash_type):
+        elif not isinstance(value, self.hash_types):
             return client.reply_wrongtype()
         if field in value:
             client.reply_zero()
         else:
+            value = self._fit(db, key, value, request[2:])
             value[field] = request[3]
             self._signal(self.NOTIFY_HASH, db, request[0], key, 1)
             client.reply_one()
@@ -1027,18 +1596,27 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_multi_bulk(())
-        elif isinstance(value, self.hash_type):
+        elif isinstance(value, self.hash_types):
             client.reply_multi_bulk(tuple(value.values()))
         else:
             client.reply_wrongtype()
 
-    @command('Hashes', supported=False)
+    @command('Hashes')
     def hscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        cursor, match, count, _ = self._scan_options(request[2:])
+        value = client.db.get(request[1])
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, self.hash_types):
+            client.reply_wrongtype()
+        else:
+            self._scan_collection(client, value, cursor, match, count,
+                                  value.get)
 
     # #########################################################################
     # #    LIST COMMANDS
-    @command('Lists', True, script=0)
+    @command('Lists', True, script=0, keys=(1, -2, 1))
     def blpop(self, client, request, N):
         check_input(request, N < 2)
         try:
@@ -1049,11 +1627,11 @@ class Storage(object):
         if not self._bpop(client, request, keys):
             client.blocked = Blocked(client, request[0], keys, timeout)
 
-    @command('Lists', True, script=0)
+    @command('Lists', True, script=0, keys=(1, -2, 1))
     def brpop(self, client, request, N):
         return self.blpop(client, request, N)
 
-    @command('Lists', True, script=0)
+    @command('Lists', True, script=0, keys=(1, 2, 1))
     def brpoplpush(self, client, request, N):
         check_input(request, N != 3)
         try:
@@ -1071,10 +1649,10 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_bulk()
-        elif isinstance(value, self.list_type):
+        elif isinstance(value, self.list_types):
             assert value
-            index = int(request[2])
-            if index >= 0 and index < len(value):
+            index = self._integer(request[2])
+            if -len(value) <= index < len(value):
                 client.reply_bulk(value[index])
             else:
                 client.reply_bulk()
@@ -1091,12 +1669,13 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
             where = request[2].lower()
             l1 = len(value)
+            value = self._fit(db, key, value, request[4:])
             if where == b'before':
                 value.insert_before(request[3], request[4])
             elif where == b'after':
@@ -1116,7 +1695,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_zero()
-        elif isinstance(value, self.list_type):
+        elif isinstance(value, self.list_types):
             assert value
             client.reply_int(len(value))
         else:
@@ -1130,7 +1709,7 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_bulk()
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
@@ -1154,12 +1733,13 @@ class Storage(object):
         db = client.db
         value = db.get(key)
         if value is None:
-            value = self.list_type()
+            value = PackedList()
             db._data[key] = value
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             return client.reply_wrongtype()
         else:
             assert value
+        value = self._fit(db, key, value, request[2:])
         if request[0] == 'lpush':
             value.extendleft(request[2:])
         else:
@@ -1179,10 +1759,11 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
+            value = self._fit(db, key, value, request[2:])
             if request[0] == 'lpushx':
                 value.appendleft(request[2])
             else:
@@ -1194,7 +1775,7 @@ class Storage(object):
     def rpushx(self, client, request, N):
         return self.lpushx(client, request, N)
 
-    @command('Lists', True)
+    @command('Lists')
     def lrange(self, client, request, N):
         check_input(request, N != 3)
         db = client.db
@@ -1206,11 +1787,11 @@ class Storage(object):
             return client.reply_error('invalid range')
         if value is None:
             client.reply_multi_bulk(())
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
-            client.reply_multi_bulk(tuple(islice(value, start, end)))
+            client.reply_multi_bulk(value[start:end])
 
     @command('Lists', True)
     def lrem(self, client, request, N):
@@ -1222,7 +1803,7 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
@@ -1245,15 +1826,13 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_error(self.OUT_OF_BOUND)
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
-            try:
-                index = int(request[2])
-            except Exception:
-                index = -1
-            if index >= 0 and index < len(value):
+            index = self._integer(request[2])
+            if -len(value) <= index < len(value):
+                value = self._fit(db, key, value, request[3:])
                 value[index] = request[3]
                 self._signal(self.NOTIFY_LIST, db, request[0], key, 1)
                 client.reply_ok()
@@ -1272,7 +1851,7 @@ class Storage(object):
             return client.reply_error('invalid range')
         if value is None:
             client.reply_ok()
-        elif not isinstance(value, self.list_type):
+        elif not isinstance(value, self.list_types):
             client.reply_wrongtype()
         else:
             assert value
@@ -1283,7 +1862,7 @@ class Storage(object):
             if db.pop(key, value) is not None:
                 self._signal(self.NOTIFY_GENERIC, db, 'del', key)
 
-    @command('Lists', True)
+    @command('Lists', True, keys=(1, 2, 1))
     def rpoplpush(self, client, request, N):
         check_input(request, N != 2)
         key1, key2 = request[1], request[2]
@@ -1292,19 +1871,20 @@ class Storage(object):
         dest = db.get(key2)
         if orig is None:
             client.reply_bulk()
-        elif not isinstance(orig, self.list_type):
+        elif not isinstance(orig, self.list_types):
             client.reply_wrongtype()
         else:
             assert orig
             if dest is None:
-                dest = self.list_type()
+                dest = PackedList()
                 db._data[key2] = dest
-            elif not isinstance(dest, self.list_type):
+            elif not isinstance(dest, self.list_types):
                 return client.reply_wrongtype()
             else:
                 assert dest
             value = orig.pop()
             self._signal(self.NOTIFY_LIST, db, 'rpop', key1, 1)
+            dest = self._fit(db, key2, dest, (value,))
             dest.appendleft(value)
             self._signal(self.NOTIFY_LIST, db, 'lpush', key2, 1)
             if db.pop(key1, orig) is not None:
@@ -1320,10 +1900,11 @@ class Storage(object):
         db = client.db
         value = db.get(key)
         if value is None:
-            value = set()
+            value = IntSet()
             db._data[key] = value
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             return client.reply_wrongtype()
+        value = self._fit(db, key, value, request[2:])
         n = len(value)
         value.update(request[2:])
         n = len(value) - n
@@ -1336,27 +1917,27 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             client.reply_wrongtype()
         else:
             client.reply_int(len(value))
 
-    @command('Sets')
+    @command('Sets', keys=(1, -1, 1))
     def sdiff(self, client, request, N):
         check_input(request, N < 1)
         self._setoper(client, 'difference', request[1:])
 
-    @command('Sets', True)
+    @command('Sets', True, keys=(1, -1, 1))
     def sdiffstore(self, client, request, N):
         check_input(request, N < 2)
         self._setoper(client, 'difference', request[2:], request[1])
 
-    @command('Sets')
+    @command('Sets', keys=(1, -1, 1))
     def sinter(self, client, request, N):
         check_input(request, N < 1)
         self._setoper(client, 'intersection', request[1:])
 
-    @command('Sets', True)
+    @command('Sets', True, keys=(1, -1, 1))
     def sinterstore(self, client, request, N):
         check_input(request, N < 2)
         self._setoper(client, 'intersection', request[2:], request[1])
@@ -1367,7 +1948,7 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             client.reply_wrongtype()
         else:
             client.reply_int(int(request[2] in value))
@@ -1378,12 +1959,12 @@ class Storage(object):
         value = client.db.get(request[1])
         if value is None:
             client.reply_multi_bulk(())
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             client.reply_wrongtype()
         else:
             client.reply_multi_bulk(value)
 
-    @command('Sets', True)
+    @command('Sets', True, keys=(1, 2, 1))
     def smove(self, client, request, N):
         check_input(request, N != 3)
         db = client.db
@@ -1393,17 +1974,18 @@ class Storage(object):
         dest = db.get(key2)
         if orig is None:
             client.reply_zero()
-        elif not isinstance(orig, set):
+        elif not isinstance(orig, self.set_types):
             client.reply_wrongtype()
         else:
             member = request[3]
             if member in orig:
                 # we my be able to move
                 if dest is None:
-                    dest = set()
-                    db._data[request[2]] = dest
-                elif not isinstance(dest, set):
+                    dest = IntSet()
+                    db._data[key2] = dest
+                elif not isinstance(dest, self.set_types):
                     return client.reply_wrongtype()
+                dest = self._fit(db, key2, dest, (member,))
                 orig.remove(member)
                 dest.add(member)
                 self._signal(self.NOTIFY_SET, db, 'srem', key1)
@@ -1422,11 +2004,13 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_bulk()
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             client.reply_wrongtype()
         else:
             result = value.pop()
-            self._signal(self.NOTIFY_SET, db, request[0], key, 1)
+            # propagate the deterministic srem
+            request[:] = ['srem', key, result]
+            self._signal(self.NOTIFY_SET, db, 'spop', key, 1)
             if db.pop(key, value) is not None:
                 self._signal(self.NOTIFY_GENERIC, db, 'del', key)
             client.reply_bulk(result)
@@ -1435,7 +2019,7 @@ class Storage(object):
     def srandmember(self, client, request, N):
         check_input(request, N < 1 or N > 2)
         value = client.db.get(request[1])
-        if value is not None and not isinstance(value, set):
+        if value is not None and not isinstance(value, self.set_types):
             return client.reply_wrongtype()
         if N == 2:
             try:
@@ -1483,7 +2067,7 @@ class Storage(object):
         value = db.get(key)
         if value is None:
             client.reply_zero()
-        elif not isinstance(value, set):
+        elif not isinstance(value, self.set_types):
             client.reply_wrongtype()
         else:
             start = len(value)
@@ -1494,19 +2078,27 @@ class Storage(object):
                 self._signal(self.NOTIFY_GENERIC, db, 'del', key)
             client.reply_int(removed)
 
-    @command('Sets')
+    @command('Sets', keys=(1, -1, 1))
     def sunion(self, client, request, N):
         check_input(request, N < 1)
         self._setoper(client, 'union', request[1:])
 
-    @command('Sets', True)
+    @command('Sets', True, keys=(1, -1, 1))
     def sunionstore(self, client, request, N):
         check_input(request, N < 2)
         self._setoper(client, 'union', request[2:], request[1])
 
-    @command('Sets', supported=False)
+    @command('Sets')
     def sscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        cursor, match, count, _ = self._scan_options(request[2:])
+        value = client.db.get(request[1])
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, self.set_types):
+            client.reply_wrongtype()
+        else:
+            self._scan_collection(client, value, cursor, match, count)
 
     # #########################################################################
     # #    SORTED SETS COMMANDS
@@ -1586,7 +2178,7 @@ class Storage(object):
             self._signal(self.NOTIFY_ZSET, db, request[0], key, 1)
             client.reply_bulk(str(score).encode('utf-8'))
 
-    @command('Sorted Sets', True)
+    @command('Sorted Sets', True, keys=zstore_keys)
     def zinterstore(self, client, request, N):
         self._zsetoper(client, request, N)
 
@@ -1763,13 +2355,532 @@ class Storage(object):
                 score = str(score).encode('utf-8')
             client.reply_bulk(score)
 
-    @command('Sorted Sets', True)
+    @command('Sorted Sets', True, keys=zstore_keys)
     def zunionstore(self, client, request, N):
         self._zsetoper(client, request, N)
 
-    @command('Sorted Sets', supported=False)
+    @command('Sorted Sets')
     def zscan(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N < 2)
+        cursor, match, count, _ = self._scan_options(request[2:])
+        value = client.db.get(request[1])
+        if value is None:
+            client.reply_multi_bulk((b'0', ()))
+        elif not isinstance(value, self.zset_type):
+            client.reply_wrongtype()
+        else:
+            self._scan_collection(client, value, cursor, match, count,
+                                  value.score)
+
+    # #########################################################################
+    # #    HYPERLOGLOG COMMANDS
+    @command('HyperLogLog', True, keys=(1, 1, 1))
+    def pfadd(self, client, request, N):
+        check_input(request, not N)
+        db = client.db
+        key = request[1]
+        value = db.get(key)
+        if value is None:
+            value = HyperLogLog()
+            db._data[key] = value
+            value.add(request[2:], self._hll_sparse_max_bytes)
+            changed = True
+        elif not isinstance(value, HyperLogLog):
+            return client.reply_wrongtype()
+        else:
+            changed = value.add(request[2:], self._hll_sparse_max_bytes)
+        if changed:
+            self._signal(self.NOTIFY_STRING, db, request[0], key, 1)
+            client.reply_one()
+        else:
+            client.reply_zero()
+
+    @command('HyperLogLog', keys=(1, -1, 1))
+    def pfcount(self, client, request, N):
+        check_input(request, not N)
+        values = self._hyperloglogs(client, request[1:])
+        if values is None:
+            return
+        elif len(values) == 1:
+            client.reply_int(values[0].count())
+        else:
+            result = HyperLogLog()
+            for value in values:
+                result.merge(value, self._hll_sparse_max_bytes)
+            client.reply_int(result.count())
+
+    @command('HyperLogLog', True, keys=(1, -1, 1))
+    def pfmerge(self, client, request, N):
+        check_input(request, not N)
+        db = client.db
+        key = request[1]
+        values = self._hyperloglogs(client, request[2:])
+        if values is None:
+            return
+        dest = db.get(key)
+        if dest is None:
+            dest = HyperLogLog()
+            db._data[key] = dest
+        elif not isinstance(dest, HyperLogLog):
+            return client.reply_wrongtype()
+        for value in values:
+            if value is not dest:
+                dest.merge(value, self._hll_sparse_max_bytes)
+        self._signal(self.NOTIFY_STRING, db, request[0], key, 1)
+        client.reply_ok()
+
+    # #########################################################################
+    # #    STREAMS COMMANDS
+    @command('Streams', True)
+    def xadd(self, client, request, N):
+        check_input(request, N < 4)
+        db = client.db
+        key = request[1]
+        nomkstream = False
+        trim = None
+        index = 2
+        try:
+            while True:
+                option = request[index].lower()
+                if option == b'nomkstream':
+                    nomkstream = True
+                    index += 1
+                elif option in (b'maxlen', b'minid'):
+                    trim, index = self._xtrim_options(request, index)
+                else:
+                    break
+        except IndexError:
+            raise CommandError(self.SYNTAX_ERROR)
+        fields = request[index+1:]
+        check_input(request, not fields or len(fields) % 2)
+        value = db.get(key)
+        if value is None:
+            if nomkstream:
+                return client.reply_bulk()
+            stream = Stream()
+        elif not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        else:
+            stream = value
+        id = request[index]
+        if id == b'*':
+            id = stream.next_id(self._milliseconds())
+        elif id[-2:] == b'-*':
+            ms = parse_id(id[:-2])[0]
+            if ms < stream.last_id[0]:
+                raise CommandError(ID_TOO_SMALL)
+            id = stream.next_id(ms)
+        else:
+            id = stream.next_id(*parse_id(id))
+        # propagate the ID of the entry
+        request[index] = format_id(id)
+        if value is None:
+            db._data[key] = stream
+        stream.add(id, fields, self._stream_node_max_entries,
+                   self._stream_node_max_bytes)
+        if trim:
+            stream.trim(*trim)
+        self._signal(self.NOTIFY_STREAM, db, request[0], key, 1)
+        client.reply_bulk(request[index])
+
+    @command('Streams')
+    def xlen(self, client, request, N):
+        check_input(request, N != 1)
+        value = client.db.get(request[1])
+        if value is None:
+            client.reply_zero()
+        elif not isinstance(value, Stream):
+            client.reply_wrongtype()
+        else:
+            client.reply_int(len(value))
+
+    @command('Streams')
+    def xrange(self, client, request, N, reverse=False):
+        check_input(request, N != 3 and N != 5)
+        value = client.db.get(request[1])
+        if value is not None and not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        start, end = request[3:1:-1] if reverse else request[2:4]
+        start = parse_range_id(start, 0)
+        end = parse_range_id(end, MAX_ID[1])
+        count = None
+        if N == 5:
+            if request[4].lower() != b'count':
+                raise CommandError(self.SYNTAX_ERROR)
+            count = max(self._integer(request[5]), 0)
+        if value is None:
+            return client.reply_multi_bulk(())
+        entries = value.range(start, end, count, reverse)
+        client.reply_multi_bulk([(format_id(id), fields)
+                                 for id, fields in entries])
+
+    @command('Streams')
+    def xrevrange(self, client, request, N):
+        return self.xrange(client, request, N, True)
+
+    @command('Streams', True)
+    def xdel(self, client, request, N):
+        check_input(request, N < 2)
+        db = client.db
+        key = request[1]
+        value = db.get(key)
+        if value is None:
+            return client.reply_zero()
+        elif not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        ids = [parse_id(id) for id in request[2:]]
+        deleted = sum((value.delete(id) for id in ids))
+        if deleted:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, deleted)
+        client.reply_int(deleted)
+
+    @command('Streams', True)
+    def xtrim(self, client, request, N):
+        check_input(request, N < 3)
+        db = client.db
+        key = request[1]
+        try:
+            trim, index = self._xtrim_options(request, 2)
+        except IndexError:
+            raise CommandError(self.SYNTAX_ERROR)
+        if index != len(request):
+            raise CommandError(self.SYNTAX_ERROR)
+        value = db.get(key)
+        if value is None:
+            return client.reply_zero()
+        elif not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        removed = value.trim(*trim)
+        if removed:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, removed)
+        client.reply_int(removed)
+
+    @command('Streams', keys=read_keys)
+    def xread(self, client, request, N):
+        check_input(request, N < 3)
+        count, block, _, keys, ids = self._xread_options(request, 1)
+        db = client.db
+        result = []
+        last_ids = {}
+        for key, id in zip(keys, ids):
+            value = db.get(key)
+            if value is not None and not isinstance(value, Stream):
+                return client.reply_wrongtype()
+            if id == b'$':
+                id = MIN_ID if value is None else value.last_id
+            else:
+                id = parse_id(id)
+            last_ids[key] = id
+            if value is not None:
+                entries = value.after(id, count)
+                if entries:
+                    result.append((key, self._entries(entries)))
+        if result:
+            client.reply_multi_bulk(result)
+        elif block is None or client.flag & self.MULTI:
+            # commands executed by EXEC never block
+            client.reply_multi_bulk(None)
+        else:
+            self._xread_block(client, request[0], block,
+                              StreamRead(last_ids, count, None))
+
+    @command('Streams', True, keys=read_keys)
+    def xreadgroup(self, client, request, N):
+        check_input(request, N < 6)
+        if request[1].lower() != b'group':
+            raise CommandError(self.SYNTAX_ERROR)
+        name, consumer_name = request[2:4]
+        count, block, noack, keys, ids = self._xread_options(request, 4,
+                                                             True)
+        db = client.db
+        reads = []
+        for key, id in zip(keys, ids):
+            stream, group = self._stream_group(client, key, name)
+            if group is None:
+                return
+            if id == b'$':
+                raise CommandError(
+                    'The $ ID is meaningless in the context of XREADGROUP')
+            reads.append((key, stream, group,
+                          None if id == b'>' else parse_id(id)))
+        now = self._milliseconds()
+        result = []
+        for key, stream, group, id in reads:
+            consumer = group.consumer(consumer_name, now)
+            consumer.seen_time = now
+            if id is None:
+                entries = group.deliver(stream, consumer, count, noack, now)
+                if entries:
+                    self._signal(self.NOTIFY_STREAM, db, request[0], key,
+                                 len(entries))
+                    result.append((key, self._entries(entries)))
+            else:
+                entries = group.history(stream, consumer, id, count)
+                result.append((key, self._entries(entries)))
+        if result:
+            client.reply_multi_bulk(result)
+        elif block is None or client.flag & self.MULTI:
+            # commands executed by EXEC never block
+            client.reply_multi_bulk(None)
+        else:
+            read = StreamRead(dict.fromkeys(keys), count, None, name,
+                              consumer_name, noack)
+            self._xread_block(client, request[0], block, read)
+        if block is not None:
+            # replicas never block
+            for index in range(4, len(request)):
+                if request[index].lower() == b'block':
+                    del request[index:index+2]
+                    break
+
+    @command('Streams', True, keys=(2, 2, 1))
+    def xgroup(self, client, request, N):
+        check_input(request, N < 3)
+        subcommand = request[1].lower()
+        db = client.db
+        key = request[2]
+        value = db.get(key)
+        if value is not None and not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        if subcommand == b'create':
+            check_input(request, N < 4)
+            mkstream = False
+            entries_read = None
+            options = iter(request[5:])
+            for option in options:
+                option = option.lower()
+                if option == b'mkstream':
+                    mkstream = True
+                elif option == b'entriesread':
+                    entries_read = self._integer(next(options, b''))
+                else:
+                    raise CommandError(self.SYNTAX_ERROR)
+            if value is None:
+                if not mkstream:
+                    raise CommandError(XGROUP_NO_KEY)
+                value = Stream()
+                db._data[key] = value
+            name = request[3]
+            if name in value.groups:
+                return client.reply_error(
+                    'Consumer Group name already exists', 'BUSYGROUP')
+            id = self._group_id(value, request[4])
+            value.groups[name] = ConsumerGroup(id, entries_read)
+            self._signal(self.NOTIFY_STREAM, db, 'xgroup', key, 1)
+            return client.reply_ok()
+        elif subcommand not in (b'setid', b'destroy', b'createconsumer',
+                                b'delconsumer'):
+            raise CommandError("Unknown subcommand '%s'" %
+                               request[1].decode('utf-8', 'replace'))
+        elif value is None:
+            raise CommandError(XGROUP_NO_KEY)
+        name = request[3]
+        if subcommand == b'destroy':
+            check_input(request, N != 3)
+            if value.groups.pop(name, None) is None:
+                return client.reply_zero()
+            self._signal(self.NOTIFY_STREAM, db, 'xgroup', key, 1)
+            return client.reply_one()
+        group = value.groups.get(name)
+        if group is None:
+            return client.reply_error(
+                "No such consumer group '%s' for key name '%s'" %
+                (name.decode('utf-8', 'replace'),
+                 key.decode('utf-8', 'replace')), 'NOGROUP')
+        if subcommand == b'setid':
+            check_input(request, N != 4 and N != 6)
+            group.last_id = self._group_id(value, request[4])
+            if N == 6:
+                if request[5].lower() != b'entriesread':
+                    raise CommandError(self.SYNTAX_ERROR)
+                group.entries_read = self._integer(request[6])
+            self._signal(self.NOTIFY_STREAM, db, 'xgroup', key, 1)
+            client.reply_ok()
+        elif subcommand == b'createconsumer':
+            check_input(request, N != 4)
+            if request[4] in group.consumers:
+                return client.reply_zero()
+            group.consumer(request[4], self._milliseconds())
+            self._signal(self.NOTIFY_STREAM, db, 'xgroup', key, 1)
+            client.reply_one()
+        else:
+            check_input(request, N != 4)
+            pending = group.delete_consumer(request[4])
+            self._signal(self.NOTIFY_STREAM, db, 'xgroup', key, 1)
+            client.reply_int(pending)
+
+    @command('Streams', True)
+    def xack(self, client, request, N):
+        check_input(request, N < 3)
+        db = client.db
+        key = request[1]
+        value = db.get(key)
+        if value is not None and not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        group = None if value is None else value.groups.get(request[2])
+        if group is None:
+            return client.reply_zero()
+        ids = [parse_id(id) for id in request[3:]]
+        acked = sum((group.ack(id) for id in ids))
+        if acked:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key, acked)
+        client.reply_int(acked)
+
+    @command('Streams')
+    def xpending(self, client, request, N):
+        check_input(request, N < 2)
+        stream, group = self._stream_group(client, request[1], request[2])
+        if group is None:
+            return
+        if N == 2:
+            ids = group._ids
+            if not ids:
+                return self._reply_values(client, (0, None, None, None))
+            consumers = [(consumer.name,
+                          str(len(consumer.pending)).encode('ascii'))
+                         for consumer in group.consumers.values()
+                         if consumer.pending]
+            return self._reply_values(client, (len(ids), format_id(ids[0]),
+                                               format_id(ids[-1]),
+                                               consumers))
+        index = 3
+        idle = 0
+        if request[3].lower() == b'idle':
+            idle = self._integer(request[4])
+            index = 5
+        check_input(request, N != index + 2 and N != index + 3)
+        start = parse_range_id(request[index], 0)
+        end = parse_range_id(request[index+1], MAX_ID[1])
+        count = self._integer(request[index+2])
+        name = request[index+3] if N == index + 3 else None
+        now = self._milliseconds()
+        result = []
+        if count > 0:
+            for id, entry in group.pending_range(start, end):
+                if name is not None and entry.consumer.name != name:
+                    continue
+                elapsed = now - entry.delivery_time
+                if elapsed < idle:
+                    continue
+                result.append((format_id(id), entry.consumer.name, elapsed,
+                               entry.delivery_count))
+                if len(result) == count:
+                    break
+        self._reply_values(client, result)
+
+    @command('Streams', True)
+    def xclaim(self, client, request, N):
+        check_input(request, N < 5)
+        db = client.db
+        key = request[1]
+        stream, group = self._stream_group(client, key, request[2])
+        if group is None:
+            return
+        consumer_name = request[3]
+        min_idle = self._integer(request[4])
+        ids = []
+        index = 5
+        for index in range(5, N + 1):
+            if request[index].lower() in XCLAIM_OPTIONS:
+                break
+            ids.append(parse_id(request[index]))
+        else:
+            index = N + 1
+        now = self._milliseconds()
+        delivery_time = now
+        retry_count = None
+        force = justid = False
+        options = iter(request[index:])
+        for option in options:
+            option = option.lower()
+            if option == b'idle':
+                delivery_time = now - self._integer(next(options, b''))
+            elif option == b'time':
+                delivery_time = self._integer(next(options, b''))
+            elif option == b'retrycount':
+                retry_count = self._integer(next(options, b''))
+            elif option == b'force':
+                force = True
+            elif option == b'justid':
+                justid = True
+            elif option == b'lastid':
+                id = parse_id(next(options, b''))
+                if id > group.last_id:
+                    group.last_id = id
+            else:
+                raise CommandError(self.SYNTAX_ERROR)
+        consumer = group.consumer(consumer_name, now)
+        claimed = []
+        for id in ids:
+            entry = group.pending.get(id)
+            fields = stream.get(id)
+            if entry is None:
+                if not force or fields is None:
+                    continue
+            elif now - entry.delivery_time < min_idle:
+                continue
+            elif fields is None:
+                # deleted from the stream
+                group.ack(id)
+                continue
+            count = retry_count
+            if count is None and justid:
+                count = entry.delivery_count if entry else 0
+            group.claim(id, consumer, delivery_time, count)
+            claimed.append(format_id(id) if justid else
+                           (format_id(id), fields))
+        if claimed:
+            self._signal(self.NOTIFY_STREAM, db, request[0], key,
+                         len(claimed))
+        client.reply_multi_bulk(claimed)
+
+    @command('Streams', keys=(2, 2, 1))
+    def xinfo(self, client, request, N):
+        check_input(request, N < 2)
+        subcommand = request[1].lower()
+        if subcommand not in (b'stream', b'groups', b'consumers'):
+            raise CommandError("Unknown subcommand '%s'" %
+                               request[1].decode('utf-8', 'replace'))
+        value = client.db.get(request[2])
+        if value is None:
+            raise CommandError('no such key')
+        elif not isinstance(value, Stream):
+            return client.reply_wrongtype()
+        if subcommand == b'stream':
+            check_input(request, N != 2)
+            first = value.first()
+            last = value.last()
+            self._reply_values(client, (
+                b'length', len(value),
+                b'radix-tree-keys', value.nodes(),
+                b'radix-tree-nodes', value.nodes(),
+                b'last-generated-id', format_id(value.last_id),
+                b'max-deleted-entry-id', format_id(value.max_deleted_id),
+                b'entries-added', value.entries_added,
+                b'groups', len(value.groups),
+                b'first-entry', first and (format_id(first[0]), first[1]),
+                b'last-entry', last and (format_id(last[0]), last[1])))
+        elif subcommand == b'groups':
+            check_input(request, N != 2)
+            self._reply_values(client, [
+                (b'name', name,
+                 b'consumers', len(group.consumers),
+                 b'pending', len(group.pending),
+                 b'last-delivered-id', format_id(group.last_id),
+                 b'entries-read', group.entries_read)
+                for name, group in value.groups.items()])
+        else:
+            check_input(request, N != 3)
+            stream, group = self._stream_group(client, request[2],
+                                               request[3])
+            if group is None:
+                return
+            now = self._milliseconds()
+            self._reply_values(client, [
+                (b'name', consumer.name,
+                 b'pending', len(consumer.pending),
+                 b'idle', now - consumer.seen_time)
+                for consumer in group.consumers.values()])
 
     # #########################################################################
     # #    PUBSUB COMMANDS
@@ -1777,16 +2888,9 @@ class Storage(object):
     def psubscribe(self, client, request, N):
         check_input(request, not N)
         for pattern in request[1:]:
-            p = self._patterns.get(pattern)
-            if not p:
-                pre = redis_to_py_pattern(pattern.decode('utf-8'))
-                p = pubsub_patterns(re.compile(pre), set())
-                self._patterns[pattern] = p
-            p.clients.add(client)
-            client.patterns.add(pattern)
-            count = reduce(lambda x, y: x + int(client in y.clients),
-                           self._patterns.values())
-            client.reply_multi_bulk((b'psubscribe', pattern, count))
+            self._patterns.add(pattern, client)
+            client.reply_multi_bulk((b'psubscribe', pattern,
+                                     len(client.patterns)))
 
     @command('Pub/Sub')
     def pubsub(self, client, request, N):
@@ -1812,9 +2916,7 @@ class Storage(object):
             client.reply_multi_bulk(count)
         elif subcommand == 'numpat':
             check_input(request, N > 1)
-            count = reduce(lambda x, y: x + len(y.clients),
-                           self._patterns.values())
-            client.reply_int(count)
+            client.reply_int(self._patterns.subscriptions)
         else:
             client.reply_error("Unknown command 'pubsub %s'" % subcommand)
 
@@ -1822,27 +2924,18 @@ class Storage(object):
     def publish(self, client, request, N):
         check_input(request, N != 2)
         channel, message = request[1:]
-        ch = channel.decode('utf-8')
         msg = self._parser.multi_bulk((b'message', channel, message))
         count = self._publish_clients(msg, self._channels.get(channel, ()))
-        for pattern in self._patterns.values():
-            g = pattern.re.match(ch)
-            if g:
-                count += self._publish_clients(msg, pattern.clients)
+        for pattern in self._patterns.match(channel):
+            count += self._publish_clients(msg, pattern.clients)
         client.reply_int(count)
 
     @command('Pub/Sub', script=0)
     def punsubscribe(self, client, request, N):
-        patterns = request[1:] if N else list(self._patterns)
+        patterns = request[1:] if N else list(client.patterns)
         for pattern in patterns:
-            if pattern in self._patterns:
-                p = self._patterns[pattern]
-                if client in p.clients:
-                    client.patterns.discard(pattern)
-                    p.clients.remove(client)
-                    if not p.clients:
-                        self._patterns.pop(pattern)
-                    client.reply_multi_bulk((b'punsubscribe', pattern))
+            if self._patterns.remove(pattern, client):
+                client.reply_multi_bulk((b'punsubscribe', pattern))
 
     @command('Pub/Sub', script=0)
     def subscribe(self, client, request, N):
@@ -1857,7 +2950,7 @@ class Storage(object):
 
     @command('Pub/Sub', script=0)
     def unsubscribe(self, client, request, N):
-        channels = request[1:] if N else list(self._channels)
+        channels = request[1:] if N else list(client.channels)
         for channel in channels:
             if channel in self._channels:
                 clients = self._channels[channel]
@@ -1886,14 +2979,22 @@ class Storage(object):
             client.reply_error("EXEC without MULTI")
         else:
             requests = client.transaction
-            if client.flag & self.DIRTY_CAS:
+            if client.flag & self.DIRTY_EXEC:
+                self._close_transaction(client)
+                client.reply_error('Transaction discarded because of '
+                                   'previous errors.', 'EXECABORT')
+            elif client.flag & self.DIRTY_CAS:
                 self._close_transaction(client)
                 client.reply_multi_bulk(())
             else:
                 self._close_transaction(client)
                 client.reply_multi_bulk_len(len(requests))
-                for handle, request in requests:
-                    client._execute_command(handle, request)
+                client.flag |= self.MULTI
+                try:
+                    for handle, request in requests:
+                        client._execute_command(handle, request)
+                finally:
+                    client.flag &= ~self.MULTI
 
     @command('Transactions', script=0)
     def multi(self, client, request, N):
@@ -1904,17 +3005,23 @@ class Storage(object):
         else:
             self.error_replay("MULTI calls can not be nested")
 
-    @command('Transactions', script=0)
+    @command('Transactions', script=0, keys=(1, -1, 1))
     def watch(self, client, request, N):
         check_input(request, not N)
         if client.transaction is not None:
             client.reply_error("WATCH inside MULTI is not allowed")
         else:
             wkeys = client.watched_keys
-            if not wkeys:
+            if wkeys is None:
                 client.watched_keys = wkeys = set()
-                self._watching.add(client)
-            wkeys.update(request[1:])
+            num = client.database
+            watched = client.db._watched_keys
+            for key in request[1:]:
+                wkeys.add((num, key))
+                clients = watched.get(key)
+                if clients is None:
+                    watched[key] = clients = set()
+                clients.add(client)
             client.reply_ok()
 
     @command('Transactions', script=0)
@@ -1983,9 +3090,17 @@ class Storage(object):
 
     # #########################################################################
     # #    SERVER COMMANDS
-    @command('Server', supported=False)
+    @command('Server')
     def bgrewriteaof(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N)
+        if self._aof is None:
+            client.reply_error('Append only file not enabled')
+        elif self._aof.rewrite():
+            client.reply_status('Background append only file rewriting '
+                                'started')
+        else:
+            client.reply_error('Background append only file rewriting '
+                               'already in progress')
 
     @command('Server')
     def bgsave(self, client, request, N):
@@ -2001,6 +3116,20 @@ class Storage(object):
             check_input(request, N != 1)
             value = '\n'.join(self._client_list(client))
             client.reply_bulk(value.encode('utf-8'))
+        elif subcommand == 'kill':
+            check_input(request, N != 2)
+            address = request[2].decode('utf-8')
+            for c in client._producer._concurrent_connections:
+                if c.address and '%s:%s' % c.address[:2] == address:
+                    c.close()
+                    return client.reply_ok()
+            client.reply_error('No such client')
+        elif subcommand == 'id':
+            check_input(request, N != 1)
+            client.reply_int(client.id)
+        elif subcommand == 'tracking':
+            check_input(request, N < 2)
+            self._client_tracking(client, request[2].lower(), request[3:])
         else:
             client.reply_error("unknown command 'client %s'" % subcommand)
 
@@ -2013,14 +3142,15 @@ class Storage(object):
                 client.reply_error("'config get' no argument")
             else:
                 value = self._get_config(request[2].decode('utf-8'))
-                client.reply_bulk(value)
+                client.reply_multi_bulk(value)
         elif subcommand == 'rewrite':
             client.reply_ok()
         elif subcommand == 'set':
             try:
                 if N != 3:
                     raise ValueError("'config set' no argument")
-                self._set_config(request[2].decode('utf-8'))
+                self._set_config(request[2].decode('utf-8').lower(),
+                                 request[3].decode('utf-8'))
             except Exception as e:
                 client.reply_error(str(e))
             else:
@@ -2029,6 +3159,14 @@ class Storage(object):
             self._hit_keys = 0
             self._missed_keys = 0
             self._expired_keys = 0
+            self._expire_cycle_time = 0
+            self._expire_cycle_cap_reached = 0
+            self._sync_full = 0
+            self._sync_partial_ok = 0
+            self._sync_partial_err = 0
+            self._evicted_keys = 0
+            self._loop_lag_max = 0
+            self._stats.reset()
             server = client._producer
             server._received = 0
             server._requests_processed = 0
@@ -2047,15 +3185,16 @@ class Storage(object):
 
     @command('Server', True)
     def flushdb(self, client, request, N):
-        check_input(request, N)
-        client.db.flush()
+        check_input(request, N > 1)
+        client.db.flush(self._flush_lazy(request))
         client.reply_ok()
 
     @command('Server', True)
     def flushall(self, client, request, N):
-        check_input(request, N)
+        check_input(request, N > 1)
+        lazy = self._flush_lazy(request)
         for db in self.databases.values():
-            db.flush()
+            db.flush(lazy)
         client.reply_ok()
 
     @command('Server')
@@ -2086,17 +3225,109 @@ class Storage(object):
     def shutdown(self, client, request, N):
         client.reply_error(self.NOT_SUPPORTED)
 
-    @command('Server', supported=False)
+    @command('Server', script=0)
+    def psync(self, client, request, N):
+        check_input(request, N != 2)
+        try:
+            offset = int(request[2])
+        except ValueError:
+            return client.reply_error('value is not an integer')
+        self._sync(client, request[1].decode('utf-8'), offset)
+
+    @command('Server', script=0)
+    def replconf(self, client, request, N):
+        check_input(request, not N or N % 2)
+        options = request[1:]
+        for name, value in zip(options[::2], options[1::2]):
+            name = name.decode('utf-8').lower()
+            try:
+                value = int(value)
+            except ValueError:
+                return client.reply_error('value is not an integer')
+            if name == 'listening-port':
+                client.listening_port = value
+            elif name == 'ack':
+                if self._replication is not None:
+                    self._replication.ack(client, value)
+                # acknowledgments are not replied to
+                return
+            elif name != 'getack':
+                return client.reply_error('Unrecognized REPLCONF option: '
+                                          '%s' % name)
+        client.reply_ok()
+
+    @command('Server', script=0)
     def slaveof(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N != 2)
+        host = request[1].decode('utf-8')
+        port = request[2].decode('utf-8')
+        if host.lower() == 'no' and port.lower() == 'one':
+            if self._master is not None:
+                self.logger.info('Stopping replication of master %s',
+                                 self._master)
+                self._master.close()
+                self._master = None
+                self._readonly = False
+        else:
+            try:
+                port = int(port)
+            except ValueError:
+                return client.reply_error('Invalid master port')
+            master = self._master
+            if master and master.host == host and master.port == port:
+                return client.reply_status(
+                    'OK Already connected to specified master')
+            self._slaveof(host, port)
+        client.reply_ok()
 
-    @command('Server', supported=False)
+    @command('Server')
     def slowlog(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, not N)
+        subcommand = request[1].decode('utf-8').lower()
+        slowlog = self._stats.slowlog
+        if subcommand == 'get':
+            check_input(request, N > 2)
+            try:
+                count = int(request[2]) if N == 2 else 10
+            except ValueError:
+                return client.reply_error('value is not an integer')
+            if count < 0:
+                count = len(slowlog)
+            client.reply_multi_bulk(tuple(islice(slowlog, count)))
+        elif subcommand == 'len':
+            check_input(request, N != 1)
+            client.reply_int(len(slowlog))
+        elif subcommand == 'reset':
+            check_input(request, N != 1)
+            slowlog.clear()
+            client.reply_ok()
+        else:
+            client.reply_error("unknown command 'slowlog %s'" % subcommand)
 
-    @command('Server', supported=False)
+    @command('Server', script=0)
     def sync(self, client, request, N):
-        client.reply_error(self.NOT_SUPPORTED)
+        check_input(request, N)
+        self._sync(client)
+
+    @command('Server')
+    def latency(self, client, request, N):
+        check_input(request, not N)
+        subcommand = request[1].decode('utf-8').lower()
+        if subcommand == 'latest':
+            check_input(request, N != 1)
+            client.reply_multi_bulk(self._latency.latest())
+        elif subcommand == 'history':
+            check_input(request, N != 2)
+            event = request[2].decode('utf-8')
+            client.reply_multi_bulk(self._latency.history(event))
+        elif subcommand == 'reset':
+            events = [e.decode('utf-8') for e in request[2:]]
+            client.reply_int(self._latency.reset(events))
+        elif subcommand == 'histogram':
+            commands = [c.decode('utf-8').lower() for c in request[2:]]
+            client.reply_multi_bulk(self._stats.histogram(commands))
+        else:
+            client.reply_error("unknown command 'latency %s'" % subcommand)
 
     @command('Server')
     def time(self, client, request, N):
@@ -2106,18 +3337,76 @@ class Storage(object):
         microseconds = int(1000000*(t-seconds))
         client.reply_multi_bulk((seconds, microseconds))
 
+    # #########################################################################
+    # #    CLUSTER
+    @command('Cluster')
+    def cluster(self, client, request, N):
+        check_input(request, not N)
+        cluster = self._cluster
+        if cluster is None:
+            return client.reply_error('This instance has cluster support '
+                                      'disabled')
+        subcommand = request[1].decode('utf-8').lower()
+        if subcommand == 'keyslot':
+            check_input(request, N != 2)
+            client.reply_int(key_slot(request[2]))
+        elif subcommand == 'slots':
+            check_input(request, N != 1)
+            client.reply_multi_bulk(cluster.slots())
+        elif subcommand == 'nodes':
+            check_input(request, N != 1)
+            client.reply_bulk(cluster.nodes().encode('utf-8'))
+        elif subcommand == 'info':
+            check_input(request, N != 1)
+            info = '\r\n'.join(('%s:%s' % item
+                                for item in cluster.info().items()))
+            client.reply_bulk(info.encode('utf-8'))
+        else:
+            client.reply_error("unknown command 'cluster %s'" % subcommand)
+
     # #########################################################################
     # #    INTERNALS
     def _cron(self):
+        now = self._loop.time()
+        if self._cron_deadline is not None:
+            self._loop_lag = lag = max(now - self._cron_deadline, 0)
+            self._loop_lag_max = max(self._loop_lag_max, lag)
+            if (self._latency_monitor_threshold and
+                    lag >= self._latency_monitor_threshold/1000):
+                self._latency.add('loop-lag', int(1000*lag))
+        self._cron_deadline = now + 1/CRON_HZ
+        self._lru_clock = int(time.time() - self._started)
+        self._expire_cycle()
+        if self._aof is not None:
+            self._aof.cron()
+        if self._replication is not None:
+            self._replication.cron()
+        if self._master is not None:
+            self._master.cron()
+        self._stats.cron()
         dirty = self._dirty
-        if dirty:
+        if dirty and self._loading is None:
             now = time.time()
             gap = now - self._last_save
             for interval, changes in self.cfg.key_value_save:
                 if gap >= interval and dirty >= changes:
                     self._save()
                     break
-        self._loop.call_later(1, self._cron)
+        self._loop.call_later(1/CRON_HZ, self._cron)
+
+    def _expire_cycle(self):
+        start = perf_counter()
+        stop = start + EXPIRE_CYCLE_PERC/CRON_HZ
+        now = self._loop.time()
+        for db in self.databases.values():
+            if not db._expire_cycle(now, stop):
+                self._expire_cycle_cap_reached += 1
+                break
+        duration = perf_counter() - start
+        self._expire_cycle_time += duration
+        if (self._latency_monitor_threshold and
+                duration >= self._latency_monitor_threshold/1000):
+            self._latency.add('expire-cycle', int(1000*duration))
 
     def _set(self, client, key, value, seconds=0, milliseconds=0,
              nx=False, xx=False):
@@ -2136,12 +3425,10 @@ class Storage(object):
         if not skip:
             if exists:
                 db.pop(key)
+            db._data[key] = bytearray(value)
             if timeout > 0:
-                db._expires[key] = (self._loop.call_later(
-                    timeout, db._do_expire, key), bytearray(value))
+                db.expire(key, timeout)
                 self._signal(self.NOTIFY_STRING, db, 'expire', key)
-            else:
-                db._data[key] = bytearray(value)
             self._signal(self.NOTIFY_STRING, db, 'set', key, 1)
             return True
 
@@ -2166,7 +3453,7 @@ class Storage(object):
         return tv
 
     def _bpop(self, client, request, keys, dest=None):
-        list_type = self.list_type
+        list_type = self.list_types
         db = client.db
         for key in keys:
             value = db.get(key)
@@ -2179,23 +3466,31 @@ class Storage(object):
         return False
 
     def _block_callback(self, client, command, key, value, dest):
+        if command in STREAM_READ_COMMANDS:
+            return self._xread_callback(client, command, key, value, dest)
         db = client.db
         if command[:2] == 'br':
             if dest is not None:
                 dval = db.get(dest)
                 if dval is None:
-                    dval = self.list_type()
+                    dval = PackedList()
                     db._data[dest] = dval
-                elif not isinstance(dval, self.list_type):
+                elif not isinstance(dval, self.list_types):
                     return client.reply_wrongtype()
             elem = value.pop()
             self._signal(self.NOTIFY_LIST, db, 'rpop', key, 1)
             if dest is not None:
+                dval = self._fit(db, dest, dval, (elem,))
                 dval.appendleft(elem)
                 self._signal(self.NOTIFY_LIST, db, 'lpush', dest, 1)
         else:
             elem = value.popleft()
             self._signal(self.NOTIFY_LIST, db, 'lpop', key, 1)
+        if self._aof is not None or self._replication is not None:
+            if dest is not None:
+                self._propagate(db, ['rpoplpush', key, dest])
+            else:
+                self._propagate(db, [command[1:], key])
         if not value:
             db.pop(key)
             self._signal(self.NOTIFY_GENERIC, db, 'del', key, 1)
@@ -2218,9 +3513,23 @@ class Storage(object):
 
     def _close_transaction(self, client):
         client.transaction = None
+        client.flag &= ~self.DIRTY_EXEC
+        self._unwatch(client)
+
+    def _unwatch(self, client):
+        # Remove client from the watched keys index of databases
+        wkeys = client.watched_keys
+        if wkeys:
+            databases = self.databases
+            for num, key in wkeys:
+                watched = databases[num]._watched_keys
+                clients = watched.get(key)
+                if clients is not None:
+                    clients.discard(client)
+                    if not clients:
+                        watched.pop(key)
         client.watched_keys = None
         client.flag &= ~self.DIRTY_CAS
-        self._watching.discard(client)
 
     def _flat_info(self):
         info = self._server.info()
@@ -2233,17 +3542,30 @@ class Storage(object):
                     if isinstance(value, (list, tuple)):
                         value = ', '.join((e(v) for v in value))
                     elif isinstance(value, dict):
-                        value = ', '.join(('%s=%s' % (k, e(v))
-                                           for k, v in value.items()))
+                        value = ','.join(('%s=%s' % (k, e(v))
+                                          for k, v in value.items()))
                     else:
                         value = e(value)
                     yield '%s:%s' % (key, value)
 
     def _get_config(self, name):
-        return b''
+        pattern = re.compile(redis_to_py_pattern(name.lower()))
+        result = []
+        for param, (attr, _) in CONFIG_PARAMETERS.items():
+            if pattern.match(param):
+                result.extend((param, str(getattr(self, attr))))
+        return result
 
     def _set_config(self, name, value):
-        pass
+        if name not in CONFIG_PARAMETERS:
+            raise ValueError('Unsupported CONFIG parameter: %s' % name)
+        attr, validator = CONFIG_PARAMETERS[name]
+        try:
+            value = validator(value)
+        except Exception:
+            raise ValueError("Invalid argument '%s' for CONFIG SET '%s'" %
+                             (value, name))
+        setattr(self, attr, value)
 
     def _encode_info_value(self, value):
         return str(value).replace('=',
@@ -2261,10 +3583,11 @@ class Storage(object):
         db = client.db
         hash = db.get(key)
         if hash is None:
-            hash = self.hash_type()
+            hash = PackedHash()
             db._data[key] = hash
-        elif not isinstance(hash, self.hash_type):
+        elif not isinstance(hash, self.hash_types):
             return client.reply_wrongtype()
+        hash = self._fit(db, key, hash, request[2:])
         if field in hash:
             try:
                 value = type(hash[field])
@@ -2276,6 +3599,75 @@ class Storage(object):
         self._signal(self.NOTIFY_HASH, db, request[0], key, 1)
         return increment
 
+    def _fit(self, db, key, value, elements):
+        '''Convert a compact ``value`` to its full encoding if adding
+        ``elements`` would exceed the limits of the compact encoding
+        '''
+        if type(value) is PackedHash:
+            fits = value.fits(elements, self._hash_max_listpack_entries,
+                              self._hash_max_listpack_value)
+        elif type(value) is PackedList:
+            fits = value.fits(elements, self._list_max_listpack_entries,
+                              self._list_max_listpack_value)
+        elif type(value) is IntSet:
+            fits = value.fits(elements, self._set_max_intset_entries)
+        else:
+            return value
+        if not fits:
+            value = value.full()
+            db._data[key] = value
+        return value
+
+    def _scan_options(self, request, types=False):
+        # cursor and MATCH, COUNT and TYPE options of the SCAN commands
+        try:
+            cursor = int(request[0])
+            if cursor < 0:
+                raise ValueError
+        except ValueError:
+            raise CommandError('invalid cursor')
+        match = type_name = None
+        count = 10
+        options = request[1:]
+        while options:
+            if len(options) < 2:
+                raise CommandError(self.SYNTAX_ERROR)
+            name, value = options[0].lower(), options[1]
+            if name == b'match':
+                pattern = value.decode('utf-8', 'ignore')
+                if pattern != '*':
+                    match = re.compile(redis_to_py_pattern(pattern))
+            elif name == b'count':
+                try:
+                    count = int(value)
+                except ValueError:
+                    count = 0
+                if count < 1:
+                    raise CommandError(self.SYNTAX_ERROR)
+            elif name == b'type' and types:
+                type_name = value.decode('utf-8', 'ignore').lower()
+            else:
+                raise CommandError(self.SYNTAX_ERROR)
+            options = options[2:]
+        return cursor, match, count, type_name
+
+    def _scan_collection(self, client, value, cursor, match, count,
+                         get=None):
+        # compact values are returned at once, full encodings are scanned
+        # with their index, see pulsar.apps.ds.scan
+        if isinstance(value, Compact):
+            cursor, members = 0, list(value)
+        else:
+            cursor, members = value.scan(cursor, count)
+        result = []
+        for member in members:
+            if match and not match.search(member.decode('utf-8', 'ignore')):
+                continue
+            result.append(member)
+            if get:
+                result.append(get(member))
+        client.reply_multi_bulk((str(cursor).encode('utf-8'), result))
+
     def _setoper(self, client, oper, keys, dest=None):
         db = client.db
         result = None
@@ -2283,16 +3675,16 @@ class Storage(object):
             value = db.get(key)
             if value is None:
                 value = set()
-            elif not isinstance(value, set):
+            elif not isinstance(value, self.set_types):
                 return client.reply_wrongtype()
             if result is None:
-                result = value
+                result = set(value)
             else:
                 result = getattr(result, oper)(value)
         if dest is not None:
             db.pop(dest)
             if result:
-                db._data[dest] = result
+                db._data[dest] = self.set_type(result)
                 client.reply_int(len(result))
             else:
                 client.reply_zero()
@@ -2371,27 +3763,322 @@ class Storage(object):
         stats = {'keyspace_hits': self._hit_keys,
                  'keyspace_misses': self._missed_keys,
                  'expired_keys': self._expired_keys,
+                 'expire_cycle_cpu_milliseconds': int(
+                     1000*self._expire_cycle_time),
+                 'expired_time_cap_reached_count':
+                     self._expire_cycle_cap_reached,
                  'keys_changed': self._dirty,
+                 'evicted_keys': self._evicted_keys,
+                 'sync_full': self._sync_full,
+                 'sync_partial_ok': self._sync_partial_ok,
+                 'sync_partial_err': self._sync_partial_err,
                  'pubsub_channels': len(self._channels),
                  'pubsub_patterns': len(self._patterns),
-                 'blocked_clients': self._bpop_blocked_clients}
+                 'tracking_clients': len(self._tracking.clients),
+                 'tracking_total_keys': len(self._tracking),
+                 'blocked_clients': self._bpop_blocked_clients,
+                 'lazyfreed_objects': self._lazyfree.freed,
+                 'loop_lag_milliseconds': int(1000*self._loop_lag),
+                 'loop_lag_max_milliseconds': int(1000*self._loop_lag_max)}
+        stats.update(self._stats.info())
         persistance = {'rdb_changes_since_last_save': self._dirty,
-                       'rdb_last_save_time': self._last_save}
+                       'rdb_last_save_time': self._last_save,
+                       'loading': int(self._loading is not None),
+                       'loading_loaded_keys': self._loaded_keys}
+        if self._aof is not None:
+            persistance.update(self._aof.info())
+        else:
+            persistance['aof_enabled'] = 0
+        if self._master is not None:
+            replication = self._master.info()
+        elif self._replication is not None:
+            replication = self._replication.info()
+        else:
+            replication = {'role': 'master', 'connected_slaves': 0}
         for db in self.databases.values():
             if len(db):
                 keyspace[str(db)] = db.info()
+        if self._cluster is not None:
+            cluster = self._cluster.info()
+        else:
+            cluster = {'cluster_enabled': 0}
+        used = used_memory(self)
+        memory = {'used_memory': used,
+                  'used_memory_human': human_size(used),
+                  'maxmemory': self._maxmemory,
+                  'maxmemory_human': human_size(self._maxmemory),
+                  'maxmemory_policy': self._maxmemory_policy,
+                  'lazyfree_pending_objects': self._lazyfree.pending}
         return {'keyspace': keyspace,
+                'memory': memory,
                 'stats': stats,
-                'persistance': persistance}
+                'persistance': persistance,
+                'replication': replication,
+                'cluster': cluster,
+                'commandstats': self._stats.commandstats(),
+                'latencystats': self._stats.latencystats()}
+
+    def _hyperloglogs(self, client, keys):
+        # the HyperLogLog values at keys, None after a wrongtype reply
+        db = client.db
+        values = []
+        for key in keys:
+            value = db.get(key)
+            if value is None:
+                continue
+            elif not isinstance(value, HyperLogLog):
+                return client.reply_wrongtype()
+            values.append(value)
+        return values
+
+    def _integer(self, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise CommandError('value is not an integer or out of range')
+
+    def _milliseconds(self):
+        # unix time in milliseconds, the time of stream IDs
+        return int(1000*time.time())
+
+    def _entries(self, entries):
+        # stream entries as a multi bulk reply
+        return [(format_id(id), fields) for id, fields in entries]
+
+    def _reply_values(self, client, values):
+        # multi bulk reply of integers, bulk strings, nil and nested arrays
+        client.reply_multi_bulk_len(len(values))
+        for value in values:
+            if value is None:
+                client.reply_bulk()
+            elif isinstance(value, int):
+                client.reply_int(value)
+            elif isinstance(value, (list, tuple)):
+                self._reply_values(client, value)
+            else:
+                client.reply_bulk(value)
+
+    def _stream_group(self, client, key, name):
+        # the stream at key and its consumer group name, None, None after
+        # an error reply
+        value = client.db.get(key)
+        if value is not None and not isinstance(value, Stream):
+            client.reply_wrongtype()
+            return None, None
+        group = None if value is None else value.groups.get(name)
+        if group is None:
+            client.reply_error("No such key '%s' or consumer group '%s'" %
+                               (key.decode('utf-8', 'replace'),
+                                name.decode('utf-8', 'replace')), 'NOGROUP')
+        return value, group
+
+    def _group_id(self, stream, id):
+        # the last ID of a consumer group, $ for the last ID of the stream
+        return stream.last_id if id == b'$' else parse_id(id)
+
+    def _xtrim_options(self, request, index):
+        # the trim arguments of XADD and XTRIM starting at index and the
+        # index of the next argument
+        strategy = request[index].lower()
+        if strategy not in (b'maxlen', b'minid'):
+            raise CommandError(self.SYNTAX_ERROR)
+        index += 1
+        approx = request[index] == b'~'
+        if approx or request[index] == b'=':
+            index += 1
+        maxlen = minid = None
+        if strategy == b'maxlen':
+            maxlen = self._integer(request[index])
+            if maxlen < 0:
+                raise CommandError('The MAXLEN argument must be >= 0.')
+        else:
+            minid = parse_id(request[index])
+        index += 1
+        limit = 0
+        if index < len(request) and request[index].lower() == b'limit':
+            if not approx:
+                raise CommandError('syntax error, LIMIT cannot be used '
+                                   'without the special ~ option')
+            limit = self._integer(request[index+1])
+            if limit < 0:
+                raise CommandError('The LIMIT argument must be >= 0.')
+            index += 2
+        return (maxlen, minid, approx, limit), index
+
+    def _xread_options(self, request, index, group=False):
+        # COUNT, BLOCK, NOACK, keys and IDs of XREAD and XREADGROUP
+        count = block = None
+        noack = False
+        try:
+            while True:
+                option = request[index].lower()
+                if option == b'count':
+                    count = self._integer(request[index+1])
+                    index += 2
+                elif option == b'block':
+                    block = self._integer(request[index+1])
+                    if block < 0:
+                        raise CommandError('timeout is negative')
+                    index += 2
+                elif option == b'noack' and group:
+                    noack = True
+                    index += 1
+                elif option == b'streams':
+                    index += 1
+                    break
+                else:
+                    raise CommandError(self.SYNTAX_ERROR)
+        except IndexError:
+            raise CommandError(self.SYNTAX_ERROR)
+        args = request[index:]
+        if not args or len(args) % 2:
+            raise CommandError("Unbalanced '%s' list of streams: for each "
+                               "stream key an ID or '$' must be "
+                               "specified." % request[0])
+        half = len(args) // 2
+        if count is not None and count <= 0:
+            count = None
+        return count, block, noack, args[:half], args[half:]
+
+    def _xread_block(self, client, command, block, read):
+        # block client until entries are added to the streams of read
+        timeout = block/1000
+        if timeout:
+            read.deadline = self._loop.time() + timeout
+        client.blocked = Blocked(client, command, read.ids, timeout, read)
+
+    def _xread_callback(self, client, command, key, value, read):
+        # serve a blocked XREAD or XREADGROUP from the stream at key
+        db = client.db
+        entries = None
+        if isinstance(value, Stream):
+            if read.group is None:
+                entries = value.after(read.ids[key], read.count)
+            else:
+                group = value.groups.get(read.group)
+                if group is None:
+                    return client.reply_error(
+                        'the consumer group this client was blocked on no '
+                        'longer exists', 'NOGROUP')
+                now = self._milliseconds()
+                consumer = group.consumer(read.consumer, now)
+                consumer.seen_time = now
+                entries = group.deliver(value, consumer, read.count,
+                                        read.noack, now)
+                if entries:
+                    self._signal(self.NOTIFY_STREAM, db, command, key,
+                                 len(entries))
+                    if (self._aof is not None or
+                            self._replication is not None):
+                        request = [command, b'group', read.group,
+                                   read.consumer, b'count',
+                                   str(len(entries)).encode('ascii')]
+                        if read.noack:
+                            request.append(b'noack')
+                        self._propagate(db, request + [b'streams', key,
+                                                       b'>'])
+        if entries:
+            client.reply_multi_bulk(((key, self._entries(entries)),))
+        elif read.deadline is None:
+            client.blocked = Blocked(client, command, read.ids, 0, read)
+        else:
+            timeout = read.deadline - self._loop.time()
+            if timeout > 0:
+                client.blocked = Blocked(client, command, read.ids, timeout,
+                                         read)
+            else:
+                client.reply_multi_bulk(None)
+
+    def _bit_range(self, args, unit):
+        # start, end and bit unit of BITCOUNT and BITPOS
+        try:
+            start = int(args[0]) if args else 0
+            end = int(args[1]) if len(args) > 1 else -1
+        except ValueError:
+            raise CommandError('value is not an integer or out of range')
+        if unit:
+            unit = args[2].lower()
+            if unit not in (b'bit', b'byte'):
+                raise CommandError(self.SYNTAX_ERROR)
+            return start, end, unit == b'bit'
+        return start, end, False
+
+    def _bitfield(self, client, request, operations):
+        db = client.db
+        key = request[1]
+        string = db.get(key)
+        if string is None:
+            string = bytearray()
+        elif not isinstance(string, bytearray):
+            return client.reply_wrongtype()
+        results = bitfield(string, operations)
+        if any((op[0] != b'get' for op in operations)):
+            if key not in db._data:
+                db._data[key] = string
+            self._signal(self.NOTIFY_STRING, db, 'setbit', key, 1)
+        client.reply_multi_bulk_len(len(results))
+        for value in results:
+            if value is None:
+                client.reply_bulk()
+            else:
+                client.reply_int(value)
+
+    def _flush_lazy(self, request):
+        # True for the ASYNC option of FLUSHDB and FLUSHALL
+        if len(request) == 1:
+            return False
+        option = request[1].lower()
+        if option not in (b'async', b'sync'):
+            raise CommandError(self.SYNTAX_ERROR)
+        return option == b'async'
+
+    def _client_tracking(self, client, switch, options):
+        redirect = None
+        bcast = False
+        prefixes = []
+        while options:
+            option = options[0].lower()
+            if option == b'redirect' and len(options) > 1:
+                try:
+                    client_id = int(options[1])
+                except ValueError:
+                    return client.reply_error('Invalid client ID')
+                for redirect in client._producer._concurrent_connections:
+                    if redirect.id == client_id:
+                        break
+                else:
+                    return client.reply_error(
+                        'The client ID you want redirect to does not exist')
+                options = options[2:]
+            elif option == b'prefix' and len(options) > 1:
+                prefixes.append(options[1])
+                options = options[2:]
+            elif option == b'bcast':
+                bcast = True
+                options = options[1:]
+            else:
+                return client.reply_error(self.SYNTAX_ERROR)
+        if switch == b'on':
+            if prefixes and not bcast:
+                return client.reply_error(
+                    'PREFIX option requires BCAST mode to be enabled')
+            self._tracking.enable(client, redirect, bcast, prefixes)
+        elif switch == b'off':
+            self._tracking.disable(client)
+        else:
+            return client.reply_error(self.SYNTAX_ERROR)
+        client.reply_ok()
 
     def _client_list(self, client):
         for client in client._producer._concurrent_connections:
             yield ' '.join(self._client_info(client))
 
     def _client_info(self, client):
-        yield 'addr=%s:%s' % client._transport.get_extra_info('addr')
+        yield 'id=%s' % client.id
+        yield 'addr=%s:%s' % client.address[:2]
         yield 'fd=%s' % client._transport._sock_fd
         yield 'age=%s' % int(time.time() - client.started)
+        yield 'flags=%s' % ('S' if client.flag & self.SLAVE else 'N')
         yield 'db=%s' % client.database
         yield 'sub=%s' % len(client.channels)
         yield 'psub=%s' % len(client.patterns)
@@ -2404,38 +4091,204 @@ class Storage(object):
         else:
             from multiprocessing import Process
             data = self._dbs()
+            # expire deadlines are in loop time, pass the unix time offset
+            offset = time.time() - self._loop.time()
             self._dirty = 0
             self._last_save = int(time.time())
             if async:
                 self.logger.debug('Saving database in background process')
                 self._writer = Process(target=save_data,
-                                       args=(self.cfg, self._filename, data))
+                                       args=(self.cfg, self._filename, data,
+                                             offset))
                 self._writer.start()
             else:
                 self.logger.debug('Saving database')
-                save_data(self.cfg, self._filename, data)
+                save_data(self.cfg, self._filename, data, offset)
 
     def _dbs(self):
-        data = [(db._num, db._data) for db in self.databases.values()
-                if len(db._data)]
-        return (1, data)
+        return [(db._num, db._data, db._expires)
+                for db in self.databases.values() if len(db._data)]
 
     def _loaddb(self):
         filename = self._filename
-        if os.path.isfile(filename):
+        aof_filename = self._appendfilename
+        if self.cfg.key_value_appendonly and os.path.isfile(aof_filename):
+            self._load_aof(aof_filename)
+        elif os.path.isfile(filename):
             self.logger.info('loading data from "%s"', filename)
-            with open(filename, 'rb') as file:
-                data = pickle.load(file)
-            version, dbs = data
-            for num, data in dbs:
-                db = self.databases.get(num)
-                if db is not None:
-                    db._data = data
+            file = open(filename, 'rb')
+            if is_snapshot(file):
+                self._loading = (file, read_snapshot(file))
+                if self.cfg.key_value_background_load:
+                    self._loop.call_soon(self._load_step)
+                else:
+                    self._load_step(0)
+            else:
+                with file:
+                    self._load_pickle(file)
+
+    def _load_step(self, limit=LOAD_STEP_TIME):
+        file, entries = self._loading
+        try:
+            if not self._load_entries(entries, limit):
+                self._loop.call_soon(self._load_step)
+                return
+        except Exception:
+            # A corrupted snapshot stops the load, keys loaded so far are
+            # kept. Loading in the foreground fails the server start.
+            self._loading = None
+            file.close()
+            self.logger.exception('stopped loading "%s" after %d keys',
+                                  self._filename, self._loaded_keys)
+            if not limit:
+                raise
+        else:
+            self._loading = None
+            file.close()
+            self.logger.info('loaded %d keys from "%s"', self._loaded_keys,
+                             self._filename)
+        if self._aof is not None and not self._aof.size:
+            self._aof_init()
+
+    def _load_entries(self, entries, limit=0):
+        databases = self.databases
+        cluster = self._cluster
+        start = perf_counter()
+        now = time.time()
+        count = 0
+        try:
+            for num, key, value, deadline in entries:
+                db = databases.get(num)
+                # keys of the slots of other nodes are dropped
+                if db is not None and (cluster is None or
+                                       cluster.serves(key)):
+                    db._data[key] = self._upgrade(value)
+                    db._data.resize(key)
+                    if deadline:
+                        db.expire(key, deadline - now)
+                count += 1
+                if (limit and not count % LOAD_STEP_CHECK and
+                        perf_counter() - start > limit):
+                    return False
+            return True
+        finally:
+            self._loaded_keys += count
+
+    def _load_aof(self, filename):
+        self.logger.info('loading append only file "%s"', filename)
+        client = AofClient(self)
+        offset = 0
+        count = 0
+        with open(filename, 'rb') as file:
+            if is_snapshot(file):
+                self._load_entries(read_snapshot(file))
+                offset = file.tell()
+            for request, offset in read_commands(file):
+                client.execute(request)
+                count += 1
+            size = file.seek(0, 2)
+        if offset < size:
+            self.logger.warning('append only file "%s" is truncated, '
+                                'removing %d bytes', filename, size - offset)
+            os.truncate(filename, offset)
+        self.logger.info('loaded %d keys and %d commands from "%s"',
+                         self._loaded_keys, count, filename)
+
+    def _aof_init(self):
+        # Write the dataset loaded from the DB file into a new append only
+        # file
+        if any((len(db) for db in self.databases.values())):
+            self._aof.rewrite()
+
+    def _load_pickle(self, file):
+        # Legacy pickle data file
+        version, dbs = pickle.load(file)
+        cluster = self._cluster
+        for num, data in dbs:
+            db = self.databases.get(num)
+            if db is not None:
+                db._data = KeySpace(((key, self._upgrade(value))
+                                     for key, value in data.items()
+                                     if cluster is None or
+                                     cluster.serves(key)))
+
+    def _upgrade(self, value):
+        # Lists saved before the quicklist encoding are deques, hashes, sets
+        # and sorted sets saved before the scan index are not indexed
+        tv = type(value)
+        if tv is Deque:
+            return QuickList(value)
+        elif tv is Dict:
+            return self.hash_type(value)
+        elif tv is set:
+            return self.set_type(value)
+        elif tv is Zset:
+            return self.zset_type.from_items(list(value.items()))
+        return value
+
+    def _propagate(self, db, request):
+        # Propagate a write command to the append only file and replicas
+        command = request[0]
+        if command in BLOCKING_COMMANDS:
+            return
+        requests = [request]
+        if command in EXPIRE_COMMANDS:
+            # replace relative expires with an absolute unix time
+            deadline = db._expires.get(request[1])
+            if deadline is not None:
+                deadline += time.time() - self._loop.time()
+                requests.append(('pexpireat', request[1],
+                                 int(1000*deadline)))
+        if self._aof is not None:
+            for request in requests:
+                self._aof.feed(db._num, request)
+        if self._replication is not None:
+            self._replication.feed(db._num, requests)
+
+    def _sync(self, client, replid=None, offset=-1):
+        if client.flag & self.SLAVE:
+            return
+        if self._replication is None:
+            self._replication = Replication(
+                self, self.cfg.key_value_repl_backlog_size)
+        self._replication.sync(client, replid, offset)
+
+    def _slaveof(self, host, port):
+        if self._master is not None:
+            self._master.close()
+        self.logger.info('Replicating master %s:%s', host, port)
+        self._master = MasterLink(self, host, port)
+        self._readonly = not self.cfg.key_value_replica_writable
+        self._master.connect()
 
     def _signal(self, type, db, command, key=None, dirty=0):
         self._dirty += dirty
+        if key is not None:
+            data = db._data
+            if key in data:
+                data.resize(key)
+                self._touch(data, key)
         self._event_handlers[type](db, key, COMMANDS_INFO[command])
 
+    def _touch(self, data, key):
+        # Update the access data of key used for eviction
+        if self._maxmemory_policy == 'allkeys-lfu':
+            access = data._access
+            access[key] = lfu_touch(access.get(key), self._lru_clock//60)
+        else:
+            data._access[key] = self._lru_clock
+
+    def _free_memory(self):
+        # Evict keys if the used memory is above maxmemory
+        return not self._maxmemory or evict(self)
+
+    def _evict(self, db, key):
+        db.pop(key)
+        self._evicted_keys += 1
+        self._modified_key(db, key)
+        if self._aof is not None or self._replication is not None:
+            self._propagate(db, ['del', key])
+
     def _publish_clients(self, msg, clients):
         remove = set()
         count = 0
@@ -2445,19 +4298,37 @@ class Storage(object):
                 count += 1
             except Exception:
                 remove.add(client)
-        if remove:
-            clients.difference_update(remove)
+        for client in remove:
+            self._remove_connection(client, None)
         return count
 
     # EVENT HANDLERS
-    def _modified_key(self, key):
-        for client in self._watching:
-            if key is None or key in client.watched_keys:
-                client.flag |= self.DIRTY_CAS
+    def _modified_key(self, db, key):
+        # Flag the transactions of clients watching key, or any key of db
+        # when key is None, as dirty. The key is dropped from the index,
+        # the transactions of its watchers fail whatever happens next
+        watched = db._watched_keys
+        if watched:
+            if key is None:
+                db._watched_keys = {}
+                for clients in watched.values():
+                    for client in clients:
+                        client.flag |= self.DIRTY_CAS
+            else:
+                clients = watched.pop(key, None)
+                if clients:
+                    for client in clients:
+                        client.flag |= self.DIRTY_CAS
+        self._invalidate(key)
+
+    def _invalidate(self, key):
+        # Notify the clients tracking key
+        if self._tracking.clients:
+            self._tracking.invalidate(key)
 
     def _generic_event(self, db, key, command):
         if command.write:
-            self._modified_key(key)
+            self._modified_key(db, key)
 
     _string_event = _generic_event
     _set_event = _generic_event
@@ -2466,30 +4337,50 @@ class Storage(object):
 
     def _list_event(self, db, key, command):
         if command.write:
-            self._modified_key(key)
+            self._modified_key(db, key)
         # the key is blocking clients
         if key in db._blocking_keys:
-            if key in db._data:
-                value = db._data[key]
-            elif key in self._expires:
-                value = db._expires[key]
-            else:
-                value = None
+            value = db._data.get(key)
             for client in db._blocking_keys.pop(key):
                 client.blocked.unblock(client, key, value)
 
+    def _stream_event(self, db, key, command):
+        if command.write:
+            self._modified_key(db, key)
+        # serve the clients blocked on the stream once the XADD is done
+        if command.name == 'xadd' and key in db._blocking_keys:
+            if not self._ready_streams:
+                self._loop.call_soon(self._serve_streams)
+            self._ready_streams.append((db, key))
+
+    def _serve_streams(self):
+        ready, self._ready_streams = self._ready_streams, []
+        for db, key in ready:
+            clients = db._blocking_keys.get(key)
+            if not clients:
+                continue
+            value = db._data.get(key)
+            for client in tuple(clients):
+                blocked = client.blocked
+                if blocked is not None and (blocked.command in
+                                            STREAM_READ_COMMANDS):
+                    blocked.unblock(client, key, value)
+
     def _remove_connection(self, client, _, **kw):
         # Remove a client from the server
+        if client.flag & self.SLAVE and self._replication is not None:
+            self._replication.remove(client)
         self._monitors.discard(client)
-        self._watching.discard(client)
-        for channel, clients in list(self._channels.items()):
-            clients.discard(client)
-            if not clients:
-                self._channels.pop(channel)
-        for pattern, p in list(self._patterns.items()):
-            p.clients.discard(client)
-            if not p.clients:
-                self._patterns.pop(pattern)
+        self._unwatch(client)
+        self._tracking.disable(client)
+        for channel in client.channels:
+            clients = self._channels.get(channel)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    self._channels.pop(channel)
+        for pattern in tuple(client.patterns):
+            self._patterns.remove(pattern, client)
 
     def _write_to_monitors(self, client, request):
         # addr = '%s:%s' % self._transport.get_extra_info('addr')
@@ -2498,7 +4389,7 @@ class Storage(object):
         remove = set()
         for m in self._monitors:
             try:
-                m._transport.write(message)
+                m._send(message)
             except Exception:
                 remove.add(m)
         if remove:
@@ -2507,83 +4398,103 @@ class Storage(object):
 
 class Db(object):
     '''A database.
+
+    Keys with a time to live have their deadline, in loop time, stored in
+    the ``_expires`` dictionary and are scheduled in a hashed timing wheel
+    with :data:`CRON_HZ` slots per second. Expired keys are removed either
+    lazily, when accessed, or by the active expire cycle run by the
+    :class:`Storage` cron.
     '''
     def __init__(self, num, store):
         self.store = store
         self._num = num
         self._loop = store._loop
-        self._data = {}
+        self._data = KeySpace()
         self._expires = {}
+        self._wheel = {}
+        self._wheel_cursor = int(self._loop.time()*CRON_HZ)
         self._events = {}
         self._blocking_keys = {}
+        # clients watching keys of the database, by key
+        self._watched_keys = {}
 
     def __repr__(self):
         return 'db%s' % self._num
     __str__ = __repr__
 
     def __len__(self):
-        return len(self._data) + len(self._expires)
+        return len(self._data)
 
     def __iter__(self):
-        return chain(self._data, self._expires)
+        expires = self._expires
+        if not expires:
+            return iter(self._data)
+        now = self._loop.time()
+        return (key for key in self._data
+                if key not in expires or expires[key] > now)
 
     # #########################################################################
     # #    INTERNALS
-    def flush(self):
+    def flush(self, lazy=False):
         removed = len(self._data)
-        self._data.clear()
-        [handle.cancel() for handle, _ in self._expires.values()]
-        self._expires.clear()
+        if lazy:
+            free = self.store._lazyfree.free
+            free(self._data)
+            free(self._expires)
+            free(self._wheel)
+            self._data = KeySpace()
+            self._expires = {}
+            self._wheel = {}
+        else:
+            self._data.clear()
+            self._expires.clear()
+            self._wheel.clear()
         self.store._signal(self.store.NOTIFY_GENERIC, self, 'flushdb',
                            dirty=removed)
 
     def get(self, key, default=None):
-        if key in self._data:
+        if key in self._data and not self._expire_if_needed(key):
             self.store._hit_keys += 1
+            self.store._touch(self._data, key)
             return self._data[key]
-        elif key in self._expires:
-            self.store._hit_keys += 1
-            return self._expires[key][1]
         else:
             self.store._missed_keys += 1
             return default
 
     def exists(self, key):
-        return key in self._data or key in self._expires
+        return key in self._data and not self._expire_if_needed(key)
 
     def expire(self, key, timeout):
-        if key in self._expires:
-            handle, value = self._expires.pop(key)
-            handle.cancel()
-        elif key in self._data:
-            value = self._data.pop(key)
-        else:
+        if not self.exists(key):
             return False
-        self._expires[key] = (self._loop.call_later(
-            timeout, self._do_expire, key), value)
+        deadline = self._loop.time() + timeout
+        self._unschedule(key)
+        if timeout <= 0:
+            self._do_expire(key)
+        else:
+            self._expires[key] = deadline
+            slot = int(deadline*CRON_HZ)
+            bucket = self._wheel.get(slot)
+            if bucket is None:
+                self._wheel[slot] = bucket = set()
+            bucket.add(key)
         return True
 
     def persist(self, key):
-        if key in self._expires:
-            self.store._hit_keys += 1
-            handle, value = self._expires.pop(key)
-            handle.cancel()
-            self._data[key] = value
-            return True
-        elif key in self._data:
+        if self.exists(key):
             self.store._hit_keys += 1
+            return self._unschedule(key)
         else:
             self.store._missed_keys += 1
-        return False
+            return False
 
     def ttl(self, key, m=1):
-        if key in self._expires:
+        if self.exists(key):
             self.store._hit_keys += 1
-            handle, value = self._expires[key]
-            return max(0, int(m*(handle._when - self._loop.time())))
-        elif key in self._data:
-            self.store._hit_keys += 1
-            return -1
+            deadline = self._expires.get(key)
+            if deadline is None:
+                return -1
+            return max(0, int(m*(deadline - self._loop.time())))
         else:
             self.store._missed_keys += 1
             return -2
@@ -2593,33 +4504,79 @@ class Db(object):
                 'expires': len(self._expires)}
 
     def pop(self, key, value=None):
-        if not value:
-            if key in self._data:
-                value = self._data.pop(key)
-                return value
-            elif key in self._expires:
-                handle, value = self._expires.pop(key)
-                handle.cancel()
-                return value
-
-    def rem(self, key):
-        if key in self._data:
-            self.store._hit_keys += 1
-            self._data.pop(key)
-            self.store._signal(self.store.NOTIFY_GENERIC, self, 'del', key, 1)
-            return 1
-        elif key in self._expires:
+        if not value and key in self._data:
+            self._unschedule(key)
+            return self._data.pop(key)
+
+    def rem(self, key, lazy=False):
+        if self.exists(key):
             self.store._hit_keys += 1
-            handle, _ = self._expires.pop(key)
-            handle.cancel()
+            self._unschedule(key)
+            value = self._data.pop(key)
+            if lazy:
+                self.store._lazyfree.free(value)
             self.store._signal(self.store.NOTIFY_GENERIC, self, 'del', key, 1)
             return 1
         else:
             self.store._missed_keys += 1
             return 0
 
+    def _expire_if_needed(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= self._loop.time():
+            self._unschedule(key)
+            self._do_expire(key)
+            return True
+        return False
+
+    def _unschedule(self, key):
+        deadline = self._expires.pop(key, None)
+        if deadline is not None:
+            slot = int(deadline*CRON_HZ)
+            bucket = self._wheel.get(slot)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    self._wheel.pop(slot)
+            return True
+        return False
+
     def _do_expire(self, key):
-        if key in self._expires:
-            handle, value, = self._expires.pop(key)
-            handle.cancel()
+        if self._data.pop(key, None) is not None:
             self.store._expired_keys += 1
+            self.store._invalidate(key)
+
+    def _expire_cycle(self, now, stop):
+        '''Remove keys in the wheel slots which are fully in the past.
+
+        :param now: current loop time
+        :param stop: :func:`time.perf_counter` value after which the cycle
+            stops, leaving the remaining keys for the next cycle
+        :return: ``True`` if the cycle completed, ``False`` if it was
+            interrupted because of the time limit
+        '''
+        target = int(now*CRON_HZ) - 1
+        wheel = self._wheel
+        if not wheel:
+            self._wheel_cursor = target
+            return True
+        expires = self._expires
+        data = self._data
+        slot = self._wheel_cursor
+        count = 0
+        while slot < target:
+            bucket = wheel.get(slot + 1)
+            while bucket:
+                key = bucket.pop()
+                expires.pop(key, None)
+                data.pop(key, None)
+                self.store._invalidate(key)
+                count += 1
+                if not count % EXPIRE_CYCLE_CHECK and perf_counter() > stop:
+                    self.store._expired_keys += count
+                    return False
+            wheel.pop(slot + 1, None)
+            slot += 1
+            self._wheel_cursor = slot
+        self.store._expired_keys += count
+        return True
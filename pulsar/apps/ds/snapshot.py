@@ -0,0 +1,146 @@
+'''Streaming binary snapshot format for pulsar-ds.
+
+A snapshot file starts with a header containing the ``PULSARDS`` magic
+string and the format version. The header is followed by chunks, each
+prefixed by its length and its CRC32 checksum. A chunk contains one or
+more entries::
+
+    type (1 byte) | expire (8 bytes) | key length (4) | value length (4)
+    key | value
+
+A ``SELECTDB`` entry switches database and stores the database number in the
+key length field. String values are stored raw, HyperLogLog values with
+their own serialisation and all other values are pickled. An empty chunk
+marks the end of the file.
+'''
+import pickle
+from struct import Struct
+from zlib import crc32
+
+import pulsar
+
+from .hyperloglog import HyperLogLog
+
+
+MAGIC = b'PULSARDS'
+VERSION = 4
+HEADER = Struct('!8sH')
+CHUNK = Struct('!II')
+ENTRY = Struct('!BdII')
+CHUNK_SIZE = 1 << 16
+
+SELECTDB = 0
+STRING = 1
+OBJECT = 2
+HYPERLOGLOG = 3
+
+
+class SnapshotError(pulsar.PulsarException):
+    '''Raised when a snapshot file is corrupted or not supported'''
+    pass
+
+
+def is_snapshot(file):
+    '''Check if ``file`` is a snapshot, leaving the file position unchanged
+    '''
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return magic == MAGIC
+
+
+def write_snapshot(file, dbs, offset=0, chunk_size=CHUNK_SIZE):
+    '''Write databases into ``file`` one key at a time.
+
+    :param dbs: iterable over ``num``, ``data``, ``expires`` triples
+    :param offset: added to the ``expires`` deadlines to obtain unix times
+    :param chunk_size: size in bytes after which a chunk is flushed
+    :return: the number of keys written
+    '''
+    pack = ENTRY.pack
+    dumps = pickle.dumps
+    protocol = pickle.HIGHEST_PROTOCOL
+    buffer = bytearray()
+    count = 0
+    file.write(HEADER.pack(MAGIC, VERSION))
+    for num, data, expires in dbs:
+        buffer += pack(SELECTDB, 0, num, 0)
+        for key, value in data.items():
+            deadline = expires.get(key)
+            deadline = 0 if deadline is None else deadline + offset
+            if type(value) is bytearray:
+                buffer += pack(STRING, deadline, len(key), len(value))
+            elif type(value) is HyperLogLog:
+                value = value.dumps()
+                buffer += pack(HYPERLOGLOG, deadline, len(key), len(value))
+            else:
+                value = dumps(value, protocol)
+                buffer += pack(OBJECT, deadline, len(key), len(value))
+            buffer += key
+            buffer += value
+            count += 1
+            if len(buffer) >= chunk_size:
+                _write_chunk(file, buffer)
+                buffer = bytearray()
+    if buffer:
+        _write_chunk(file, buffer)
+    file.write(CHUNK.pack(0, 0))
+    return count
+
+
+def read_snapshot(file):
+    '''Generator over the entries of a snapshot ``file``.
+
+    Chunks are read and checked one at a time. Each entry is a tuple
+    ``num``, ``key``, ``value``, ``deadline`` where ``deadline`` is a unix
+    time or ``None``.
+    '''
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise SnapshotError('Snapshot header is truncated')
+    magic, version = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise SnapshotError('Not a pulsar-ds snapshot')
+    if version > VERSION:
+        raise SnapshotError('Snapshot version %s not supported' % version)
+    unpack = ENTRY.unpack_from
+    size = ENTRY.size
+    loads = pickle.loads
+    num = 0
+    while True:
+        head = file.read(CHUNK.size)
+        if len(head) < CHUNK.size:
+            raise SnapshotError('Snapshot is truncated')
+        length, crc = CHUNK.unpack(head)
+        if not length:
+            break
+        chunk = file.read(length)
+        if len(chunk) < length:
+            raise SnapshotError('Snapshot is truncated')
+        if crc32(chunk) != crc:
+            raise SnapshotError('Snapshot chunk checksum mismatch')
+        view = memoryview(chunk)
+        pos = 0
+        while pos < length:
+            code, deadline, klen, vlen = unpack(chunk, pos)
+            pos += size
+            if code == SELECTDB:
+                num = klen
+                continue
+            key = chunk[pos:pos+klen]
+            pos += klen
+            if code == STRING:
+                value = bytearray(view[pos:pos+vlen])
+            elif code == OBJECT:
+                value = loads(view[pos:pos+vlen])
+            elif code == HYPERLOGLOG:
+                value = HyperLogLog.loads(view[pos:pos+vlen])
+            else:
+                raise SnapshotError('Unknown snapshot entry %s' % code)
+            pos += vlen
+            yield num, key, value, deadline or None
+
+
+def _write_chunk(file, buffer):
+    file.write(CHUNK.pack(len(buffer), crc32(buffer)))
+    file.write(buffer)
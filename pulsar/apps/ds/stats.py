@@ -0,0 +1,239 @@
+'''Commands statistics, slow log and latency monitor for pulsar-ds.
+
+Every command executed by a client is timed with ``perf_counter`` and
+accounted in the :class:`CommandStats` of its name: number of calls and
+of failed calls, total time and a latency histogram with power of two
+buckets of microseconds, from which ``INFO latencystats`` percentiles are
+approximated.
+
+Commands slower than ``slowlog-log-slower-than`` microseconds are added
+to the slow log, a list of the last ``slowlog-max-len`` slow commands.
+Commands and expire cycles slower than ``latency-monitor-threshold``
+milliseconds are recorded as latency events, a history of
+:data:`LATENCY_HISTORY_LEN` samples, one per second, for each event.
+
+Instantaneous metrics (operations and network kilobytes per second) are
+the average of the last :data:`STATS_METRIC_SAMPLES` samples taken by the
+storage cron.
+'''
+import time
+from collections import deque
+
+
+# Arguments and argument length of a slow log entry
+SLOWLOG_ENTRY_MAX_ARGC = 32
+SLOWLOG_ENTRY_MAX_STRING = 128
+# Number of buckets of latency histograms, the last one for all
+# latencies above 2**(HISTOGRAM_BUCKETS-2) microseconds
+HISTOGRAM_BUCKETS = 40
+# Percentiles of INFO latencystats
+LATENCY_PERCENTILES = (50, 99, 99.9)
+# Number of samples of a latency event
+LATENCY_HISTORY_LEN = 160
+# Number of samples of instantaneous metrics
+STATS_METRIC_SAMPLES = 16
+
+
+class CommandStats:
+    '''Statistics of a command
+    '''
+    __slots__ = ('calls', 'usec', 'failed_calls', 'histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.usec = 0
+        self.failed_calls = 0
+        self.histogram = [0]*HISTOGRAM_BUCKETS
+
+    def info(self):
+        return {'calls': self.calls,
+                'usec': self.usec,
+                'usec_per_call': '%.2f' % (self.usec/self.calls),
+                'failed_calls': self.failed_calls}
+
+    def percentile(self, percent):
+        '''Upper bound, in microseconds, of the histogram bucket of the
+        ``percent`` percentile
+        '''
+        rank = percent*self.calls/100
+        count = 0
+        for bucket, calls in enumerate(self.histogram):
+            count += calls
+            if count >= rank:
+                break
+        return 1 << bucket
+
+    def cumulative_histogram(self):
+        '''Flat list of bucket upper bound, cumulative number of calls
+        pairs for non empty buckets
+        '''
+        result = []
+        count = 0
+        for bucket, calls in enumerate(self.histogram):
+            if calls:
+                count += calls
+                result.extend((1 << bucket, count))
+        return result
+
+
+class InstantaneousMetric:
+    '''Rate per second of a counter sampled by the storage cron
+    '''
+    __slots__ = ('samples', 'last_time', 'last_value')
+
+    def __init__(self, value=0):
+        self.samples = deque(maxlen=STATS_METRIC_SAMPLES)
+        self.last_time = time.time()
+        self.last_value = value
+
+    def __call__(self):
+        samples = self.samples
+        return sum(samples)/len(samples) if samples else 0
+
+    def sample(self, now, value):
+        elapsed = now - self.last_time
+        if elapsed > 0:
+            self.samples.append((value - self.last_value)/elapsed)
+        self.last_time = now
+        self.last_value = value
+
+
+class Stats:
+    '''Commands statistics and slow log of a :class:`.Storage`
+    '''
+    def __init__(self, store):
+        self.store = store
+        self.slowlog = deque()
+        self.slowlog_id = 0
+        self.reset()
+
+    def reset(self):
+        self.commands = {}
+        self.total_commands = 0
+        self.net_input_bytes = 0
+        self.net_output_bytes = 0
+        self.ops = InstantaneousMetric()
+        self.input = InstantaneousMetric()
+        self.output = InstantaneousMetric()
+
+    def call(self, client, request, duration, failed):
+        '''Account the execution of ``request`` by ``client`` which
+        lasted ``duration`` seconds
+        '''
+        usec = int(1000000*duration)
+        command = request[0]
+        stats = self.commands.get(command)
+        if stats is None:
+            self.commands[command] = stats = CommandStats()
+        stats.calls += 1
+        stats.usec += usec
+        if failed:
+            stats.failed_calls += 1
+        stats.histogram[min(usec.bit_length(), HISTOGRAM_BUCKETS-1)] += 1
+        self.total_commands += 1
+        store = self.store
+        if 0 <= store._slowlog_log_slower_than <= usec:
+            self.slowlog_push(client, request, usec)
+        if (store._latency_monitor_threshold and
+                usec >= 1000*store._latency_monitor_threshold):
+            store._latency.add('command', usec//1000)
+
+    def cron(self):
+        now = time.time()
+        self.ops.sample(now, self.total_commands)
+        self.input.sample(now, self.net_input_bytes)
+        self.output.sample(now, self.net_output_bytes)
+
+    def info(self):
+        return {'total_commands_processed': self.total_commands,
+                'instantaneous_ops_per_sec': int(self.ops()),
+                'total_net_input_bytes': self.net_input_bytes,
+                'total_net_output_bytes': self.net_output_bytes,
+                'instantaneous_input_kbps': '%.2f' % (self.input()/1024),
+                'instantaneous_output_kbps': '%.2f' % (self.output()/1024)}
+
+    def commandstats(self):
+        return dict((('cmdstat_%s' % name, stats.info())
+                     for name, stats in self.commands.items()))
+
+    def latencystats(self):
+        return dict((('latency_percentiles_usec_%s' % name,
+                      dict((('p%s' % p, stats.percentile(p))
+                            for p in LATENCY_PERCENTILES)))
+                     for name, stats in self.commands.items()))
+
+    def histogram(self, commands=None):
+        '''Flat list of command name, histogram pairs for ``LATENCY
+        HISTOGRAM``
+        '''
+        result = []
+        for name in commands or sorted(self.commands):
+            stats = self.commands.get(name)
+            if stats is not None:
+                result.extend((name, ['calls', stats.calls,
+                                      'histogram_usec',
+                                      stats.cumulative_histogram()]))
+        return result
+
+    def slowlog_push(self, client, request, usec):
+        argc = len(request)
+        args = []
+        for value in request[:SLOWLOG_ENTRY_MAX_ARGC]:
+            if isinstance(value, str):
+                value = value.encode('utf-8')
+            elif len(value) > SLOWLOG_ENTRY_MAX_STRING:
+                value = (bytes(value[:SLOWLOG_ENTRY_MAX_STRING]) +
+                         ('... (%d more bytes)' % (
+                          len(value) - SLOWLOG_ENTRY_MAX_STRING)).encode(
+                              'utf-8'))
+            args.append(value)
+        if argc > SLOWLOG_ENTRY_MAX_ARGC:
+            args[-1] = ('... (%d more arguments)' % (
+                argc - SLOWLOG_ENTRY_MAX_ARGC + 1)).encode('utf-8')
+        address = getattr(client, 'address', None)
+        address = '%s:%s' % address[:2] if address else ''
+        self.slowlog.appendleft((self.slowlog_id, int(time.time()), usec,
+                                 args, address, ''))
+        self.slowlog_id += 1
+        while len(self.slowlog) > self.store._slowlog_max_len:
+            self.slowlog.pop()
+
+
+class Latency:
+    '''Latency events of a :class:`.Storage`
+    '''
+    def __init__(self):
+        # event -> (history, max latency)
+        self.events = {}
+
+    def add(self, event, latency):
+        '''Add a ``latency`` sample, in milliseconds, to ``event``
+        '''
+        now = int(time.time())
+        history, highest = self.events.get(event, (None, 0))
+        if history is None:
+            history = deque(maxlen=LATENCY_HISTORY_LEN)
+        if history and history[-1][0] == now:
+            latency = max(latency, history[-1][1])
+            history.pop()
+        history.append((now, latency))
+        self.events[event] = (history, max(highest, latency))
+
+    def latest(self):
+        return [(event, history[-1][0], history[-1][1], highest)
+                for event, (history, highest) in sorted(self.events.items())]
+
+    def history(self, event):
+        history, _ = self.events.get(event, ((), 0))
+        return list(history)
+
+    def reset(self, events=None):
+        '''Reset ``events``, all events if not given, and return the
+        number of events reset
+        '''
+        if not events:
+            count = len(self.events)
+            self.events.clear()
+            return count
+        return sum((self.events.pop(event, None) is not None
+                    for event in events))
@@ -0,0 +1,529 @@
+'''Streams for pulsar-ds.
+
+A :class:`Stream` is an append only log of entries, each entry being a
+list of fields and values identified by a unique ``ms-seq`` ID, where
+``ms`` is a time in milliseconds and ``seq`` a sequence number. IDs are
+always increasing.
+
+Entries are stored in :class:`StreamNode` chunks of at most
+``stream-node-max-entries`` entries or ``stream-node-max-bytes`` bytes,
+like the listpacks of the redis radix tree: the IDs of a node are kept in
+two ``array`` of integers and its fields and values are packed in a
+single ``bytearray``. The first ID of each node is kept in a sorted list,
+so that locating an ID takes a bisection of the nodes followed by a
+bisection of a node. Range queries are logarithmic in the length of the
+stream, plus the number of entries returned.
+
+Deleted entries are flagged in their node, which is removed when all its
+entries are deleted. Trimming removes whole nodes from the head of the
+stream and, unless approximate, flags the remaining entries to remove.
+
+A :class:`ConsumerGroup` delivers the entries of a stream to its
+consumers and tracks the entries delivered and not acknowledged in its
+pending entries list.
+'''
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from .encoding import pack, unpack
+from .parser import CommandError
+
+
+MAX_ID = ((1 << 64) - 1, (1 << 64) - 1)
+MIN_ID = (0, 0)
+# Bytes used by the ID and the offset of an entry in a node
+ENTRY_OVERHEAD = 20
+INVALID_ID = 'Invalid stream ID specified as stream command argument'
+ID_TOO_SMALL = ('The ID specified in XADD is equal or smaller than the '
+                'target stream top item')
+ID_ZERO = 'The ID specified in XADD must be greater than 0-0'
+
+
+def parse_id(value, seq=0):
+    '''Parse a stream ID ``ms-seq``, ``seq`` is the sequence number of an
+    ID given by its milliseconds only.
+    '''
+    if value == b'-':
+        return MIN_ID
+    elif value == b'+':
+        return MAX_ID
+    ms, sep, sequence = value.partition(b'-')
+    try:
+        ms = int(ms)
+        sequence = int(sequence) if sep else seq
+        if not (0 <= ms <= MAX_ID[0] and 0 <= sequence <= MAX_ID[1]):
+            raise ValueError
+    except ValueError:
+        raise CommandError(INVALID_ID)
+    return ms, sequence
+
+
+def parse_range_id(value, seq):
+    '''Parse the ``start`` of a range, when ``seq`` is 0, or its ``end``,
+    when ``seq`` is the maximum sequence number. An ID with the ``(``
+    prefix is excluded from the range.
+    '''
+    if value[:1] != b'(':
+        return parse_id(value, seq)
+    id = parse_id(value[1:], seq)
+    if seq:
+        # exclusive end
+        if id == MIN_ID:
+            raise CommandError(INVALID_ID)
+        return (id[0], id[1] - 1) if id[1] else (id[0] - 1, MAX_ID[1])
+    if id == MAX_ID:
+        raise CommandError(INVALID_ID)
+    return (id[0], id[1] + 1) if id[1] < MAX_ID[1] else (id[0] + 1, 0)
+
+
+def format_id(id):
+    return ('%d-%d' % id).encode('ascii')
+
+
+def read_keys(request):
+    '''The keys of a ``XREAD`` or ``XREADGROUP`` request, the first half
+    of the arguments after ``STREAMS``, given as bytes or strings
+    '''
+    for index, value in enumerate(request):
+        if (isinstance(value, (bytes, str)) and
+                value.lower() in (b'streams', 'streams')):
+            args = request[index+1:]
+            return args[:len(args)//2]
+    return ()
+
+
+class StreamNode:
+    '''A chunk of entries of a :class:`Stream`
+    '''
+    __slots__ = ('ms', 'seq', 'data', 'offsets', 'deleted')
+
+    def __init__(self):
+        self.ms = array('Q')
+        self.seq = array('Q')
+        self.data = bytearray()
+        self.offsets = array('I', (0,))
+        self.deleted = set()
+
+    def __len__(self):
+        return len(self.ms) - len(self.deleted)
+
+    def size(self):
+        '''Number of entries, deleted entries included
+        '''
+        return len(self.ms)
+
+    def nbytes(self):
+        return len(self.data) + ENTRY_OVERHEAD*len(self.ms)
+
+    def id(self, index):
+        return self.ms[index], self.seq[index]
+
+    def fields(self, index):
+        '''The fields and values of the entry at ``index``
+        '''
+        offsets = self.offsets
+        return unpack(bytes(self.data[offsets[index]:offsets[index+1]]))
+
+    def append(self, id, fields):
+        self.ms.append(id[0])
+        self.seq.append(id[1])
+        self.data.extend(pack(fields))
+        self.offsets.append(len(self.data))
+
+    def position(self, id):
+        '''Index of the first entry with an ID greater or equal to ``id``
+        '''
+        lo = bisect_left(self.ms, id[0])
+        hi = bisect_right(self.ms, id[0], lo)
+        return bisect_left(self.seq, id[1], lo, hi)
+
+    def position_right(self, id):
+        '''Index of the first entry with an ID greater than ``id``
+        '''
+        lo = bisect_left(self.ms, id[0])
+        hi = bisect_right(self.ms, id[0], lo)
+        return bisect_right(self.seq, id[1], lo, hi)
+
+
+class Stream:
+    '''An append only log of entries
+
+    .. attribute:: last_id
+
+        The ID of the last entry added to the stream
+
+    .. attribute:: groups
+
+        Dictionary of :class:`ConsumerGroup` by name
+    '''
+    __slots__ = ('_nodes', '_firsts', '_length', '_nbytes', 'last_id',
+                 'entries_added', 'max_deleted_id', 'groups')
+    encoding = 'stream'
+
+    def __init__(self):
+        self._nodes = []
+        self._firsts = []
+        self._length = 0
+        self._nbytes = 0
+        self.last_id = MIN_ID
+        self.entries_added = 0
+        self.max_deleted_id = MIN_ID
+        self.groups = {}
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        # an empty stream is a valid value
+        return True
+
+    def nbytes(self):
+        return self._nbytes
+
+    def nodes(self):
+        '''Number of nodes
+        '''
+        return len(self._nodes)
+
+    def next_id(self, ms, seq=None):
+        '''The ID of a new entry at time ``ms``, with the sequence number
+        ``seq`` or an automatic one when ``None``
+        '''
+        last_ms, last_seq = self.last_id
+        if seq is None:
+            if ms > last_ms:
+                return ms, 0
+            elif last_seq < MAX_ID[1]:
+                return last_ms, last_seq + 1
+            elif last_ms < MAX_ID[0]:
+                return last_ms + 1, 0
+            raise CommandError(ID_TOO_SMALL)
+        id = (ms, seq)
+        if id == MIN_ID:
+            raise CommandError(ID_ZERO)
+        elif id <= self.last_id:
+            raise CommandError(ID_TOO_SMALL)
+        return id
+
+    def add(self, id, fields, max_entries, max_bytes):
+        '''Append an entry with ``fields`` at ``id``, greater than
+        :attr:`last_id`, to the stream
+        '''
+        nodes = self._nodes
+        node = nodes[-1] if nodes else None
+        if (node is None or (max_entries and node.size() >= max_entries) or
+                (max_bytes and len(node.data) >= max_bytes)):
+            node = StreamNode()
+            nodes.append(node)
+            self._firsts.append(id)
+        size = len(node.data)
+        node.append(id, fields)
+        self._nbytes += len(node.data) - size + ENTRY_OVERHEAD
+        self._length += 1
+        self.entries_added += 1
+        self.last_id = id
+
+    def get(self, id):
+        '''The fields and values of the entry ``id``, ``None`` if not
+        available
+        '''
+        node, index = self._locate(id)
+        if node is not None:
+            return node.fields(index)
+
+    def range(self, start=MIN_ID, end=MAX_ID, count=None, reverse=False):
+        '''Generator of ``(id, fields)`` entries with IDs between ``start``
+        and ``end`` included, from ``end`` if ``reverse`` is true
+        '''
+        if count is not None and count <= 0:
+            return
+        nodes = self._nodes
+        if reverse:
+            n = bisect_right(self._firsts, end) - 1
+            index = nodes[n].position_right(end) if n >= 0 else 0
+            while n >= 0:
+                node = nodes[n]
+                ms, seq, deleted = node.ms, node.seq, node.deleted
+                for index in range(index - 1, -1, -1):
+                    if index in deleted:
+                        continue
+                    id = (ms[index], seq[index])
+                    if id < start:
+                        return
+                    yield id, node.fields(index)
+                    if count is not None:
+                        count -= 1
+                        if not count:
+                            return
+                n -= 1
+                if n >= 0:
+                    index = nodes[n].size()
+        else:
+            n = max(bisect_right(self._firsts, start) - 1, 0)
+            index = nodes[n].position(start) if nodes else 0
+            while n < len(nodes):
+                node = nodes[n]
+                ms, seq, deleted = node.ms, node.seq, node.deleted
+                for index in range(index, node.size()):
+                    if index in deleted:
+                        continue
+                    id = (ms[index], seq[index])
+                    if id > end:
+                        return
+                    yield id, node.fields(index)
+                    if count is not None:
+                        count -= 1
+                        if not count:
+                            return
+                n += 1
+                index = 0
+
+    def after(self, id, count=None):
+        '''The list of entries with an ID greater than ``id``
+        '''
+        if id >= self.last_id:
+            return []
+        start = (id[0], id[1] + 1) if id[1] < MAX_ID[1] else (id[0] + 1, 0)
+        return list(self.range(start, count=count))
+
+    def first(self):
+        for entry in self.range(count=1):
+            return entry
+
+    def last(self):
+        for entry in self.range(count=1, reverse=True):
+            return entry
+
+    def delete(self, id):
+        '''Delete the entry ``id``, return ``True`` if it was available
+        '''
+        node, index = self._locate(id)
+        if node is None:
+            return False
+        node.deleted.add(index)
+        self._length -= 1
+        self.max_deleted_id = max(self.max_deleted_id, id)
+        if not node:
+            self._remove_node(self._nodes.index(node))
+        return True
+
+    def trim(self, maxlen=None, minid=None, approx=False, limit=0):
+        '''Remove entries from the head of the stream until it has at most
+        ``maxlen`` entries or its first ID is ``minid``.
+
+        When ``approx`` is true, only whole nodes are removed, up to
+        ``limit`` entries if given.
+
+        :return: the number of entries removed
+        '''
+        removed = 0
+        nodes = self._nodes
+        while nodes:
+            node = nodes[0]
+            if maxlen is not None:
+                excess = self._length - maxlen
+            else:
+                excess = len([i for i in range(node.size()) if
+                              i not in node.deleted and node.id(i) < minid])
+            if excess <= 0:
+                break
+            live = len(node)
+            if live <= excess:
+                if approx and limit and removed + live > limit:
+                    break
+                self._remove_node(0)
+                self._length -= live
+                removed += live
+                continue
+            elif approx:
+                break
+            # remove the first excess entries of the node
+            deleted = node.deleted
+            for index in range(node.size()):
+                if index not in deleted:
+                    deleted.add(index)
+                    removed += 1
+                    excess -= 1
+                    if not excess:
+                        break
+            self._length -= live - len(node)
+            self.max_deleted_id = max(self.max_deleted_id, node.id(index))
+            break
+        return removed
+
+    def _locate(self, id):
+        # the node and index of the entry id, None, None if not available
+        n = bisect_right(self._firsts, id) - 1
+        if n >= 0:
+            node = self._nodes[n]
+            index = node.position(id)
+            if (index < node.size() and node.id(index) == id and
+                    index not in node.deleted):
+                return node, index
+        return None, None
+
+    def _remove_node(self, n):
+        node = self._nodes.pop(n)
+        self._firsts.pop(n)
+        self._nbytes -= node.nbytes()
+
+
+class StreamRead:
+    '''The arguments of a ``XREAD`` or ``XREADGROUP`` blocked until new
+    entries are added to its streams
+
+    .. attribute:: ids
+
+        Dictionary of the IDs to read after by stream key
+
+    .. attribute:: deadline
+
+        Loop time when the read times out, ``None`` to block forever
+    '''
+    __slots__ = ('ids', 'count', 'group', 'consumer', 'noack', 'deadline')
+
+    def __init__(self, ids, count, deadline, group=None, consumer=None,
+                 noack=False):
+        self.ids = ids
+        self.count = count
+        self.deadline = deadline
+        self.group = group
+        self.consumer = consumer
+        self.noack = noack
+
+
+class PendingEntry:
+    '''An entry delivered to a consumer and not acknowledged
+    '''
+    __slots__ = ('consumer', 'delivery_time', 'delivery_count')
+
+    def __init__(self, consumer, delivery_time, delivery_count=1):
+        self.consumer = consumer
+        self.delivery_time = delivery_time
+        self.delivery_count = delivery_count
+
+
+class Consumer:
+    '''A consumer of a :class:`ConsumerGroup`
+    '''
+    __slots__ = ('name', 'seen_time', 'pending')
+
+    def __init__(self, name, seen_time):
+        self.name = name
+        self.seen_time = seen_time
+        self.pending = set()
+
+
+class ConsumerGroup:
+    '''A consumer group of a stream
+
+    .. attribute:: last_id
+
+        The ID of the last entry delivered to the consumers of the group
+
+    .. attribute:: pending
+
+        The pending entries list, a dictionary of :class:`PendingEntry` by
+        ID
+    '''
+    __slots__ = ('last_id', 'entries_read', 'consumers', 'pending', '_ids')
+
+    def __init__(self, last_id, entries_read=None):
+        self.last_id = last_id
+        self.entries_read = entries_read
+        self.consumers = {}
+        self.pending = {}
+        # sorted IDs of the pending entries
+        self._ids = []
+
+    def consumer(self, name, now, create=True):
+        '''The consumer ``name``, created if not available and ``create``
+        is true
+        '''
+        consumer = self.consumers.get(name)
+        if consumer is None and create:
+            consumer = Consumer(name, now)
+            self.consumers[name] = consumer
+        return consumer
+
+    def delete_consumer(self, name):
+        '''Delete the consumer ``name`` and its pending entries.
+
+        :return: the number of pending entries of the consumer
+        '''
+        consumer = self.consumers.pop(name, None)
+        if consumer is None:
+            return 0
+        for id in consumer.pending:
+            self._remove(id)
+        return len(consumer.pending)
+
+    def deliver(self, stream, consumer, count, noack, now):
+        '''Deliver new entries of ``stream`` to ``consumer``
+        '''
+        entries = stream.after(self.last_id, count)
+        if entries:
+            self.last_id = entries[-1][0]
+            if self.entries_read is not None:
+                self.entries_read += len(entries)
+            if not noack:
+                for id, _ in entries:
+                    self.claim(id, consumer, now, 1)
+        return entries
+
+    def history(self, stream, consumer, start, count):
+        '''The pending entries of ``consumer`` from ``start``, entries
+        deleted from the stream have no fields
+        '''
+        ids = sorted(consumer.pending)
+        ids = ids[bisect_left(ids, start):]
+        if count:
+            ids = ids[:count]
+        return [(id, stream.get(id)) for id in ids]
+
+    def claim(self, id, consumer, now, delivery_count=None):
+        '''Assign the pending entry ``id`` to ``consumer``
+        '''
+        entry = self.pending.get(id)
+        if entry is None:
+            entry = PendingEntry(consumer, now, 0)
+            self.pending[id] = entry
+            insort(self._ids, id)
+        else:
+            entry.consumer.pending.discard(id)
+            entry.consumer = consumer
+            entry.delivery_time = now
+        if delivery_count is None:
+            entry.delivery_count += 1
+        else:
+            entry.delivery_count = delivery_count
+        consumer.pending.add(id)
+        return entry
+
+    def ack(self, id):
+        '''Acknowledge the entry ``id``, return ``True`` if it was pending
+        '''
+        entry = self.pending.get(id)
+        if entry is None:
+            return False
+        entry.consumer.pending.discard(id)
+        self._remove(id)
+        return True
+
+    def pending_range(self, start=MIN_ID, end=MAX_ID, count=None):
+        '''Generator of ``(id, entry)`` pending entries between ``start``
+        and ``end``
+        '''
+        ids = self._ids
+        for index in range(bisect_left(ids, start), len(ids)):
+            id = ids[index]
+            if id > end or count is not None and count <= 0:
+                break
+            if count is not None:
+                count -= 1
+            yield id, self.pending[id]
+
+    def _remove(self, id):
+        self.pending.pop(id)
+        ids = self._ids
+        del ids[bisect_left(ids, id)]
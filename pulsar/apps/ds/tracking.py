@@ -0,0 +1,120 @@
+'''Keys tracking for server-assisted client side caching.
+
+A client enables tracking with ``CLIENT TRACKING ON``. In the default mode
+the server remembers, in a table mapping keys to clients, the keys read by
+the client and, when one of them is modified, expires or is evicted, sends
+an invalidation message and forgets the key: the client is notified again
+only after reading the key again. In broadcast mode (``BCAST``) the server
+does not remember keys, the client is notified of the modification of
+every key starting with one of its ``PREFIX``, or of every key without
+prefixes.
+
+Invalidation messages are pub/sub messages on the
+:data:`INVALIDATE_CHANNEL` channel, written to the connection given by
+``REDIRECT`` if it is subscribed to the channel. The message is the list
+of invalidated keys, or a null array when all keys are invalidated by
+FLUSHDB or FLUSHALL.
+'''
+INVALIDATE_CHANNEL = b'__redis__:invalidate'
+MESSAGE_HEADER = b''.join((b'*3\r\n$7\r\nmessage\r\n$',
+                           str(len(INVALIDATE_CHANNEL)).encode('ascii'),
+                           b'\r\n', INVALIDATE_CHANNEL, b'\r\n'))
+
+
+class ClientTracking:
+    '''Tracking options of a client
+    '''
+    __slots__ = ('redirect', 'bcast', 'prefixes')
+
+    def __init__(self, redirect, bcast=False, prefixes=None):
+        self.redirect = redirect
+        self.bcast = bcast
+        self.prefixes = prefixes or (b'',)
+
+
+class Tracking:
+    '''The tracking table of a :class:`.Storage`
+    '''
+    def __init__(self, store):
+        self.store = store
+        # clients with tracking enabled
+        self.clients = set()
+        # key -> clients which read it, in default mode
+        self.table = {}
+        # prefix -> clients in broadcast mode
+        self.prefixes = {}
+
+    def __len__(self):
+        return len(self.table)
+
+    def enable(self, client, redirect, bcast=False, prefixes=None):
+        '''Enable tracking for ``client``, replacing previous options
+        '''
+        self.disable(client)
+        client.tracking = tracking = ClientTracking(redirect, bcast, prefixes)
+        self.clients.add(client)
+        if bcast:
+            for prefix in tracking.prefixes:
+                clients = self.prefixes.get(prefix)
+                if clients is None:
+                    self.prefixes[prefix] = clients = set()
+                clients.add(client)
+
+    def disable(self, client):
+        '''Disable tracking for ``client``.
+
+        Keys read by the client are left in the table and skipped when
+        invalidated.
+        '''
+        tracking = client.tracking
+        if tracking is not None:
+            client.tracking = None
+            self.clients.discard(client)
+            if tracking.bcast:
+                for prefix in tracking.prefixes:
+                    clients = self.prefixes.get(prefix)
+                    if clients is not None:
+                        clients.discard(client)
+                        if not clients:
+                            self.prefixes.pop(prefix)
+
+    def track(self, client, keys):
+        '''Remember the ``keys`` read by a ``client`` in default mode
+        '''
+        if not client.tracking.bcast:
+            table = self.table
+            for key in keys:
+                clients = table.get(key)
+                if clients is None:
+                    table[key] = clients = set()
+                clients.add(client)
+
+    def invalidate(self, key):
+        '''Notify the clients tracking ``key``, all clients when ``key``
+        is ``None``
+        '''
+        if key is None:
+            self.table.clear()
+            targets = self.clients
+        else:
+            targets = set()
+            clients = self.table.pop(key, None)
+            if clients:
+                targets.update((c for c in clients if c.tracking is not None
+                                and not c.tracking.bcast))
+            for prefix, clients in self.prefixes.items():
+                if key.startswith(prefix):
+                    targets.update(clients)
+            if not targets:
+                return
+        message = self.message(key)
+        for client in tuple(targets):
+            target = client.tracking.redirect or client
+            if (INVALIDATE_CHANNEL in target.channels and
+                    not target._transport._closing):
+                target._send(message)
+
+    def message(self, key):
+        if key is None:
+            return MESSAGE_HEADER + self.store.NULL_ARRAY
+        return MESSAGE_HEADER + self.store._parser.multi_bulk((key,))
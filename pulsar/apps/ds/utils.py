@@ -1,14 +1,19 @@
+import heapq
 import shutil
-import pickle
+from itertools import islice
+from operator import itemgetter
 
+from .encoding import PackedList
+from .snapshot import write_snapshot
 
-def save_data(cfg, filename, data):
+
+def save_data(cfg, filename, dbs, offset=0):
     logger = cfg.configured_logger('pulsar.ds')
     temp = 'temp_%s' % filename
     with open(temp, 'wb') as file:
-        pickle.dump(data, file, protocol=2)
+        count = write_snapshot(file, dbs, offset)
     shutil.move(temp, filename)
-    logger.info('wrote data into "%s"', filename)
+    logger.info('wrote %d keys into "%s"', count, filename)
 
 
 def sort_command(store, client, request, value):
@@ -38,7 +43,7 @@ def sort_command(store, client, request, value):
                 start = max(0, int(request[j+1]))
                 count = int(request[j+2])
             except Exception:
-                return client.error_reply(store.SYNTAX_ERROR)
+                return client.reply_error(store.SYNTAX_ERROR)
             end = len(value) if count <= 0 else start + count
             j += 2
         elif val == b'store' and right >= 1:
@@ -53,7 +58,7 @@ def sort_command(store, client, request, value):
             getops.append(request[j+1])
             j += 1
         else:
-            return client.error_reply(store.SYNTAX_ERROR)
+            return client.reply_error(store.SYNTAX_ERROR)
         j += 1
 
     db = client.db
@@ -62,136 +67,105 @@ def sort_command(store, client, request, value):
         alpha = True
         sortby = None
 
-    vector = []
-    sortable = SortableDesc if desc else Sortable
-    #
     if not dontsort:
-        for val in value:
-            if sortby:
-                byval = lookup(store, db, sortby, val)
-                if byval is None:
-                    vector.append((val, null))
-                    continue
-            else:
-                byval = val
-            if not alpha:
-                try:
-                    byval = sortable(float(byval))
-                except Exception:
-                    byval = null
-            else:
-                byval = sortable(byval)
-            vector.append((val, byval))
-
-        vector = sorted(vector, key=lambda x: x[1])
-        if start is not None:
-            vector = vector[start:end]
-        vector = [val for val, _ in vector]
+        vector = sort_values(store, db, value, sortby, alpha, desc,
+                             start, end)
+    elif start is not None:
+        vector = list(islice(value, start, end))
     else:
         vector = list(value)
-        if start is not None:
-            vector = vector[start:end]
+
+    if getops:
+        lookups = [compile_pattern(store, db, getv) for getv in getops]
+        if storekey is None:
+            vector = [lookup(val) for val in vector for lookup in lookups]
+        else:
+            empty = b''
+            vector = [lookup(val) or empty for val in vector
+                      for lookup in lookups]
 
     if storekey is None:
-        if getops:
-            result = []
-            for val in vector:
-                for getv in getops:
-                    gval = lookup(store, db, getv, val)
-                    result.append(gval)
-            vector = result
         client.reply_multi_bulk(vector)
     else:
-        if getops:
-            vals = store.list_type()
-            empty = b''
-            for val in vector:
-                for getv in getops:
-                    vals.append(lookup(store, db, getv, val) or empty)
-        else:
-            vals = store.list_type(vector)
         if db.pop(storekey) is not None:
             store._signal(store.NOTIFY_GENERIC, db, 'del', storekey)
-        result = len(vals)
+        result = len(vector)
         if result:
-            db._data[storekey] = vals
+            stored = PackedList()
+            db._data[storekey] = stored
+            stored = store._fit(db, storekey, stored, vector)
+            stored.extend(vector)
             store._signal(store.NOTIFY_LIST, db, 'sort', storekey, result)
         client.reply_int(result)
 
 
-def lookup(store, db, pattern, repl):
-    if pattern == b'#':
-        return repl
-    key = pattern.replace(b'*', repl)
-    bits = key.split(b'->', 1)
-    if len(bits) == 1:
-        string = db.get(key)
-        return bytes(string) if isinstance(string, bytearray) else None
-    else:
-        key, field = bits
-        hash = db.get(key)
-        return hash.get(field) if isinstance(hash, store.hash_type) else None
-
-
-class Null:
-    __slots__ = ()
-
-    def __lt__(self, other):
-        return False
-
-null = Null()
-
-
-class Sortable:
-    __slots__ = ('value',)
-
-    def __init__(self, value):
-        self.value = value
-
-    def __lt__(self, other):
-        if other is null:
-            return True
-        else:
-            return self.value < other.value
+def sort_values(store, db, value, sortby, alpha, desc, start, end):
+    '''The elements of ``value`` sorted by themselves or by the values
+    of the ``sortby`` pattern, from ``start`` to ``end`` excluded.
 
-
-class SortableDesc:
-    __slots__ = ('value',)
-
-    def __init__(self, value):
-        self.value = value
-
-    def __lt__(self, other):
-        if other is null:
-            return True
-        else:
-            return self.value > other.value
-
-
-def count_bytes(array):
-    '''Count the number of bits in a byte ``array``.
-
-    It uses the Hamming weight popcount algorithm
+    Elements without a value to sort by, or with a value which is not a
+    number unless ``alpha`` is set, come last in their original order.
     '''
-    # this algorithm can be rewritten as
-    # for i in array:
-    #     count += sum(b=='1' for b in bin(i)[2:])
-    # but this version is almost 2 times faster
-    count = 0
-    for i in array:
-        i = i - ((i >> 1) & 0x55555555)
-        i = (i & 0x33333333) + ((i >> 2) & 0x33333333)
-        count += (((i + (i >> 4)) & 0x0F0F0F0F) * 0x01010101) >> 24
-    return count
-
-
-def and_op(x, y):
-    return x & y
-
+    if sortby:
+        lookup = compile_pattern(store, db, sortby, False)
+        pairs = [(val, lookup(val)) for val in value]
+    else:
+        pairs = [(val, val) for val in value]
+    scored = []
+    nulls = []
+    if alpha:
+        for pair in pairs:
+            if pair[1] is None:
+                nulls.append(pair[0])
+            else:
+                scored.append(pair)
+    else:
+        for val, byval in pairs:
+            try:
+                scored.append((val, float(byval)))
+            except Exception:
+                nulls.append(val)
+    size = len(scored)
+    if start is None:
+        start, end = 0, size + len(nulls)
+    if end <= start:
+        return []
+    if end < size:
+        # partial selection of the first end elements
+        select = heapq.nlargest if desc else heapq.nsmallest
+        ordered = select(end, scored, key=itemgetter(1))
+    else:
+        ordered = sorted(scored, key=itemgetter(1), reverse=desc)
+    vector = [val for val, _ in islice(ordered, start, end)]
+    if end > size:
+        vector.extend(nulls[max(start - size, 0):end - size])
+    return vector
 
-def or_op(x, y):
-    return x | y
 
+def compile_pattern(store, db, pattern, as_bytes=True):
+    '''A function returning the value of ``pattern`` for an element.
 
-def xor_op(x, y):
-    return x ^ y
+    The ``*`` in the pattern are replaced by the element, ``key->field``
+    patterns return a field of a hash and ``#`` the element itself.
+    Values of string keys are returned as ``bytes`` when ``as_bytes`` is
+    set, otherwise as they are stored.
+    '''
+    if pattern == b'#':
+        return lambda repl: repl
+    get = db.get
+    bits = pattern.split(b'->', 1)
+    key_parts = bits[0].split(b'*')
+    if len(bits) == 1:
+        def lookup(repl):
+            string = get(repl.join(key_parts))
+            if isinstance(string, bytearray):
+                return bytes(string) if as_bytes else string
+    else:
+        field_parts = bits[1].split(b'*')
+        hash_types = store.hash_types
+
+        def lookup(repl):
+            hash = get(repl.join(key_parts))
+            if isinstance(hash, hash_types):
+                return hash.get(repl.join(field_parts))
+    return lookup
@@ -1,33 +1,76 @@
-from .skiplist import Skiplist
+'''Sorted set engine.
+
+Members are kept ordered by score and member in blocks of parallel lists
+of scores and members, each block holding at most ``2*LOAD`` elements.
+Inserting or removing an element bisects the list of the last element
+of each block, then bisects and updates one block. The lengths of the
+blocks are summed by a Fenwick tree, which gives the rank of an element
+and the element at a rank in ``O(log n)``.
+
+A dictionary maps members to their score.
+'''
+from bisect import bisect_left, bisect_right
+
+
+LOAD = 1000
 
 
 class Zset(object):
     '''Ordered-set equivalent of redis zset.
     '''
+    __slots__ = ('_dict', '_scores', '_members', '_maxes', '_max_scores',
+                 '_tree')
+
     def __init__(self, data=None):
-        self._sl = Skiplist()
-        self._dict = {}
+        self.clear()
         if data:
             self.update(data)
 
+    @classmethod
+    def from_items(cls, items):
+        '''A :class:`zset` from ``items``, a list of score, member pairs.
+
+        The blocks are built at once from the sorted pairs, sorting takes
+        linear time when ``items`` is already sorted in either order, as
+        the replies of redis range commands.
+        '''
+        zset = cls()
+        data = zset._dict
+        for score, member in items:
+            if score != score:
+                raise ValueError('Cannot insert score {0}'.format(score))
+            data[member] = score
+        if len(data) < len(items):
+            # repeated members keep their last score
+            items = [(score, member) for member, score in data.items()]
+        items = sorted(items)
+        zset._scores = [[score for score, _ in items[i:i+LOAD]]
+                        for i in range(0, len(items), LOAD)]
+        zset._members = [[member for _, member in items[i:i+LOAD]]
+                         for i in range(0, len(items), LOAD)]
+        zset._reindex()
+        return zset
+
     def __repr__(self):
-        return repr(self._sl)
+        return repr(list(self.items()))
     __str__ = __repr__
 
     def __len__(self):
         return len(self._dict)
 
     def __iter__(self):
-        for _, value in self._sl:
-            yield value
+        for members in self._members:
+            yield from members
+
+    def __contains__(self, member):
+        return member in self._dict
 
     def __getstate__(self):
         return self._dict
 
     def __setstate__(self, state):
-        self._dict = state
-        self._sl = Skiplist(((score, member) for member, score
-                             in state.items()))
+        self.clear()
+        self.update(((score, member) for member, score in state.items()))
 
     def __eq__(self, other):
         if isinstance(other, Zset):
@@ -37,35 +80,64 @@ class Zset(object):
     def items(self):
         '''Iterable over ordered score, value pairs of this :class:`zset`
         '''
-        return iter(self._sl)
+        for scores, members in zip(self._scores, self._members):
+            yield from zip(scores, members)
 
-    def range(self, start, end, scores=False):
-        return self._sl.range(start, end, scores)
+    def range(self, start=0, end=None, scores=False):
+        '''Iterable over members, or score, member pairs if ``scores``,
+        from rank ``start`` to rank ``end`` excluded
+        '''
+        N = len(self)
+        if start < 0:
+            start = max(N + start, 0)
+        if end is None:
+            end = N
+        elif end < 0:
+            end = max(N + end, 0)
+        else:
+            end = min(end, N)
+        return self._range(start, end, scores)
 
     def range_by_score(self, minval, maxval, include_min=True,
                        include_max=True, start=0, num=None, scores=False):
-        return self._sl.range_by_score(minval, maxval, start=start,
-                                       num=num, include_min=include_min,
-                                       include_max=include_max,
-                                       scores=scores)
+        '''Iterable over members, or score, member pairs if ``scores``,
+        with score between ``minval`` and ``maxval``.
+
+        The first ``start`` members are skipped and at most ``num`` members
+        are returned, all of them if ``num`` is ``None`` or negative.
+        '''
+        first = self._score_rank(minval, not include_min)
+        end = self._score_rank(maxval, include_max)
+        if start < 0:
+            return iter(())
+        first += start
+        if num is not None and num >= 0:
+            end = min(end, first + num)
+        return self._range(first, end, scores)
 
     def score(self, member, default=None):
         '''The score of a given member'''
         return self._dict.get(member, default)
 
     def count(self, minval, maxval, include_min=True, include_max=True):
-        return self._sl.count(minval, maxval, include_min, include_max)
+        '''The number of members with score between ``minval`` and
+        ``maxval``
+        '''
+        return max(self._score_rank(maxval, include_max) -
+                   self._score_rank(minval, not include_min), 0)
 
     def add(self, score, val):
+        if score != score:
+            raise ValueError('Cannot insert score {0}'.format(score))
         r = 1
         if val in self._dict:
             sc = self._dict[val]
             if sc == score:
                 return 0
-            self.remove(val)
+            self._remove(sc, val)
             r = 0
         self._dict[val] = score
-        self._sl.insert(score, val)
+        self._insert(score, val)
         return r
 
     def update(self, score_vals):
@@ -89,58 +161,64 @@ scores and values.'''
         '''
         score = self._dict.pop(item, None)
         if score is not None:
-            index = self._sl.rank(score)
-            assert index >= 0, 'could not find start range'
-            for i, v in enumerate(self._sl.range(index)):
-                if v == item:
-                    assert self._sl.remove_range(index + i, index+i + 1) == 1
-                    return score
-            assert False, 'could not find element'
+            self._remove(score, item)
+            return score
 
     def remove_range(self, start, end):
-        '''Remove a range by score.
+        '''Remove a range by rank.
         '''
-        return self._sl.remove_range(
-            start, end, callback=lambda sc, value: self._dict.pop(value))
+        N = len(self)
+        if start < 0:
+            start = max(N + start, 0)
+        if end is None:
+            end = N
+        elif end < 0:
+            end = max(N + end, 0)
+        else:
+            end = min(end, N)
+        return self._remove_ranks(start, end)
 
     def remove_range_by_score(self, minval, maxval,
                               include_min=True, include_max=True):
         '''Remove a range by score.
         '''
-        return self._sl.remove_range_by_score(
-            minval, maxval, include_min=include_min, include_max=include_max,
-            callback=lambda sc, value: self._dict.pop(value))
+        return self._remove_ranks(self._score_rank(minval, not include_min),
+                                  self._score_rank(maxval, include_max))
 
     def clear(self):
         '''Clear this :class:`zset`.'''
-        self._sl = Skiplist()
-        self._dict.clear()
+        self._dict = {}
+        self._scores = []
+        self._members = []
+        # last score, member pair and last score of each block
+        self._maxes = []
+        self._max_scores = []
+        # Fenwick tree of the block lengths
+        self._tree = [0]
 
     def rank(self, item):
         '''Return the rank (index) of ``item`` in this :class:`zset`.'''
         score = self._dict.get(item)
         if score is not None:
-            return self._sl.rank(score)
+            block = bisect_left(self._maxes, (score, item))
+            return self._prefix(block) + self._bisect(block, score, item)
 
     def flat(self):
-        return self._sl.flat()
+        result = []
+        for pair in self.items():
+            result.extend(pair)
+        return tuple(result)
 
     @classmethod
     def union(cls, zsets, weights, oper):
-        result = None
+        result = cls()
         for zset, weight in zip(zsets, weights):
-            if result is None:
-                result = cls()
-                sl = result._sl
-                for score, value in zset._sl:
-                    result.add(score*weight, value)
-            else:
-                for score, value in zset._sl:
-                    score *= weight
-                    existing = sl.score(value)
-                    if existing is not None:
-                        score = oper(score, existing)
-                    result.add(score, value)
+            for score, value in zset.items():
+                score *= weight
+                existing = result.score(value)
+                if existing is not None:
+                    score = oper((score, existing))
+                result.add(score, value)
         return result
 
     @classmethod
@@ -156,13 +234,182 @@ scores and values.'''
         for zset, weight in zip(zsets, weights):
             if result is None:
                 result = cls()
-                for score, value in zset._sl:
+                for score, value in zset.items():
                     if value in values:
                         result.add(score*weight, value)
             else:
-                for score, value in zset._sl:
+                for score, value in zset.items():
                     if value in values:
                         existing = result.score(value)
                         score = oper((score*weight, existing))
                         result.add(score, value)
         return result
+
+    #    INTERNALS
+    def _bisect(self, block, score, member):
+        # index of score, member pair in block
+        scores = self._scores[block]
+        lo = bisect_left(scores, score)
+        hi = bisect_right(scores, score, lo)
+        return bisect_left(self._members[block], member, lo, hi)
+
+    def _insert(self, score, member):
+        maxes = self._maxes
+        key = (score, member)
+        block = bisect_left(maxes, key)
+        if block == len(maxes):
+            if not maxes:
+                self._scores.append([])
+                self._members.append([])
+                maxes.append(key)
+                self._max_scores.append(score)
+                self._tree.append(0)
+            block = len(maxes) - 1
+            self._scores[block].append(score)
+            self._members[block].append(member)
+            maxes[block] = key
+            self._max_scores[block] = score
+        else:
+            index = self._bisect(block, score, member)
+            self._scores[block].insert(index, score)
+            self._members[block].insert(index, member)
+        if len(self._scores[block]) > 2*LOAD:
+            self._split(block)
+        else:
+            self._add(block, 1)
+
+    def _remove(self, score, member):
+        block = bisect_left(self._maxes, (score, member))
+        index = self._bisect(block, score, member)
+        scores = self._scores[block]
+        members = self._members[block]
+        assert members[index] == member, 'could not find element'
+        del scores[index]
+        del members[index]
+        if not scores:
+            self._delete_block(block)
+        else:
+            if index == len(scores):
+                self._maxes[block] = (scores[-1], members[-1])
+                self._max_scores[block] = scores[-1]
+            self._add(block, -1)
+
+    def _remove_ranks(self, start, end):
+        # remove elements from rank start to rank end excluded
+        if start >= end:
+            return 0
+        block, index = self._locate(start)
+        removed = end - start
+        count = removed
+        pop = self._dict.pop
+        while count:
+            scores = self._scores[block]
+            members = self._members[block]
+            last = min(len(scores), index + count)
+            for member in members[index:last]:
+                pop(member)
+            del scores[index:last]
+            del members[index:last]
+            count -= last - index
+            block += 1
+            index = 0
+        self._reindex()
+        return removed
+
+    def _range(self, start, end, scores):
+        if start < end:
+            block, index = self._locate(start)
+            count = end - start
+            while count:
+                last = min(len(self._scores[block]), index + count)
+                if scores:
+                    yield from zip(self._scores[block][index:last],
+                                   self._members[block][index:last])
+                else:
+                    yield from self._members[block][index:last]
+                count -= last - index
+                block += 1
+                index = 0
+
+    def _score_rank(self, score, after):
+        # number of elements with score lower than score, or lower or equal
+        # when after is True
+        if after:
+            block = bisect_right(self._max_scores, score)
+        else:
+            block = bisect_left(self._max_scores, score)
+        if block == len(self._max_scores):
+            return len(self)
+        if after:
+            index = bisect_right(self._scores[block], score)
+        else:
+            index = bisect_left(self._scores[block], score)
+        return self._prefix(block) + index
+
+    def _split(self, block):
+        scores = self._scores[block]
+        members = self._members[block]
+        self._scores[block:block+1] = [scores[:LOAD], scores[LOAD:]]
+        self._members[block:block+1] = [members[:LOAD], members[LOAD:]]
+        self._maxes.insert(block, (scores[LOAD-1], members[LOAD-1]))
+        self._max_scores.insert(block, scores[LOAD-1])
+        self._build_tree()
+
+    def _delete_block(self, block):
+        del self._scores[block]
+        del self._members[block]
+        del self._maxes[block]
+        del self._max_scores[block]
+        self._build_tree()
+
+    def _reindex(self):
+        # rebuild blocks information after a bulk removal
+        blocks = [(scores, members) for scores, members
+                  in zip(self._scores, self._members) if scores]
+        self._scores = [scores for scores, _ in blocks]
+        self._members = [members for _, members in blocks]
+        self._maxes = [(scores[-1], members[-1]) for scores, members
+                       in blocks]
+        self._max_scores = [scores[-1] for scores, _ in blocks]
+        self._build_tree()
+
+    def _build_tree(self):
+        tree = [0]
+        tree.extend((len(scores) for scores in self._scores))
+        size = len(tree)
+        for i in range(1, size):
+            j = i + (i & -i)
+            if j < size:
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _add(self, block, delta):
+        tree = self._tree
+        size = len(tree)
+        i = block + 1
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, block):
+        # number of elements in the blocks before block
+        tree = self._tree
+        total = 0
+        while block:
+            total += tree[block]
+            block -= block & -block
+        return total
+
+    def _locate(self, rank):
+        # block and index in the block of the element at rank
+        tree = self._tree
+        size = len(tree)
+        block = 0
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            i = block + step
+            if i < size and tree[i] <= rank:
+                block = i
+                rank -= tree[i]
+            step >>= 1
+        return block, rank
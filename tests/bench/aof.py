@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestAppendOnlyFileDisabled(unittest.TestCase):
+    '''Write commands throughput, the number of commands executed in each
+    loop iteration is given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 10
+    _sizes = {'tiny': 10,
+              'small': 100,
+              'normal': 1000,
+              'big': 10000,
+              'huge': 100000}
+    appendonly = False
+    fsync = 'no'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.loop = pulsar.new_event_loop()
+        cls.store = storage(cls.loop,
+                            filename=os.path.join(cls.dir, 'bench.rdb'),
+                            appendonly=cls.appendonly,
+                            appendfilename=os.path.join(cls.dir, 'bench.aof'),
+                            appendfsync=cls.fsync,
+                            aof_rewrite_size=0)
+        cls.client = AofClient(cls.store)
+        size = cls._sizes[cls.cfg.size]
+        cls.requests = [(b'set', ('key%s' % n).encode('utf-8'), b'x'*100)
+                        for n in range(size)]
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.store._aof:
+            cls.store._aof.close()
+        cls.loop.close()
+        shutil.rmtree(cls.dir)
+
+    def test_set(self):
+        execute = self.client.execute
+        for request in self.requests:
+            execute(list(request))
+        if self.store._aof:
+            self.store._aof.flush()
+
+
+class TestAppendOnlyFileNo(TestAppendOnlyFileDisabled):
+    appendonly = True
+    fsync = 'no'
+
+
+class TestAppendOnlyFileEverysec(TestAppendOnlyFileDisabled):
+    appendonly = True
+    fsync = 'everysec'
+
+
+class TestAppendOnlyFileAlways(TestAppendOnlyFileDisabled):
+    __number__ = 1
+    appendonly = True
+    fsync = 'always'
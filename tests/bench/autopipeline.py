@@ -0,0 +1,90 @@
+import unittest
+from functools import partial
+from threading import Thread
+
+import pulsar
+from pulsar import asyncio
+from pulsar.apps.ds import PulsarDS
+from pulsar.apps.ds.server import TcpServer
+from pulsar.apps.ds.client import PulsarStoreClient
+from pulsar.apps.data import create_store
+
+
+class TestAutoPipeline(unittest.TestCase):
+    '''Concurrent GET commands sent to a pulsar-ds server on the loopback,
+    with a pool of :attr:`pool_size` connections and with automatic
+    pipelining on :attr:`auto_pipeline` connections. The number of
+    concurrent commands is given by the test ``size``.
+
+    The number of connections opened by the store is reported next to the
+    timing.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 100,
+              'small': 1000,
+              'normal': 10000,
+              'big': 20000,
+              'huge': 50000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          '{0[connections]} connections')
+    pool_size = 50
+    auto_pipeline = 2
+
+    @classmethod
+    def setUpClass(cls):
+        # the test runs in the loop of the test runner, the server and the
+        # stores run in a loop of their own
+        cls.loop = loop = pulsar.new_event_loop()
+        cls.thread = Thread(target=loop.run_forever, daemon=True)
+        cls.thread.start()
+        cfg = PulsarDS().cfg.copy()
+        cls.server = TcpServer(cfg, partial(PulsarStoreClient, cfg), loop,
+                               ('127.0.0.1', 0))
+        cls.run(cls.server.start_serving)
+        address = 'pulsar://%s:%s/9' % cls.server.address[:2]
+        cls.pooled = create_store(address, loop=loop,
+                                  pool_size=cls.pool_size)
+        cls.pipelined = create_store(address, loop=loop,
+                                     pool_size=cls.pool_size,
+                                     auto_pipeline=cls.auto_pipeline)
+        cls.keys = ['key:%d' % n for n in range(cls._sizes[cls.cfg.size])]
+        cls.run(cls.pooled.client().set, 'key:0', 'x')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.run(cls.pooled.close)
+        cls.run(cls.pipelined.close)
+        cls.run(cls.server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    @classmethod
+    def run(cls, method, *args):
+        # call method in the loop thread and wait for its result
+        def call():
+            return (yield from method(*args))
+        return asyncio.run_coroutine_threadsafe(call(), cls.loop).result()
+
+    def getInfo(self, info, delta, dt):
+        store = self.store
+        connections = store.pool.in_use + store.pool.available
+        if store.auto_pipeline is not None:
+            connections += len(store.auto_pipeline._connections)
+        info['connections'] = connections
+
+    def get(self, store):
+        self.store = store
+        self.run(self.gather, store.client())
+
+    def gather(self, client):
+        return asyncio.gather(*[client.get(key) for key in self.keys],
+                              loop=self.loop)
+
+    def test_pool(self):
+        self.get(self.pooled)
+
+    def test_auto_pipeline(self):
+        self.get(self.pipelined)
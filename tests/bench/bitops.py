@@ -0,0 +1,61 @@
+import os
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestBitops(unittest.TestCase):
+    '''Bit commands on random bitmaps, the size of the bitmaps in bytes is
+    given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 1 << 20,
+              'small': 1 << 24,
+              'normal': 1 << 25,
+              'big': 1 << 26,
+              'huge': 1 << 27}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        size = cls._sizes[cls.cfg.size]
+        store = storage(cls.loop)
+        cls.client = AofClient(store)
+        data = cls.client.db._data
+        data[b'a'] = bytearray(os.urandom(size))
+        data[b'b'] = bytearray(os.urandom(size))
+        # a bitmap with only the last bit set
+        data[b'c'] = bytearray(size)
+        data[b'c'][-1] = 1
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_bitcount(self):
+        self.client.execute([b'bitcount', b'a'])
+
+    def test_bitcount_range(self):
+        self.client.execute([b'bitcount', b'a', b'1', b'-2'])
+
+    def test_bitcount_bit_range(self):
+        self.client.execute([b'bitcount', b'a', b'3', b'-3', b'bit'])
+
+    def test_bitop_and(self):
+        self.client.execute([b'bitop', b'and', b'd', b'a', b'b'])
+
+    def test_bitop_or(self):
+        self.client.execute([b'bitop', b'or', b'd', b'a', b'b'])
+
+    def test_bitop_xor(self):
+        self.client.execute([b'bitop', b'xor', b'd', b'a', b'b'])
+
+    def test_bitop_not(self):
+        self.client.execute([b'bitop', b'not', b'd', b'a'])
+
+    def test_bitpos(self):
+        self.client.execute([b'bitpos', b'c', b'1'])
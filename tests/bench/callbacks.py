@@ -0,0 +1,84 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds import redis_parser
+from pulsar.apps.data.redis import Consumer
+
+
+class DummyTransport:
+
+    def write(self, data):
+        pass
+
+
+class DummyConnection:
+
+    def __init__(self):
+        self.parser = redis_parser(True)()
+        self._transport = DummyTransport()
+
+
+class BenchConsumer(Consumer):
+    result = None
+
+    def finished(self, result=None, exc=None):
+        self.result = exc or result
+
+
+class TestResponseCallbacks(unittest.TestCase):
+    '''Replies of a pipeline of HGETALL or ZRANGE WITHSCORES commands
+    processed by the :class:`.Consumer` of a redis connection, converted by
+    the response callbacks or returned as they are with the ``raw`` option.
+    The number of commands is given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 100,
+              'small': 1000,
+              'normal': 10000,
+              'big': 20000,
+              'huge': 50000}
+    fields = 20
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = size = cls._sizes[cls.cfg.size]
+        parser = redis_parser(True)()
+        pairs = []
+        for n in range(cls.fields):
+            pairs.extend((('field%d' % n).encode('utf-8'),
+                          str(n).encode('utf-8')))
+        # the replies of MULTI, of the queued commands and of EXEC
+        cls.data = b''.join((b'+OK\r\n', b'+QUEUED\r\n'*size,
+                             ('*%d\r\n' % size).encode('utf-8'),
+                             parser.multi_bulk(pairs)*size))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def pipeline(self, *args, **options):
+        consumer = BenchConsumer(self.loop)
+        consumer._connection = DummyConnection()
+        commands = [(('multi',), {})]
+        commands.extend(((args, options) for _ in range(self.size)))
+        commands.append((('exec',), {}))
+        consumer._request = (commands, True, [])
+        consumer.start_request()
+        consumer.data_received(self.data)
+        assert len(consumer.result) == self.size
+
+    def test_hgetall(self):
+        self.pipeline('hgetall', 'hash')
+
+    def test_hgetall_raw(self):
+        self.pipeline('hgetall', 'hash', raw=True)
+
+    def test_zrange_withscores(self):
+        self.pipeline('zrange', 'zset', 0, -1, 'withscores',
+                      withscores=True)
+
+    def test_zrange_withscores_raw(self):
+        self.pipeline('zrange', 'zset', 0, -1, 'withscores',
+                      withscores=True, raw=True)
@@ -0,0 +1,99 @@
+import tracemalloc
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+def key(n):
+    return ('key:%d' % n).encode('utf-8')
+
+
+class TestEncodingMemory(unittest.TestCase):
+    '''Memory used by small hashes, lists and sets of integers with the
+    compact and the full encodings.
+
+    The number of keys is given by the test ``size`` and the memory
+    allocated by the keys, extrapolated to one million keys, is reported
+    next to the timing. Requests go through the parser, as on a
+    connection, so that every element is a distinct bytes object.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 500000,
+              'huge': 1000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          '{0[memory]} MB per million keys')
+    full = {'hash_max_listpack_entries': 0,
+            'list_max_listpack_entries': 0,
+            'set_max_intset_entries': 0}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = cls._sizes[cls.cfg.size]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def storage(self, **params):
+        store = storage(self.loop, **params)
+        return store, AofClient(store)
+
+    def execute(self, client, *request):
+        parser = self.store._parser
+        parser.feed(parser.multi_bulk(request))
+        client.execute(parser.get())
+
+    def startUp(self):
+        self.store = None
+        tracemalloc.start()
+
+    def getInfo(self, info, delta, dt):
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.store = None
+        info['memory'] = round(1000000*memory/self.size/1048576, 1)
+
+    def hashes(self, **params):
+        self.store, client = self.storage(**params)
+        for n in range(self.size):
+            self.execute(client, b'hmset', key(n), b'name', b'pulsar',
+                         b'email', b'pulsar@example.com', b'visits', b'10')
+
+    def lists(self, **params):
+        self.store, client = self.storage(**params)
+        for n in range(self.size):
+            self.execute(client, b'rpush', key(n), b'event:1', b'event:2',
+                         b'event:3', b'event:4', b'event:5')
+
+    def sets(self, **params):
+        self.store, client = self.storage(**params)
+        for n in range(self.size):
+            self.execute(client, b'sadd', key(n), b'1', b'20', b'300',
+                         b'4000', b'50000')
+
+    def test_hash_listpack(self):
+        self.hashes()
+
+    def test_hash_hashtable(self):
+        self.hashes(**self.full)
+
+    def test_list_listpack(self):
+        self.lists()
+
+    def test_list_linkedlist(self):
+        self.lists(**self.full)
+
+    def test_set_intset(self):
+        self.sets()
+
+    def test_set_hashtable(self):
+        self.sets(**self.full)
@@ -0,0 +1,89 @@
+import tracemalloc
+import unittest
+
+import pulsar
+from pulsar.apps.ds import redis_parser
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestHyperLogLog(unittest.TestCase):
+    '''Unique visitors counted with a set and with a HyperLogLog, the
+    number of visitors is given by the test ``size``.
+
+    The memory allocated by the key and the relative error of the count
+    are reported next to the timing. Requests go through the parser, as on
+    a connection, so that every visitor is a distinct bytes object.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 1000,
+              'small': 100000,
+              'normal': 1000000,
+              'big': 2000000,
+              'huge': 5000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          '{0[memory]} KB, error {0[error]}%')
+    batch = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = cls._sizes[cls.cfg.size]
+        multi_bulk = redis_parser(True)().multi_bulk
+        visitors = [('visitor:%d' % n).encode('utf-8')
+                    for n in range(cls.size)]
+        cls.requests = {}
+        for command in (b'sadd', b'pfadd'):
+            cls.requests[command] = [
+                multi_bulk([command, b'visitors'] +
+                           visitors[n:n+cls.batch])
+                for n in range(0, cls.size, cls.batch)]
+        cls.ping = multi_bulk([b'ping'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def startUp(self):
+        self.command = None
+        self.store, self.client = self.storage()
+
+    def getInfo(self, info, delta, dt):
+        # build the key again with memory tracing, which slows down
+        # allocations too much to be used in the timing
+        self.store, self.client = self.storage()
+        tracemalloc.start()
+        self.execute(self.command)
+        # release the last request held by the parser
+        parser = self.store._parser
+        parser.feed(self.ping)
+        self.client.execute(parser.get())
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        value = self.client.db._data[b'visitors']
+        count = len(value) if isinstance(value, set) else value.count()
+        info['memory'] = round(memory/1024, 1)
+        info['error'] = round(100*abs(count - self.size)/self.size, 2)
+        self.store = self.client = None
+
+    def storage(self):
+        # the slow log would keep the arguments of requests
+        store = storage(self.loop, slowlog_log_slower_than=-1)
+        return store, AofClient(store)
+
+    def execute(self, command):
+        self.command = command
+        parser = self.store._parser
+        execute = self.client.execute
+        for request in self.requests[command]:
+            parser.feed(request)
+            execute(parser.get())
+
+    def test_sadd(self):
+        self.execute(b'sadd')
+
+    def test_pfadd(self):
+        self.execute(b'pfadd')
@@ -0,0 +1,66 @@
+import unittest
+from time import perf_counter
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestLazyFree(unittest.TestCase):
+    '''Event loop lag of deleting a set and of flushing a database, the
+    number of members and of keys is given by the test ``size``.
+
+    The timing is the duration of the command, the longest step freeing
+    values lazily is reported next to it.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 10000,
+              'small': 100000,
+              'normal': 1000000,
+              'big': 2000000,
+              'huge': 5000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          'longest lazy free step {0[step]} secs')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = cls._sizes[cls.cfg.size]
+        cls.store = storage(cls.loop)
+        cls.client = AofClient(cls.store)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def startUp(self):
+        db = self.client.db
+        db._data[b'set'] = set(range(self.size))
+        for n in range(self.size):
+            db._data[('key:%d' % n).encode('utf-8')] = bytearray(b'x')
+
+    def getInfo(self, info, delta, dt):
+        lazyfree = self.store._lazyfree
+        step = 0
+        done = False
+        while not done:
+            start = perf_counter()
+            done = lazyfree.step()
+            step = max(step, perf_counter() - start)
+        info['step'] = round(step, 4)
+        self.client.db.flush()
+
+    def test_del(self):
+        self.client.execute([b'del', b'set'])
+
+    def test_unlink(self):
+        self.client.execute([b'unlink', b'set'])
+
+    def test_flushdb(self):
+        self.client.execute([b'flushdb'])
+
+    def test_flushdb_async(self):
+        self.client.execute([b'flushdb', b'async'])
@@ -0,0 +1,97 @@
+import unittest
+from threading import Thread
+
+import pulsar
+from pulsar import asyncio
+from pulsar.apps.test import check_server
+from pulsar.apps.data import create_store
+from pulsar.apps.data.redis.lock import Lock
+
+
+class PollingLock(Lock):
+    '''A :class:`.Lock` waiting by sleeping, as before waiters were woken
+    on release
+    '''
+    def _wait(self, token, timeout):
+        return asyncio.sleep(timeout, loop=self._loop)
+
+
+@unittest.skipUnless(check_server('redis'), 'Requires a running redis server')
+class TestLockContention(unittest.TestCase):
+    '''Concurrent workers acquiring and releasing the same lock on a redis
+    server, with waiters woken on release and with waiters sleeping
+    ``sleep`` seconds between attempts. The number of workers is given by
+    the test ``size``.
+
+    Percentiles of the time taken to acquire the lock are reported next to
+    the timing.
+    '''
+    __benchmark__ = True
+    __number__ = 3
+    _sizes = {'tiny': 5,
+              'small': 20,
+              'normal': 50,
+              'big': 100,
+              'huge': 200}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          'acquire p50 {0[p50]} p90 {0[p90]} '
+                          'p99 {0[p99]} msecs')
+    sleep = 0.1
+
+    @classmethod
+    def setUpClass(cls):
+        # the store runs in a loop of its own
+        cls.loop = loop = pulsar.new_event_loop()
+        cls.thread = Thread(target=loop.run_forever, daemon=True)
+        cls.thread.start()
+        addr = cls.cfg.redis_server
+        if not addr.startswith('redis://'):
+            addr = 'redis://%s' % addr
+        cls.size = size = cls._sizes[cls.cfg.size]
+        cls.store = create_store(addr, loop=loop, pool_size=size + 1,
+                                 namespace=cls.__name__.lower())
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.run(cls.store.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    @classmethod
+    def run(cls, method, *args):
+        # call method in the loop thread and wait for its result
+        def call():
+            return (yield from method(*args))
+        return asyncio.run_coroutine_threadsafe(call(), cls.loop).result()
+
+    def getInfo(self, info, delta, dt):
+        latencies = sorted(self.latencies)
+        for p in (50, 90, 99):
+            index = min(len(latencies) - 1, p*len(latencies) // 100)
+            info['p%d' % p] = '%.2f' % (1000*latencies[index])
+
+    def contend(self, lock_class):
+        self.latencies = []
+        self.run(self.gather, lock_class)
+
+    def gather(self, lock_class):
+        return asyncio.gather(*[self.worker(lock_class)
+                                for _ in range(self.size)], loop=self.loop)
+
+    def worker(self, lock_class):
+        lock = lock_class(self.client, 'bench-lock', timeout=10,
+                          blocking=None, sleep=self.sleep)
+        start = self.loop.time()
+        yield from lock.acquire()
+        self.latencies.append(self.loop.time() - start)
+        yield from asyncio.sleep(0.001, loop=self.loop)
+        yield from lock.release()
+
+    def test_event_driven(self):
+        self.contend(Lock)
+
+    def test_polling(self):
+        self.contend(PollingLock)
@@ -0,0 +1,59 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds import redis_parser
+
+
+class TestParser(unittest.TestCase):
+    '''Replies parsed by the python parser, the number of elements is given
+    by the test ``size``. Data is fed in chunks of :attr:`chunk` bytes, as
+    read from a socket, or at once.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 200000,
+              'huge': 500000}
+    chunk = 65536
+    py_parser = True
+
+    @classmethod
+    def setUpClass(cls):
+        cls.parser_class = staticmethod(redis_parser(cls.py_parser))
+        size = cls._sizes[cls.cfg.size]
+        parser = cls.parser_class()
+        values = [('value:%d' % n).encode('utf-8') for n in range(size)]
+        cls.array = parser.multi_bulk(values)
+        cls.replies = b''.join(parser.bulk(value) for value in values)
+        cls.statuses = b'+OK\r\n' * size
+        cls.size = size
+
+    def parse(self, data, replies, chunk=None):
+        parser = self.parser_class()
+        chunk = chunk or self.chunk
+        for n in range(0, len(data), chunk):
+            parser.feed(data[n:n+chunk])
+            result = parser.get()
+            while result is not False:
+                replies -= 1
+                result = parser.get()
+        assert replies == 0
+
+    def test_large_array(self):
+        self.parse(self.array, 1)
+
+    def test_large_array_at_once(self):
+        self.parse(self.array, 1, len(self.array))
+
+    def test_bulk_replies(self):
+        self.parse(self.replies, self.size)
+
+    def test_status_replies(self):
+        self.parse(self.statuses, self.size)
+
+
+@unittest.skipUnless(pulsar.HAS_C_EXTENSIONS, 'Requires C extensions')
+class TestCParser(TestParser):
+    py_parser = False
@@ -0,0 +1,108 @@
+import os
+import unittest
+
+import pulsar
+from pulsar.apps.ds.client import PulsarStoreClient
+
+from tests.stores.utils import storage
+
+
+class DummyTransport:
+    '''Write to the null device, a system call as a socket write'''
+    _closing = False
+
+    def __init__(self):
+        self.writes = 0
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+
+    def write(self, data):
+        self.writes += 1
+        os.write(self.fd, data)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class UnbatchedClient(PulsarStoreClient):
+    '''Write each reply as soon as it is available'''
+
+    def data_received(self, data):
+        self.parser.feed(data)
+        request = self.parser.get()
+        while request is not False:
+            self.execute(request)
+            request = self.parser.get()
+
+
+class TestPipeline(unittest.TestCase):
+    '''Throughput of pipelined requests received by a connection, the
+    number of requests in a pipeline is given by the test ``size``.
+
+    The number of transport writes of a run is reported next to the
+    timing.
+    '''
+    __benchmark__ = True
+    __number__ = 10
+    _sizes = {'tiny': 10,
+              'small': 100,
+              'normal': 1000,
+              'big': 10000,
+              'huge': 100000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          '{0[writes]} writes')
+    client_class = PulsarStoreClient
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        store = storage(cls.loop)
+        cls.server = store._server
+        cls.server._key_value_store = store
+        size = cls._sizes[cls.cfg.size]
+        pack = cls.server._key_value_store._parser.pack_command
+        keys = [('key:%d' % n).encode('utf-8') for n in range(size)]
+        cls.sets = b''.join(pack((b'SET', key, b'x'*100)) for key in keys)
+        cls.gets = b''.join(pack((b'GET', key)) for key in keys)
+        cls.incrs = b''.join(pack((b'INCR', b'counter'))
+                             for _ in range(size))
+        cls.large_gets = b''.join(pack((b'GET', b'large'))
+                                  for _ in range(size))
+        client = cls.new_client()
+        client.data_received(cls.sets)
+        client.data_received(pack((b'SET', b'large', b'x'*100000)))
+        client._transport.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    @classmethod
+    def new_client(cls):
+        client = cls.client_class(cls.server.cfg, cls.loop,
+                                  producer=cls.server)
+        client._transport = DummyTransport()
+        return client
+
+    def startUp(self):
+        self.client = self.new_client()
+
+    def getInfo(self, info, delta, dt):
+        info['writes'] = self.client._transport.writes
+        self.client._transport.close()
+
+    def test_set(self):
+        self.client.data_received(self.sets)
+
+    def test_get(self):
+        self.client.data_received(self.gets)
+
+    def test_incr(self):
+        self.client.data_received(self.incrs)
+
+    def test_get_large(self):
+        self.client.data_received(self.large_gets)
+
+
+class TestUnbatchedPipeline(TestPipeline):
+    client_class = UnbatchedClient
@@ -0,0 +1,63 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class DummyTransport:
+
+    def __init__(self):
+        self.messages = 0
+
+    def write(self, data):
+        self.messages += 1
+
+
+class Subscriber:
+
+    def __init__(self):
+        self.channels = set()
+        self.patterns = set()
+        self._transport = DummyTransport()
+
+
+class TestPatternPublish(unittest.TestCase):
+    '''Publish throughput with 10000 pattern subscriptions, one for each
+    user, plus a few patterns without a literal prefix. The number of
+    messages published is given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 10
+    _sizes = {'tiny': 10,
+              'small': 100,
+              'normal': 1000,
+              'big': 10000,
+              'huge': 100000}
+    users = 10000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.store = storage(cls.loop)
+        cls.client = AofClient(cls.store)
+        patterns = cls.store._patterns
+        cls.subscriber = subscriber = Subscriber()
+        for n in range(cls.users):
+            patterns.add(('user:%d:*' % n).encode('utf-8'), subscriber)
+        patterns.add(b'*:alerts', subscriber)
+        patterns.add(b'[a-z]*:broadcast', subscriber)
+        size = cls._sizes[cls.cfg.size]
+        cls.requests = [(b'publish',
+                         ('user:%d:inbox' % (n*7 % cls.users)).encode('utf-8'),
+                         b'hello') for n in range(size)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_publish(self):
+        execute = self.client.execute
+        for request in self.requests:
+            execute(list(request))
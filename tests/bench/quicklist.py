@@ -0,0 +1,122 @@
+import tracemalloc
+import unittest
+from itertools import islice
+
+from pulsar.apps.ds.quicklist import QuickList
+from pulsar.utils.structures import Deque
+
+
+def elements(size):
+    return [('element:%d' % n).encode('utf-8') for n in range(size)]
+
+
+class TestListMemory(unittest.TestCase):
+    '''Memory used by a list stored in a deque and in a quicklist, the
+    number of elements is given by the test ``size``.
+
+    The memory allocated by the list, without its elements, is reported
+    next to the timing.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 10000,
+              'small': 100000,
+              'normal': 1000000,
+              'big': 2000000,
+              'huge': 5000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          '{0[memory]} KB')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.elements = elements(cls._sizes[cls.cfg.size])
+
+    def startUp(self):
+        self.value = None
+        tracemalloc.start()
+
+    def getInfo(self, info, delta, dt):
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.value = None
+        info['memory'] = round(memory/1024, 1)
+
+    def push(self, value):
+        self.value = value
+        for element in self.elements:
+            value.append(element)
+
+    def test_deque(self):
+        self.push(Deque())
+
+    def test_quicklist(self):
+        self.push(QuickList())
+
+
+class TestListAccess(unittest.TestCase):
+    '''Positional access to a list stored in a deque and in a quicklist,
+    the number of elements is given by the test ``size``. Each test
+    accesses the middle of the list 1000 times, ranges fetch 10 elements.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 10000,
+              'small': 100000,
+              'normal': 1000000,
+              'big': 2000000,
+              'huge': 5000000}
+    reads = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        values = elements(cls._sizes[cls.cfg.size])
+        cls.deque = Deque(values)
+        cls.quicklist = QuickList(values)
+        cls.middle = len(values) // 2
+
+    def index(self, value):
+        middle = self.middle
+        for _ in range(self.reads):
+            value[middle]
+
+    def setitem(self, value):
+        middle = self.middle
+        for _ in range(self.reads):
+            value[middle] = b'x'
+
+    def push_pop(self, value):
+        for _ in range(self.reads):
+            value.appendleft(b'x')
+            value.append(b'x')
+            value[self.middle]
+            value.popleft()
+            value.pop()
+
+    def test_deque_index(self):
+        self.index(self.deque)
+
+    def test_quicklist_index(self):
+        self.index(self.quicklist)
+
+    def test_deque_setitem(self):
+        self.setitem(self.deque)
+
+    def test_quicklist_setitem(self):
+        self.setitem(self.quicklist)
+
+    def test_deque_range(self):
+        start = self.middle
+        for _ in range(self.reads):
+            tuple(islice(self.deque, start, start + 10))
+
+    def test_quicklist_range(self):
+        start = self.middle
+        for _ in range(self.reads):
+            self.quicklist[start:start+10]
+
+    def test_deque_push_pop(self):
+        self.push_pop(self.deque)
+
+    def test_quicklist_push_pop(self):
+        self.push_pop(self.quicklist)
@@ -0,0 +1,87 @@
+import unittest
+from functools import partial
+from threading import Thread
+
+import pulsar
+from pulsar import asyncio
+from pulsar.apps.ds import PulsarDS
+from pulsar.apps.ds.server import TcpServer
+from pulsar.apps.ds.client import PulsarStoreClient
+from pulsar.apps.data import create_store
+
+
+class TestShardedStore(unittest.TestCase):
+    '''MGET and pipelined SET of keys on one pulsar-ds server and sharded
+    over :attr:`nodes` servers on the loopback. The number of keys is given
+    by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 200000,
+              'huge': 500000}
+    nodes = 3
+
+    @classmethod
+    def setUpClass(cls):
+        # the test runs in the loop of the test runner, the servers and the
+        # stores run in a loop of their own
+        cls.loop = loop = pulsar.new_event_loop()
+        cls.thread = Thread(target=loop.run_forever, daemon=True)
+        cls.thread.start()
+        cfg = PulsarDS(key_value_save=[]).cfg.copy()
+        cls.servers = []
+        for _ in range(cls.nodes):
+            server = TcpServer(cfg, partial(PulsarStoreClient, cfg), loop,
+                               ('127.0.0.1', 0))
+            cls.run(server.start_serving)
+            cls.servers.append(server)
+        addresses = ['%s:%s' % server.address[:2] for server in cls.servers]
+        cls.single = create_store('pulsar://%s/9' % addresses[0], loop=loop)
+        cls.sharded = create_store('shard://%s/9' % ','.join(addresses),
+                                   loop=loop)
+        cls.keys = ['key:%d' % n for n in range(cls._sizes[cls.cfg.size])]
+        cls.run(cls.set, cls.single)
+        cls.run(cls.set, cls.sharded)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.single.close()
+        cls.sharded.close()
+        for server in cls.servers:
+            cls.run(server.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.loop.close()
+
+    @classmethod
+    def run(cls, method, *args):
+        # call method in the loop thread and wait for its result
+        def call():
+            return (yield from method(*args))
+        return asyncio.run_coroutine_threadsafe(call(), cls.loop).result()
+
+    @classmethod
+    def set(cls, store):
+        pipe = store.pipeline()
+        for key in cls.keys:
+            pipe.set(key, key)
+        return pipe.commit()
+
+    def mget(self, store):
+        values = self.run(store.client().mget, *self.keys)
+        assert len(values) == len(self.keys)
+
+    def test_mget_single(self):
+        self.mget(self.single)
+
+    def test_mget_sharded(self):
+        self.mget(self.sharded)
+
+    def test_pipeline_single(self):
+        self.run(self.set, self.single)
+
+    def test_pipeline_sharded(self):
+        self.run(self.set, self.sharded)
@@ -0,0 +1,86 @@
+import os
+import pickle
+import tempfile
+import tracemalloc
+import unittest
+from random import choice
+import string
+
+from pulsar.utils.structures import Dict
+from pulsar.apps.ds.snapshot import write_snapshot, read_snapshot
+
+characters = string.ascii_letters + string.digits
+
+
+def random_bytes(size=20):
+    return ''.join((choice(characters) for _ in range(size))).encode('utf-8')
+
+
+class TestSnapshot(unittest.TestCase):
+    '''Compare the streaming snapshot with the legacy pickle dump.
+
+    The peak memory allocated during each run is reported next to the
+    timing.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 500000,
+              'huge': 2000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          'peak memory {0[peak]} MB')
+
+    @classmethod
+    def setUpClass(cls):
+        size = cls._sizes[cls.cfg.size]
+        data = {}
+        for n in range(size):
+            key = random_bytes()
+            if n % 10:
+                data[key] = bytearray(random_bytes(100))
+            else:
+                data[key] = Dict(((random_bytes(8), random_bytes(20))
+                                  for _ in range(5)))
+        cls.dbs = [(0, data, {})]
+        cls.dir = tempfile.mkdtemp()
+        cls.pickle_file = os.path.join(cls.dir, 'pickle.rdb')
+        cls.snapshot_file = os.path.join(cls.dir, 'snapshot.rdb')
+        with open(cls.pickle_file, 'wb') as file:
+            pickle.dump((1, [(0, data)]), file, protocol=2)
+        with open(cls.snapshot_file, 'wb') as file:
+            write_snapshot(file, cls.dbs)
+
+    @classmethod
+    def tearDownClass(cls):
+        for name in (cls.pickle_file, cls.snapshot_file):
+            os.remove(name)
+        os.rmdir(cls.dir)
+
+    def startUp(self):
+        tracemalloc.start()
+
+    def getInfo(self, info, delta, dt):
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        info['peak'] = max(info.get('peak', 0), round(peak/1048576, 2))
+
+    def test_pickle_save(self):
+        with open(self.pickle_file, 'wb') as file:
+            pickle.dump((1, [(0, self.dbs[0][1])]), file, protocol=2)
+
+    def test_snapshot_save(self):
+        with open(self.snapshot_file, 'wb') as file:
+            write_snapshot(file, self.dbs)
+
+    def test_pickle_load(self):
+        with open(self.pickle_file, 'rb') as file:
+            pickle.load(file)
+
+    def test_snapshot_load(self):
+        data = {}
+        with open(self.snapshot_file, 'rb') as file:
+            for _, key, value, _ in read_snapshot(file):
+                data[key] = value
@@ -0,0 +1,55 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestSort(unittest.TestCase):
+    '''SORT of a set of ids by a field of the hashes of the ids, the number
+    of ids is given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 200000,
+              'huge': 500000}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        size = cls._sizes[cls.cfg.size]
+        store = storage(cls.loop)
+        cls.client = client = AofClient(store)
+        ids = [str(n).encode('ascii') for n in range(size)]
+        for id in ids:
+            client.execute([b'hmset', b'user:' + id,
+                            b'score',
+                            str((int(id) * 7919) % size).encode('ascii'),
+                            b'name', b'user' + id])
+        client.execute([b'sadd', b'users'] + ids)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_sort(self):
+        self.client.execute([b'sort', b'users'])
+
+    def test_sort_by(self):
+        self.client.execute([b'sort', b'users', b'by', b'user:*->score'])
+
+    def test_sort_by_get(self):
+        self.client.execute([b'sort', b'users', b'by', b'user:*->score',
+                             b'get', b'#', b'get', b'user:*->name'])
+
+    def test_sort_by_limit(self):
+        self.client.execute([b'sort', b'users', b'by', b'user:*->score',
+                             b'desc', b'limit', b'0', b'10'])
+
+    def test_sort_by_store(self):
+        self.client.execute([b'sort', b'users', b'by', b'user:*->score',
+                             b'get', b'user:*->name', b'store', b'sorted'])
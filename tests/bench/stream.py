@@ -0,0 +1,70 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+from pulsar.apps.ds.stream import Stream
+from pulsar.utils.structures import Deque
+
+from tests.stores.utils import storage
+
+
+class TestStream(unittest.TestCase):
+    '''Streams and lists with the number of entries given by the test
+    ``size``. Reads fetch 10 entries from the middle of the log 1000
+    times, by ID for the stream and by index for the list.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 10000,
+              'small': 100000,
+              'normal': 1000000,
+              'big': 2000000,
+              'huge': 5000000}
+    reads = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = size = cls._sizes[cls.cfg.size]
+        store = storage(cls.loop)
+        cls.client = AofClient(store)
+        data = cls.client.db._data
+        stream = Stream()
+        log = Deque()
+        for n in range(1, size + 1):
+            entry = [b'event', str(n).encode('ascii')]
+            stream.add((n, 0), entry, store._stream_node_max_entries,
+                       store._stream_node_max_bytes)
+            log.append(('event:%d' % n).encode('ascii'))
+        data[b'stream'] = stream
+        data[b'list'] = log
+        cls.middle = size // 2
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_xadd(self):
+        execute = self.client.execute
+        for _ in range(self.reads):
+            execute([b'xadd', b'added', b'*', b'event', b'value'])
+
+    def test_xrange_middle(self):
+        execute = self.client.execute
+        start = str(self.middle).encode('ascii')
+        for _ in range(self.reads):
+            execute([b'xrange', b'stream', start, b'+', b'count', b'10'])
+
+    def test_xread_middle(self):
+        execute = self.client.execute
+        start = str(self.middle).encode('ascii')
+        for _ in range(self.reads):
+            execute([b'xread', b'count', b'10', b'streams', b'stream',
+                     start])
+
+    def test_lrange_middle(self):
+        execute = self.client.execute
+        start = str(self.middle).encode('ascii')
+        end = str(self.middle + 9).encode('ascii')
+        for _ in range(self.reads):
+            execute([b'lrange', b'list', start, end])
@@ -0,0 +1,56 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+
+from tests.stores.utils import storage
+
+
+class TestWatch(unittest.TestCase):
+    '''Writes with :attr:`watchers` clients watching a key each, the number
+    of writes is given by the test ``size``.
+    '''
+    __benchmark__ = True
+    __number__ = 5
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 200000,
+              'huge': 500000}
+    watchers = 1000
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+        cls.size = cls._sizes[cls.cfg.size]
+        cls.store = storage(cls.loop)
+        cls.client = AofClient(cls.store)
+        cls.watching = [AofClient(cls.store) for _ in range(cls.watchers)]
+        cls.watched = [('watched:%d' % n).encode('ascii')
+                       for n in range(cls.watchers)]
+        cls.keys = [('key:%d' % n).encode('ascii') for n in range(cls.size)]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def startUp(self):
+        for client, key in zip(self.watching, self.watched):
+            client.execute([b'unwatch'])
+            client.execute([b'watch', key])
+
+    def test_set(self):
+        execute = self.client.execute
+        for key in self.keys:
+            execute([b'set', key, b'bla'])
+
+    def test_set_watched(self):
+        execute = self.client.execute
+        watched = self.watched
+        for n in range(self.size):
+            execute([b'set', watched[n % self.watchers], b'bla'])
+
+    def test_flushdb(self):
+        execute = self.client.execute
+        for _ in range(self.size // 100):
+            execute([b'flushdb'])
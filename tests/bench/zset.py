@@ -0,0 +1,132 @@
+import tracemalloc
+import unittest
+from random import random, randrange, shuffle
+
+from pulsar.utils.structures import Zset, Skiplist
+
+
+class SkiplistZset(object):
+    '''The sorted set as it was before the blocked arrays engine, a
+    :class:`.Skiplist` of score, member pairs and a dictionary of scores
+    '''
+    def __init__(self, data=None):
+        self._sl = Skiplist()
+        self._dict = {}
+        if data:
+            for score, member in data:
+                self.add(score, member)
+
+    def __len__(self):
+        return len(self._dict)
+
+    def add(self, score, member):
+        if member in self._dict:
+            if self._dict[member] == score:
+                return 0
+            self.remove(member)
+        self._dict[member] = score
+        self._sl.insert(score, member)
+        return 1
+
+    def remove(self, member):
+        index = self.rank(member)
+        if index is not None:
+            self._sl.remove_range(index, index + 1)
+            return self._dict.pop(member)
+
+    def rank(self, member):
+        score = self._dict.get(member)
+        if score is not None:
+            index = self._sl.rank(score)
+            for i, value in enumerate(self._sl.range(index)):
+                if value == member:
+                    return index + i
+
+    def range(self, start, end, scores=False):
+        return self._sl.range(start, end, scores)
+
+    def range_by_score(self, minval, maxval, start=0, num=None,
+                       scores=False):
+        return self._sl.range_by_score(minval, maxval, start=start,
+                                       num=num, scores=scores)
+
+
+class TestZset(unittest.TestCase):
+    '''Operations on a leaderboard of ``size`` members.
+
+    The ``add`` test builds the leaderboard, the others run ``size``
+    rank lookups, score updates, ranges of 10 members and removals.
+    The peak memory allocated during each run is reported next to the
+    timing.
+    '''
+    __benchmark__ = True
+    __number__ = 1
+    _sizes = {'tiny': 1000,
+              'small': 10000,
+              'normal': 100000,
+              'big': 500000,
+              'huge': 1000000}
+    benchmark_template = ('{0[name]}: repeated {0[repeat]}(x{0[times]}) '
+                          'times, average {0[mean]} secs, stdev {0[std]}, '
+                          'peak memory {0[peak]} MB')
+    zset = Zset
+
+    @classmethod
+    def setUpClass(cls):
+        size = cls._sizes[cls.cfg.size]
+        cls.members = [('player:%d' % n).encode('utf-8')
+                       for n in range(size)]
+        # integer scores, as in a leaderboard, give many ties
+        cls.scores = [int(1000*random()) for _ in range(size)]
+        cls.shuffled = cls.members[:]
+        shuffle(cls.shuffled)
+        cls.starts = [randrange(size) for _ in range(size)]
+
+    def startUp(self):
+        self.board = self.zset(zip(self.scores, self.members))
+        tracemalloc.start()
+
+    def getInfo(self, info, delta, dt):
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.board = None
+        info['peak'] = max(info.get('peak', 0), round(peak/1048576, 2))
+
+    def test_add(self):
+        self.zset(zip(self.scores, self.members))
+
+    def test_rank(self):
+        rank = self.board.rank
+        for member in self.shuffled:
+            rank(member)
+
+    def test_update(self):
+        add = self.board.add
+        for score, member in zip(self.scores, self.shuffled):
+            add(score + 1, member)
+
+    def test_range(self):
+        range = self.board.range
+        for start in self.starts:
+            list(range(start, start + 10, True))
+
+    def test_range_by_score(self):
+        range_by_score = self.board.range_by_score
+        for score in self.scores:
+            list(range_by_score(score, score + 10, num=10, scores=True))
+
+    def test_remove(self):
+        remove = self.board.remove
+        for member in self.shuffled:
+            remove(member)
+
+
+class TestSkiplistZset(TestZset):
+    zset = SkiplistZset
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # ranks and removals walk the bottom level of the skiplist
+        if len(cls.members) > 1000:
+            raise unittest.SkipTest('Too slow')
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient, AofError, read_commands
+
+from .utils import storage
+
+
+class TestAppendOnlyFile(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loop = pulsar.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def storage(self, fsync='always'):
+        return storage(self.loop,
+                       filename=os.path.join(self.dir, 'test.rdb'),
+                       appendonly=True,
+                       appendfilename=os.path.join(self.dir, 'test.aof'),
+                       appendfsync=fsync)
+
+    def execute(self, store, *requests):
+        client = AofClient(store)
+        for request in requests:
+            client.execute(list(request))
+        return client
+
+    def test_read_commands(self):
+        data = (b'*2\r\n$6\r\nselect\r\n$1\r\n1\r\n'
+                b'*3\r\n$3\r\nset\r\n$1\r\na\r\n$3\r\nfoo\r\n'
+                b'*2\r\n$3\r\ndel\r\n$1')
+        commands = list(read_commands(BytesIO(data)))
+        self.assertEqual(commands, [([b'select', b'1'], 23),
+                                    ([b'set', b'a', b'foo'], 52)])
+
+    def test_bad_format(self):
+        commands = read_commands(BytesIO(b'*1\r\n$3\r\nfoo\r\n+OK\r\n'))
+        self.assertRaises(AofError, list, commands)
+
+    def test_replay(self):
+        store = self.storage()
+        self.execute(store,
+                     (b'set', b'a', b'foo'),
+                     (b'select', b'2'),
+                     (b'sadd', b'b', b'x', b'y', b'z'),
+                     (b'spop', b'b'),
+                     (b'set', b'c', b'bla', b'ex', b'100'),
+                     (b'rpush', b'd', b'1', b'2'),
+                     (b'get', b'a'))
+        store._aof.close()
+        store2 = self.storage()
+        self.assertEqual(store2.databases[0]._data, {b'a': bytearray(b'foo')})
+        db, db2 = store.databases[2], store2.databases[2]
+        self.assertEqual(db2._data, db._data)
+        self.assertTrue(0 < db2.ttl(b'c') <= 100)
+        store2._aof.close()
+
+    def test_truncated(self):
+        store = self.storage()
+        self.execute(store, (b'set', b'a', b'foo'), (b'set', b'b', b'bla'))
+        store._aof.close()
+        filename = store._aof.filename
+        size = os.path.getsize(filename)
+        os.truncate(filename, size - 3)
+        store2 = self.storage()
+        self.assertEqual(store2.databases[0]._data, {b'a': bytearray(b'foo')})
+        self.assertTrue(os.path.getsize(filename) < size - 3)
+        store2._aof.close()
+
+    def test_rewrite(self):
+        store = self.storage('everysec')
+        self.execute(store, *[(b'incr', b'a') for _ in range(100)])
+        aof = store._aof
+        aof.flush()
+        size = aof.size
+        self.assertTrue(aof.rewrite())
+        self.assertFalse(aof.rewrite())
+        self.execute(store, (b'select', b'3'), (b'set', b'b', b'foo'))
+        aof._rewriter.join()
+        aof.cron()
+        self.assertFalse(aof.rewriting)
+        self.assertEqual(aof.last_rewrite_status, 'ok')
+        self.assertTrue(aof.size < size)
+        aof.close()
+        store2 = self.storage()
+        self.assertEqual(store2.databases[0]._data, {b'a': bytearray(b'100')})
+        self.assertEqual(store2.databases[3]._data,
+                         {b'b': bytearray(b'foo')})
+        store2._aof.close()
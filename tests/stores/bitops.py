@@ -0,0 +1,93 @@
+import os
+import unittest
+
+from pulsar.apps.ds.parser import CommandError
+from pulsar.apps.ds.bitops import (bitcount, bitpos, bitop, bitfield,
+                                   bitfield_operations, BitField, CHUNK_SIZE)
+
+
+def bits(string):
+    return ''.join((format(byte, '08b') for byte in string))
+
+
+class TestBitops(unittest.TestCase):
+
+    def test_bitcount(self):
+        string = bytearray(os.urandom(100))
+        text = bits(string)
+        self.assertEqual(bitcount(string), text.count('1'))
+        for start, end in ((0, 0), (3, 57), (-20, -3), (50, 20), (0, 500)):
+            count = bits(string[start:end+1 or None]).count('1')
+            self.assertEqual(bitcount(string, start, end), count)
+        for start, end in ((0, 0), (3, 457), (-200, -3), (9, 15),
+                           (13, 14), (500, 20)):
+            count = text[start:end+1 or None].count('1')
+            self.assertEqual(bitcount(string, start, end, True), count)
+
+    def test_bitpos(self):
+        string = bytearray(3*CHUNK_SIZE)
+        self.assertEqual(bitpos(string, 1), -1)
+        self.assertEqual(bitpos(string, 0), 0)
+        string[-1] = 1
+        self.assertEqual(bitpos(string, 1), 24*CHUNK_SIZE - 1)
+        self.assertEqual(bitpos(string, 1, -1), 24*CHUNK_SIZE - 1)
+        self.assertEqual(bitpos(string, 1, 0, -2), -1)
+        string = bytearray(b'\xff'*CHUNK_SIZE)
+        self.assertEqual(bitpos(string, 0), 8*CHUNK_SIZE)
+        self.assertEqual(bitpos(string, 0, 0, -1), -1)
+        string[100] = 0xfe
+        self.assertEqual(bitpos(string, 0, 5, 100, True), -1)
+        self.assertEqual(bitpos(string, 0, 5), 807)
+        self.assertEqual(bitpos(string, 0, 800, -1, True), 807)
+
+    def test_bitop(self):
+        a = bytearray(os.urandom(1000))
+        b = bytearray(os.urandom(700))
+        c = b + bytes(300)
+        self.assertEqual(bitop(b'and', [a, b]),
+                         bytes((x & y for x, y in zip(a, c))))
+        self.assertEqual(bitop(b'or', [a, b]),
+                         bytes((x | y for x, y in zip(a, c))))
+        self.assertEqual(bitop(b'xor', [a, b, a]), c)
+        self.assertEqual(bitop(b'not', [a]),
+                         bytes((~x & 255 for x in a)))
+        self.assertEqual(bitop(b'and', [bytearray(3)]), bytes(3))
+
+    def test_bitfield_type(self):
+        field = BitField(b'i64', b'#2')
+        self.assertEqual(field.offset, 128)
+        self.assertTrue(field.signed)
+        self.assertRaises(CommandError, BitField, b'u64', b'0')
+        self.assertRaises(CommandError, BitField, b'x8', b'0')
+        self.assertRaises(CommandError, BitField, b'i0', b'0')
+        self.assertRaises(CommandError, BitField, b'u8', b'-1')
+        self.assertRaises(CommandError, BitField, b'u8', b'#a')
+
+    def test_bitfield_overflow(self):
+        field = BitField(b'i8', b'0')
+        self.assertEqual(field.overflow(130, b'wrap'), -126)
+        self.assertEqual(field.overflow(-130, b'wrap'), 126)
+        self.assertEqual(field.overflow(130, b'sat'), 127)
+        self.assertEqual(field.overflow(-130, b'sat'), -128)
+        self.assertEqual(field.overflow(130, b'fail'), None)
+        field = BitField(b'u3', b'0')
+        self.assertEqual(field.overflow(9, b'wrap'), 1)
+        self.assertEqual(field.overflow(-1, b'sat'), 0)
+        self.assertEqual(field.overflow(7, b'fail'), 7)
+
+    def test_bitfield(self):
+        string = bytearray()
+        operations = bitfield_operations([b'SET', b'u5', b'3', b'31',
+                                          b'get', b'u8', b'0',
+                                          b'incrby', b'u5', b'3', b'1',
+                                          b'get', b'u16', b'0'])
+        self.assertEqual(bitfield(string, operations), [0, 31, 0, 0])
+        self.assertEqual(string, b'\x00')
+        operations = bitfield_operations([b'get', b'u8', b'100'], True)
+        self.assertEqual(bitfield(string, operations), [0])
+        self.assertEqual(len(string), 1)
+        self.assertRaises(CommandError, bitfield_operations,
+                          [b'set', b'u8', b'0', b'1'], True)
+        self.assertRaises(CommandError, bitfield_operations,
+                          [b'set', b'u8', b'0', b'a'])
+        self.assertRaises(CommandError, bitfield_operations, [b'get', b'u8'])
@@ -0,0 +1,222 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import pulsar
+from pulsar.apps.ds import PulsarDS, ResponseError, MovedError, key_slot
+from pulsar.apps.ds.cluster import Cluster, slot_ranges, SLOTS
+from pulsar.apps.ds.snapshot import write_snapshot
+from pulsar.apps.data import create_store
+
+from .utils import storage
+
+
+class TestKeySlot(unittest.TestCase):
+
+    def test_key_slot(self):
+        self.assertEqual(key_slot(b'123456789'), 0x31C3)
+        self.assertEqual(key_slot('foo'), 12182)
+        self.assertEqual(key_slot(b'{user1000}.following'),
+                         key_slot(b'user1000'))
+        self.assertEqual(key_slot(b'foo{}{bar}'), key_slot(b'foo{}{bar}'))
+        self.assertNotEqual(key_slot(b'foo{}{bar}'), key_slot(b'bar'))
+
+    def test_slot_ranges(self):
+        ranges = slot_ranges(3)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], SLOTS - 1)
+        for (_, last), (first, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(last + 1, first)
+        cluster = Cluster([('127.0.0.1', 7000), ('127.0.0.1', 7001),
+                           ('127.0.0.1', 7002)], 1)
+        for index, (first, last) in enumerate(ranges):
+            self.assertEqual(cluster.node(first), index)
+            self.assertEqual(cluster.node(last), index)
+
+
+class TestNodeData(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loop = pulsar.new_event_loop()
+        self.cluster = Cluster([('127.0.0.1', 7000), ('127.0.0.1', 7001)], 1)
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_filenames(self):
+        self.assertEqual(self.cluster.filename('data/pulsards.rdb'),
+                         'data/pulsards-1.rdb')
+        store = storage(self.loop, self.cluster,
+                        filename=os.path.join(self.dir, 'test.rdb'),
+                        appendfilename=os.path.join(self.dir, 'test.aof'))
+        self.assertEqual(store._filename, os.path.join(self.dir,
+                                                       'test-1.rdb'))
+        self.assertEqual(store._appendfilename,
+                         os.path.join(self.dir, 'test-1.aof'))
+
+    def test_load(self):
+        data = dict(((('key:%d' % n).encode('utf-8'), bytearray(b'x'))
+                     for n in range(100)))
+        file = BytesIO()
+        write_snapshot(file, [(0, data, {})])
+        filename = os.path.join(self.dir, 'test.rdb')
+        with open(self.cluster.filename(filename), 'wb') as fp:
+            fp.write(file.getvalue())
+        store = storage(self.loop, self.cluster, filename=filename)
+        # keys of the slots of the other node are dropped
+        keys = [key for key in data if self.cluster.serves(key)]
+        self.assertTrue(0 < len(keys) < 100)
+        self.assertEqual(sorted(store.databases[0]._data), sorted(keys))
+
+
+class Monitor:
+    sockets = ()
+
+    def __init__(self, nodes):
+        self.cluster_nodes = list(nodes)
+        self.cluster_sockets = ['socket%d' % n for n in range(len(nodes))]
+        self.managed_actors = {}
+
+
+class TestActorParams(unittest.TestCase):
+
+    def params(self, monitor):
+        params = {}
+        PulsarDS(key_value_cluster=True).actorparams(monitor, params)
+        return params
+
+    def test_free_node(self):
+        monitor = Monitor(['a', 'b', 'c'])
+        monitor.managed_actors = {'a': None, 'c': None}
+        params = self.params(monitor)
+        self.assertEqual(params['cluster_node'], (1, 'socket1'))
+        self.assertEqual(monitor.cluster_nodes[1], params['aid'])
+        self.assertEqual(monitor.cluster_nodes[::2], ['a', 'c'])
+
+    def test_no_free_node(self):
+        monitor = Monitor(['a', 'b'])
+        monitor.managed_actors = {'a': None, 'b': None}
+        params = self.params(monitor)
+        self.assertFalse('cluster_node' in params)
+        self.assertFalse('aid' in params)
+        self.assertEqual(monitor.cluster_nodes, ['a', 'b'])
+
+
+class Worker:
+    sockets = ()
+    stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestWorkerStart(unittest.TestCase):
+
+    def test_no_cluster_node(self):
+        server = PulsarDS(key_value_cluster=True, workers=2)
+        server.logger = pulsar.logger()
+        worker = Worker()
+        server.worker_start(worker)
+        self.assertTrue(worker.stopped)
+
+
+class TestCluster(unittest.TestCase):
+    app_cfg = None
+
+    @classmethod
+    def setUpClass(cls):
+        server = PulsarDS(name=cls.__name__.lower(),
+                          bind='127.0.0.1:0',
+                          concurrency='process',
+                          workers=2,
+                          key_value_cluster=True)
+        cls.app_cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.pulsards_uri = 'pulsar://%s:%s' % cls.app_cfg.addresses[0]
+        cls.store = create_store(cls.pulsards_uri, pool_size=1)
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfg is not None:
+            return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
+
+    def node_store(self, address):
+        return create_store('pulsar://%s:%s' % address, pool_size=1)
+
+    def node_client(self, address):
+        return self.node_store(address).client()
+
+    def test_nodes(self):
+        addresses = self.app_cfg.cluster_addresses
+        self.assertEqual(len(addresses), 2)
+        slots = yield from self.node_client(addresses[0]).execute(
+            'cluster', 'slots')
+        self.assertEqual(len(slots), 2)
+        self.assertEqual(slots[0][:2], [b'0', b'8191'])
+        self.assertEqual(slots[1][:2], [b'8192', b'16383'])
+        slot = yield from self.client.execute('cluster', 'keyslot', 'foo')
+        self.assertEqual(slot, 12182)
+
+    def test_moved(self):
+        addresses = self.app_cfg.cluster_addresses
+        store = self.node_store(addresses[0])
+        # slot 12182 is served by the second node
+        connection = yield from store.pool.connect()
+        with connection:
+            try:
+                yield from connection.execute('get', 'foo')
+            except MovedError as exc:
+                self.assertEqual(exc.args[0], '12182 %s:%s' % addresses[1])
+            else:
+                raise AssertionError('MovedError not raised')
+        # the store follows the redirect
+        client = store.client()
+        yield from self.async.assertEqual(client.set('foo', 1), True)
+        yield from self.async.assertEqual(client.get('foo'), b'1')
+        # the first redirect loads the slots of all nodes
+        self.assertEqual(len(store._slots), SLOTS)
+        self.assertEqual(store._slots[0], store.pool)
+        self.assertEqual(store._slots[12182],
+                         store._nodes[addresses[1][:2]])
+
+    def test_moved_cache(self):
+        addresses = self.app_cfg.cluster_addresses
+        store = create_store('pulsar://%s:%s' % addresses[0], pool_size=1,
+                             cache_size=10)
+        client = store.client()
+        yield from self.async.assertEqual(client.set('{foo}.cache', 2), True)
+        # the cached read follows the redirect too
+        store = create_store('pulsar://%s:%s' % addresses[0], pool_size=1,
+                             cache_size=10)
+        client = store.client()
+        yield from self.async.assertEqual(client.get('{foo}.cache'), b'2')
+        self.assertTrue(12182 in store._slots)
+        self.assertEqual(len(store.cache), 0)
+        store.cache.close()
+
+    def test_redirects(self):
+        client = self.client
+        keys = ['key%s' % n for n in range(20)]
+        for n, key in enumerate(keys):
+            yield from self.async.assertEqual(client.set(key, n), True)
+        for n, key in enumerate(keys):
+            yield from self.async.assertEqual(client.get(key),
+                                              str(n).encode('utf-8'))
+        sizes = []
+        for address in self.app_cfg.cluster_addresses:
+            size = yield from self.node_client(address).dbsize()
+            sizes.append(size)
+        self.assertTrue(min(sizes) > 0)
+
+    def test_crossslot(self):
+        client = self.client
+        yield from self.async.assertRaises(ResponseError, client.mget,
+                                           'a', 'b')
+        yield from self.async.assertEqual(
+            client.mset('{user}.a', 1, '{user}.b', 2), True)
+        yield from self.async.assertEqual(
+            client.mget('{user}.a', '{user}.b'), [b'1', b'2'])
@@ -0,0 +1,170 @@
+import pickle
+import unittest
+
+import pulsar
+from pulsar.utils.structures import Dict
+from pulsar.apps.ds.aof import AofClient
+from pulsar.apps.ds.encoding import (pack, unpack, as_integer, PackedHash,
+                                     PackedList, IntSet)
+from pulsar.apps.ds.quicklist import QuickList
+
+from .utils import storage
+
+
+class Client(AofClient):
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.replies = []
+
+    def reply_bulk(self, value=None):
+        self.replies.append(value)
+
+
+class TestPacked(unittest.TestCase):
+
+    def test_pack(self):
+        elements = [b'', b'a', b'x'*254, b'y'*255, b'z'*70000]
+        self.assertEqual(unpack(pack(elements)), elements)
+        self.assertEqual(unpack(b''), [])
+
+    def test_as_integer(self):
+        self.assertEqual(as_integer(b'10'), 10)
+        self.assertEqual(as_integer(b'-3'), -3)
+        for value in (b'010', b'+1', b' 1', b'1.0', b'foo', b'1_0',
+                      str(1 << 63).encode('utf-8')):
+            self.assertEqual(as_integer(value), None)
+
+    def test_hash(self):
+        value = PackedHash()
+        self.assertFalse(value)
+        value[b'a'] = b'1'
+        value[b'b'] = 2
+        value[b'a'] = b'3'
+        self.assertEqual(len(value), 2)
+        self.assertTrue(b'a' in value)
+        self.assertFalse(b'1' in value)
+        self.assertEqual(value[b'b'], b'2')
+        self.assertEqual(value.get(b'c'), None)
+        self.assertEqual(value.items(), [(b'a', b'3'), (b'b', b'2')])
+        value.update(((b'c', b'4'), (b'a', b'5')))
+        self.assertEqual(value.flat(), [b'a', b'5', b'b', b'2', b'c', b'4'])
+        self.assertEqual(value.mget((b'c', b'd')), [b'4', None])
+        self.assertEqual(value.pop(b'b'), b'2')
+        self.assertEqual(value.pop(b'b', None), None)
+        self.assertEqual(list(value), [b'a', b'c'])
+        self.assertEqual(value.values(), [b'5', b'4'])
+        self.assertEqual(value.full(), Dict(((b'a', b'5'), (b'c', b'4'))))
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+
+    def test_list(self):
+        value = PackedList()
+        full = QuickList()
+        for v in (value, full):
+            v.extend((b'a', b'b'))
+            v.extendleft((b'c', b'd'))
+            v.append(b'b')
+            v.appendleft(b'e')
+            v.insert_before(b'b', b'f')
+            v.insert_after(b'a', b'g')
+            v[1] = b'b'
+        self.assertEqual(list(value), list(full))
+        self.assertEqual(value[-1], full[-1])
+        self.assertEqual(value.remove(b'b', -1), full.remove(b'b', -1))
+        self.assertEqual(list(value), list(full))
+        self.assertEqual(value.remove(b'b', 0), full.remove(b'b', 0))
+        self.assertEqual(list(value), list(full))
+        self.assertEqual(value.pop(), full.pop())
+        self.assertEqual(value.popleft(), full.popleft())
+        value.trim(1, 3)
+        full.trim(1, 3)
+        self.assertEqual(list(value), list(full))
+        self.assertEqual(value.full(), full)
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+
+    def test_intset(self):
+        value = IntSet((b'3', b'-1', b'20', b'3'))
+        self.assertEqual(list(value), [b'-1', b'3', b'20'])
+        self.assertTrue(b'20' in value)
+        self.assertFalse(b'foo' in value)
+        self.assertRaises(ValueError, value.add, b'foo')
+        value.difference_update((b'3', b'4'))
+        self.assertRaises(KeyError, value.remove, b'3')
+        self.assertTrue(value.pop() in (b'-1', b'20'))
+        self.assertEqual(len(value), 1)
+        self.assertTrue(value.fits((b'1', b'2'), 3))
+        self.assertFalse(value.fits((b'1', b'2', b'3'), 3))
+        self.assertFalse(value.fits((b'foo',), 3))
+        self.assertEqual(pickle.loads(pickle.dumps(value)), value)
+        self.assertEqual(value.full(), set(value))
+
+
+class TestConversion(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = pulsar.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.store = storage(self.loop, hash_max_listpack_entries=2,
+                             list_max_listpack_value=4,
+                             set_max_intset_entries=3)
+        self.client = Client(self.store)
+
+    def execute(self, *request):
+        self.client.execute(list(request))
+
+    def encoding(self, key):
+        self.execute(b'object', b'encoding', key)
+        return self.client.replies.pop()
+
+    def test_hash(self):
+        self.execute(b'hset', b'h', b'a', b'1')
+        self.execute(b'hincrby', b'h', b'b', b'2')
+        self.assertEqual(self.encoding(b'h'), b'listpack')
+        self.execute(b'hset', b'h', b'b', b'3')
+        self.assertEqual(self.encoding(b'h'), b'listpack')
+        self.execute(b'hset', b'h', b'c', b'4')
+        self.assertEqual(self.encoding(b'h'), b'hashtable')
+        self.execute(b'hmset', b'h2', b'a', b'1', b'b', b'2', b'c', b'3')
+        self.assertEqual(self.encoding(b'h2'), b'hashtable')
+        value = self.store.databases[0]._data[b'h']
+        self.assertEqual(value, Dict(((b'a', b'1'), (b'b', b'3'),
+                                      (b'c', b'4'))))
+
+    def test_list(self):
+        self.execute(b'rpush', b'l', b'a', b'b')
+        self.assertEqual(self.encoding(b'l'), b'listpack')
+        self.execute(b'lpush', b'l', b'abcde')
+        self.assertEqual(self.encoding(b'l'), b'quicklist')
+        self.execute(b'rpoplpush', b'l', b'l2')
+        self.assertEqual(self.encoding(b'l2'), b'listpack')
+        self.execute(b'lset', b'l2', b'0', b'abcde')
+        self.assertEqual(self.encoding(b'l2'), b'quicklist')
+        data = self.store.databases[0]._data
+        self.assertEqual(data[b'l'], QuickList((b'abcde', b'a')))
+
+    def test_set(self):
+        self.execute(b'sadd', b's', b'1', b'2', b'3', b'3')
+        self.assertEqual(self.encoding(b's'), b'intset')
+        self.execute(b'sadd', b's', b'4')
+        self.assertEqual(self.encoding(b's'), b'hashtable')
+        self.execute(b'sadd', b's2', b'1', b'foo')
+        self.assertEqual(self.encoding(b's2'), b'hashtable')
+        self.execute(b'smove', b's', b's3', b'1')
+        self.assertEqual(self.encoding(b's3'), b'intset')
+        data = self.store.databases[0]._data
+        self.assertEqual(data[b's'], {b'2', b'3', b'4'})
+
+    def test_strings(self):
+        self.execute(b'set', b'a', b'10')
+        self.assertEqual(self.encoding(b'a'), b'int')
+        self.execute(b'set', b'a', b'foo')
+        self.assertEqual(self.encoding(b'a'), b'embstr')
+        self.execute(b'set', b'a', b'x'*100)
+        self.assertEqual(self.encoding(b'a'), b'raw')
+        self.assertEqual(self.encoding(b'b'), None)
@@ -0,0 +1,84 @@
+import os
+import pickle
+import unittest
+from random import randrange
+
+from pulsar.apps.ds.hyperloglog import (HyperLogLog, pack_registers,
+                                        unpack_registers, max_registers,
+                                        REGISTERS, DENSE_SIZE)
+
+
+def elements(size):
+    return (os.urandom(16) for _ in range(size))
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_registers(self):
+        a = bytearray((randrange(52) for _ in range(REGISTERS)))
+        b = bytearray((randrange(52) for _ in range(REGISTERS)))
+        data = pack_registers(a)
+        self.assertEqual(len(data), DENSE_SIZE + 1)
+        self.assertEqual(unpack_registers(data), a)
+        self.assertEqual(max_registers(a, b),
+                         bytes((max(x, y) for x, y in zip(a, b))))
+
+    def test_sparse(self):
+        hll = HyperLogLog()
+        self.assertEqual(hll.encoding, 'sparse')
+        self.assertEqual(hll.count(), 0)
+        self.assertTrue(hll)
+        self.assertTrue(hll.add((b'a', b'b', b'c'), 3000))
+        self.assertFalse(hll.add((b'a', b'b'), 3000))
+        self.assertEqual(hll.count(), 3)
+        self.assertTrue(hll.nbytes() <= 12)
+        dense = HyperLogLog()
+        dense.add((b'a', b'b', b'c'), 3000)
+        dense.full()
+        self.assertEqual(dense.encoding, 'dense')
+        self.assertEqual(dense.registers(), hll.registers())
+        self.assertEqual(dense.count(), 3)
+
+    def test_promote(self):
+        hll = HyperLogLog()
+        hll.add(elements(100), 200)
+        self.assertEqual(hll.encoding, 'dense')
+        self.assertEqual(hll.nbytes(), DENSE_SIZE + 1)
+        self.assertTrue(abs(hll.count() - 100) <= 2)
+
+    def test_accuracy(self):
+        hll = HyperLogLog()
+        size = 0
+        for added in (1000, 9000, 90000):
+            hll.add(elements(added), 3000)
+            size += added
+            self.assertTrue(abs(hll.count() - size) < 0.05*size)
+
+    def test_merge(self):
+        a = HyperLogLog()
+        a.add((str(n).encode('ascii') for n in range(5000)), 3000)
+        b = HyperLogLog()
+        b.add((str(n).encode('ascii')
+               for n in range(4000, 8000)), 3000)
+        c = HyperLogLog()
+        c.add((b'x', b'y'), 3000)
+        union = HyperLogLog()
+        union.add((str(n).encode('ascii') for n in range(8000)), 3000)
+        union.add((b'x', b'y'), 3000)
+        merged = HyperLogLog()
+        merged.merge(c, 3000)
+        self.assertEqual(merged.encoding, 'sparse')
+        merged.merge(a, 3000)
+        merged.merge(b, 3000)
+        self.assertEqual(merged, union)
+        self.assertEqual(merged.count(), union.count())
+
+    def test_serialise(self):
+        for size in (0, 10, 1000):
+            hll = HyperLogLog()
+            hll.add(elements(size), 3000)
+            self.assertEqual(HyperLogLog.loads(hll.dumps()), hll)
+            copy = pickle.loads(pickle.dumps(hll))
+            self.assertEqual(copy, hll)
+            self.assertEqual(copy.encoding, hll.encoding)
+        self.assertRaises(ValueError, HyperLogLog.loads, b'HXLL\x00')
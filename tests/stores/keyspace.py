@@ -0,0 +1,64 @@
+import pickle
+import unittest
+
+from pulsar.apps.ds.keyspace import KeySpace, key_bucket
+
+
+def key(n):
+    return ('k%d' % n).encode('utf-8')
+
+
+def value(n):
+    return bytearray(str(n).encode('utf-8'))
+
+
+class TestKeySpace(unittest.TestCase):
+
+    def scan_all(self, data, count=10, callback=None):
+        keys = []
+        cursor, result = data.scan(0, count)
+        keys.extend(result)
+        while cursor:
+            if callback:
+                callback()
+            cursor, result = data.scan(cursor, count)
+            keys.extend(result)
+        return keys
+
+    def test_index(self):
+        data = KeySpace({b'a': value(1), b'b': value(2)})
+        data[b'c'] = value(3)
+        data[b'a'] = value(4)
+        self.assertEqual(sorted(self.scan_all(data)), [b'a', b'b', b'c'])
+        del data[b'a']
+        self.assertEqual(data.pop(b'b'), value(2))
+        self.assertEqual(data.pop(b'b', None), None)
+        self.assertEqual(self.scan_all(data), [b'c'])
+        # emptied buckets are kept
+        self.assertEqual(len(data._bucket_ids), 3)
+        self.assertEqual(set(data._buckets[key_bucket(b'c')]), {b'c'})
+        self.assertFalse(data._buckets[key_bucket(b'a')])
+        data.clear()
+        self.assertEqual(data.scan(0, 10), (0, []))
+        self.assertFalse(data._buckets)
+
+    def test_pickle(self):
+        data = KeySpace({b'a': value(1), b'b': value(2)})
+        data2 = pickle.loads(pickle.dumps(data))
+        self.assertIsInstance(data2, KeySpace)
+        self.assertEqual(data2, data)
+        self.assertEqual(sorted(self.scan_all(data2)), [b'a', b'b'])
+
+    def test_scan_changes(self):
+        data = KeySpace(((key(n), value(n)) for n in range(2000)))
+        added = iter(range(2000, 2500))
+
+        def change():
+            n = next(added)
+            data[key(n)] = value(n)
+            data.pop(key(n - 2000), None)
+
+        keys = self.scan_all(data, 10, change)
+        # keys present during the whole iteration are returned
+        self.assertTrue(set(key(n) for n in range(500, 2000)) <=
+                        set(keys))
@@ -0,0 +1,133 @@
+import unittest
+
+import pulsar
+from pulsar.utils.structures import Zset
+from pulsar.apps.ds.aof import AofClient
+from pulsar.apps.ds.keyspace import KeySpace
+from pulsar.apps.ds.lazyfree import (LazyFree, containers,
+                                     LAZYFREE_THRESHOLD, LAZYFREE_SLICE)
+
+from .utils import storage
+
+
+class Client(AofClient):
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.errors = []
+        self.replies = []
+
+    def reply_error(self, value, prefix=None):
+        self.errors.append(value)
+
+    def reply_int(self, value):
+        self.replies.append(value)
+
+
+class TestLazyFree(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = pulsar.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def storage(self):
+        return storage(self.loop)
+
+    def free_all(self, lazyfree):
+        while not lazyfree.step():
+            pass
+
+    def test_small_values(self):
+        lazyfree = LazyFree(self.loop)
+        value = set(range(LAZYFREE_THRESHOLD))
+        lazyfree.free(value)
+        lazyfree.free(bytearray(100000))
+        self.assertEqual(lazyfree.pending, 0)
+        self.assertEqual(len(value), LAZYFREE_THRESHOLD)
+
+    def test_containers(self):
+        lazyfree = LazyFree(self.loop)
+        zset = Zset(((n, n) for n in range(1000)))
+        data = KeySpace(((str(n).encode('utf-8'), set(range(100)))
+                         for n in range(1000)))
+        sets = list(data.values())
+        lazyfree.free(zset)
+        lazyfree.free(data)
+        self.assertEqual(lazyfree.pending, 2)
+        self.free_all(lazyfree)
+        self.assertEqual(lazyfree.pending, 0)
+        self.assertEqual(lazyfree.freed, 1002)
+        self.assertFalse(zset._dict)
+        self.assertFalse(zset._members)
+        self.assertFalse(data)
+        self.assertFalse(data._sizes)
+        self.assertFalse(data._buckets)
+        self.assertFalse(any(sets))
+
+    def test_slices(self):
+        lazyfree = LazyFree(self.loop)
+        zset = Zset(((n, n) for n in range(10000)))
+        blocks = len(zset._members)
+        values = containers(zset)
+        self.assertTrue(values[1] is zset._members)
+        # a block of the zset is larger than a slice
+        self.assertTrue(len(zset._members[0]) > LAZYFREE_SLICE)
+        lazyfree._drain(values[1])
+        self.assertEqual(len(zset._members), blocks - 1)
+        data = {n: set(range(LAZYFREE_THRESHOLD)) for n in range(100)}
+        lazyfree._drain(data)
+        self.assertEqual(len(data), 100 - LAZYFREE_SLICE // LAZYFREE_THRESHOLD)
+
+    def test_unlink(self):
+        store = self.storage()
+        client = Client(store)
+        client.execute([b'sadd', b'a'] +
+                       [str(n).encode('ascii') for n in range(1000)])
+        client.execute([b'set', b'b', b'foo'])
+        value = client.db.get(b'a')
+        client.execute([b'unlink', b'a', b'b', b'c'])
+        self.assertEqual(client.replies[-1], 2)
+        self.assertEqual(len(client.db), 0)
+        self.assertEqual(client.db._data.memory, 0)
+        self.assertEqual(store._lazyfree.pending, 1)
+        self.assertEqual(len(value), 1000)
+        # scheduled in the event loop
+        self.assertTrue(store._lazyfree._handle)
+        self.free_all(store._lazyfree)
+        self.assertEqual(store._lazyfree.pending, 0)
+        self.assertFalse(value)
+
+    def test_flushdb_async(self):
+        store = self.storage()
+        client = Client(store)
+        db = client.db
+        for n in range(100):
+            key = str(n).encode('ascii')
+            client.execute([b'sadd', key] +
+                           [('m%d' % m).encode('ascii') for m in range(100)])
+            client.execute([b'expire', key, b'100'])
+        data, expires = db._data, db._expires
+        client.execute([b'flushdb', b'async'])
+        self.assertEqual(len(db), 0)
+        self.assertEqual(db._data.memory, 0)
+        self.assertFalse(db._expires)
+        self.assertEqual(len(data), 100)
+        client.execute([b'set', b'a', b'foo'])
+        self.assertEqual(len(db), 1)
+        self.free_all(store._lazyfree)
+        self.assertFalse(data)
+        self.assertFalse(expires)
+        self.assertTrue(store._lazyfree.freed >= 102)
+        self.assertEqual(len(db), 1)
+
+    def test_flush_options(self):
+        store = self.storage()
+        client = Client(store)
+        client.execute([b'set', b'a', b'foo'])
+        client.execute([b'flushall', b'SYNC'])
+        self.assertEqual(len(client.db), 0)
+        client.execute([b'flushdb', b'foo'])
+        client.execute([b'flushall', b'async', b'sync'])
+        self.assertEqual(len(client.errors), 2)
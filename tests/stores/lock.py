@@ -1,8 +1,15 @@
+from pulsar import asyncio, async
 from pulsar.apps.data import LockError
 
 
 class RedisLockTests:
 
+    def waiters_client(self):
+        # a client with connections to spare for blocked waiters, the
+        # tests running concurrently share the pool of self.client
+        return self.create_store(self.client.store.dns,
+                                 pool_size=10).client()
+
     def test_lock(self):
         key = self.randomkey()
         eq = self.async.assertEqual
@@ -73,3 +80,73 @@ class RedisLockTests:
         yield from self.async.assertRaises(LockError, lock.release)
         # even though we errored, the token is still cleared
         self.assertEqual(lock.token, None)
+
+    def test_release_wakes_waiter(self):
+        key = self.randomkey()
+        client = self.waiters_client()
+        lock1 = client.lock(key)
+        lock2 = client.lock(key, blocking=5, sleep=1)
+        yield from self.async.assertEqual(lock1.acquire(), True)
+        waiter = async(lock2.acquire(), loop=lock1._loop)
+        yield from asyncio.sleep(0.1)
+        start = lock1._loop.time()
+        yield from self.async.assertEqual(lock1.release(), True)
+        yield from self.async.assertEqual(waiter, True)
+        # woken up well before the fallback poll
+        self.assertTrue(lock1._loop.time() - start < 0.5)
+        yield from self.async.assertEqual(lock2.release(), True)
+
+    def test_fifo(self):
+        key = self.randomkey()
+        client = self.waiters_client()
+        order = []
+
+        def worker(n):
+            lock = client.lock(key, blocking=None)
+            yield from lock.acquire()
+            order.append(n)
+            yield from lock.release()
+
+        holder = client.lock(key)
+        yield from self.async.assertEqual(holder.acquire(), True)
+        workers = []
+        for n in range(5):
+            workers.append(async(worker(n), loop=holder._loop))
+            yield from asyncio.sleep(0.05)
+        yield from self.async.assertEqual(client.llen(holder._queue), 5)
+        yield from self.async.assertEqual(holder.release(), True)
+        yield from asyncio.gather(*workers, loop=holder._loop)
+        self.assertEqual(order, list(range(5)))
+        yield from self.async.assertEqual(client.lock(key).acquire(), True)
+
+    def test_blocking_timeout_leaves_queue(self):
+        key = self.randomkey()
+        lock1 = self.client.lock(key)
+        lock2 = self.client.lock(key, blocking=0.3)
+        yield from self.async.assertEqual(lock1.acquire(), True)
+        yield from self.async.assertEqual(lock2.acquire(), False)
+        yield from self.async.assertEqual(self.client.llen(lock2._queue), 0)
+        yield from self.async.assertEqual(lock1.release(), True)
+        yield from self.async.assertEqual(lock2.acquire(), True)
+        yield from self.async.assertEqual(lock2.release(), True)
+
+    def test_extend(self):
+        key = self.randomkey()
+        lock = self.client.lock(key, timeout=5)
+        yield from self.async.assertRaises(LockError, lock.extend, 5)
+        yield from self.async.assertEqual(lock.acquire(), True)
+        yield from self.async.assertEqual(lock.extend(5), True)
+        ttl = yield from self.client.pttl(key)
+        self.assertTrue(9000 < ttl <= 10000)
+        yield from self.async.assertEqual(lock.extend(2, True), True)
+        ttl = yield from self.client.pttl(key)
+        self.assertTrue(1000 < ttl <= 2000)
+        yield from self.async.assertEqual(lock.renew(), True)
+        ttl = yield from self.client.pttl(key)
+        self.assertTrue(4000 < ttl <= 5000)
+        yield from self.client.set(key, 'a')
+        yield from self.async.assertRaises(LockError, lock.extend, 5)
+        lock = self.client.lock(key)
+        yield from self.client.delete(key)
+        yield from self.async.assertEqual(lock.acquire(), True)
+        yield from self.async.assertRaises(LockError, lock.extend, 5)
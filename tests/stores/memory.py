@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pulsar
+from pulsar.utils.structures import Dict, Deque
+from pulsar.apps.ds.aof import AofClient
+from pulsar.apps.ds.encoding import PackedList
+from pulsar.apps.ds.memory import (key_size, lfu_touch, lfu_counter,
+                                   used_memory, LFU_INIT_VAL, KEY_OVERHEAD,
+                                   VALUE_OVERHEAD)
+
+from .utils import storage
+
+
+def key(n):
+    return ('key%d' % n).encode('utf-8')
+
+
+class Client(AofClient):
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.errors = []
+        self.replies = []
+
+    def reply_error(self, value, prefix=None):
+        self.errors.append(prefix)
+
+    def reply_rejected(self, value, prefix):
+        self.errors.append(prefix)
+
+    def reply_int(self, value):
+        self.replies.append(value)
+
+
+class TestMemory(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.loop = pulsar.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def storage(self, **params):
+        params.setdefault('filename', os.path.join(self.dir, 'test.rdb'))
+        return storage(self.loop, **params)
+
+    def execute(self, client, *requests):
+        for request in requests:
+            client.execute(list(request))
+
+    def test_key_size(self):
+        size = KEY_OVERHEAD + 3 + VALUE_OVERHEAD
+        self.assertEqual(key_size(b'foo', bytearray(10)), size + 10)
+        small = key_size(b'foo', Deque((b'x'*10 for _ in range(10))))
+        big = key_size(b'foo', Deque((b'x'*10 for _ in range(1000))))
+        self.assertTrue(100*(small - size) == big - size)
+        value = Dict(((b'a', b'x'*1000),))
+        self.assertTrue(key_size(b'foo', value) > size + 1000)
+
+    def test_lfu(self):
+        access = lfu_touch(None, 10)
+        self.assertEqual(lfu_counter(access, 10), LFU_INIT_VAL)
+        for _ in range(100):
+            access = lfu_touch(access, 10)
+        counter = lfu_counter(access, 10)
+        self.assertTrue(LFU_INIT_VAL < counter < 100)
+        self.assertEqual(lfu_counter(access, 12), counter - 2)
+        self.assertEqual(lfu_counter(access, 1000), 0)
+
+    def test_accounting(self):
+        store = self.storage()
+        client = Client(store)
+        db = store.databases[0]
+        self.execute(client, (b'set', b'a', b'foo'))
+        size = db._data.memory
+        self.assertEqual(size, key_size(b'a', bytearray(b'foo')))
+        self.execute(client, (b'rpush', b'b', b'1', b'2', b'3'))
+        self.execute(client, (b'rpush', b'b', b'4'))
+        self.assertEqual(db._data.memory,
+                         size + key_size(b'b', PackedList((b'1', b'2', b'3',
+                                                           b'4'))))
+        self.assertEqual(used_memory(store), db._data.memory)
+        self.execute(client, (b'del', b'a'), (b'lpop', b'b'))
+        self.assertEqual(db._data.memory,
+                         key_size(b'b', PackedList((b'2', b'3', b'4'))))
+        self.execute(client, (b'flushdb',))
+        self.assertEqual(db._data.memory, 0)
+        self.assertFalse(db._data._access)
+
+    def test_noeviction(self):
+        store = self.storage(maxmemory=1000)
+        client = Client(store)
+        for n in range(10):
+            self.execute(client, (b'set', key(n), b'x'*100))
+        self.assertEqual(client.errors[-1], 'OOM')
+        self.assertTrue(used_memory(store) > 1000)
+        # commands which free memory are allowed
+        count = len(client.errors)
+        self.execute(client, (b'del', b'key0'))
+        self.assertEqual(len(client.errors), count)
+        info = store._info()['memory']
+        self.assertEqual(info['maxmemory'], 1000)
+        self.assertEqual(info['used_memory'], used_memory(store))
+
+    def test_allkeys_lru(self):
+        store = self.storage(maxmemory_policy='allkeys-lru',
+                             maxmemory_samples=100)
+        client = Client(store)
+        for n in range(20):
+            store._lru_clock = n
+            self.execute(client, (b'set', key(n), b'x'*100))
+        store._lru_clock = 20
+        # key0 and key1 are the most recently used
+        self.execute(client, (b'get', b'key0'), (b'get', b'key1'))
+        store._maxmemory = used_memory(store) - 1
+        self.execute(client, (b'set', b'new', b'x'*100))
+        db = store.databases[0]
+        self.assertTrue(db.exists(b'new'))
+        # keys are evicted before executing the command
+        self.assertFalse(db.exists(b'key2'))
+        for n in (0, 1, 3):
+            self.assertTrue(db.exists(key(n)))
+        self.assertEqual(store._evicted_keys, 1)
+        self.assertEqual(client.errors, [])
+
+    def test_sparse_keyspace(self):
+        store = self.storage(maxmemory_policy='allkeys-lru')
+        client = Client(store)
+        for n in range(20000):
+            self.execute(client, (b'set', key(n), b'x'))
+        # most buckets of the keyspace are empty
+        self.execute(client, [b'del'] + [key(n) for n in range(19900)])
+        store._maxmemory = used_memory(store) - 10
+        for n in range(20):
+            self.execute(client, (b'set', ('new%d' % n).encode('utf-8'),
+                                  b'x'))
+        self.assertEqual(client.errors, [])
+        self.assertTrue(store._evicted_keys > 10)
+
+    def test_allkeys_lfu(self):
+        store = self.storage(maxmemory_policy='allkeys-lfu',
+                             maxmemory_samples=100)
+        client = Client(store)
+        for n in range(10):
+            self.execute(client, (b'set', key(n), b'x'*100))
+        for n in range(1, 10):
+            self.execute(client, *([(b'get', key(n))]*100))
+        store._maxmemory = used_memory(store) - 1
+        self.execute(client, (b'set', b'key0', b'y'*100))
+        self.execute(client, (b'set', b'new', b'x'*100))
+        db = store.databases[0]
+        self.assertEqual(len(db), 10)
+        self.assertFalse(db.exists(b'key0'))
+        self.execute(client, (b'object', b'freq', b'key1'))
+        self.assertTrue(client.replies[-1] > LFU_INIT_VAL)
+        self.execute(client, (b'object', b'idletime', b'key1'))
+        self.assertEqual(client.errors, [None])
+
+    def test_volatile(self):
+        store = self.storage(maxmemory_policy='volatile-ttl',
+                             maxmemory_samples=100)
+        client = Client(store)
+        for n in range(10):
+            self.execute(client, (b'set', key(n), b'x'*100))
+        self.execute(client, (b'set', b'exp1', b'x', b'ex', b'100'),
+                     (b'set', b'exp2', b'x', b'ex', b'10'))
+        store._maxmemory = used_memory(store) - 1
+        self.execute(client, (b'set', b'new', b'x'))
+        db = store.databases[0]
+        self.assertFalse(db.exists(b'exp2'))
+        self.assertTrue(db.exists(b'exp1'))
+        store._maxmemory = 1
+        self.execute(client, (b'set', b'new', b'y'))
+        self.assertEqual(client.errors, ['OOM'])
+        self.assertEqual(len(db), 11)
+        self.assertFalse(db.exists(b'exp1'))
+
+    def test_config(self):
+        store = self.storage()
+        self.assertEqual(store._get_config('maxmemory*'),
+                         ['maxmemory', '0', 'maxmemory-policy', 'noeviction',
+                          'maxmemory-samples', '5'])
+        store._set_config('maxmemory', '10mb')
+        store._set_config('maxmemory-policy', 'allkeys-lru')
+        self.assertEqual(store._maxmemory, 10*1024*1024)
+        self.assertEqual(store._maxmemory_policy, 'allkeys-lru')
+        self.assertRaises(ValueError, store._set_config, 'maxmemory-policy',
+                          'foo')
+        self.assertRaises(ValueError, store._set_config, 'foo', '1')
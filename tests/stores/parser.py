@@ -134,6 +134,34 @@ class TestParser(unittest.TestCase):
         self.assertEqual(res2[0], b'100')
         self.assertEqual(res2[1], result[1])
 
+    def test_many_replies(self):
+        p = self.parser()
+        replies = [b'+OK\r\n', b':5\r\n', b'$3\r\nfoo\r\n', b'*0\r\n']
+        p.feed(b''.join(replies*1000) + b'$3\r\nba')
+        for n in range(1000):
+            self.assertEqual(p.get(), b'OK')
+            self.assertEqual(p.get(), 5)
+            self.assertEqual(p.get(), b'foo')
+            self.assertEqual(p.get(), [])
+        self.assertEqual(p.get(), False)
+        self.assertEqual(p.buffer(), b'ba')
+        p.feed(b'r\r\n:1\r\n')
+        self.assertEqual(p.get(), b'bar')
+        self.assertEqual(p.buffer(), b':1\r\n')
+        self.assertEqual(p.get(), 1)
+        self.assertEqual(p.buffer(), b'')
+
+    def test_large_array(self):
+        p = self.parser()
+        result = [('value:%d' % n).encode('utf-8') for n in range(20000)]
+        data = p.multi_bulk(result)
+        # the buffer is compacted as chunks are fed
+        for n in range(0, len(data), 4096):
+            p.feed(data[n:n+4096])
+            value = p.get()
+        self.assertEqual(value, result)
+        self.assertEqual(p.buffer(), b'')
+
     # CLIENT ENCODERS
     def test_encode_commands(self):
         p = self.parser()
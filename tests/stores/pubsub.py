@@ -0,0 +1,61 @@
+import unittest
+
+from pulsar.apps.ds.pubsub import PatternIndex, literal_prefix
+
+
+class Client:
+
+    def __init__(self):
+        self.patterns = set()
+
+
+class TestPatternIndex(unittest.TestCase):
+
+    def matches(self, index, channel):
+        return sorted(p.pattern for p in index.match(channel))
+
+    def test_literal_prefix(self):
+        self.assertEqual(literal_prefix(b'news.*'), b'news.')
+        self.assertEqual(literal_prefix(b'h?llo'), b'h')
+        self.assertEqual(literal_prefix(b'[ab]c'), b'')
+        self.assertEqual(literal_prefix(b'a\\*'), b'a')
+        self.assertEqual(literal_prefix(b'foo'), b'foo')
+
+    def test_match(self):
+        index = PatternIndex()
+        client = Client()
+        for pattern in (b'*', b'news.*', b'news.*.sport', b'n?ws.it',
+                        b'news.it', b'news.[ab]*', b'a\\*'):
+            index.add(pattern, client)
+        self.assertEqual(len(index), 7)
+        self.assertEqual(self.matches(index, b'news.it'),
+                         [b'*', b'n?ws.it', b'news.*', b'news.it'])
+        self.assertEqual(self.matches(index, b'news.uk.sport'),
+                         [b'*', b'news.*', b'news.*.sport'])
+        self.assertEqual(self.matches(index, b'news.b'),
+                         [b'*', b'news.*', b'news.[ab]*'])
+        self.assertEqual(self.matches(index, b'a*'), [b'*', b'a\\*'])
+        self.assertEqual(self.matches(index, b'ab'), [b'*'])
+        self.assertEqual(self.matches(index, b'news'), [b'*'])
+
+    def test_subscriptions(self):
+        index = PatternIndex()
+        c1, c2 = Client(), Client()
+        index.add(b'a*', c1)
+        index.add(b'a*', c1)
+        index.add(b'a*', c2)
+        index.add(b'b*', c2)
+        self.assertEqual(index.subscriptions, 3)
+        self.assertEqual(c2.patterns, set((b'a*', b'b*')))
+        self.assertTrue(index.remove(b'a*', c1))
+        self.assertFalse(index.remove(b'a*', c1))
+        self.assertFalse(index.remove(b'c*', c1))
+        self.assertEqual(index.subscriptions, 2)
+        self.assertEqual(len(index.match(b'abc')), 1)
+        index.remove(b'a*', c2)
+        index.remove(b'b*', c2)
+        self.assertEqual(index.subscriptions, 0)
+        self.assertEqual(len(index), 0)
+        self.assertFalse(index._prefixes)
+        self.assertFalse(index._lengths)
+        self.assertEqual(index.match(b'abc'), [])
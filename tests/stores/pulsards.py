@@ -3,6 +3,7 @@ import time
 import unittest
 import asyncio
 import datetime
+from itertools import chain
 
 import pulsar
 from pulsar.utils.string import random_string
@@ -54,6 +55,14 @@ class StoreMixin(object):
         yield from eq(c.delete(key), rem)
         yield from eq(c.rpush(key, 'bla'), 1)
 
+    def _scan_all(self, iterator):
+        result = []
+        item = yield from iterator.next()
+        while item is not None:
+            result.append(item)
+            item = yield from iterator.next()
+        return result
+
     def _remove_and_sadd(self, key, rem=1):
         c = self.client
         eq = self.async.assertEqual
@@ -122,6 +131,18 @@ class RedisCommands(StoreMixin):
         yield from eq(c.ttl(key), -1)
         yield from eq(c.persist(key), False)
 
+    def test_expire_lazy(self):
+        key1, key2 = self.randomkey(), self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.set(key1, 'foo', px=50), True)
+        yield from eq(c.set(key2, 'foo'), True)
+        yield from eq(c.pexpire(key2, 50), True)
+        yield from asyncio.sleep(0.1)
+        yield from eq(c.get(key1), None)
+        yield from eq(c.exists(key2), False)
+        yield from eq(c.ttl(key2), -2)
+
     def test_keys(self):
         key = self.randomkey()
         keya = '%s_a' % key
@@ -155,6 +176,21 @@ class RedisCommands(StoreMixin):
         yield from eq(c.move(key, db), False)
         yield from eq(c.exists(key), True)
 
+    def test_object(self):
+        key = self.randomkey()
+        c = self.client
+        yield from self.async.assertEqual(c.object('idletime', key), None)
+        yield from self.async.assertEqual(c.set(key, 'foo'), True)
+        idle = yield from c.object('idletime', key)
+        self.assertTrue(0 <= idle <= 1)
+        yield from self.async.assertEqual(c.object('refcount', key), 1)
+        yield from self.async.assertEqual(c.object('encoding', key),
+                                          b'embstr')
+        key = self.randomkey()
+        yield from self.async.assertEqual(c.hset(key, 'a', 'foo'), True)
+        yield from self.async.assertEqual(c.object('encoding', key),
+                                          b'listpack')
+
     def test_randomkey(self):
         key = self.randomkey()
         c = self.client
@@ -179,6 +215,28 @@ class RedisCommands(StoreMixin):
         yield from eq(c.renamenx(key, des+'a'), True)
         yield from eq(c.exists(key), False)
 
+    def test_scan(self):
+        key = self.randomkey()
+        c = self.client
+        keys = set(('%s_%d' % (key, n)).encode('utf-8') for n in range(50))
+        yield from self.async.assertEqual(c.mset(*chain(*zip(keys, keys))),
+                                          True)
+        yield from c.hset(key + 'h', 'a', 1)
+        result = yield from self._scan_all(c.scan_iter(match=key + '_*',
+                                                       count=5))
+        self.assertEqual(len(result), len(keys))
+        self.assertEqual(set(result), keys)
+        hashes = []
+        cursor = None
+        while cursor != 0:
+            cursor, result = yield from c.scan(cursor or 0, match=key + '*',
+                                               type='hash')
+            hashes.extend(result)
+        self.assertEqual(hashes, [(key + 'h').encode('utf-8')])
+        yield from self.async.assertRaises(ResponseError, c.scan, 'bla')
+        yield from self.async.assertRaises(ResponseError, c.scan, 0,
+                                           count=0)
+
     ###########################################################################
     #    BAD REQUESTS
     # def test_no_command(self):
@@ -289,6 +347,103 @@ class RedisCommands(StoreMixin):
         self.assertEqual(int(binascii.hexlify(res2), 16), 0x0102FFFF)
         self.assertEqual(int(binascii.hexlify(res3), 16), 0x000000FF)
 
+    def test_bitcount_bit(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.set(key, b'\xff\xf0\x00'), True)
+        yield from eq(c.bitcount(key, 5, 30, 'bit'), 7)
+        yield from eq(c.bitcount(key, 0, 0, 'byte'), 8)
+        yield from eq(c.bitcount(key, -16, -1, 'BIT'), 4)
+        yield from self.async.assertRaises(ResponseError, c.bitcount,
+                                           key, 0, 1, 'foo')
+        yield from self.async.assertRaises(ResponseError, c.bitcount,
+                                           key, 'a', 1)
+
+    def test_bitpos(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.bitpos(key, 1), -1)
+        yield from eq(c.bitpos(key, 0), 0)
+        yield from eq(c.set(key, b'\xff\xf0\x00'), True)
+        yield from eq(c.bitpos(key, 0), 12)
+        yield from eq(c.bitpos(key, 1, 2), -1)
+        yield from eq(c.bitpos(key, 0, 2), 16)
+        yield from eq(c.bitpos(key, 1, 7, 15, 'bit'), 7)
+        yield from eq(c.bitpos(key, 0, 0, 1), 12)
+        yield from eq(c.set(key, b'\xff\xff'), True)
+        yield from eq(c.bitpos(key, 0), 16)
+        yield from eq(c.bitpos(key, 0, 0, -1), -1)
+        yield from self.async.assertRaises(ResponseError, c.bitpos, key, 2)
+        yield from self._remove_and_push(key)
+        yield from self.async.assertRaises(ResponseError, c.bitpos, key, 1)
+
+    def test_bitfield(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.execute('bitfield', key, 'set', 'i8', 0, 100,
+                                'get', 'u4', 0), [0, 6])
+        yield from eq(c.get(key), b'\x64')
+        yield from eq(c.execute('bitfield', key, 'incrby', 'i8', 0, 100,
+                                'overflow', 'sat', 'incrby', 'i8', '#1', -200,
+                                'overflow', 'fail', 'incrby', 'u2', 6, 5),
+                      [-56, -128, None])
+        yield from eq(c.get(key), b'\xc8\x80')
+        yield from eq(c.execute('bitfield', key, 'get', 'i16', 0,
+                                'get', 'u8', 24), [-14208, 0])
+        yield from eq(c.execute('bitfield_ro', key, 'get', 'u8', 8), [128])
+        yield from self.async.assertRaises(
+            ResponseError, c.execute, 'bitfield_ro', key, 'set', 'u8', 0, 1)
+        yield from self.async.assertRaises(
+            ResponseError, c.execute, 'bitfield', key, 'get', 'u64', 0)
+        yield from self.async.assertRaises(
+            ResponseError, c.execute, 'bitfield', key, 'overflow', 'foo')
+        yield from eq(c.execute('bitfield', key), [])
+
+    def test_pfadd_pfcount(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.execute('pfcount', key), 0)
+        yield from eq(c.execute('pfadd', key), 1)
+        yield from eq(c.execute('pfadd', key), 0)
+        yield from eq(c.execute('pfcount', key), 0)
+        yield from eq(c.execute('pfadd', key, 'a', 'b', 'c'), 1)
+        yield from eq(c.execute('pfadd', key, 'a', 'b'), 0)
+        yield from eq(c.execute('pfcount', key), 3)
+        elements = ['e%d' % n for n in range(5000)]
+        yield from eq(c.execute('pfadd', key, *elements), 1)
+        count = yield from c.execute('pfcount', key)
+        self.assertTrue(abs(count - 5003) < 5003*0.05)
+        yield from eq(c.set(key + '2', 'foo'), True)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'pfadd', key + '2', 'a')
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'pfcount', key, key + '2')
+
+    def test_pfmerge(self):
+        key1 = self.randomkey()
+        key2 = key1 + '2'
+        dest = key1 + 'd'
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.execute('pfadd', key1, 'a', 'b', 'c'), 1)
+        yield from eq(c.execute('pfadd', key2, 'c', 'd'), 1)
+        yield from eq(c.execute('pfcount', key1, key2), 4)
+        yield from eq(c.execute('pfmerge', dest, key1, key2), True)
+        yield from eq(c.execute('pfcount', dest), 4)
+        yield from eq(c.execute('pfmerge', dest, dest + 'x'), True)
+        yield from eq(c.execute('pfcount', dest), 4)
+        elements = ['e%d' % n for n in range(3000)]
+        yield from eq(c.execute('pfadd', key2, *elements), 1)
+        yield from eq(c.execute('pfmerge', dest, key2), True)
+        count = yield from c.execute('pfcount', dest)
+        self.assertTrue(abs(count - 3004) < 3004*0.05)
+        yield from eq(c.execute('pfmerge', key1 + 'e'), True)
+        yield from eq(c.execute('pfcount', key1 + 'e'), 0)
+
     def test_decr(self):
         key = self.randomkey()
         c = self.client
@@ -594,6 +749,22 @@ class RedisCommands(StoreMixin):
         yield from self.async.assertRaises(ResponseError, c.hsetnx, key,
                                            'a', 'jk')
 
+    def test_hscan(self):
+        key = self.randomkey()
+        c = self.client
+        h = dict((('f%d' % n).encode('utf-8'), str(n).encode('utf-8'))
+                 for n in range(100))
+        yield from self.async.assertEqual(c.hscan(key), (0, {}))
+        yield from self.async.assertEqual(c.hmset(key, h), True)
+        result = yield from self._scan_all(c.hscan_iter(key, count=10))
+        self.assertEqual(len(result), len(h))
+        self.assertEqual(dict(result), h)
+        result = yield from self._scan_all(c.hscan_iter(key, match='f1*'))
+        self.assertEqual(dict(result), dict(((k, v) for k, v in h.items()
+                                             if k.startswith(b'f1'))))
+        yield from self._remove_and_push(key)
+        yield from self.async.assertRaises(ResponseError, c.hscan, key)
+
     ###########################################################################
     #    LISTS
     def test_blpop(self):
@@ -663,6 +834,8 @@ class RedisCommands(StoreMixin):
         yield from eq(c.lindex(key, '1'), b'2')
         yield from eq(c.lindex(key, '2'), b'3')
         yield from eq(c.lindex(key, '3'), None)
+        yield from self.async.assertRaises(ResponseError, c.lindex, key,
+                                           'foo')
         yield from eq(c.llen(key), 3)
         yield from self._remove_and_sadd(key)
         yield from self.async.assertRaises(ResponseError, c.lindex, key, '1')
@@ -707,6 +880,9 @@ class RedisCommands(StoreMixin):
         yield from eq(c.lrange(key, 0, -1), [b'1', b'2', b'3'])
         yield from eq(c.lset(key, 1, '4'), True)
         yield from eq(c.lrange(key, 0, 2), [b'1', b'4', b'3'])
+        yield from self.async.assertRaises(ResponseError, c.lset, key,
+                                           'foo', '5')
+        yield from eq(c.lrange(key, 0, 2), [b'1', b'4', b'3'])
 
     def test_ltrim(self):
         key = self.randomkey()
@@ -748,6 +924,27 @@ class RedisCommands(StoreMixin):
         yield from self._remove_and_sadd(key, 0)
         yield from self.async.assertRaises(ResponseError, c.lrem, key, 1)
 
+    def test_large_list(self):
+        key = self.randomkey()
+        eq = self.async.assertEqual
+        c = self.client
+        values = [str(n).encode('utf-8') for n in range(1000)]
+        yield from eq(c.rpush(key, *values), 1000)
+        yield from eq(c.lindex(key, 500), b'500')
+        yield from eq(c.lindex(key, -1), b'999')
+        yield from eq(c.lrange(key, 250, 260), values[250:261])
+        yield from eq(c.lset(key, -2, 'x'), True)
+        yield from eq(c.lindex(key, 998), b'x')
+        yield from eq(c.linsert(key, 'before', '300', 'y'), 1001)
+        yield from eq(c.lrange(key, 299, 301), [b'299', b'y', b'300'])
+        yield from eq(c.lrem(key, 0, 'y'), 1)
+        yield from eq(c.lpush(key, 'a'), 1001)
+        yield from eq(c.rpop(key), b'999')
+        yield from eq(c.lindex(key, 1), b'0')
+        yield from eq(c.ltrim(key, 100, 899), True)
+        yield from eq(c.llen(key), 800)
+        yield from eq(c.lrange(key, 0, 1), [b'99', b'100'])
+
     def test_rpop(self):
         key = self.randomkey()
         eq = self.async.assertEqual
@@ -831,6 +1028,42 @@ class RedisCommands(StoreMixin):
         yield from eq(c.sort(key2, get=('%s:*' % key, '#'), groups=True),
                       [(b'u1', b'1'), (b'u2', b'2'), (b'u3', b'3')])
 
+    def test_sort_by_hash_limited(self):
+        key = self.randomkey()
+        key2 = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        pipe = c.pipeline()
+        for n in range(1, 21):
+            pipe.hmset('%s:%d' % (key, n), {'score': (n * 7) % 20,
+                                            'name': 'u%d' % n})
+        pipe.sadd(key2, *range(1, 21))
+        yield from pipe.commit()
+        by = '%s:*->score' % key
+        yield from eq(c.sort(key2, by=by, start=0, num=3),
+                      [b'20', b'3', b'6'])
+        yield from eq(c.sort(key2, by=by, desc=True, start=2, num=2,
+                             get=('%s:*->name' % key, '#')),
+                      [b'u11', b'11', b'u8', b'8'])
+        yield from eq(c.sort(key2, by=by, start=18, num=5),
+                      [b'14', b'17'])
+
+    def test_sort_store(self):
+        key = self.randomkey()
+        key2 = self.randomkey()
+        des = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        pipe = c.pipeline()
+        pipe.mset('%s:1' % key, 'u1', '%s:3' % key, 'u3')
+        pipe.rpush(key2, '3', '2', '1')
+        yield from pipe.commit()
+        yield from eq(c.sort(key2, get='%s:*' % key, store=des), 3)
+        yield from eq(c.lrange(des, 0, -1), [b'u1', b'', b'u3'])
+        yield from eq(c.object('encoding', des), b'listpack')
+        yield from eq(c.sort(key2, desc=True, store=des), 3)
+        yield from eq(c.lrange(des, 0, -1), [b'3', b'2', b'1'])
+
     ###########################################################################
     #    SETS
     def test_sadd_scard(self):
@@ -971,6 +1204,20 @@ class RedisCommands(StoreMixin):
         yield from eq(c.sunionstore(des, key, key2), 4)
         yield from eq(c.smembers(des), set([b'1', b'2', b'3', b'4']))
 
+    def test_sscan(self):
+        key = self.randomkey()
+        c = self.client
+        members = set(str(n).encode('utf-8') for n in range(200))
+        yield from self.async.assertEqual(c.sadd(key, *members), 200)
+        result = yield from self._scan_all(c.sscan_iter(key, count=20))
+        self.assertEqual(len(result), len(members))
+        self.assertEqual(set(result), members)
+        cursor, result = yield from c.sscan(key, count=1000)
+        self.assertEqual(cursor, 0)
+        self.assertEqual(set(result), members)
+        yield from self._remove_and_push(key)
+        yield from self.async.assertRaises(ResponseError, c.sscan, key)
+
     ###########################################################################
     #    SORTED SETS
     def test_zadd_zcard(self):
@@ -1073,6 +1320,37 @@ class RedisCommands(StoreMixin):
         yield from eq(c.zrange(key, 1, 2, withscores=True),
                       Zset([(2, b'a2'), (3, b'a3')]))
 
+    def test_raw_responses(self):
+        key = self.randomkey()
+        key2 = self.randomkey()
+        eq = self.async.assertEqual
+        c = self.client
+        yield from eq(c.hmset(key, {'f1': 1, 'f2': 2}), True)
+        yield from eq(c.zadd(key2, a1=1, a2=2), 2)
+        result = yield from c.execute('hgetall', key, raw=True)
+        self.assertEqual(sorted(result), [b'1', b'2', b'f1', b'f2'])
+        result = yield from c.execute('zrange', key2, 0, -1, 'withscores',
+                                      withscores=True, raw=True)
+        self.assertEqual(result[::2], [b'a1', b'a2'])
+        self.assertEqual([float(s) for s in result[1::2]], [1, 2])
+        yield from eq(c.execute('exists', key, raw=True), 1)
+        yield from eq(c.execute('exists', key, raw=False), True)
+        yield from eq(c.execute('hgetall', key, raw=False),
+                      {b'f1': b'1', b'f2': b'2'})
+        pipe = c.pipeline()
+        pipe.hgetall(key)
+        pipe.execute('hgetall', key, raw=True)
+        pipe.zrange(key2, 0, -1, withscores=True)
+        pipe.hgetall(key2)
+        pipe.exists(key)
+        result = yield from pipe.commit(raise_on_error=False)
+        self.assertEqual(result[0], {b'f1': b'1', b'f2': b'2'})
+        self.assertEqual(len(result[1]), 4)
+        self.assertEqual(result[2], Zset([(1, b'a1'), (2, b'a2')]))
+        # no callback on errors
+        self.assertIsInstance(result[3], ResponseError)
+        self.assertEqual(result[4], True)
+
     def test_zrangebyscore(self):
         key = self.randomkey()
         eq = self.async.assertEqual
@@ -1127,6 +1405,167 @@ class RedisCommands(StoreMixin):
         yield from eq(c.zremrangebyscore(key, 2, 4), 0)
         yield from eq(c.zrange(key, 0, -1), [b'a1', b'a5'])
 
+    def test_zscan(self):
+        key = self.randomkey()
+        c = self.client
+        scores = dict((('m%d' % n).encode('utf-8'), float(n))
+                      for n in range(100))
+        args = chain(*((score, m) for m, score in scores.items()))
+        yield from self.async.assertEqual(c.zadd(key, *args), 100)
+        result = yield from self._scan_all(c.zscan_iter(key, count=10))
+        self.assertEqual(len(result), len(scores))
+        self.assertEqual(dict(result), scores)
+        yield from self._remove_and_push(key)
+        yield from self.async.assertRaises(ResponseError, c.zscan, key)
+
+    ###########################################################################
+    #    STREAMS
+    def test_xadd_xrange(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.execute('xadd', key, '1-1', 'a', 1), b'1-1')
+        yield from eq(c.execute('xadd', key, '1-*', 'b', 2), b'1-2')
+        yield from eq(c.execute('xadd', key, '2', 'c', 3, 'd', 4), b'2-0')
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xadd', key, '1-5', 'e', 5)
+        id = yield from c.execute('xadd', key, '*', 'e', 5)
+        ms, seq = id.split(b'-')
+        self.assertTrue(int(ms) > 2)
+        yield from eq(c.execute('xlen', key), 4)
+        yield from eq(c.execute('xrange', key, '-', '+', 'count', 2),
+                      [[b'1-1', [b'a', b'1']], [b'1-2', [b'b', b'2']]])
+        yield from eq(c.execute('xrange', key, '(1-1', '2'),
+                      [[b'1-2', [b'b', b'2']],
+                       [b'2-0', [b'c', b'3', b'd', b'4']]])
+        yield from eq(c.execute('xrevrange', key, '(%s' % id.decode(), '-',
+                                'count', 1),
+                      [[b'2-0', [b'c', b'3', b'd', b'4']]])
+        yield from eq(c.execute('xrange', key + 'x', '-', '+'), [])
+        yield from eq(c.execute('xadd', key + 'x', 'nomkstream', '*',
+                                'a', 1), None)
+        yield from eq(c.execute('exists', key + 'x'), 0)
+        yield from eq(c.execute('type', key), 'stream')
+        yield from eq(c.execute('object', 'encoding', key), b'stream')
+        yield from self._remove_and_push(key)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xadd', key, '*', 'a', 1)
+
+    def test_xdel_xtrim(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        for n in range(1, 11):
+            yield from c.execute('xadd', key, n, 'n', n)
+        yield from eq(c.execute('xdel', key, '3', '4', '20'), 2)
+        yield from eq(c.execute('xlen', key), 8)
+        yield from eq(c.execute('xtrim', key, 'maxlen', 6), 2)
+        yield from eq(c.execute('xrange', key, '-', '+', 'count', 1),
+                      [[b'5-0', [b'n', b'5']]])
+        yield from eq(c.execute('xtrim', key, 'minid', 8), 3)
+        yield from eq(c.execute('xadd', key, 'maxlen', '=', 2, 11, 'n', 11),
+                      b'11-0')
+        yield from eq(c.execute('xrange', key, '-', '+'),
+                      [[b'10-0', [b'n', b'10']], [b'11-0', [b'n', b'11']]])
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xtrim', key, 'maxlen', 2,
+                                           'limit', 10)
+        yield from eq(c.execute('xtrim', key, 'maxlen', '~', 0), 2)
+        yield from eq(c.execute('xlen', key), 0)
+
+    def test_xread(self):
+        key1 = self.randomkey()
+        key2 = key1 + 'x'
+        bk1 = key1.encode('utf-8')
+        bk2 = key2.encode('utf-8')
+        c = self.client
+        eq = self.async.assertEqual
+        yield from c.execute('xadd', key1, '1', 'a', 1)
+        yield from c.execute('xadd', key1, '2', 'b', 2)
+        yield from c.execute('xadd', key2, '3', 'c', 3)
+        yield from eq(c.execute('xread', 'count', 1, 'streams', key1, key2,
+                                0, 0),
+                      [[bk1, [[b'1-0', [b'a', b'1']]]],
+                       [bk2, [[b'3-0', [b'c', b'3']]]]])
+        yield from eq(c.execute('xread', 'streams', key1, key2, '1', '$'),
+                      [[bk1, [[b'2-0', [b'b', b'2']]]]])
+        yield from eq(c.execute('xread', 'streams', key1, '2'), None)
+        yield from eq(c.execute('xread', 'block', 100, 'streams', key1, '$'),
+                      None)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xread', 'streams', key1)
+
+    def test_xgroup(self):
+        key = self.randomkey()
+        c = self.client
+        eq = self.async.assertEqual
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xgroup', 'create', key, 'g', '$')
+        yield from c.execute('xadd', key, '1', 'a', 1)
+        yield from c.execute('xadd', key, '2', 'b', 2)
+        yield from eq(c.execute('xgroup', 'create', key, 'g', '$'), b'OK')
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xgroup', 'create', key, 'g', '0')
+        yield from eq(c.execute('xreadgroup', 'group', 'g', 'alice',
+                                'streams', key, '>'), None)
+        yield from eq(c.execute('xgroup', 'setid', key, 'g', 0), b'OK')
+        yield from eq(c.execute('xgroup', 'createconsumer', key, 'g', 'bob'),
+                      1)
+        yield from eq(c.execute('xinfo', 'groups', key),
+                      [[b'name', b'g', b'consumers', 2, b'pending', 0,
+                        b'last-delivered-id', b'0-0', b'entries-read',
+                        None]])
+        yield from eq(c.execute('xgroup', 'delconsumer', key, 'g', 'bob'), 0)
+        yield from eq(c.execute('xgroup', 'destroy', key, 'g'), 1)
+        yield from eq(c.execute('xgroup', 'destroy', key, 'g'), 0)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'xreadgroup', 'group', 'g', 'a',
+                                           'streams', key, '>')
+
+    def test_xreadgroup(self):
+        key = self.randomkey()
+        bk = key.encode('utf-8')
+        c = self.client
+        eq = self.async.assertEqual
+        for n in range(1, 4):
+            yield from c.execute('xadd', key, n, 'n', n)
+        yield from eq(c.execute('xgroup', 'create', key, 'g', 0), b'OK')
+        yield from eq(c.execute('xreadgroup', 'group', 'g', 'alice',
+                                'count', 2, 'streams', key, '>'),
+                      [[bk, [[b'1-0', [b'n', b'1']],
+                             [b'2-0', [b'n', b'2']]]]])
+        yield from eq(c.execute('xreadgroup', 'group', 'g', 'bob',
+                                'streams', key, '>'),
+                      [[bk, [[b'3-0', [b'n', b'3']]]]])
+        yield from eq(c.execute('xreadgroup', 'group', 'g', 'alice',
+                                'streams', key, '0'),
+                      [[bk, [[b'1-0', [b'n', b'1']],
+                             [b'2-0', [b'n', b'2']]]]])
+        yield from eq(c.execute('xpending', key, 'g'),
+                      [3, b'1-0', b'3-0', [[b'alice', b'2'],
+                                           [b'bob', b'1']]])
+        yield from eq(c.execute('xack', key, 'g', 1, 5), 1)
+        pending = yield from c.execute('xpending', key, 'g', '-', '+', 10,
+                                       'alice')
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0][:2], [b'2-0', b'alice'])
+        self.assertEqual(pending[0][3], 1)
+        yield from eq(c.execute('xclaim', key, 'g', 'bob', 0, 2, 'justid'),
+                      [b'2-0'])
+        yield from eq(c.execute('xclaim', key, 'g', 'bob', 100000, 3), [])
+        yield from eq(c.execute('xdel', key, 2), 1)
+        yield from eq(c.execute('xreadgroup', 'group', 'g', 'bob',
+                                'streams', key, '0'),
+                      [[bk, [[b'2-0', None], [b'3-0', [b'n', b'3']]]]])
+        yield from eq(c.execute('xclaim', key, 'g', 'alice', 0, 2, 3),
+                      [[b'3-0', [b'n', b'3']]])
+        yield from eq(c.execute('xpending', key, 'g', 'idle', 0, '-', '+',
+                                10, 'bob'), [])
+        info = yield from c.execute('xinfo', 'stream', key)
+        self.assertEqual(info[:2], [b'length', 2])
+        self.assertEqual(info[-4:], [b'first-entry', [b'1-0', [b'n', b'1']],
+                                     b'last-entry', [b'3-0', [b'n', b'3']]])
+
     ###########################################################################
     #    CONNECTION
     def test_ping(self):
@@ -1148,6 +1587,7 @@ class RedisCommands(StoreMixin):
         info = yield from self.client.info()
         self.assertTrue(info)
         self.assertIsInstance(info, dict)
+        self.assertTrue('used_memory' in info)
 
     def test_time(self):
         t = yield from self.client.time()
@@ -1250,6 +1690,270 @@ class TestPulsarStore(RedisCommands, unittest.TestCase):
         if cls.app_cfg is not None:
             return pulsar.send('arbiter', 'kill_actor', cls.app_cfg.name)
 
+    def test_expire_cycle(self):
+        keys = [self.randomkey() for _ in range(10)]
+        c = self.client
+        for key in keys:
+            yield from c.set(key, 'foo', px=100)
+        yield from asyncio.sleep(0.5)
+        info = yield from c.info()
+        self.assertTrue(info['expired_keys'] >= len(keys))
+        self.assertTrue('expire_cycle_cpu_milliseconds' in info)
+        for key in keys:
+            yield from self.async.assertEqual(c.exists(key), False)
+
+    def test_pipeline_large_bulk(self):
+        key = self.randomkey()
+        value = b'x'*100000
+        pipe = self.client.pipeline()
+        pipe.set(key, value)
+        pipe.get(key)
+        pipe.append(key, 'y')
+        pipe.get(key)
+        pipe.strlen(key)
+        result = yield from pipe.commit()
+        self.assertEqual(result, [True, value, 100001, value + b'y',
+                                  100001])
+
+    def test_xread_block(self):
+        key = self.randomkey()
+        bk = key.encode('utf-8')
+        c = self.client
+        eq = self.async.assertEqual
+        yield from eq(c.execute('xgroup', 'create', key, 'g', '$',
+                                'mkstream'), b'OK')
+        # the blocking reads use their own connections
+        store = self.create_store('%s/9' % self.pulsards_uri)
+        read = asyncio.async(store.execute('xread', 'block', 0, 'streams',
+                                           key, '0'))
+        group = asyncio.async(store.execute('xreadgroup', 'group', 'g',
+                                            'alice', 'block', 0, 'streams',
+                                            key, '>'))
+        yield from eq(c.execute('xadd', key, '1', 'a', 1), b'1-0')
+        entries = [[bk, [[b'1-0', [b'a', b'1']]]]]
+        yield from eq(read, entries)
+        yield from eq(group, entries)
+        yield from eq(c.execute('xpending', key, 'g'),
+                      [1, b'1-0', b'1-0', [[b'alice', b'1']]])
+
+    def test_xread_multi(self):
+        key = self.randomkey()
+        c = self.client
+        yield from self.async.assertEqual(
+            c.execute('xgroup', 'create', key, 'g', '$', 'mkstream'), b'OK')
+        # blocking reads executed by EXEC reply nil
+        pipe = c.pipeline()
+        pipe.execute('xread', 'block', 0, 'streams', key, '$')
+        pipe.execute('xreadgroup', 'group', 'g', 'alice', 'block', 0,
+                     'streams', key, '>')
+        pipe.set(self.randomkey(), 1)
+        result = yield from pipe.commit()
+        self.assertEqual(result, [None, None, True])
+        yield from self.async.assertEqual(c.ping(), True)
+
+    def test_client_id(self):
+        id1 = yield from self.client.execute('client', 'id')
+        self.assertIsInstance(id1, int)
+        store = self.create_store('%s/9' % self.pulsards_uri)
+        id2 = yield from store.execute('client', 'id')
+        self.assertTrue(id2 > id1)
+
+    def test_client_tracking_errors(self):
+        eq = self.async.assertRaises
+        yield from eq(ResponseError, self.client.execute,
+                      'client', 'tracking', 'foo')
+        yield from eq(ResponseError, self.client.execute,
+                      'client', 'tracking', 'on', 'redirect', 'foo')
+        yield from eq(ResponseError, self.client.execute,
+                      'client', 'tracking', 'on', 'redirect', 1000000)
+        yield from eq(ResponseError, self.client.execute,
+                      'client', 'tracking', 'on', 'prefix', 'foo')
+
+    def test_client_cache(self):
+        key = self.randomkey()
+        store = self.create_store('%s/9' % self.pulsards_uri, cache_size=10)
+        cache = store.cache
+        client = store.client()
+        yield from self.client.set(key, 'foo')
+        yield from self.async.assertEqual(client.get(key), b'foo')
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(len(cache), 1)
+        yield from self.async.assertEqual(client.get(key), b'foo')
+        self.assertEqual(cache.hits, 1)
+        info = yield from self.client.info()
+        self.assertTrue(info['tracking_clients'] >= 1)
+        # modified by another client
+        yield from self.client.set(key, 'bar')
+        yield from pulsar.async_while(2, len, cache)
+        self.assertEqual(len(cache), 0)
+        yield from self.async.assertEqual(client.get(key), b'bar')
+        self.assertEqual(cache.misses, 2)
+        # commands not cached
+        yield from self.async.assertEqual(client.set(key, 'foo'), True)
+        yield from self.async.assertEqual(client.incr(key + 'n'), 1)
+        yield from pulsar.async_while(2, len, cache)
+        yield from self.async.assertEqual(client.get(key), b'foo')
+        self.assertEqual(cache.misses, 3)
+        # a lost invalidation connection clears the cache
+        cache._connection.close()
+        yield from pulsar.async_while(2, lambda: cache.client_id)
+        self.assertEqual(len(cache), 0)
+        yield from self.async.assertEqual(client.get(key), b'foo')
+        yield from self.async.assertEqual(client.get(key), b'foo')
+        self.assertEqual(cache.misses, 4)
+        self.assertEqual(cache.hits, 2)
+        yield from self.client.set(key, 'bar')
+        yield from pulsar.async_while(2, len, cache)
+        self.assertEqual(len(cache), 0)
+        store.close()
+
+    def test_client_cache_broadcast(self):
+        prefix = self.randomkey()
+        key1, key2 = prefix + 'a', prefix + 'b'
+        store = self.create_store('%s/9' % self.pulsards_uri, cache_size=2,
+                                  cache_broadcast=True,
+                                  cache_prefixes=[prefix])
+        cache = store.cache
+        client = store.client()
+        yield from self.client.mset(key1, 1, key2, 2)
+        yield from self.async.assertEqual(client.get(key1), b'1')
+        yield from self.async.assertEqual(client.get(key2), b'2')
+        yield from self.async.assertEqual(client.strlen(key2), 1)
+        self.assertEqual(len(cache), 2)
+        # least recently used
+        self.assertFalse(('get', key1.encode('utf-8')) in cache._data)
+        # keys without prefix are not cached
+        yield from self.async.assertEqual(client.get(self.randomkey()),
+                                          None)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.misses, 3)
+        yield from self.client.set(key2, 3)
+        yield from pulsar.async_while(2, len, cache)
+        self.assertEqual(len(cache), 0)
+        yield from self.async.assertEqual(client.get(key2), b'3')
+        store.close()
+
+    def test_auto_pipeline(self):
+        keys = [self.randomkey() for _ in range(100)]
+        store = self.create_store('%s/9' % self.pulsards_uri,
+                                  auto_pipeline=2)
+        pipeline = store.auto_pipeline
+        client = store.client()
+        results = yield from asyncio.gather(
+            *[client.set(key, key) for key in keys], loop=store._loop)
+        self.assertEqual(results, [True]*len(keys))
+        results = yield from asyncio.gather(
+            *[client.get(key) for key in keys], loop=store._loop)
+        self.assertEqual(results, [key.encode('utf-8') for key in keys])
+        self.assertEqual(pipeline.commands, 2*len(keys))
+        self.assertTrue(pipeline.writes < 10)
+        self.assertEqual(len(pipeline._connections), 2)
+        # errors are raised to their command only
+        results = yield from asyncio.gather(
+            client.lpush(keys[0], 'x'), client.get(keys[1]),
+            loop=store._loop, return_exceptions=True)
+        self.assertIsInstance(results[0], ResponseError)
+        self.assertEqual(results[1], keys[1].encode('utf-8'))
+        # blocking commands use a connection of the pool
+        yield from self.async.assertEqual(client.blpop(keys[2] + 'l', 1),
+                                          None)
+        self.assertEqual(pipeline.commands, 2*len(keys) + 2)
+        # lost connections fail their commands and are replaced
+        connection = pipeline._connections[0]
+        connection.close()
+        yield from pulsar.async_while(
+            2, lambda: connection in pipeline._connections)
+        yield from self.async.assertEqual(client.get(keys[3]),
+                                          keys[3].encode('utf-8'))
+        self.assertEqual(len(pipeline._connections), 2)
+        store.close()
+
+    def test_info_commandstats(self):
+        c = self.client
+        yield from c.get(self.randomkey())
+        info = yield from c.info()
+        stats = info['cmdstat_get']
+        self.assertTrue(stats['calls'] >= 1)
+        self.assertEqual(set(stats), set(('calls', 'usec', 'usec_per_call',
+                                          'failed_calls')))
+        percentiles = info['latency_percentiles_usec_get']
+        self.assertEqual(set(percentiles), set(('p50', 'p99', 'p99.9')))
+        self.assertTrue(percentiles['p50'] <= percentiles['p99.9'])
+        self.assertTrue(info['total_commands_processed'] > 1)
+        self.assertTrue(info['total_net_input_bytes'] > 0)
+        self.assertTrue(info['total_net_output_bytes'] > 0)
+        self.assertTrue('instantaneous_ops_per_sec' in info)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'incr', 'foo', 'bla')
+        info = yield from c.info()
+        self.assertTrue(info['cmdstat_incr']['failed_calls'] >= 1)
+
+    def test_slowlog(self):
+        c = self.client
+        key = self.randomkey()
+        yield from c.execute('config', 'set', 'slowlog-log-slower-than', 0)
+        try:
+            yield from c.set(key, 'x'*200)
+            yield from c.mset(key + 'm', 0, *range(98))
+            entries = yield from c.execute('slowlog', 'get', -1)
+            # other tests may run commands in the meantime
+            entries = dict(((e[3][0], e) for e in entries
+                            if e[3][1:2] and
+                            e[3][1].startswith(key.encode('utf-8'))))
+            entry = entries[b'set']
+            self.assertEqual(len(entry), 6)
+            self.assertTrue(int(entry[2]) >= 0)
+            self.assertEqual(entry[3][1], key.encode('utf-8'))
+            self.assertEqual(entry[3][2], b'x'*128 + b'... (72 more bytes)')
+            args = entries[b'mset'][3]
+            self.assertEqual(len(args), 32)
+            self.assertEqual(args[-1], b'... (70 more arguments)')
+            self.assertTrue(int(entries[b'mset'][0]) > int(entry[0]))
+            yield from c.execute('config', 'set', 'slowlog-max-len', 2)
+            yield from c.ping()
+            length = yield from c.execute('slowlog', 'len')
+            self.assertTrue(0 < length <= 2)
+            yield from c.execute('slowlog', 'reset')
+        finally:
+            yield from c.execute('config', 'set', 'slowlog-log-slower-than',
+                                 10000)
+            yield from c.execute('config', 'set', 'slowlog-max-len', 128)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'slowlog', 'foo')
+
+    def test_latency(self):
+        c = self.client
+        yield from c.get(self.randomkey())
+        histogram = yield from c.execute('latency', 'histogram', 'get')
+        self.assertEqual(histogram[0], b'get')
+        self.assertEqual(histogram[1][:3:2], [b'calls', b'histogram_usec'])
+        self.assertEqual(int(histogram[1][1]), int(histogram[1][3][-1]))
+        yield from self.async.assertEqual(
+            c.execute('latency', 'history', 'foo'), [])
+        latest = yield from c.execute('latency', 'latest')
+        self.assertIsInstance(latest, list)
+        yield from self.async.assertEqual(
+            c.execute('latency', 'reset', 'foo'), 0)
+        yield from self.async.assertRaises(ResponseError, c.execute,
+                                           'latency', 'foo')
+
+    def test_unlink(self):
+        c = self.client
+        key1, key2 = self.randomkey(), self.randomkey()
+        yield from c.sadd(key1, *range(1000))
+        yield from c.set(key2, 'foo')
+        info = yield from c.info()
+        freed = info['lazyfreed_objects']
+        yield from self.async.assertEqual(
+            c.execute('unlink', key1, key2, self.randomkey()), 2)
+        yield from self.async.assertEqual(c.exists(key1), False)
+        yield from self.async.assertEqual(c.exists(key2), False)
+        info = yield from c.info()
+        self.assertTrue(info['lazyfreed_objects'] > freed or
+                        info['lazyfree_pending_objects'])
+        self.assertTrue('loop_lag_milliseconds' in info)
+        self.assertTrue('loop_lag_max_milliseconds' in info)
+
     def test_store_methods(self):
         store = self.create_store('%s/8' % self.pulsards_uri)
         self.assertEqual(store.database, 8)
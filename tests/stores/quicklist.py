@@ -0,0 +1,120 @@
+import pickle
+import unittest
+
+from pulsar.apps.ds.quicklist import QuickList, CHUNK_SIZE
+
+
+def element(n):
+    return str(n).encode('ascii')
+
+
+def quicklist(size):
+    return QuickList((element(n) for n in range(size)))
+
+
+def elements(size):
+    return [element(n) for n in range(size)]
+
+
+class TestQuickList(unittest.TestCase):
+
+    def test_chunks(self):
+        value = quicklist(3*CHUNK_SIZE + 5)
+        self.assertEqual(len(value), 3*CHUNK_SIZE + 5)
+        self.assertEqual(value.chunks(), 4)
+        self.assertEqual(list(value), elements(3*CHUNK_SIZE + 5))
+        self.assertEqual(list(reversed(value)),
+                         list(reversed(elements(3*CHUNK_SIZE + 5))))
+        self.assertEqual(QuickList(), QuickList([]))
+        self.assertNotEqual(value, quicklist(10))
+
+    def test_index(self):
+        size = 3*CHUNK_SIZE + 5
+        value = quicklist(size)
+        for index in (0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, 2*CHUNK_SIZE + 7,
+                      size - 1, -1, -size):
+            self.assertEqual(value[index], elements(size)[index])
+        self.assertRaises(IndexError, value.__getitem__, size)
+        self.assertRaises(IndexError, value.__getitem__, -size - 1)
+        value[CHUNK_SIZE + 1] = b'x'
+        value[-1] = b'y'
+        self.assertEqual(value[CHUNK_SIZE + 1], b'x')
+        self.assertEqual(value[size - 1], b'y')
+
+    def test_slice(self):
+        size = 3*CHUNK_SIZE + 5
+        value = quicklist(size)
+        full = elements(size)
+        for start, stop in ((0, size), (5, 10), (CHUNK_SIZE - 2, 2*CHUNK_SIZE),
+                            (10, 3*CHUNK_SIZE), (size - 3, size + 10),
+                            (20, 10), (-5, size)):
+            self.assertEqual(value[start:stop], full[start:stop])
+        self.assertEqual(value[::2], full[::2])
+        self.assertEqual(value.range(-4, 2), full[:2])
+
+    def test_ends(self):
+        value = QuickList()
+        full = []
+        for n in range(3*CHUNK_SIZE):
+            value.appendleft(b'l' + element(n))
+            full.insert(0, b'l' + element(n))
+            value.append(b'r' + element(n))
+            full.append(b'r' + element(n))
+            if not n % 50:
+                # positional access keeps the counts of the chunks which
+                # are then updated by pushes and pops
+                self.assertEqual(value[len(full)//3], full[len(full)//3])
+        self.assertEqual(list(value), full)
+        for n in range(2*CHUNK_SIZE + 10):
+            self.assertEqual(value.popleft(), full.pop(0))
+            self.assertEqual(value.pop(), full.pop())
+            self.assertEqual(value[-7], full[-7])
+            self.assertEqual(value[3], full[3])
+        self.assertEqual(list(value), full)
+        value.extendleft((b'a', b'b'))
+        self.assertEqual(value[:2], [b'b', b'a'])
+        value.clear()
+        self.assertEqual(len(value), 0)
+        self.assertRaises(IndexError, value.pop)
+        self.assertRaises(IndexError, value.popleft)
+
+    def test_insert(self):
+        value = quicklist(CHUNK_SIZE)
+        self.assertTrue(value.insert_before(b'10', b'a'))
+        self.assertTrue(value.insert_after(b'10', b'b'))
+        self.assertFalse(value.insert_after(b'foo', b'c'))
+        self.assertEqual(value.chunks(), 2)
+        self.assertEqual(len(value), CHUNK_SIZE + 2)
+        self.assertEqual(value[9:13], [b'9', b'a', b'10', b'b'])
+        self.assertEqual(value[-1], element(CHUNK_SIZE - 1))
+
+    def test_remove(self):
+        value = QuickList([b'a', b'b']*CHUNK_SIZE)
+        self.assertEqual(value.remove(b'a', 2), 2)
+        self.assertEqual(value[:3], [b'b', b'b', b'a'])
+        self.assertEqual(value.remove(b'b', -3), 3)
+        self.assertEqual(value[-6:], [b'b', b'a', b'b', b'a', b'a', b'a'])
+        self.assertEqual(value.remove(b'c'), 0)
+        self.assertEqual(value.remove(b'b', 0), CHUNK_SIZE - 3)
+        self.assertEqual(list(value), [b'a']*(CHUNK_SIZE - 2))
+        # chunks emptied by the removals are merged
+        self.assertEqual(value.chunks(), 1)
+
+    def test_trim(self):
+        size = 3*CHUNK_SIZE + 5
+        value = quicklist(size)
+        value.trim(CHUNK_SIZE - 3, 2*CHUNK_SIZE + 4)
+        self.assertEqual(list(value),
+                         elements(size)[CHUNK_SIZE - 3:2*CHUNK_SIZE + 4])
+        self.assertEqual(value.chunks(), 3)
+        self.assertEqual(value[3], element(CHUNK_SIZE))
+        value.trim(5, 5)
+        self.assertEqual(len(value), 0)
+
+    def test_serialise(self):
+        value = quicklist(2*CHUNK_SIZE + 1)
+        value.appendleft(b'x')
+        copy = pickle.loads(pickle.dumps(value))
+        self.assertEqual(copy, value)
+        self.assertEqual(copy[CHUNK_SIZE], value[CHUNK_SIZE])
+        self.assertEqual(copy.chunks(), value.chunks())
@@ -0,0 +1,125 @@
+import os
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+import pulsar
+from pulsar.utils.pep import to_string
+from pulsar.apps.ds import PulsarDS, ResponseError
+from pulsar.apps.data import create_store
+from pulsar.apps.test import sequential
+
+
+@sequential
+class TestReplication(unittest.TestCase):
+    app_cfgs = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.app_cfgs = []
+        master = yield from cls.start_server('master')
+        replica = yield from cls.start_server('replica')
+        cls.master_address = master.addresses[0]
+        cls.master = cls.client(master)
+        cls.replica = cls.client(replica)
+        # written before the replica connects, sent with the snapshot
+        yield from cls.master.set('before', 'foo', ex=100)
+        yield from cls.replica.execute('slaveof', *cls.master_address)
+        yield from cls.wait_link()
+
+    @classmethod
+    def tearDownClass(cls):
+        for cfg in cls.app_cfgs:
+            yield from pulsar.send('arbiter', 'kill_actor', cfg.name)
+        shutil.rmtree(cls.dir)
+
+    @classmethod
+    def start_server(cls, name):
+        name = '%s_%s' % (cls.__name__.lower(), name)
+        server = PulsarDS(name=name,
+                          bind='127.0.0.1:0',
+                          concurrency=cls.cfg.concurrency,
+                          key_value_filename=os.path.join(cls.dir,
+                                                          '%s.rdb' % name))
+        cfg = yield from pulsar.send('arbiter', 'run', server)
+        cls.app_cfgs.append(cfg)
+        return cfg
+
+    @classmethod
+    def client(cls, cfg):
+        store = create_store('pulsar://%s:%s/5' % cfg.addresses[0],
+                             pool_size=1)
+        return store.client()
+
+    @classmethod
+    def wait_link(cls):
+        for _ in range(100):
+            info = yield from cls.replica.info()
+            if info['master_link_status'] == 'up':
+                return info
+            yield from asyncio.sleep(0.05)
+        raise AssertionError('replica not connected')
+
+    def wait_offset(self):
+        for _ in range(100):
+            info = yield from self.master.info()
+            offset = info['master_repl_offset']
+            info = yield from self.replica.info()
+            if info['slave_repl_offset'] == offset:
+                return offset
+            yield from asyncio.sleep(0.05)
+        raise AssertionError('replica did not reach the master offset')
+
+    def test_full_sync(self):
+        yield from self.async.assertEqual(self.replica.get('before'), b'foo')
+        ttl = yield from self.replica.ttl('before')
+        self.assertTrue(0 < ttl <= 100)
+        info = yield from self.master.info()
+        self.assertEqual(info['role'], 'master')
+        self.assertEqual(info['connected_slaves'], 1)
+        self.assertTrue(info['sync_full'] >= 1)
+        info = yield from self.replica.info()
+        self.assertEqual(info['role'], 'slave')
+        self.assertEqual(info['master_port'], self.master_address[1])
+
+    def test_stream(self):
+        master = self.master
+        yield from master.set('a', 'bla')
+        yield from master.set('b', 'expiring', px=100000)
+        yield from master.sadd('c', 'x', 'y', 'z')
+        popped = yield from master.spop('c')
+        yield from master.rpush('d', 1, 2, 3)
+        yield from self.wait_offset()
+        replica = self.replica
+        yield from self.async.assertEqual(replica.get('a'), b'bla')
+        ttl = yield from replica.pttl('b')
+        self.assertTrue(99000 < ttl <= 100000)
+        members = yield from replica.smembers('c')
+        self.assertEqual(len(members), 2)
+        self.assertFalse(popped in members)
+        yield from self.async.assertEqual(replica.lrange('d', 0, -1),
+                                          [b'1', b'2', b'3'])
+
+    def test_read_only(self):
+        yield from self.async.assertRaises(ResponseError,
+                                           self.replica.set, 'a', 'foo')
+
+    def test_partial_resync(self):
+        master = self.master
+        info = yield from master.info()
+        partial = info['sync_partial_ok']
+        clients = yield from master.execute('client', 'list')
+        for line in to_string(clients).splitlines():
+            fields = dict((f.split('=', 1) for f in line.split()))
+            if fields['flags'] == 'S':
+                yield from master.execute('client', 'kill', fields['addr'])
+        yield from master.set('during', 'disconnected')
+        yield from asyncio.sleep(0.1)
+        yield from self.wait_link()
+        yield from self.wait_offset()
+        yield from self.async.assertEqual(self.replica.get('during'),
+                                          b'disconnected')
+        info = yield from master.info()
+        self.assertEqual(info['sync_partial_ok'], partial + 1)
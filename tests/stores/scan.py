@@ -0,0 +1,136 @@
+import pickle
+import unittest
+from binascii import crc32
+
+from pulsar.utils.structures import Zset
+from pulsar.apps.ds.scan import (ScanIndex, ScanDict, ScanSet, ScanZset,
+                                 BUCKET_SIZE)
+
+
+def member(n):
+    return ('m%d' % n).encode('utf-8')
+
+
+class TestScanIndex(unittest.TestCase):
+
+    def scan_all(self, value, count=10, callback=None):
+        members = []
+        cursor, calls = None, 0
+        while cursor != 0:
+            cursor, result = value.scan(cursor or 0, count)
+            members.extend(result)
+            calls += 1
+            if callback:
+                callback()
+        return members, calls
+
+    def check_index(self, index, members):
+        starts = index._starts
+        self.assertEqual(starts[0], 0)
+        self.assertEqual(starts, sorted(set(starts)))
+        indexed = set()
+        for start, end, bucket in zip(starts, starts[1:] + [1 << 32],
+                                      index._buckets):
+            self.assertTrue(len(bucket) <= BUCKET_SIZE)
+            for m in bucket:
+                self.assertTrue(start <= crc32(m) < end)
+            indexed.update(bucket)
+        self.assertEqual(indexed, set(members))
+
+    def test_index(self):
+        members = [member(n) for n in range(5000)]
+        index = ScanIndex(members)
+        self.check_index(index, members)
+        for m in members[::2]:
+            index.discard(m)
+        self.check_index(index, members[1::2])
+        index.clear()
+        self.assertEqual(index.scan(0, 10), (0, []))
+
+    def test_scan(self):
+        members = [member(n) for n in range(5000)]
+        index = ScanIndex(members)
+        result, calls = self.scan_all(index, 10)
+        self.assertEqual(sorted(result), sorted(members))
+        # a call returns about count members
+        self.assertTrue(calls > 5000 / (BUCKET_SIZE + 10))
+        cursor, result = index.scan(0, 10)
+        self.assertTrue(10 <= len(result) <= BUCKET_SIZE + 10)
+        # a cursor in the middle of a bucket
+        start = cursor + 1
+        cursor, result = index.scan(start, 1)
+        self.assertTrue(all(crc32(m) >= start for m in result))
+        cursor, result = index.scan(0, 10000)
+        self.assertEqual(cursor, 0)
+        self.assertEqual(len(result), 5000)
+
+    def test_scan_changes(self):
+        value = ScanSet(member(n) for n in range(2000))
+        added = iter(range(2000, 3000))
+
+        def change():
+            for _ in range(3):
+                n = next(added)
+                value.add(member(n))
+                value.discard(member(n - 2000))
+
+        result, _ = self.scan_all(value, 10, change)
+        # members present during the whole iteration are returned
+        kept = set(member(n) for n in range(1000, 2000))
+        self.assertTrue(kept <= set(result))
+
+    def test_dict(self):
+        value = ScanDict(((member(n), n) for n in range(300)))
+        value[b'a'] = 1
+        value.update(((b'b', 2), (b'a', 3)))
+        value.setdefault(b'c', 4)
+        del value[member(0)]
+        value.pop(member(1))
+        value.pop(b'x', None)
+        value.popitem()
+        self.check_index(value._index, value)
+        result, _ = self.scan_all(value)
+        self.assertEqual(sorted(result), sorted(value))
+        copy = pickle.loads(pickle.dumps(value))
+        self.assertEqual(type(copy), ScanDict)
+        self.assertEqual(copy, value)
+        self.check_index(copy._index, value)
+        value.clear()
+        self.assertEqual(value.scan(0, 10), (0, []))
+
+    def test_set(self):
+        value = ScanSet(member(n) for n in range(300))
+        value.add(b'a')
+        value.discard(member(0))
+        value.remove(member(1))
+        value.pop()
+        value.update((b'b', b'c'), (b'd',))
+        value.difference_update((member(2), member(3)))
+        value.intersection_update(set(value) - set((member(4),)))
+        value.symmetric_difference_update((b'd', b'e'))
+        value |= set((b'f',))
+        value -= set((b'f',))
+        self.assertFalse(member(4) in value)
+        self.assertFalse(b'd' in value)
+        self.assertTrue(b'e' in value)
+        self.check_index(value._index, value)
+        copy = pickle.loads(pickle.dumps(value))
+        self.assertEqual(type(copy), ScanSet)
+        self.assertEqual(copy, value)
+        self.check_index(copy._index, value)
+
+    def test_zset(self):
+        value = ScanZset(((n, member(n)) for n in range(300)))
+        value.add(3.5, member(3))
+        value.remove(member(5))
+        value.remove_range(0, 2)
+        self.check_index(value._dict._index, value._dict)
+        result, _ = self.scan_all(value)
+        self.assertEqual(sorted(result), sorted(value))
+        union = ScanZset.union([value, Zset(((1, b'a'),))], [1, 1], sum)
+        self.assertEqual(type(union), ScanZset)
+        self.check_index(union._dict._index, union._dict)
+        copy = pickle.loads(pickle.dumps(value))
+        self.assertEqual(type(copy), ScanZset)
+        self.assertEqual(copy, value)
+        self.check_index(copy._dict._index, value._dict)
@@ -0,0 +1,254 @@
+import unittest
+
+import pulsar
+from pulsar import asyncio
+from pulsar.apps.ds import PulsarDS, CommandError
+from pulsar.apps.data import create_store, ShardedStore, HashRing
+from pulsar.apps.data.redis.shard import key_hash, command_keys
+
+
+NODES = ['127.0.0.1:7000', '127.0.0.1:7001', '127.0.0.1:7002']
+
+
+class TestHashRing(unittest.TestCase):
+
+    def keys(self, size=10000):
+        return ['key:%d' % n for n in range(size)]
+
+    def test_points(self):
+        ring = HashRing(NODES)
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.nodes, tuple(NODES))
+        self.assertEqual(len(ring._positions), 3*ring.points)
+        self.assertTrue('127.0.0.1:7001' in ring)
+        self.assertRaises(KeyError, HashRing().get, 'foo')
+
+    def test_distribution(self):
+        ring = HashRing(NODES)
+        counts = dict(((node, 0) for node in NODES))
+        keys = self.keys()
+        for key in keys:
+            counts[ring.get(key)] += 1
+        for count in counts.values():
+            self.assertTrue(0.2 < count/len(keys) < 0.47)
+
+    def test_hash_tag(self):
+        ring = HashRing(NODES)
+        self.assertEqual(key_hash('{user1000}.following'),
+                         key_hash('user1000'))
+        self.assertEqual(key_hash(b'user1000'), key_hash('user1000'))
+        node = ring.get('{user1000}.following')
+        for n in range(20):
+            self.assertEqual(ring.get('{user1000}.%d' % n), node)
+
+    def test_add_node(self):
+        ring = HashRing(NODES)
+        keys = self.keys()
+        before = [ring.get(key) for key in keys]
+        ring.add('127.0.0.1:7003')
+        after = [ring.get(key) for key in keys]
+        moved = [(b, a) for b, a in zip(before, after) if a != b]
+        # only keys moving to the new node are remapped
+        self.assertTrue(moved)
+        self.assertTrue(len(moved) < 0.4*len(keys))
+        for _, node in moved:
+            self.assertEqual(node, '127.0.0.1:7003')
+
+    def test_remove_node(self):
+        ring = HashRing(NODES)
+        keys = self.keys()
+        before = [ring.get(key) for key in keys]
+        ring.remove('127.0.0.1:7001')
+        self.assertEqual(len(ring), 2)
+        for key, node in zip(keys, before):
+            if node != '127.0.0.1:7001':
+                self.assertEqual(ring.get(key), node)
+        # adding the node back restores the mapping
+        ring.add('127.0.0.1:7001')
+        ring2 = HashRing(['127.0.0.1:7000', '127.0.0.1:7002',
+                          '127.0.0.1:7001'])
+        self.assertEqual([ring.get(key) for key in keys], before)
+        self.assertEqual([ring2.get(key) for key in keys], before)
+
+
+class TestRoute(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = pulsar.new_event_loop()
+        self.store = create_store('shard://%s' % ','.join(NODES),
+                                  loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_xread(self):
+        for streams in ('streams', b'STREAMS'):
+            self.assertEqual(command_keys('xread', ('xread', 'count', 10,
+                                                    streams, 'k1', 'k2',
+                                                    '0', '0')),
+                             ('k1', 'k2'))
+        self.assertEqual(command_keys('xreadgroup', (
+            'xreadgroup', 'group', 'g', 'c', 'streams', 'k', '>')), ('k',))
+        for n in range(10):
+            key = 'stream:%d' % n
+            parts, _ = self.store._route(('xread', 'streams', key, '0'))
+            self.assertEqual(parts[0][0], self.store.node(key))
+
+    def test_keyless(self):
+        # commands without key information go to the first node
+        parts, merge = self.store._route(('touch', 'a', 'b', 'c'))
+        self.assertEqual(parts, [(self.store.nodes[0], ('touch', 'a', 'b',
+                                                        'c'))])
+        self.assertEqual(merge, None)
+
+
+class TestShardedStore(unittest.TestCase):
+    app_cfgs = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app_cfgs = []
+        for n in range(3):
+            server = PulsarDS(name='%s%d' % (cls.__name__.lower(), n),
+                              bind='127.0.0.1:0',
+                              concurrency=cls.cfg.concurrency)
+            app_cfg = yield from pulsar.send('arbiter', 'run', server)
+            cls.app_cfgs.append(app_cfg)
+        cls.addresses = [app_cfg.addresses[0] for app_cfg in cls.app_cfgs]
+        cls.store = create_store(
+            'shard://%s/9' % ','.join('%s:%s' % a for a in cls.addresses),
+            pool_size=2)
+        cls.client = cls.store.client()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.app_cfgs:
+            cls.store.close()
+        for app_cfg in cls.app_cfgs:
+            yield from pulsar.send('arbiter', 'kill_actor', app_cfg.name)
+
+    def node_client(self, address):
+        return create_store('pulsar://%s:%s/9' % address,
+                            pool_size=1).client()
+
+    def test_store(self):
+        store = self.store
+        self.assertIsInstance(store, ShardedStore)
+        self.assertEqual(len(store.nodes), 3)
+        self.assertEqual(store._host, self.addresses)
+        self.assertEqual(store.database, 9)
+        yield from self.async.assertEqual(store.ping(), True)
+
+    def test_set_get(self):
+        client = self.client
+        keys = ['set_get:%d' % n for n in range(30)]
+        for n, key in enumerate(keys):
+            yield from self.async.assertEqual(client.set(key, n), True)
+        for n, key in enumerate(keys):
+            yield from self.async.assertEqual(client.get(key),
+                                              str(n).encode('utf-8'))
+        # keys are stored in the node given by the ring
+        for key in keys[:5]:
+            node = self.store.node(key)
+            node_client = self.node_client(node._host)
+            yield from self.async.assertEqual(node_client.exists(key), True)
+        sizes = []
+        for address in self.addresses:
+            client = self.node_client(address)
+            node_keys = yield from client.execute('keys', 'set_get:*')
+            sizes.append(len(node_keys))
+        self.assertEqual(sum(sizes), len(keys))
+        self.assertTrue(min(sizes) > 0)
+
+    def test_multi_keys(self):
+        client = self.client
+        keys = ['multi:%d' % n for n in range(20)]
+        values = [str(n).encode('utf-8') for n in range(20)]
+        mapping = []
+        for key, value in zip(keys, values):
+            mapping.extend((key, value))
+        yield from self.async.assertEqual(client.mset(*mapping), True)
+        yield from self.async.assertEqual(client.mget(*keys), values)
+        yield from self.async.assertEqual(
+            client.mget('multi:0', 'multi:none', 'multi:19'),
+            [b'0', None, b'19'])
+        yield from self.async.assertEqual(client.delete(*keys[:10]), 10)
+        yield from self.async.assertEqual(client.mget(*keys[:10]),
+                                          [None]*10)
+        yield from self.async.assertEqual(client.delete(*keys), 10)
+
+    def test_crossnode(self):
+        client = self.client
+        keys = ['cross:%d' % n for n in range(10)]
+        yield from self.async.assertRaises(CommandError, client.sinterstore,
+                                           *keys)
+        keys = ['{cross}.%d' % n for n in range(10)]
+        for key in keys:
+            yield from self.async.assertEqual(client.sadd(key, 'a', 'b'), 2)
+        yield from self.async.assertEqual(client.sinterstore(*keys), 2)
+
+    def test_pipeline(self):
+        keys = ['pipe:%d' % n for n in range(20)]
+        pipe = self.client.pipeline()
+        for n, key in enumerate(keys):
+            pipe.set(key, n)
+        pipe.mget(*keys)
+        pipe.incr(keys[3])
+        pipe.delete(*keys)
+        result = yield from pipe.commit()
+        self.assertEqual(len(result), 23)
+        self.assertEqual(result[:20], [True]*20)
+        self.assertEqual(result[20],
+                         [str(n).encode('utf-8') for n in range(20)])
+        self.assertEqual(result[21], 4)
+        self.assertEqual(result[22], 20)
+
+    def test_pipeline_error(self):
+        pipe = self.client.pipeline()
+        pipe.set('pipe_error:a', 'foo')
+        pipe.lpush('pipe_error:a', 'bla')
+        pipe.set('pipe_error:b', 'bar')
+        yield from self.async.assertRaises(Exception, pipe.commit)
+        pipe.get('pipe_error:a')
+        pipe.lpush('pipe_error:a', 'bla')
+        pipe.get('pipe_error:b')
+        result = yield from pipe.commit(raise_on_error=False)
+        self.assertEqual(result[0], b'foo')
+        self.assertIsInstance(result[1], Exception)
+        self.assertEqual(result[2], b'bar')
+
+    def test_gather(self):
+        client = self.client
+        keys = ['gather:%d' % n for n in range(100)]
+        results = yield from asyncio.gather(
+            *[client.set(key, key) for key in keys], loop=self.store._loop)
+        self.assertEqual(results, [True]*len(keys))
+        results = yield from asyncio.gather(
+            *[client.get(key) for key in keys], loop=self.store._loop)
+        self.assertEqual(results, [key.encode('utf-8') for key in keys])
+
+    def test_add_node(self):
+        store = create_store(
+            'shard://%s:%s/10' % self.addresses[0], pool_size=1)
+        client = store.client()
+        yield from client.flushdb()
+        keys = ['add:%d' % n for n in range(60)]
+        for key in keys:
+            yield from client.set(key, key)
+        for address in self.addresses[1:]:
+            store.add_node(address)
+        self.assertEqual(len(store.nodes), 3)
+        self.assertEqual(store.dns, 'shard://%s/10' % ','.join(
+            '%s:%s' % a for a in self.addresses))
+        values = yield from client.mget(*keys)
+        # keys remapped to the new nodes are missing
+        moved = [key for key, value in zip(keys, values) if value is None]
+        self.assertTrue(moved)
+        self.assertTrue(len(moved) < len(keys))
+        for key in moved:
+            self.assertNotEqual(store.node(key), store.nodes[0])
+        node = store.remove_node(self.addresses[2])
+        node.close()
+        yield from self.async.assertEqual(client.dbsize(), len(keys))
+        yield from client.flushdb()
+        store.close()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import pulsar
+from pulsar.utils.structures import Dict, Zset, Deque
+from pulsar.apps.ds.snapshot import (write_snapshot, read_snapshot,
+                                     is_snapshot, SnapshotError)
+from pulsar.apps.ds.hyperloglog import HyperLogLog
+
+from .utils import storage
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def dbs(self):
+        data0 = {b'a': bytearray(b'foo'),
+                 b'b': Dict(((b'x', b'1'), (b'y', b'2'))),
+                 b'c': {b'p', b'q'},
+                 b'd': Deque((b'1', b'2', b'3')),
+                 b'e': Zset(((1.0, b'u'), (2.0, b'v')))}
+        sparse = HyperLogLog()
+        sparse.add((b'x', b'y'), 3000)
+        dense = HyperLogLog()
+        dense.add((str(n).encode('utf-8') for n in range(1000)), 3000)
+        data3 = {b'a': bytearray(b'bla'), b'big': bytearray(200000),
+                 b'hll': sparse, b'dense': dense}
+        return [(0, data0, {b'a': 100.0}), (3, data3, {})]
+
+    def dump(self, dbs, **kw):
+        file = BytesIO()
+        count = write_snapshot(file, dbs, **kw)
+        self.assertEqual(count, sum(len(d) for _, d, _ in dbs))
+        return file.getvalue()
+
+    def test_roundtrip(self):
+        dbs = self.dbs()
+        file = BytesIO(self.dump(dbs, offset=10, chunk_size=64))
+        self.assertTrue(is_snapshot(file))
+        self.assertEqual(file.tell(), 0)
+        entries = list(read_snapshot(file))
+        self.assertEqual(len(entries), 9)
+        for num, data, expires in dbs:
+            for key, value in data.items():
+                entry = (num, key, value,
+                         expires[key] + 10 if key in expires else None)
+                self.assertTrue(entry in entries)
+
+    def test_not_snapshot(self):
+        file = BytesIO(b'\x80\x02blabla')
+        self.assertFalse(is_snapshot(file))
+        self.assertRaises(SnapshotError, list, read_snapshot(file))
+
+    def test_checksum(self):
+        data = bytearray(self.dump(self.dbs()))
+        data[40] ^= 255
+        entries = read_snapshot(BytesIO(bytes(data)))
+        self.assertRaises(SnapshotError, list, entries)
+
+    def test_truncated(self):
+        data = self.dump(self.dbs())
+        entries = read_snapshot(BytesIO(data[:-5]))
+        self.assertRaises(SnapshotError, list, entries)
+
+
+class TestLoadSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, 'test.rdb')
+        self.loop = pulsar.new_event_loop()
+        data = dict(((('key:%d' % n).encode('utf-8'), bytearray(b'x'))
+                     for n in range(1000)))
+        file = BytesIO()
+        write_snapshot(file, [(0, data, {})], chunk_size=256)
+        with open(self.filename, 'wb') as fp:
+            fp.write(file.getvalue()[:-2000])
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.dir)
+
+    def test_truncated_background(self):
+        store = storage(self.loop, filename=self.filename,
+                        background_load=True)
+        self.assertTrue(store._loading)
+        file = store._loading[0]
+        # run the steps scheduled in the loop
+        for _ in range(100):
+            if store._loading is None:
+                break
+            store._load_step()
+        self.assertEqual(store._loading, None)
+        self.assertTrue(file.closed)
+        loaded = len(store.databases[0])
+        self.assertTrue(0 < loaded < 1000)
+        self.assertEqual(store._loaded_keys, loaded)
+
+    def test_truncated_foreground(self):
+        self.assertRaises(SnapshotError, storage, self.loop,
+                          filename=self.filename)
@@ -0,0 +1,147 @@
+import pickle
+import unittest
+
+from pulsar.apps.ds.parser import CommandError
+from pulsar.apps.ds.stream import (Stream, ConsumerGroup, parse_id,
+                                   parse_range_id, read_keys, MAX_ID)
+
+
+def stream(size, max_entries=10):
+    value = Stream()
+    for n in range(1, size + 1):
+        value.add((n, 0), [b'n', str(n).encode('ascii')], max_entries, 0)
+    return value
+
+
+def ids(entries):
+    return [id[0] for id, _ in entries]
+
+
+class TestStream(unittest.TestCase):
+
+    def test_parse_id(self):
+        self.assertEqual(parse_id(b'5'), (5, 0))
+        self.assertEqual(parse_id(b'5', 7), (5, 7))
+        self.assertEqual(parse_id(b'5-3'), (5, 3))
+        self.assertEqual(parse_id(b'+'), MAX_ID)
+        self.assertRaises(CommandError, parse_id, b'5-a')
+        self.assertRaises(CommandError, parse_id, b'-1')
+        self.assertEqual(parse_range_id(b'(5-3', 0), (5, 4))
+        self.assertEqual(parse_range_id(b'(5-0', MAX_ID[1]),
+                         (4, MAX_ID[1]))
+        self.assertEqual(parse_range_id(b'5', MAX_ID[1]), (5, MAX_ID[1]))
+        self.assertRaises(CommandError, parse_range_id, b'(-', MAX_ID[1])
+        self.assertEqual(read_keys([b'xread', b'count', b'1', b'STREAMS',
+                                    b'a', b'b', b'0', b'0']), [b'a', b'b'])
+
+    def test_next_id(self):
+        value = Stream()
+        self.assertRaises(CommandError, value.next_id, 0, 0)
+        self.assertEqual(value.next_id(5), (5, 0))
+        value.add((5, 0), [b'a', b'1'], 10, 0)
+        self.assertEqual(value.next_id(3), (5, 1))
+        self.assertEqual(value.next_id(5, 4), (5, 4))
+        self.assertRaises(CommandError, value.next_id, 5, 0)
+
+    def test_nodes(self):
+        value = stream(95)
+        self.assertEqual(len(value), 95)
+        self.assertEqual(value.nodes(), 10)
+        self.assertEqual(value.get((42, 0)), [b'n', b'42'])
+        self.assertEqual(value.get((42, 1)), None)
+        value = Stream()
+        for n in range(1, 11):
+            value.add((n, 0), [b'x'*50], 0, 100)
+        self.assertEqual(value.nodes(), 5)
+
+    def test_range(self):
+        value = stream(95)
+        self.assertEqual(ids(value.range()), list(range(1, 96)))
+        self.assertEqual(ids(value.range((9, 0), (31, 0))),
+                         list(range(9, 32)))
+        self.assertEqual(ids(value.range((9, 1), count=3)), [10, 11, 12])
+        self.assertEqual(ids(value.range((9, 0), (31, 0), reverse=True)),
+                         list(range(31, 8, -1)))
+        self.assertEqual(ids(value.range(end=(30, 0), count=2,
+                                         reverse=True)), [30, 29])
+        self.assertEqual(ids(value.range((96, 0))), [])
+        self.assertEqual(ids(value.after((93, 0))), [94, 95])
+        self.assertEqual(value.first()[0], (1, 0))
+        self.assertEqual(value.last()[0], (95, 0))
+        self.assertEqual(ids(Stream().range()), [])
+
+    def test_delete(self):
+        value = stream(30)
+        self.assertTrue(value.delete((5, 0)))
+        self.assertFalse(value.delete((5, 0)))
+        self.assertEqual(len(value), 29)
+        self.assertEqual(ids(value.range((4, 0), (6, 0))), [4, 6])
+        for n in range(11, 21):
+            value.delete((n, 0))
+        self.assertEqual(value.nodes(), 2)
+        self.assertEqual(ids(value.range((9, 0), (22, 0))), [9, 10, 21, 22])
+        self.assertEqual(value.max_deleted_id, (20, 0))
+
+    def test_trim(self):
+        value = stream(95)
+        self.assertEqual(value.trim(maxlen=80, approx=True), 10)
+        self.assertEqual(len(value), 85)
+        self.assertEqual(value.trim(maxlen=80), 5)
+        self.assertEqual(value.first()[0], (16, 0))
+        self.assertEqual(value.trim(minid=(33, 0)), 17)
+        self.assertEqual(value.first()[0], (33, 0))
+        self.assertEqual(value.trim(maxlen=0, approx=True, limit=20), 18)
+        self.assertEqual(value.first()[0], (51, 0))
+        self.assertEqual(len(value), 45)
+
+    def test_serialise(self):
+        value = stream(25)
+        value.delete((3, 0))
+        group = ConsumerGroup((0, 0))
+        value.groups[b'g'] = group
+        group.deliver(value, group.consumer(b'a', 0), 2, False, 0)
+        copy = pickle.loads(pickle.dumps(value))
+        self.assertEqual(list(copy.range()), list(value.range()))
+        group = copy.groups[b'g']
+        self.assertIs(group.pending[(1, 0)].consumer,
+                      group.consumers[b'a'])
+
+
+class TestConsumerGroup(unittest.TestCase):
+
+    def test_deliver(self):
+        value = stream(10)
+        group = ConsumerGroup((0, 0), 0)
+        alice = group.consumer(b'alice', 100)
+        bob = group.consumer(b'bob', 100)
+        self.assertEqual(ids(group.deliver(value, alice, 3, False, 100)),
+                         [1, 2, 3])
+        self.assertEqual(ids(group.deliver(value, bob, 2, True, 100)),
+                         [4, 5])
+        self.assertEqual(group.last_id, (5, 0))
+        self.assertEqual(group.entries_read, 5)
+        self.assertEqual(len(group.pending), 3)
+        self.assertEqual(ids(group.history(value, alice, (2, 0), None)),
+                         [2, 3])
+        self.assertEqual(bob.pending, set())
+
+    def test_claim_ack(self):
+        value = stream(10)
+        group = ConsumerGroup((0, 0))
+        alice = group.consumer(b'alice', 0)
+        bob = group.consumer(b'bob', 0)
+        group.deliver(value, alice, 4, False, 0)
+        entry = group.claim((2, 0), bob, 50)
+        self.assertEqual(entry.delivery_count, 2)
+        self.assertEqual(alice.pending, {(1, 0), (3, 0), (4, 0)})
+        self.assertEqual(bob.pending, {(2, 0)})
+        self.assertTrue(group.ack((3, 0)))
+        self.assertFalse(group.ack((3, 0)))
+        self.assertEqual([id for id, _ in group.pending_range()],
+                         [(1, 0), (2, 0), (4, 0)])
+        self.assertEqual([id for id, _ in group.pending_range((2, 0),
+                                                              count=1)],
+                         [(2, 0)])
+        self.assertEqual(group.delete_consumer(b'alice'), 2)
+        self.assertEqual(list(group.pending), [(2, 0)])
+        self.assertEqual(group.delete_consumer(b'alice'), 0)
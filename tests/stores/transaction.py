@@ -0,0 +1,133 @@
+import unittest
+
+import pulsar
+from pulsar.apps.ds.aof import AofClient
+from pulsar.apps.ds.cluster import Cluster
+from pulsar.apps.ds.memory import used_memory
+
+from .utils import storage
+
+
+class Client(AofClient):
+
+    def __init__(self, store):
+        super().__init__(store)
+        self.replies = []
+        self.errors = []
+        self.rejected = []
+
+    def reply_error(self, value, prefix=None):
+        self.errors.append(prefix)
+
+    def reply_rejected(self, value, prefix):
+        self.rejected.append(prefix)
+
+    def reply_multi_bulk(self, value):
+        self.replies.append(value)
+
+    def reply_multi_bulk_len(self, len):
+        self.replies.append(len)
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = pulsar.new_event_loop()
+        self.store = storage(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def execute(self, client, *args):
+        client.execute([arg.encode('utf-8') for arg in args])
+
+    def transaction(self, client):
+        self.execute(client, 'multi')
+        self.execute(client, 'set', 'a', 'x')
+        self.execute(client, 'exec')
+        return client.replies.pop()
+
+    def test_index(self):
+        store = self.store
+        c1, c2 = Client(store), Client(store)
+        self.execute(c1, 'watch', 'a', 'b')
+        self.execute(c2, 'watch', 'b')
+        watched = store.databases[0]._watched_keys
+        self.assertEqual(watched, {b'a': {c1}, b'b': {c1, c2}})
+        self.execute(c1, 'unwatch')
+        self.assertEqual(watched, {b'b': {c2}})
+        self.assertEqual(c1.watched_keys, None)
+        store._remove_connection(c2, None)
+        self.assertEqual(watched, {})
+
+    def test_modified_key(self):
+        store = self.store
+        c1, c2, c3 = Client(store), Client(store), Client(store)
+        self.execute(c1, 'watch', 'a')
+        self.execute(c2, 'watch', 'b')
+        self.execute(c3, 'set', 'a', 'y')
+        self.assertTrue(c1.flag & store.DIRTY_CAS)
+        self.assertFalse(c2.flag & store.DIRTY_CAS)
+        self.assertEqual(self.transaction(c1), ())
+        self.assertEqual(self.transaction(c2), 1)
+        self.assertEqual(store.databases[0]._watched_keys, {})
+        self.assertFalse(c1.flag & store.DIRTY_CAS)
+        # keys are watched in the database selected by the client
+        self.execute(c1, 'watch', 'a')
+        self.execute(c3, 'select', '1')
+        self.execute(c3, 'set', 'a', 'z')
+        self.assertEqual(self.transaction(c1), 1)
+
+    def test_flushdb(self):
+        store = self.store
+        clients = [Client(store) for _ in range(3)]
+        for n, client in enumerate(clients):
+            self.execute(client, 'watch', 'k%d' % n)
+        self.execute(clients[0], 'flushdb')
+        self.assertEqual(store.databases[0]._watched_keys, {})
+        for client in clients:
+            self.assertTrue(client.flag & store.DIRTY_CAS)
+            self.assertEqual(self.transaction(client), ())
+
+
+class TestAbort(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = pulsar.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def execute(self, client, *args):
+        client.execute([arg.encode('utf-8') for arg in args])
+
+    def check_abort(self, store, prefix):
+        client = Client(store)
+        self.execute(client, 'multi')
+        self.execute(client, 'set', 'foo', 'x')
+        self.assertEqual(client.rejected, [prefix])
+        self.assertTrue(client.flag & store.DIRTY_EXEC)
+        # the error is not queued with the requests of the transaction
+        self.assertEqual(client.transaction, [])
+        self.execute(client, 'exec')
+        self.assertEqual(client.errors, ['EXECABORT'])
+        self.assertEqual(client.transaction, None)
+        self.assertFalse(client.flag & store.DIRTY_EXEC)
+        self.assertFalse(b'foo' in store.databases[0]._data)
+
+    def test_readonly(self):
+        store = storage(self.loop)
+        store._readonly = True
+        self.check_abort(store, 'READONLY')
+
+    def test_moved(self):
+        store = storage(self.loop)
+        # slot 12182 of foo is served by the second node
+        store._cluster = Cluster([('127.0.0.1', 7000),
+                                  ('127.0.0.1', 7001)])
+        self.check_abort(store, 'MOVED')
+
+    def test_oom(self):
+        store = storage(self.loop, maxmemory_policy='noeviction')
+        store._maxmemory = used_memory(store) - 1
+        self.check_abort(store, 'OOM')
@@ -1,7 +1,30 @@
 import re
 import unittest
 
-from pulsar.apps.ds import redis_to_py_pattern
+import pulsar
+from pulsar.apps.ds import PulsarDS, redis_parser, redis_to_py_pattern
+from pulsar.apps.ds.server import Storage
+
+
+class DummyServer:
+    '''The attributes of a pulsar-ds server used by a :class:`.Storage`,
+    to run commands without sockets
+    '''
+    def __init__(self, loop, cfg=None):
+        self._loop = loop
+        self.cfg = cfg
+        self._parser_class = redis_parser(True)
+        self.logger = loop.logger = pulsar.logger()
+
+
+def storage(loop, cluster=None, **params):
+    '''A :class:`.Storage` running in ``loop``, the node ``cluster`` if
+    given, ``params`` override the ``key_value_`` settings of the server
+    '''
+    cfg = PulsarDS().cfg.copy()
+    for name, value in params.items():
+        cfg.set('key_value_%s' % name, value)
+    return Storage(DummyServer(loop, cfg), cfg, cluster)
 
 
 class TestUtils(unittest.TestCase):
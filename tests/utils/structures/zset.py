@@ -93,3 +93,62 @@ class TestZset(unittest.TestCase):
                        (4, 'b'), (5, 'c')])
         self.assertEqual(s.remove_range(1, 4), 3)
         self.assertEqual(s, self.zset([(1.2, 'bla'), (5, 'c')]))
+
+    def test_rank_same_score(self):
+        s = self.zset([(3, 'pippo'), (3, 'bla'), (1, 'c'), (3, 'foo')])
+        self.assertEqual(list(s), ['c', 'bla', 'foo', 'pippo'])
+        self.assertEqual(s.rank('c'), 0)
+        self.assertEqual(s.rank('bla'), 1)
+        self.assertEqual(s.rank('foo'), 2)
+        self.assertEqual(s.rank('pippo'), 3)
+
+    def test_range_negative(self):
+        s = self.zset([(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')])
+        self.assertEqual(list(s.range(-3, -1)), ['b', 'c'])
+        self.assertEqual(list(s.range(2)), ['c', 'd'])
+        self.assertEqual(list(s.range(3, 2)), [])
+
+    def test_range_by_score_limit(self):
+        s = self.zset([(1, 'a'), (2, 'b'), (2, 'c'), (3, 'd'), (5, 'e')])
+        self.assertEqual(list(s.range_by_score(2, 5)), ['b', 'c', 'd', 'e'])
+        self.assertEqual(list(s.range_by_score(2, 5, include_min=False,
+                                               include_max=False)), ['d'])
+        self.assertEqual(list(s.range_by_score(2, 5, start=1, num=2)),
+                         ['c', 'd'])
+        self.assertEqual(s.count(2, 3), 3)
+        self.assertEqual(s.count(4, 1), 0)
+
+    def test_large(self):
+        # several blocks
+        scores = [randint(0, 100) for _ in range(5000)]
+        s = self.zset(zip(scores, range(5000)))
+        expected = sorted(zip(scores, range(5000)))
+        self.assertEqual(list(s.items()), expected)
+        for rank in (0, 1999, 2000, 4999):
+            self.assertEqual(s.rank(expected[rank][1]), rank)
+        self.assertEqual(list(s.range(1995, 2005, True)),
+                         expected[1995:2005])
+        self.assertEqual(s.remove_range(1000, 3000), 2000)
+        del expected[1000:3000]
+        self.assertEqual(list(s.items()), expected)
+        for score, member in expected[::7]:
+            self.assertEqual(s.remove(member), score)
+        self.assertEqual(list(s.items()),
+                         [p for i, p in enumerate(expected) if i % 7])
+
+    def test_from_items(self):
+        items = [(randint(0, 100), n) for n in range(5000)]
+        expected = Zset(items)
+        for data in (items, sorted(items), sorted(items, reverse=True)):
+            s = Zset.from_items(data)
+            self.assertEqual(s, expected)
+            self.assertEqual(list(s.items()), list(expected.items()))
+            self.assertEqual(len(s), 5000)
+            member = sorted(items)[2500][1]
+            self.assertEqual(s.rank(member), 2500)
+            s.add(-1, 'x')
+            self.assertEqual(s.rank('x'), 0)
+        s = Zset.from_items([(1, 'a'), (3, 'b'), (2, 'a')])
+        self.assertEqual(list(s.items()), [(2, 'a'), (3, 'b')])
+        self.assertEqual(len(Zset.from_items([])), 0)
+        self.assertRaises(ValueError, Zset.from_items, [(float('nan'), 'a')])